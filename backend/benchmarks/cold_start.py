@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+EchoGuard Cold Start Benchmark
+
+This script measures, in a fresh interpreter per handler, how long each
+Lambda handler module takes to import and how long its first AWS client
+takes to create, so cold start regressions are visible. No AWS calls are
+made; clients are created with placeholder credentials.
+"""
+
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+LAMBDA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'lambda')
+
+HANDLERS = [
+    'upload_handler',
+    'transcribe_handler',
+    'transcribe_complete_handler',
+    'analysis_handler',
+    'get_recordings_handler',
+    'digest_flush_handler',
+    'start_transcribe',
+    'analyze_transcript'
+]
+
+# Runs in the child interpreter; prints one JSON line of timings in milliseconds
+PROBE = """
+import json, sys, time
+sys.path.insert(0, {lambda_dir!r})
+started = time.perf_counter()
+import boto3
+boto3_ms = (time.perf_counter() - started) * 1000
+started = time.perf_counter()
+module = __import__({handler!r})
+import_ms = (time.perf_counter() - started) * 1000
+import aws_clients
+started = time.perf_counter()
+aws_clients.client('s3')
+first_client_ms = (time.perf_counter() - started) * 1000
+started = time.perf_counter()
+aws_clients.client('s3')
+cached_client_ms = (time.perf_counter() - started) * 1000
+print(json.dumps({{'boto3_ms': boto3_ms, 'import_ms': import_ms,
+                   'first_client_ms': first_client_ms, 'cached_client_ms': cached_client_ms}}))
+"""
+
+def parse_args():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description='Measure EchoGuard Lambda cold start costs')
+    parser.add_argument('--runs', type=int, default=5,
+                        help='Fresh interpreters per handler; the median is reported')
+    parser.add_argument('--max-import-ms', type=float, default=0,
+                        help='Exit non-zero if any handler import median exceeds this')
+    parser.add_argument('handlers', nargs='*', default=HANDLERS,
+                        help='Handlers to measure')
+    return parser.parse_args()
+
+def measure(handler):
+    """Import a handler in a fresh interpreter and return its timings"""
+    env = dict(os.environ)
+    env.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+    env.setdefault('AWS_ACCESS_KEY_ID', 'benchmark')
+    env.setdefault('AWS_SECRET_ACCESS_KEY', 'benchmark')
+    output = subprocess.run(
+        [sys.executable, '-c', PROBE.format(lambda_dir=LAMBDA_DIR, handler=handler)],
+        env=env, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def median(values):
+    """Median of a non-empty list"""
+    values = sorted(values)
+    middle = len(values) // 2
+    return values[middle] if len(values) % 2 else (values[middle - 1] + values[middle]) / 2
+
+def main():
+    """Main function"""
+    args = parse_args()
+    columns = ['boto3_ms', 'import_ms', 'first_client_ms', 'cached_client_ms']
+    print(f"{'handler':<30}" + ''.join(f"{column:>18}" for column in columns))
+
+    slow = []
+    for handler in args.handlers:
+        runs = [measure(handler) for _ in range(args.runs)]
+        medians = {column: median([run[column] for run in runs]) for column in columns}
+        print(f"{handler:<30}" + ''.join(f"{medians[column]:>18.1f}" for column in columns))
+        if args.max_import_ms and medians['import_ms'] > args.max_import_ms:
+            slow.append(handler)
+
+    if slow:
+        print(f"Import time above {args.max_import_ms}ms: {', '.join(slow)}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
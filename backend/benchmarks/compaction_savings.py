@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+EchoGuard Prompt Compaction Benchmark
+
+This script reports the estimated tokens prompt_compaction saves on
+Amazon Transcribe output, by default the sample transcripts in tests/data,
+and whether every compliance term found in the original is still found in
+the compacted text. Fillers and stutters can be mixed into the transcripts
+at a given rate to see how much of the saving depends on disfluent speech.
+"""
+
+import os
+import sys
+import json
+import glob
+import argparse
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(BACKEND_DIR, 'lambda'))
+
+import prompt_compaction
+import rule_packs
+
+DATA_DIR = os.path.join(BACKEND_DIR, 'tests', 'data')
+
+FILLERS = ['um', 'uh', 'erm', 'ah', 'hmm']
+
+def parse_args():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description='Report prompt compaction savings')
+    parser.add_argument('transcripts', nargs='*',
+                        help='Transcribe output JSON files, by default those in tests/data')
+    parser.add_argument('--budgets', type=int, nargs='*', default=[0],
+                        help='Token budgets to fit; 0 only removes fillers and repeats')
+    parser.add_argument('--disfluency', type=float, nargs='*', default=[0, 0.05, 0.1, 0.2],
+                        help='Share of words preceded by a filler or stutter')
+    return parser.parse_args()
+
+def load_transcripts(paths):
+    """Return (name, text) for each Transcribe output file with a transcript"""
+    transcripts = []
+    for path in paths or sorted(glob.glob(os.path.join(DATA_DIR, '*.json'))):
+        with open(path) as f:
+            data = json.load(f)
+        texts = data.get('results', {}).get('transcripts', []) if isinstance(data, dict) else []
+        if texts:
+            transcripts.append((os.path.basename(path), ' '.join(text['transcript'] for text in texts)))
+    return transcripts
+
+def disfluent(text, rate):
+    """Put a filler, or a stutter of the word, before every 1/rate-th word"""
+    words = []
+    for index, word in enumerate(text.split()):
+        if rate and int((index + 1) * rate) > int(index * rate):
+            bare = word.lower().strip('.,!?')
+            words.append(bare if bare in prompt_compaction.STUTTER_WORDS else FILLERS[len(words) % len(FILLERS)] + ',')
+        words.append(word)
+    return ' '.join(words)
+
+def main():
+    """Main function"""
+    args = parse_args()
+    matcher = rule_packs.get_rule_pack('financial').matcher
+    print(f"{'transcript':<24}{'disfluency':>11}{'budget':>8}{'tokens':>8}{'compacted':>11}{'saved':>8}{'terms kept':>12}")
+    for name, text in load_transcripts(args.transcripts):
+        for rate in args.disfluency:
+            spoken = disfluent(text, rate)
+            terms = set(matcher.count(spoken))
+            for budget in args.budgets:
+                result = prompt_compaction.compact_transcript(spoken, token_budget=budget or None, matcher=matcher)
+                kept = len(terms & set(matcher.count(result.text)))
+                saved = result.tokens_saved / result.original_tokens if result.original_tokens else 0
+                print(f"{name:<24}{rate:>11g}{budget or '-':>8}{result.original_tokens:>8}{result.compacted_tokens:>11}"
+                      f"{saved:>8.0%}{f'{kept}/{len(terms)}':>12}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+EchoGuard Keyword Scan Benchmark
+
+This script compares scanning synthetic call transcripts for compliance
+phrases with the original loop of one word-boundary regex per phrase, a
+single compiled alternation regex, and the PhraseIndex that rule_packs
+uses, reporting the milliseconds per transcript for growing rule sets.
+"""
+
+import os
+import re
+import sys
+import time
+import random
+import argparse
+
+LAMBDA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'lambda')
+sys.path.insert(0, LAMBDA_DIR)
+
+import rule_packs
+from phrase_index import PhraseIndex
+
+WORDS = ['the', 'account', 'returns', 'we', 'can', 'offer', 'you', 'a', 'plan', 'that', 'is', 'risk',
+         'to', 'fit', 'your', 'needs', 'and', 'I', 'understand', 'thank', 'for', 'calling', 'today', 'free']
+
+def parse_args():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description='Benchmark compliance phrase scanning')
+    parser.add_argument('--minutes', type=float, nargs='*', default=[5, 30, 120],
+                        help='Call lengths to synthesize')
+    parser.add_argument('--rules', type=int, nargs='*', default=[10, 100, 1000],
+                        help='Rule set sizes; sets above the financial pack are padded with synthetic phrases')
+    parser.add_argument('--words-per-minute', type=int, default=150,
+                        help='Speaking rate of the synthetic calls')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='Runs per measurement; the fastest is reported')
+    return parser.parse_args()
+
+def rule_set(size, seed=0):
+    """The financial pack's phrases, padded with synthetic two-word phrases"""
+    rng = random.Random(seed)
+    phrases = list(rule_packs.get_rule_pack('financial').rules)
+    while len(phrases) < size:
+        phrases.append(f"{rng.choice(WORDS)} {''.join(rng.choice('abcdefghij') for _ in range(6))}")
+    return phrases[:size]
+
+def synthesize(minutes, words_per_minute, phrases, seed=0):
+    """Build transcript text with a phrase roughly every 200 words"""
+    rng = random.Random(seed)
+    words = []
+    for _ in range(int(minutes * words_per_minute)):
+        words.append(rng.choice(phrases) if rng.random() < 0.005 else rng.choice(WORDS))
+    return ' '.join(words)
+
+def scan_per_phrase_regex(phrases):
+    """The original approach: one word-boundary regex search per phrase"""
+    patterns = [re.compile(r'\b' + re.escape(phrase) + r'\b') for phrase in phrases]
+
+    def scan(text):
+        lowered = text.lower()
+        return sum(len(pattern.findall(lowered)) for pattern in patterns)
+    return scan
+
+def scan_alternation_regex(phrases):
+    """One compiled alternation of every phrase, longest first"""
+    pattern = re.compile(r'\b(?:' + '|'.join(re.escape(phrase) for phrase in sorted(phrases, key=len, reverse=True)) + r')\b')
+
+    def scan(text):
+        return sum(1 for _ in pattern.finditer(text.lower()))
+    return scan
+
+def scan_phrase_index(phrases):
+    """The PhraseIndex built once per container by rule_packs"""
+    index = PhraseIndex(phrases)
+
+    def scan(text):
+        return len(index.scan(text))
+    return scan
+
+def measure(scan, text, repeat):
+    """Return (hits, fastest milliseconds) over repeat runs"""
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        hits = scan(text)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return hits, best * 1000
+
+def main():
+    """Main function"""
+    args = parse_args()
+    scanners = [('per-phrase re', scan_per_phrase_regex), ('alternation re', scan_alternation_regex),
+                ('PhraseIndex', scan_phrase_index)]
+    print(f"{'minutes':>8}{'rules':>7}" + ''.join(f"{name + ' ms':>18}" for name, _ in scanners) + f"{'hits':>16}")
+    for rules in args.rules:
+        phrases = rule_set(rules)
+        built = [build(phrases) for _, build in scanners]
+        for minutes in args.minutes:
+            text = synthesize(minutes, args.words_per_minute, phrases)
+            results = [measure(scan, text, args.repeat) for scan in built]
+            print(f"{minutes:>8g}{rules:>7}" + ''.join(f"{ms:>18.1f}" for _, ms in results)
+                  + f"{'/'.join(str(hits) for hits, _ in results):>16}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+EchoGuard Transcript Reader Benchmark
+
+This script compares reading synthetic Amazon Transcribe output for 1-4 hour
+multi-speaker calls with json.loads on the whole body against streaming it
+with transcript_reader, reporting wall time and peak traced memory for
+reading the transcript text and scanning every word item.
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tracemalloc
+
+LAMBDA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'lambda')
+sys.path.insert(0, LAMBDA_DIR)
+
+import transcript_reader
+
+WORDS = ['the', 'account', 'returns', 'we', 'can', 'offer', 'you', 'a', 'plan', 'that', 'is', 'guaranteed',
+         'to', 'fit', 'your', 'needs', 'and', 'I', 'understand', 'thank', 'for', 'calling', 'today']
+
+def parse_args():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description='Benchmark streaming Transcribe output parsing')
+    parser.add_argument('--hours', type=float, nargs='*', default=[1, 2, 4],
+                        help='Call lengths to synthesize')
+    parser.add_argument('--words-per-minute', type=int, default=150,
+                        help='Speaking rate of the synthetic calls')
+    parser.add_argument('--speakers', type=int, default=2,
+                        help='Speakers in the synthetic calls')
+    return parser.parse_args()
+
+def synthesize(hours, words_per_minute, speakers, seed=0):
+    """Build Transcribe output JSON bytes for a call of the given length"""
+    rng = random.Random(seed)
+    items, label_items, words = [], [], []
+    start, speaker = 0.0, 0
+    for index in range(int(hours * 60 * words_per_minute)):
+        if rng.random() < 0.05:
+            speaker = (speaker + 1) % speakers
+        word = rng.choice(WORDS)
+        end = start + 0.3
+        label = f"spk_{speaker}"
+        items.append({
+            'start_time': f"{start:.3f}", 'end_time': f"{end:.3f}", 'speaker_label': label,
+            'alternatives': [{'confidence': '0.99', 'content': word}], 'type': 'pronunciation'
+        })
+        label_items.append({'start_time': f"{start:.3f}", 'end_time': f"{end:.3f}", 'speaker_label': label})
+        words.append(word)
+        if index % 12 == 11:
+            items.append({'alternatives': [{'confidence': '0.0', 'content': '.'}], 'type': 'punctuation'})
+            words[-1] += '.'
+        start = end + 0.1
+
+    document = {
+        'jobName': 'benchmark',
+        'accountId': '000000000000',
+        'results': {
+            'transcripts': [{'transcript': ' '.join(words)}],
+            'speaker_labels': {'speakers': speakers, 'segments': [
+                {'start_time': '0.000', 'end_time': f"{start:.3f}", 'speaker_label': 'spk_0', 'items': label_items}
+            ]},
+            'items': items
+        },
+        'status': 'COMPLETED'
+    }
+    return json.dumps(document).encode('utf-8')
+
+def read_with_json_loads(raw):
+    """The previous approach: decode the whole document"""
+    data = json.loads(io.BytesIO(raw).read())
+    transcript = data['results']['transcripts'][0]['transcript']
+    return len(transcript), sum(1 for item in data['results']['items'] if item['type'] == 'pronunciation')
+
+def read_with_stream(raw):
+    """Stream the transcript text and items with transcript_reader"""
+    transcript = transcript_reader.open_transcript(io.BytesIO(raw))
+    return len(transcript.transcript), sum(1 for item in transcript.items if item['type'] == 'pronunciation')
+
+def measure(read, raw):
+    """Return (result, seconds, peak traced MB) for one read"""
+    started = time.perf_counter()
+    result = read(raw)
+    seconds = time.perf_counter() - started
+
+    tracemalloc.start()
+    read(raw)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, seconds, peak / (1024 * 1024)
+
+def main():
+    """Main function"""
+    args = parse_args()
+    print(f"{'hours':>6}{'size MB':>10}{'loads s':>10}{'loads MB':>10}{'stream s':>10}{'stream MB':>11}")
+    for hours in args.hours:
+        raw = synthesize(hours, args.words_per_minute, args.speakers)
+        expected, loads_seconds, loads_peak = measure(read_with_json_loads, raw)
+        result, stream_seconds, stream_peak = measure(read_with_stream, raw)
+        if result != expected:
+            raise SystemExit(f"Streaming result {result} differs from json.loads result {expected}")
+        print(f"{hours:>6g}{len(raw) / (1024 * 1024):>10.1f}{loads_seconds:>10.2f}{loads_peak:>10.1f}"
+              f"{stream_seconds:>10.2f}{stream_peak:>11.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+"""
+EchoGuard Rule Pack Build Script
+
+This script compiles the JSON compliance rule packs into versioned binary
+artifacts holding the prebuilt matcher tables, so Lambda functions can
+load them at cold start without rebuilding the matcher.
+"""
+
+import os
+import sys
+import argparse
+
+LAMBDA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lambda')
+sys.path.insert(0, LAMBDA_DIR)
+
+import rule_packs
+
+def parse_args():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description='Build EchoGuard compliance rule packs')
+    parser.add_argument('--rule-dir', default=os.path.join(LAMBDA_DIR, 'rules'),
+                        help='Directory containing JSON rule sources')
+    return parser.parse_args()
+
+def build(rule_dir):
+    """Build every rule pack in rule_dir"""
+    built = rule_packs.build_rule_packs(rule_dir)
+    for industry, version, path in built:
+        print(f"Built rule pack {industry} version {version}: {path} ({os.path.getsize(path)} bytes)")
+    return built
+
+def main():
+    """Main function"""
+    args = parse_args()
+    build(args.rule_dir)
+
+if __name__ == "__main__":
+    main()
@@ -49,24 +49,14 @@ if "%BUCKET_NAME%"=="" (
 
 echo Using S3 bucket: %BUCKET_NAME%
 
-REM Create zip files for Lambda functions
+REM Create zip files for Lambda functions, with the shared modules and rule packs they import
 echo Creating Lambda function zip files...
-cd lambda
-powershell Compress-Archive -Path start_transcribe.py -DestinationPath start_transcribe.zip -Force
+python deploy.py --package start_transcribe analyze_transcript
 if %ERRORLEVEL% NEQ 0 (
-    echo Error creating start_transcribe.zip
-    cd ..
+    echo Error creating Lambda function zip files
     exit /b 1
 )
 
-powershell Compress-Archive -Path analyze_transcript.py -DestinationPath analyze_transcript.zip -Force
-if %ERRORLEVEL% NEQ 0 (
-    echo Error creating analyze_transcript.zip
-    cd ..
-    exit /b 1
-)
-cd ..
-
 REM Upload Lambda code to S3
 echo Uploading Lambda code to S3...
 aws s3 cp lambda\start_transcribe.zip s3://%BUCKET_NAME%/
@@ -15,11 +15,14 @@ import tempfile
 import shutil
 from botocore.exceptions import ClientError
 
-# AWS clients
-cloudformation = boto3.client('cloudformation')
-s3 = boto3.client('s3')
-ssm = boto3.client('ssm')
-lambda_client = boto3.client('lambda')
+import build_rule_packs
+
+# AWS clients, created by create_clients for the region being deployed to,
+# so packaging and importing the script need no AWS configuration
+cloudformation = None
+s3 = None
+ssm = None
+lambda_client = None
 
 # Constants
 LAMBDA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lambda')
@@ -31,9 +34,46 @@ LAMBDA_FUNCTIONS = [
     'transcribe_handler',
     'transcribe_complete_handler',
     'analysis_handler',
-    'get_recordings_handler'
+    'get_recordings_handler',
+    'reconcile_handler',
+    'digest_flush_handler'
 ]
 
+# Shared modules packaged alongside each Lambda function
+LAMBDA_DEPENDENCIES = {
+    'upload_handler': ['aws_clients'],
+    'transcribe_handler': [
+        'aws_clients', 'chunked_transcription', 'media_dedup', 'media_probe', 'record_dispatch',
+        'speaker_segments', 'transcript_chunker', 'transcript_stream', 'transcription_jobs', 'transcription_scheduler'
+    ],
+    'transcribe_complete_handler': [
+        'aws_clients', 'chunked_transcription', 'media_dedup', 'speaker_segments', 'transcript_chunker',
+        'transcript_stream', 'transcription_jobs', 'transcription_scheduler'
+    ],
+    'analysis_handler': [
+        'aws_clients', 'alert_digest', 'analysis_cache', 'bedrock_stream', 'blob_store', 'kiro_client',
+        'kiro_integration', 'keyword_matcher', 'media_dedup', 'phrase_index', 'transcript_stream',
+        'rule_packs', 'transcript_chunker', 'record_dispatch', 'rate_limiter',
+        'prompt_compaction', 'tiered_analysis', 'transcript_reader'
+    ],
+    'get_recordings_handler': ['aws_clients', 'blob_store'],
+    'digest_flush_handler': ['aws_clients', 'alert_digest'],
+    'reconcile_handler': [
+        'aws_clients', 'chunked_transcription', 'media_dedup', 'speaker_segments', 'transcript_chunker',
+        'transcript_stream', 'transcription_jobs', 'transcription_scheduler'
+    ],
+    # Functions of the original stack, deployed by the .bat scripts with --package
+    'analyze_transcript': [
+        'aws_clients', 'alert_digest', 'bedrock_stream', 'keyword_matcher', 'kiro_integration', 'phrase_index',
+        'prompt_compaction', 'rate_limiter', 'record_dispatch', 'rule_packs', 'speaker_segments',
+        'transcript_chunker', 'transcript_reader', 'transcript_stream'
+    ],
+    'start_transcribe': ['aws_clients', 'media_probe', 'record_dispatch', 'transcription_jobs']
+}
+
+# Compiled rule packs are packaged with functions that use rule_packs
+RULES_DIR = os.path.join(LAMBDA_DIR, 'rules')
+
 def parse_args():
     """Parse command line arguments"""
     parser = argparse.ArgumentParser(description='Deploy EchoGuard backend')
@@ -48,8 +88,20 @@ def parse_args():
                         help='Kiro AI API key')
     parser.add_argument('--cognito-user-pool-arn', default='',
                         help='Cognito User Pool ARN')
+    parser.add_argument('--package', nargs='+', metavar='FUNCTION',
+                        help='Only build the ZIP files for these functions, without deploying')
+    parser.add_argument('--output-dir', default=LAMBDA_DIR,
+                        help='Directory for the ZIP files built with --package')
     return parser.parse_args()
 
+def create_clients(region):
+    """Create the AWS clients used by the deployment"""
+    global cloudformation, s3, ssm, lambda_client
+    cloudformation = boto3.client('cloudformation', region_name=region)
+    s3 = boto3.client('s3', region_name=region)
+    ssm = boto3.client('ssm', region_name=region)
+    lambda_client = boto3.client('lambda', region_name=region)
+
 def create_lambda_bucket(bucket_name, region):
     """Create S3 bucket for Lambda code if it doesn't exist"""
     try:
@@ -68,13 +120,19 @@ def create_lambda_bucket(bucket_name, region):
         else:
             raise
 
-def zip_lambda_function(function_name):
-    """Create a ZIP file for a Lambda function"""
-    zip_path = os.path.join(tempfile.gettempdir(), f"{function_name}.zip")
+def zip_lambda_function(function_name, output_dir=None):
+    """Create a ZIP file for a Lambda function with its shared modules and rule packs"""
+    zip_path = os.path.join(output_dir or tempfile.gettempdir(), f"{function_name}.zip")
     source_path = os.path.join(LAMBDA_DIR, f"{function_name}.py")
     
     with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
         zipf.write(source_path, os.path.basename(source_path))
+        for module_name in LAMBDA_DEPENDENCIES.get(function_name, []):
+            zipf.write(os.path.join(LAMBDA_DIR, f"{module_name}.py"), f"{module_name}.py")
+        if 'rule_packs' in LAMBDA_DEPENDENCIES.get(function_name, []):
+            for file_name in os.listdir(RULES_DIR):
+                if file_name.endswith(('.json', '.pack')):
+                    zipf.write(os.path.join(RULES_DIR, file_name), f"rules/{file_name}")
     
     return zip_path
 
@@ -196,6 +254,15 @@ def main():
     """Main function"""
     args = parse_args()
     
+    # Only package the requested functions, for the .bat deployment scripts
+    if args.package:
+        build_rule_packs.build(RULES_DIR)
+        for function_name in args.package:
+            print(f"Packaged {function_name} to {zip_lambda_function(function_name, args.output_dir)}")
+        return
+    
+    create_clients(args.region)
+    
     # Create Lambda code bucket
     lambda_bucket = f"{LAMBDA_BUCKET_NAME}-{args.environment}"
     create_lambda_bucket(lambda_bucket, args.region)
@@ -211,6 +278,9 @@ def main():
     # Deploy CloudFormation stack
     outputs = deploy_cloudformation(args.environment, args.region, lambda_bucket)
     
+    # Compile rule packs
+    build_rule_packs.build(RULES_DIR)
+    
     # Package and upload Lambda functions
     for function_name in LAMBDA_FUNCTIONS:
         zip_path = zip_lambda_function(function_name)
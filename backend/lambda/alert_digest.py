@@ -0,0 +1,315 @@
+"""
+Alert Digest Module for EchoGuard
+Buffers SNS notifications per user or team and sends them as digests with
+publish_batch once a group's window elapses or it holds enough alerts.
+Alerts at or below the critical score skip the buffer and are published
+immediately.
+"""
+import json
+import os
+import threading
+import time
+
+from boto3.dynamodb.conditions import Key
+
+import aws_clients
+
+# Digest configuration
+ALERT_DIGEST_BACKEND = os.environ.get('ALERT_DIGEST_BACKEND', 'local')
+ALERT_DIGEST_TABLE = os.environ.get('ALERT_DIGEST_TABLE', 'echoguard-alert-digests')
+ALERT_DIGEST_WINDOW_SECONDS = int(os.environ.get('ALERT_DIGEST_WINDOW_SECONDS', '300'))
+ALERT_DIGEST_MAX_ALERTS = int(os.environ.get('ALERT_DIGEST_MAX_ALERTS', '10'))
+ALERT_CRITICAL_SCORE = int(os.environ.get('ALERT_CRITICAL_SCORE', '40'))
+
+# Index of buffered groups by the time of their first alert, and the
+# partition key value every buffered group carries in it
+ALERT_DIGEST_DUE_INDEX = os.environ.get('ALERT_DIGEST_DUE_INDEX', 'DueIndex')
+DUE_PARTITION = 'buffered'
+
+# Subject of the analysis completion notifications
+COMPLETION_SUBJECT = 'Compliance Analysis Completed'
+
+# SNS limits for one PublishBatch request
+PUBLISH_BATCH_ENTRIES = 10
+PUBLISH_BATCH_BYTES = 256 * 1024
+
+# Longest SNS email subject
+MAX_SUBJECT_LENGTH = 100
+
+# Container-scoped digests keyed by topic and subject
+_digests = {}
+_digests_lock = threading.Lock()
+
+class LocalStore:
+    """
+    In-process buffer. Nothing survives the invocation, so every group is
+    flushed at the end of each invocation: alerts are batched per
+    invocation rather than per window.
+    """
+    durable = False
+
+    def __init__(self):
+        self._groups = {}
+        self._lock = threading.Lock()
+
+    def append(self, group, alert, now):
+        """
+        Buffers an alert and returns (alerts buffered, time of the first)
+        """
+        with self._lock:
+            state = self._groups.setdefault(group, {'first_at': now, 'alerts': []})
+            state['alerts'].append(alert)
+            return len(state['alerts']), state['first_at']
+
+    def claim(self, group):
+        """
+        Removes and returns a group's buffered alerts
+        """
+        with self._lock:
+            return self._groups.pop(group, {'alerts': []})['alerts']
+
+    def due_groups(self, cutoff):
+        """
+        Returns groups whose first alert was buffered at or before cutoff
+        """
+        with self._lock:
+            return [group for group, state in self._groups.items() if state['first_at'] <= cutoff]
+
+    def groups(self):
+        with self._lock:
+            return list(self._groups)
+
+class DynamoDBStore:
+    """
+    Buffer shared by every container, one item per group. Appends are
+    atomic, and a flush claims a group by deleting its item, so each alert
+    is sent by exactly one invocation. Every item is in the due index under
+    one partition sorted by firstAt, so finding due groups is a query for
+    the old end of that range rather than a scan of the table.
+    """
+    durable = True
+
+    def __init__(self, table_name=ALERT_DIGEST_TABLE, dynamodb=None, index_name=ALERT_DIGEST_DUE_INDEX):
+        self._table = (dynamodb or aws_clients.resource('dynamodb')).Table(table_name)
+        self.index_name = index_name
+
+    def append(self, group, alert, now):
+        response = self._table.update_item(
+            Key={'groupKey': group},
+            UpdateExpression=(
+                "SET alerts = list_append(if_not_exists(alerts, :empty), :alert), "
+                "firstAt = if_not_exists(firstAt, :now), due = :due"
+            ),
+            ExpressionAttributeValues={
+                ':empty': [], ':alert': [json.dumps(alert)], ':now': int(now), ':due': DUE_PARTITION
+            },
+            ReturnValues='ALL_NEW'
+        )
+        item = response['Attributes']
+        return len(item['alerts']), int(item['firstAt'])
+
+    def claim(self, group):
+        response = self._table.delete_item(Key={'groupKey': group}, ReturnValues='ALL_OLD')
+        return [json.loads(alert) for alert in response.get('Attributes', {}).get('alerts', [])]
+
+    def due_groups(self, cutoff=None):
+        """
+        Returns groups whose first alert was buffered at or before cutoff,
+        or every group. The index is eventually consistent, so a group just
+        claimed elsewhere may still be listed; claiming it again finds no
+        alerts.
+        """
+        groups = []
+        condition = Key('due').eq(DUE_PARTITION)
+        if cutoff is not None:
+            condition = condition & Key('firstAt').lte(int(cutoff))
+        kwargs = {'IndexName': self.index_name, 'KeyConditionExpression': condition}
+        while True:
+            response = self._table.query(**kwargs)
+            groups.extend(item['groupKey'] for item in response.get('Items', []))
+            if 'LastEvaluatedKey' not in response:
+                return groups
+            kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    def groups(self):
+        return self.due_groups()
+
+class AlertDigest:
+    """
+    Sends the notifications for one topic. Critical alerts are published at
+    once; others are buffered per group and sent as a digest once the group
+    holds max_alerts or its oldest alert is window_seconds old.
+    """
+
+    def __init__(self, topic_arn, subject, sns=None, store=None,
+                 window_seconds=ALERT_DIGEST_WINDOW_SECONDS,
+                 max_alerts=ALERT_DIGEST_MAX_ALERTS,
+                 critical_score=ALERT_CRITICAL_SCORE,
+                 clock=time.time):
+        self.topic_arn = topic_arn
+        self.subject = subject
+        self.sns = sns or aws_clients.client('sns')
+        self.window_seconds = window_seconds
+        self.max_alerts = max_alerts
+        self.critical_score = critical_score
+        self.requests = 0
+        self.published = 0
+        self._store = store
+        self._clock = clock
+
+    @property
+    def store(self):
+        if self._store is None:
+            self._store = create_store()
+        return self._store
+
+    def add(self, group, message, score=None, subject=None):
+        """
+        Sends or buffers one alert.
+
+        Args:
+            group (str): User or team the alert is digested for
+            message (dict): Alert message
+            score (int): Compliance score; alerts at or below the critical
+                score are published immediately
+            subject (str): Subject for the alert when sent on its own
+
+        Returns:
+            bool: Whether the alert was published immediately
+        """
+        alert = {'subject': subject or self.subject, 'message': message}
+        if score is not None and score <= self.critical_score:
+            self._publish_one(alert)
+            return True
+
+        count, first_at = self.store.append(group or 'unassigned', alert, self._clock())
+        if count >= self.max_alerts or self._clock() - first_at >= self.window_seconds:
+            self.flush([group or 'unassigned'])
+        return False
+
+    def flush(self, groups=None):
+        """
+        Sends the buffered alerts of the given groups, or of every group whose
+        window has elapsed. A group with one alert gets that alert as is.
+        """
+        if groups is None:
+            groups = self.store.due_groups(self._clock() - self.window_seconds)
+
+        entries = []
+        for group in groups:
+            alerts = self.store.claim(group)
+            if len(alerts) == 1:
+                entries.append((alerts[0], group, alerts))
+            elif alerts:
+                entries.append(({
+                    'subject': f"{self.subject} ({len(alerts)} calls)",
+                    'message': {
+                        'digest': True,
+                        'group': group,
+                        'count': len(alerts),
+                        'alerts': [alert['message'] for alert in alerts]
+                    }
+                }, group, alerts))
+
+        self._publish_batches(entries)
+
+    def close(self):
+        """
+        Flushes at the end of an invocation: every group for an in-process
+        store, only groups whose window has elapsed for a shared one
+        """
+        self.flush(None if self.store.durable else self.store.groups())
+
+    def _publish_one(self, alert):
+        self.sns.publish(
+            TopicArn=self.topic_arn,
+            Message=json.dumps(alert['message']),
+            Subject=alert['subject'][:MAX_SUBJECT_LENGTH]
+        )
+        self.requests += 1
+        self.published += 1
+
+    def _publish_batches(self, entries):
+        """
+        Sends (alert, group, buffered alerts) entries in as few PublishBatch
+        requests as the SNS limits allow. The alerts behind entries SNS
+        rejects, or that were not sent because a request raised, are
+        buffered again so a later flush sends them; delivered entries are
+        not, so nothing is sent twice.
+        """
+        batches = []
+        batch = []
+        size = 0
+        for entry in entries:
+            alert = entry[0]
+            request = {
+                'Message': json.dumps(alert['message']),
+                'Subject': alert['subject'][:MAX_SUBJECT_LENGTH]
+            }
+            request_size = len(request['Message'].encode('utf-8')) + len(request['Subject'].encode('utf-8'))
+            if batch and (len(batch) == PUBLISH_BATCH_ENTRIES or size + request_size > PUBLISH_BATCH_BYTES):
+                batches.append(batch)
+                batch, size = [], 0
+            batch.append((request, entry))
+            size += request_size
+        if batch:
+            batches.append(batch)
+
+        undelivered = []
+        for position, batch in enumerate(batches):
+            try:
+                failed = self._send_batch([request for request, entry in batch])
+            except Exception:
+                self._rebuffer(undelivered + [entry for pending in batches[position:] for request, entry in pending])
+                raise
+            undelivered.extend(batch[index][1] for index in failed)
+        self._rebuffer(undelivered)
+
+    def _rebuffer(self, entries):
+        for alert, group, alerts in entries:
+            for buffered in alerts:
+                self.store.append(group, buffered, self._clock())
+
+    def _send_batch(self, entries):
+        """
+        Sends one request and returns the indexes of the entries SNS rejected
+        """
+        failed = []
+        if len(entries) == 1:
+            entry = entries[0]
+            self.sns.publish(TopicArn=self.topic_arn, Message=entry['Message'], Subject=entry['Subject'])
+        else:
+            response = self.sns.publish_batch(
+                TopicArn=self.topic_arn,
+                PublishBatchRequestEntries=[dict(entry, Id=str(index)) for index, entry in enumerate(entries)]
+            )
+            for failure in response.get('Failed', []):
+                print(f"Alert digest entry {failure.get('Id')} failed: {failure.get('Message')}")
+                failed.append(int(failure['Id']))
+        self.requests += 1
+        self.published += len(entries) - len(failed)
+        return failed
+
+def create_store(name=ALERT_DIGEST_BACKEND):
+    """
+    Creates the store selected by ALERT_DIGEST_BACKEND
+    """
+    if name == 'dynamodb':
+        return DynamoDBStore()
+    if name == 'local':
+        return LocalStore()
+    raise ValueError(f"Unknown alert digest backend: {name}")
+
+def get_digest(topic_arn, subject, sns=None):
+    """
+    Returns the container-scoped AlertDigest for a topic and subject,
+    creating it on first use
+    """
+    key = (topic_arn, subject)
+    digest = _digests.get(key)
+    if digest is None:
+        with _digests_lock:
+            digest = _digests.get(key)
+            if digest is None:
+                digest = _digests[key] = AlertDigest(topic_arn, subject, sns)
+    return digest
@@ -0,0 +1,230 @@
+"""
+Analysis Cache Module for EchoGuard
+Content-addressed cache for Bedrock and Kiro analysis results, keyed by a
+hash of the normalized transcript, description, model and prompt version
+"""
+import collections
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+
+import aws_clients
+
+# Cache configuration
+ANALYSIS_CACHE_BACKEND = os.environ.get('ANALYSIS_CACHE_BACKEND', 'memory')
+ANALYSIS_CACHE_TABLE = os.environ.get('ANALYSIS_CACHE_TABLE', 'echoguard-analysis-cache')
+ANALYSIS_CACHE_PATH = os.environ.get('ANALYSIS_CACHE_PATH', '/tmp/echoguard-analysis-cache.db')
+ANALYSIS_CACHE_TTL_SECONDS = int(os.environ.get('ANALYSIS_CACHE_TTL_SECONDS', str(7 * 24 * 3600)))
+ANALYSIS_CACHE_MAX_ENTRIES = int(os.environ.get('ANALYSIS_CACHE_MAX_ENTRIES', '1000'))
+
+# Container-scoped cache, created on first use
+_cache = None
+_cache_lock = threading.Lock()
+
+def normalize_transcript(transcript_text):
+    """
+    Normalizes Unicode and whitespace so re-delivered transcripts hash the same
+    """
+    return ' '.join(unicodedata.normalize('NFC', transcript_text).split())
+
+def cache_key(transcript_text, description, model_id, prompt_version):
+    """
+    Builds the cache key for one analysis request.
+
+    Args:
+        transcript_text (str): The transcript being analyzed
+        description (str): Recording description passed to the analyzer
+        model_id (str): Model or endpoint that produces the analysis
+        prompt_version (str): Version of the prompt or request format
+
+    Returns:
+        str: Hex SHA-256 digest
+    """
+    material = json.dumps(
+        [normalize_transcript(transcript_text), description or '', model_id, prompt_version],
+        ensure_ascii=False
+    )
+    return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+class MemoryBackend:
+    """
+    In-process LRU backend with per-entry expiry
+    """
+
+    def __init__(self, max_entries=ANALYSIS_CACHE_MAX_ENTRIES, clock=time.time):
+        self.max_entries = max_entries
+        self._clock = clock
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= self._clock():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key, value, ttl_seconds):
+        with self._lock:
+            self._entries[key] = (self._clock() + ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+class SQLiteBackend:
+    """
+    SQLite backend for local runs, evicting least recently used entries
+    once max_entries is exceeded
+    """
+
+    def __init__(self, path=ANALYSIS_CACHE_PATH, max_entries=ANALYSIS_CACHE_MAX_ENTRIES, clock=time.time):
+        self.max_entries = max_entries
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS analysis_cache ("
+            "cache_key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+            "expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._connection.commit()
+
+    def get(self, key):
+        now = self._clock()
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT value, expires_at FROM analysis_cache WHERE cache_key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] <= now:
+                self._connection.execute("DELETE FROM analysis_cache WHERE cache_key = ?", (key,))
+                self._connection.commit()
+                return None
+            self._connection.execute(
+                "UPDATE analysis_cache SET accessed_at = ? WHERE cache_key = ?", (now, key)
+            )
+            self._connection.commit()
+            return json.loads(row[0])
+
+    def put(self, key, value, ttl_seconds):
+        now = self._clock()
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO analysis_cache VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), now + ttl_seconds, now)
+            )
+            self._connection.execute("DELETE FROM analysis_cache WHERE expires_at <= ?", (now,))
+            self._connection.execute(
+                "DELETE FROM analysis_cache WHERE cache_key IN ("
+                "SELECT cache_key FROM analysis_cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+            self._connection.commit()
+
+class DynamoDBBackend:
+    """
+    DynamoDB backend for production. Entries carry an expiresAt attribute
+    that the table's TTL setting uses to evict them. TTL only bounds how
+    old entries get; the table has no entry limit, so its size grows with
+    the number of distinct transcripts analyzed per TTL period.
+    """
+
+    def __init__(self, table_name=ANALYSIS_CACHE_TABLE, dynamodb=None, clock=time.time):
+        self._clock = clock
+        self._table = (dynamodb or aws_clients.resource('dynamodb')).Table(table_name)
+
+    def get(self, key):
+        item = self._table.get_item(Key={'cacheKey': key}).get('Item')
+        # TTL deletion is lazy, so expired items can still be returned for a while
+        if item is None or item['expiresAt'] <= self._clock():
+            return None
+        return json.loads(item['value'])
+
+    def put(self, key, value, ttl_seconds):
+        self._table.put_item(Item={
+            'cacheKey': key,
+            'value': json.dumps(value),
+            'expiresAt': int(self._clock() + ttl_seconds)
+        })
+
+class AnalysisCache:
+    """
+    Cache front end that counts hits and misses and never lets a backend
+    error fail an analysis. It is shared by the analysis threads, so the
+    counters are updated under a lock.
+    """
+
+    def __init__(self, backend, ttl_seconds=ANALYSIS_CACHE_TTL_SECONDS):
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Returns the cached result for key, or None on a miss
+        """
+        try:
+            value = self.backend.get(key)
+        except Exception as e:
+            print(f"Analysis cache read error: {str(e)}")
+            self._count('errors')
+            value = None
+        self._count('misses' if value is None else 'hits')
+        return value
+
+    def put(self, key, value):
+        """
+        Stores a result under key
+        """
+        try:
+            self.backend.put(key, value, self.ttl_seconds)
+        except Exception as e:
+            print(f"Analysis cache write error: {str(e)}")
+            self._count('errors')
+
+    def stats(self):
+        """
+        Returns hit, miss and error counters since the container started
+        """
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'errors': self.errors}
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+def create_backend(name=ANALYSIS_CACHE_BACKEND):
+    """
+    Creates the backend selected by ANALYSIS_CACHE_BACKEND
+    """
+    if name == 'dynamodb':
+        return DynamoDBBackend()
+    if name == 'sqlite':
+        return SQLiteBackend()
+    if name == 'memory':
+        return MemoryBackend()
+    raise ValueError(f"Unknown analysis cache backend: {name}")
+
+def get_cache():
+    """
+    Returns the container-scoped AnalysisCache, creating it on first use
+    """
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = AnalysisCache(create_backend())
+    return _cache
@@ -1,15 +1,25 @@
 import json
-import boto3
 import os
+import threading
 import time
-import requests
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError, wait
+from decimal import Decimal
 from botocore.exceptions import ClientError
 
-# Initialize AWS clients
-s3 = boto3.client('s3')
-dynamodb = boto3.resource('dynamodb')
-sns = boto3.client('sns')
-bedrock = boto3.client('bedrock-runtime')
+import alert_digest
+import analysis_cache
+import aws_clients
+import bedrock_stream
+import blob_store
+import kiro_client
+import kiro_integration
+import media_dedup
+import prompt_compaction
+import rate_limiter
+import record_dispatch
+import tiered_analysis
+import transcript_chunker
+import transcript_reader
 
 # Environment variables
 TRANSCRIPT_BUCKET = os.environ.get('TRANSCRIPT_BUCKET', 'echoguard-transcripts-656570226565')
@@ -18,88 +28,325 @@ RESULTS_TABLE = os.environ.get('RESULTS_TABLE', 'echoguard-results')
 NOTIFICATION_TOPIC_ARN = os.environ.get('NOTIFICATION_TOPIC_ARN', 'arn:aws:sns:us-east-1:656570226565:echoguard-notifications')
 KIRO_API_ENDPOINT = os.environ.get('KIRO_API_ENDPOINT', 'https://api.kiro.ai/compliance/analyze')
 KIRO_API_KEY = os.environ.get('KIRO_API_KEY', 'kiro-api-key')
+BEDROCK_TIMEOUT_SECONDS = float(os.environ.get('BEDROCK_TIMEOUT_SECONDS', '120'))
+KIRO_TIMEOUT_SECONDS = float(os.environ.get('KIRO_TIMEOUT_SECONDS', '60'))
+BEDROCK_MODEL_ID = os.environ.get('BEDROCK_MODEL_ID', 'anthropic.claude-v2')
+BEDROCK_CHUNK_WORKERS = int(os.environ.get('BEDROCK_CHUNK_WORKERS', '4'))
+
+# Bump when the Bedrock prompt or Kiro payload changes so cached results are not reused
+BEDROCK_PROMPT_VERSION = '1'
+KIRO_REQUEST_VERSION = '1'
+
+# AWS clients, created on first use
+s3 = aws_clients.LazyClient('s3')
+dynamodb = aws_clients.LazyResource('dynamodb')
+sns = aws_clients.LazyClient('sns')
+bedrock = aws_clients.LazyClient('bedrock-runtime', read_timeout=BEDROCK_TIMEOUT_SECONDS)
+
+# Threads for the remote analyses, reused across warm invocations
+analysis_executor = ThreadPoolExecutor(
+    max_workers=4 * max(1, record_dispatch.RECORD_CONCURRENCY), thread_name_prefix='analysis'
+)
+
+# Separate pool for transcript chunks, so chunk calls never wait on the analyses that submit them
+chunk_executor = ThreadPoolExecutor(max_workers=BEDROCK_CHUNK_WORKERS, thread_name_prefix='bedrock-chunk')
+
+class AnalysisUnavailableError(Exception):
+    """
+    Raised when the Bedrock analysis fails or misses its deadline, so the
+    record fails and is retried instead of storing a made-up score
+    """
 
 def lambda_handler(event, context):
     """
     Handles analysis of transcripts using Amazon Bedrock and Kiro AI.
     
-    Expected SNS event format:
+    Expected SNS or SQS message format:
     {
         "recordingId": "abc-123",
         "transcriptKey": "abc-123/transcript.json",
         "bucket": "echoguard-transcripts-656570226565"
     }
+    
+    Every record in the event is analyzed; failed SQS messages are returned
+    in batchItemFailures and a failed SNS record fails the invocation so
+    Lambda retries it. Completion notifications buffered during the
+    invocation are flushed before it returns; digest_flush_handler sends
+    the digests whose window elapses between invocations.
     """
     try:
-        # Extract message from SNS event
-        message = json.loads(event['Records'][0]['Sns']['Message'])
+        return record_dispatch.dispatch(event, analyze_record, 'Error analyzing transcript')
+    finally:
+        notifications = completion_notifications()
+        try:
+            notifications.close()
+        except Exception as e:
+            print(f"Error flushing completion notifications: {str(e)}")
+        print(f"SNS requests: {notifications.requests} for {notifications.published} notifications")
+
+def analyze_record(record):
+    """
+    Analyzes the transcript referenced by one SNS or SQS record
+    """
+    usage = DynamoDBUsage()
+    
+    try:
+        # Extract message from the record
+        message = record_dispatch.message(record)
         
         recording_id = message.get('recordingId')
         transcript_key = message.get('transcriptKey')
         bucket = message.get('bucket', TRANSCRIPT_BUCKET)
         
-        # Update recording status in DynamoDB
-        update_recording_status(recording_id, 'ANALYZING')
+        # Mark the recording as analyzing and read its metadata while the transcript downloads
+        recording_future = analysis_executor.submit(start_recording_analysis, recording_id, usage)
         
-        # Get transcript from S3
+        # Stream the transcript from S3; word items are scanned as they are read
         transcript_obj = s3.get_object(Bucket=bucket, Key=transcript_key)
-        transcript_data = json.loads(transcript_obj['Body'].read().decode('utf-8'))
+        transcript = transcript_reader.open_transcript(transcript_obj['Body'])
+        
+        # Scan the word stream for keyword findings before the remote analyses
+        keyword_findings, keyword_results, evidence = scan_keyword_findings(transcript.items)
+        
+        # Escalate to Bedrock only when the keyword tier is not confident
+        tier = tiered_analysis.choose_tier(keyword_results, evidence=evidence)
+        print(f"Verdict tier: {tier.tier}" + (f" ({tier.band} band)" if tier.band else ""))
         
         # Extract transcript text
-        transcript_text = transcript_data['results']['transcripts'][0]['transcript']
+        transcript_text = transcript.transcript
         
         # Get recording metadata
-        recordings_table = dynamodb.Table(RECORDINGS_TABLE)
-        recording = recordings_table.get_item(Key={'recordingId': recording_id})['Item']
-        
-        # Analyze with Amazon Bedrock
-        bedrock_results = analyze_with_bedrock(transcript_text, recording.get('description', ''))
+        recording = recording_future.result()
         
-        # Analyze with Kiro AI
-        kiro_results = analyze_with_kiro(transcript_text, recording.get('description', ''))
+        # Analyze with Amazon Bedrock and Kiro AI concurrently
+        bedrock_results, kiro_results = run_analyses(transcript_text, recording.get('description', ''), tier)
         
         # Calculate compliance score
         compliance_score = calculate_compliance_score(bedrock_results, kiro_results)
         
-        # Store analysis results in DynamoDB
-        store_analysis_results(recording_id, transcript_text, bedrock_results, kiro_results, compliance_score)
+        # Store analysis results and mark the recording completed in one transaction
+        store_analysis_results(
+            recording_id, transcript_text, bedrock_results, kiro_results,
+            compliance_score, keyword_findings, usage, tier.tier
+        )
         
-        # Update recording status and score
-        update_recording_completed(recording_id, compliance_score)
+        # Recordings uploaded again with the same media share the result
+        share_with_duplicates(recording, {'status': 'COMPLETED', 'complianceScore': compliance_score,
+                                          'verdictTier': tier.tier})
         
         # Send notification
         send_completion_notification(recording_id, compliance_score, recording.get('userId'))
         
+        print(f"Analysis cache stats: {analysis_cache.get_cache().stats()}")
+        print(f"DynamoDB usage: {usage.summary()}")
+        
         return {
-            'statusCode': 200,
-            'body': json.dumps({
-                'message': 'Analysis completed successfully',
-                'recordingId': recording_id,
-                'complianceScore': compliance_score
-            })
+            'message': 'Analysis completed successfully',
+            'recordingId': recording_id,
+            'complianceScore': compliance_score,
+            'verdictTier': tier.tier
         }
         
     except Exception as e:
         print(f"Error: {str(e)}")
         
-        # Update recording status to error if we have a recording ID
+        # Update recording status to error if we have a recording ID,
+        # after the ANALYZING update so the error status is not overwritten
+        if 'recording_future' in locals():
+            wait([recording_future])
         if 'recording_id' in locals():
-            update_recording_status(recording_id, 'ANALYSIS_ERROR')
+            update_recording_status(recording_id, 'ANALYSIS_ERROR', usage)
+        if 'recording_future' in locals() and recording_future.exception() is None:
+            share_with_duplicates(recording_future.result(), {'status': 'ANALYSIS_ERROR'})
         
+        raise
+
+class DynamoDBUsage:
+    """
+    Per-invocation counters for DynamoDB round-trips and consumed capacity
+    """
+    
+    def __init__(self):
+        self.round_trips = 0
+        self.read_units = 0.0
+        self.write_units = 0.0
+        self._lock = threading.Lock()
+    
+    def record(self, response, kind):
+        """
+        Counts one call and the capacity it reports as 'read' or 'write' units
+        """
+        consumed = response.get('ConsumedCapacity') or []
+        if isinstance(consumed, dict):
+            consumed = [consumed]
+        units = sum(capacity.get('CapacityUnits', 0) for capacity in consumed)
+        
+        with self._lock:
+            self.round_trips += 1
+            if kind == 'read':
+                self.read_units += units
+            else:
+                self.write_units += units
+    
+    def summary(self):
         return {
-            'statusCode': 500,
-            'body': json.dumps({
-                'message': 'Error analyzing transcript',
-                'error': str(e)
-            })
+            'roundTrips': self.round_trips,
+            'readCapacityUnits': self.read_units,
+            'writeCapacityUnits': self.write_units
         }
 
-def analyze_with_bedrock(transcript_text, description):
+def start_recording_analysis(recording_id, usage):
     """
-    Analyzes transcript using Amazon Bedrock
+    Sets the recording status to ANALYZING and returns the updated recording,
+    replacing a separate status update and metadata read with one call
     """
+    recordings_table = dynamodb.Table(RECORDINGS_TABLE)
+    response = recordings_table.update_item(
+        Key={'recordingId': recording_id},
+        UpdateExpression="set #status = :status, updatedAt = :timestamp",
+        ConditionExpression="attribute_exists(recordingId)",
+        ExpressionAttributeNames={
+            '#status': 'status'
+        },
+        ExpressionAttributeValues={
+            ':status': 'ANALYZING',
+            ':timestamp': int(time.time())
+        },
+        ReturnValues='ALL_NEW',
+        ReturnConsumedCapacity='TOTAL'
+    )
+    usage.record(response, 'write')
+    return response['Attributes']
+
+def scan_keyword_findings(items):
+    """
+    Scans Transcribe word items for compliance keywords, logging each
+    finding with its word-level timestamps as soon as it is found.
+    
+    Returns:
+        tuple: Findings to store, the keyword tier result, and the
+            ScanEvidence of the words scanned
+    """
+    findings = []
+    evidence = tiered_analysis.ScanEvidence()
+    
+    def on_finding(finding):
+        print(f"Keyword finding '{finding['keyword']}' at {finding['start_time']}s-{finding['end_time']}s")
+        findings.append({
+            'keyword': finding['keyword'],
+            'issue': finding['issue'],
+            'confidence': to_decimal(finding['confidence']),
+            'startTime': to_decimal(finding['start_time']),
+            'endTime': to_decimal(finding['end_time'])
+        })
+    
+    keyword_results = kiro_integration.analyze_compliance_items(evidence.track(items), on_finding=on_finding)
+    return findings, keyword_results, evidence
+
+def to_decimal(value):
+    """
+    Converts a float to a Decimal DynamoDB can store
+    """
+    return None if value is None else Decimal(str(value))
+
+def run_analyses(transcript_text, description, tier=None):
+    """
+    Runs the Bedrock and Kiro analyses concurrently, each against its own
+    deadline. The deadline is passed down to the provider calls, which stop
+    waiting, retrying and reading responses once it passes, so a late call
+    frees its analysis_executor worker soon after. If Bedrock misses its
+    deadline AnalysisUnavailableError is raised, so a slow Bedrock fails the
+    record rather than holding up the invocation, and the analyses that have
+    not started yet are cancelled; cancelling does not stop a call that is
+    already running. A Kiro call that misses its deadline is reported as
+    unavailable instead.
+    
+    When the keyword tier produced the verdict, Bedrock is not called and
+    the keyword verdict takes the place of its result.
+    """
+    started = time.monotonic()
+    kiro_deadline = started + KIRO_TIMEOUT_SECONDS
+    analyses = [
+        ('Kiro', analysis_executor.submit(analyze_with_kiro, transcript_text, description, kiro_deadline),
+         KIRO_TIMEOUT_SECONDS, kiro_unavailable_result)
+    ]
+    if tier is None or tier.tier == tiered_analysis.BEDROCK_TIER:
+        bedrock_deadline = started + BEDROCK_TIMEOUT_SECONDS
+        analyses.insert(0, (
+            'Bedrock', analysis_executor.submit(analyze_with_bedrock, transcript_text, description, bedrock_deadline),
+            BEDROCK_TIMEOUT_SECONDS, None
+        ))
+    
+    results = []
+    for name, future, timeout, unavailable in analyses:
+        remaining = timeout - (time.monotonic() - started)
+        try:
+            results.append(future.result(timeout=max(0, remaining)))
+        except FutureTimeoutError:
+            if unavailable is not None:
+                future.cancel()
+                print(f"{name} analysis timed out after {timeout}s")
+                results.append(unavailable(f"timed out after {timeout}s"))
+                continue
+            for _, pending, _, _ in analyses:
+                pending.cancel()
+            raise AnalysisUnavailableError(f"{name} analysis timed out after {timeout}s")
+    
+    if len(results) == 1:
+        results.insert(0, tier.results)
+    return tuple(results)
+
+def analyze_with_bedrock(transcript_text, description, deadline=None):
+    """
+    Analyzes transcript using Amazon Bedrock, reusing the cached result for
+    an identical transcript, description, model and prompt version.
+    
+    Filler and repeated words are removed before prompting. Transcripts
+    over the chunk token budget are then split into overlapping chunks that
+    are analyzed in parallel and merged into one result. No Bedrock call is
+    started or read after deadline, a time.monotonic() value.
+    
+    Raises:
+        AnalysisUnavailableError: If Bedrock cannot analyze the transcript
+    """
+    cache = analysis_cache.get_cache()
+    cache_key = analysis_cache.cache_key(transcript_text, description, BEDROCK_MODEL_ID, BEDROCK_PROMPT_VERSION)
+    cached = cache.get(cache_key)
+    if cached is not None:
+        print("Bedrock analysis served from cache")
+        return cached
+    
     try:
-        prompt = f"""
+        compaction = prompt_compaction.compact_transcript(transcript_text)
+        print(f"Prompt compaction saved {compaction.tokens_saved} of {compaction.original_tokens} estimated tokens")
+        
+        chunks = transcript_chunker.chunk_transcript(compaction.text)
+        if len(chunks) <= 1:
+            result = invoke_bedrock_analysis(compaction.text, description, deadline)
+        else:
+            print(f"Analyzing transcript in {len(chunks)} chunks")
+            results = list(chunk_executor.map(
+                lambda chunk: invoke_bedrock_analysis(
+                    chunk.text, f"{description} (transcript part {chunk.index + 1} of {len(chunks)})", deadline
+                ),
+                chunks
+            ))
+            result = transcript_chunker.merge_results(chunks, results)
+        
+        cache.put(cache_key, result)
+        return result
+        
+    except Exception as e:
+        # Fail the record so Lambda retries it, rather than storing a made-up score
+        print(f"Bedrock analysis error: {str(e)}")
+        raise AnalysisUnavailableError(f"Bedrock analysis failed: {str(e)}") from e
+
+def invoke_bedrock_analysis(transcript_text, description, deadline=None):
+    """
+    Sends one compliance analysis prompt to Amazon Bedrock and parses the
+    JSON result from the response stream as it arrives
+    """
+    prompt = f"""
         You are a compliance expert analyzing a transcript of a conversation. 
         Identify any potential compliance issues in the following transcript.
         
@@ -127,47 +374,39 @@ def analyze_with_bedrock(transcript_text, description):
             "summary": "Brief summary of compliance analysis"
         }}
         """
-        
-        # Call Amazon Bedrock
-        response = bedrock.invoke_model(
-            modelId='anthropic.claude-v2',
-            body=json.dumps({
-                "prompt": f"\n\nHuman: {prompt}\n\nAssistant:",
-                "max_tokens_to_sample": 4000,
-                "temperature": 0.1
-            })
-        )
-        
-        response_body = json.loads(response['body'].read())
-        result_text = response_body['completion']
-        
-        # Extract JSON from the response
-        json_start = result_text.find('{')
-        json_end = result_text.rfind('}') + 1
-        json_str = result_text[json_start:json_end]
-        
-        return json.loads(json_str)
-        
-    except Exception as e:
-        print(f"Bedrock analysis error: {str(e)}")
-        # Return a default response in case of error
-        return {
-            "issues": [],
-            "overall_score": 50,
-            "summary": "Error analyzing transcript with Bedrock"
-        }
+    
+    # Call Amazon Bedrock through the shared limiter, reading only until the
+    # JSON result is complete or the deadline passes
+    limiter = rate_limiter.get_limiter(f"bedrock:{BEDROCK_MODEL_ID}")
+    result = limiter.call_before(deadline, bedrock_stream.invoke_json, bedrock, BEDROCK_MODEL_ID, {
+        "prompt": f"\n\nHuman: {prompt}\n\nAssistant:",
+        "max_tokens_to_sample": 4000,
+        "temperature": 0.1
+    }, deadline=deadline)
+    print(f"Bedrock first token after {result.time_to_first_token:.2f}s, result complete after {result.latency:.2f}s")
+    
+    return result.value
 
-def analyze_with_kiro(transcript_text, description):
+def analyze_with_kiro(transcript_text, description, deadline=None):
     """
-    Analyzes transcript using Kiro AI
+    Analyzes transcript using Kiro AI, reusing the cached result for an
+    identical transcript, description, endpoint and request version. The
+    call is not retried or waited on past deadline, a time.monotonic()
+    value, which defaults to KIRO_TIMEOUT_SECONDS from now.
+    
+    When Kiro is unavailable or the call fails, the analysis goes ahead on
+    the Bedrock result alone: kiro_unavailable_result() is returned, and
+    not cached, so a later analysis calls Kiro again.
     """
+    cache = analysis_cache.get_cache()
+    cache_key = analysis_cache.cache_key(transcript_text, description, KIRO_API_ENDPOINT, KIRO_REQUEST_VERSION)
+    cached = cache.get(cache_key)
+    if cached is not None:
+        print("Kiro analysis served from cache")
+        return cached
+    
     try:
         # Prepare request to Kiro AI API
-        headers = {
-            'Authorization': f'Bearer {KIRO_API_KEY}',
-            'Content-Type': 'application/json'
-        }
-        
         payload = {
             'transcript': transcript_text,
             'context': description,
@@ -175,26 +414,41 @@ def analyze_with_kiro(transcript_text, description):
             'detailed': True
         }
         
-        # Call Kiro AI API
-        response = requests.post(KIRO_API_ENDPOINT, headers=headers, json=payload)
-        response.raise_for_status()
+        # Call Kiro AI API, retrying only while the analysis deadline allows
+        client = kiro_client.get_client(KIRO_API_ENDPOINT, KIRO_API_KEY)
+        if deadline is None:
+            deadline = time.monotonic() + KIRO_TIMEOUT_SECONDS
+        result = client.analyze(payload, deadline=deadline)
+        cache.put(cache_key, result)
+        return result
         
-        return response.json()
+    except kiro_client.CircuitOpenError as e:
+        print(f"Kiro unavailable, skipping call: {str(e)}")
+        return kiro_unavailable_result(str(e))
         
     except Exception as e:
         print(f"Kiro analysis error: {str(e)}")
-        # Return a default response in case of error
-        return {
-            "financial_compliance_score": 50,
-            "issues": [],
-            "summary": "Error analyzing transcript with Kiro AI"
-        }
+        return kiro_unavailable_result(f"analysis failed: {str(e)}")
+
+def kiro_unavailable_result(reason):
+    """
+    Kiro result used when Kiro could not analyze the transcript. It has no
+    score, so the compliance score is Bedrock's alone.
+    """
+    return {
+        "available": False,
+        "issues": [],
+        "summary": f"Kiro AI analysis unavailable: {reason}"
+    }
 
 def calculate_compliance_score(bedrock_results, kiro_results):
     """
-    Calculates overall compliance score based on both analysis results
+    Calculates overall compliance score based on both analysis results,
+    or on Bedrock's alone when Kiro was unavailable
     """
     bedrock_score = bedrock_results.get('overall_score', 50)
+    if kiro_results.get('available') is False:
+        return round(bedrock_score)
     kiro_score = kiro_results.get('financial_compliance_score', 50)
     
     # Weight Kiro AI higher for financial compliance
@@ -202,19 +456,21 @@ def calculate_compliance_score(bedrock_results, kiro_results):
     
     return round(weighted_score)
 
-def store_analysis_results(recording_id, transcript_text, bedrock_results, kiro_results, compliance_score):
+def store_analysis_results(recording_id, transcript_text, bedrock_results, kiro_results, compliance_score,
+                           keyword_findings=None, usage=None, verdict_tier=tiered_analysis.BEDROCK_TIER):
     """
-    Stores analysis results in DynamoDB
+    Stores analysis results and sets the recording to COMPLETED with its
+    score in a single DynamoDB transaction. The transcript and raw provider
+    results are stored compressed via blob_store to keep the item small.
     """
-    results_table = dynamodb.Table(RESULTS_TABLE)
-    
     # Combine issues from both analyses
     all_issues = []
     
-    # Add Bedrock issues
+    # Add Bedrock issues, or the keyword tier's when it produced the verdict
+    bedrock_source = 'Bedrock' if verdict_tier == tiered_analysis.BEDROCK_TIER else 'Keyword analysis'
     for issue in bedrock_results.get('issues', []):
         all_issues.append({
-            'source': 'Bedrock',
+            'source': bedrock_source,
             'description': issue.get('description', ''),
             'risk_level': issue.get('risk_level', 'Medium'),
             'recommendation': issue.get('recommendation', '')
@@ -229,27 +485,79 @@ def store_analysis_results(recording_id, transcript_text, bedrock_results, kiro_
             'recommendation': issue.get('recommendation', '')
         })
     
-    # Store results
-    results_table.put_item(
-        Item={
-            'recordingId': recording_id,
-            'transcript': transcript_text,
-            'bedrockResults': bedrock_results,
-            'kiroResults': kiro_results,
-            'issues': all_issues,
-            'complianceScore': compliance_score,
-            'bedrockSummary': bedrock_results.get('summary', ''),
-            'kiroSummary': kiro_results.get('summary', ''),
-            'timestamp': int(time.time())
-        }
+    # Compress the large fields, offloading any that are still big to S3
+    transcript_blob, bedrock_blob, kiro_blob = analysis_executor.map(
+        lambda field: blob_store.store_field(s3, TRANSCRIPT_BUCKET, recording_id, *field),
+        [('transcript', transcript_text), ('bedrockResults', bedrock_results), ('kiroResults', kiro_results)]
     )
+    
+    timestamp = int(time.time())
+    results_item = {
+        'recordingId': recording_id,
+        'transcript': transcript_blob,
+        'bedrockResults': bedrock_blob,
+        'kiroResults': kiro_blob,
+        'issues': all_issues,
+        'keywordFindings': keyword_findings or [],
+        'complianceScore': compliance_score,
+        'verdictTier': verdict_tier,
+        'bedrockSummary': bedrock_results.get('summary', ''),
+        'kiroSummary': kiro_results.get('summary', ''),
+        'kiroAvailable': kiro_results.get('available', True),
+        'timestamp': timestamp
+    }
+    
+    response = dynamodb.meta.client.transact_write_items(
+        TransactItems=[
+            {
+                'Put': {
+                    'TableName': RESULTS_TABLE,
+                    'Item': to_dynamodb_value(results_item)
+                }
+            },
+            {
+                'Update': {
+                    'TableName': RECORDINGS_TABLE,
+                    'Key': {'recordingId': recording_id},
+                    'UpdateExpression': (
+                        "set #status = :status, complianceScore = :score, verdictTier = :tier, updatedAt = :timestamp"
+                    ),
+                    'ExpressionAttributeNames': {
+                        '#status': 'status'
+                    },
+                    'ExpressionAttributeValues': to_dynamodb_value({
+                        ':status': 'COMPLETED',
+                        ':score': compliance_score,
+                        ':tier': verdict_tier,
+                        ':timestamp': timestamp
+                    })
+                }
+            }
+        ],
+        ReturnConsumedCapacity='TOTAL'
+    )
+    if usage is not None:
+        usage.record(response, 'write')
 
-def update_recording_status(recording_id, status):
+def to_dynamodb_value(value):
+    """
+    Converts floats, which DynamoDB rejects, to Decimals throughout a value.
+    The resource's client serializes the rest of the native Python types.
+    """
+    if isinstance(value, float):
+        return to_decimal(value)
+    if isinstance(value, dict):
+        return {name: to_dynamodb_value(item) for name, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_dynamodb_value(item) for item in value]
+    return value
+
+def update_recording_status(recording_id, status, usage=None):
     """
     Updates the status of a recording in DynamoDB
     """
     recordings_table = dynamodb.Table(RECORDINGS_TABLE)
-    recordings_table.update_item(
+    response = recordings_table.update_item(
         Key={'recordingId': recording_id},
         UpdateExpression="set #status = :status, updatedAt = :timestamp",
         ExpressionAttributeNames={
@@ -258,30 +566,38 @@ def update_recording_status(recording_id, status):
         ExpressionAttributeValues={
             ':status': status,
             ':timestamp': int(time.time())
-        }
+        },
+        ReturnConsumedCapacity='TOTAL'
     )
+    if usage is not None:
+        usage.record(response, 'write')
 
-def update_recording_completed(recording_id, compliance_score):
+def share_with_duplicates(recording, outcome):
     """
-    Updates the recording with completed status and compliance score
+    Gives the recordings linked to this one's media its final status and
+    score. Errors are logged so they do not undo the recording's own result.
     """
-    recordings_table = dynamodb.Table(RECORDINGS_TABLE)
-    recordings_table.update_item(
-        Key={'recordingId': recording_id},
-        UpdateExpression="set #status = :status, complianceScore = :score, updatedAt = :timestamp",
-        ExpressionAttributeNames={
-            '#status': 'status'
-        },
-        ExpressionAttributeValues={
-            ':status': 'COMPLETED',
-            ':score': compliance_score,
-            ':timestamp': int(time.time())
-        }
-    )
+    if not recording.get('contentHash'):
+        return
+    try:
+        media_dedup.update_duplicates(
+            dynamodb.Table(RECORDINGS_TABLE),
+            to_dynamodb_value(dict(outcome, recordingId=recording['recordingId'])),
+            media_dedup.duplicates(recording['contentHash'], recording['recordingId'])
+        )
+    except Exception as e:
+        print(f"Error updating duplicates of {recording['recordingId']}: {str(e)}")
+
+def completion_notifications():
+    """
+    Returns the digest that batches completion notifications per user
+    """
+    return alert_digest.get_digest(NOTIFICATION_TOPIC_ARN, alert_digest.COMPLETION_SUBJECT, sns)
 
 def send_completion_notification(recording_id, compliance_score, user_id):
     """
-    Sends an SNS notification about completed analysis
+    Sends an SNS notification about completed analysis. Notifications are
+    digested per user; scores at or below ALERT_CRITICAL_SCORE are sent at once.
     """
     message = {
         'recordingId': recording_id,
@@ -290,8 +606,4 @@ def send_completion_notification(recording_id, compliance_score, user_id):
         'timestamp': int(time.time())
     }
     
-    sns.publish(
-        TopicArn=NOTIFICATION_TOPIC_ARN,
-        Message=json.dumps(message),
-        Subject='Compliance Analysis Completed'
-    )
\ No newline at end of file
+    completion_notifications().add(user_id, message, compliance_score)
\ No newline at end of file
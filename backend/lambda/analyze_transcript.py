@@ -1,109 +1,95 @@
-import boto3
 import json
 import os
 import uuid
 import logging
 from datetime import datetime
+from decimal import Decimal
 
 # Import Kiro integration
 import kiro_integration
+import alert_digest
+import aws_clients
+import bedrock_stream
+import prompt_compaction
+import rule_packs
+import rate_limiter
+import record_dispatch
+import speaker_segments
+import transcript_reader
 
 # Configure logging
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
+BEDROCK_MODEL_ID = 'anthropic.claude-3-sonnet-20240229-v1:0'
+
+# Team that low-score alerts are digested for
+ALERT_GROUP = os.environ.get('ALERT_GROUP', 'compliance')
+
+# AWS clients, created on first use and reused by warm invocations
+s3 = aws_clients.LazyClient('s3')
+bedrock = aws_clients.LazyClient('bedrock-runtime')
+dynamodb = aws_clients.LazyResource('dynamodb')
+sns = aws_clients.LazyClient('sns')
+
 def lambda_handler(event, context):
     logger.info(f"Received event: {json.dumps(event)}")
     
+    # Analyze every transcript in the batch, then send the buffered alerts
+    try:
+        return record_dispatch.dispatch(
+            event, lambda record: record_dispatch.process_s3_objects(record, analyze_transcript)
+        )
+    finally:
+        try:
+            compliance_alerts().close()
+        except Exception as e:
+            logger.error(f"Error flushing compliance alerts: {str(e)}")
+
+def analyze_transcript(bucket, key):
+    """
+    Analyzes one transcript file written by Amazon Transcribe
+    """
     try:
-        # Initialize AWS clients
-        s3 = boto3.client('s3')
-        bedrock = boto3.client('bedrock-runtime')
-        dynamodb = boto3.resource('dynamodb')
-        sns = boto3.client('sns')
-        
-        # Get the transcript file details
-        key = event['Records'][0]['s3']['object']['key']
-        bucket = event['Records'][0]['s3']['bucket']['name']
         logger.info(f"Processing transcript from s3://{bucket}/{key}")
         
-        # Get the transcript content
+        # Stream the transcript content, decoding only the text, word items and speaker labels
         obj = s3.get_object(Bucket=bucket, Key=key)
-        transcript_data = json.loads(obj['Body'].read())
-        transcript = transcript_data['results']['transcripts'][0]['transcript']
+        stream = transcript_reader.open_transcript(obj['Body'], speaker_labels=True)
+        transcript = stream.transcript
+        items = list(stream.items)
         
         # Extract job name from the key to link back to original audio
         job_name = key.replace('.json', '')
         
-        # Prepare the prompt for Bedrock
-        prompt = f"""Human: Analyze this customer call transcript for compliance issues. 
-        Provide your analysis in JSON format with the following fields:
-        - complianceScore: a number from 0-100 indicating overall compliance
-        - tone: a single word describing the overall tone (e.g., 'professional', 'aggressive', 'confused')
-        - violations: an array of potential compliance violations found
-        - summary: a brief summary of the call
-        
-        Here is the transcript:
-        {transcript}
+        # Split the call into speaker turns and keep the ones we score
+        turns = speaker_segments.turns_from_items(items, stream.speaker_labels)
+        agent = speaker_segments.identify_agent(turns)
+        scored_turns = speaker_segments.select_turns(turns, agent)
+        if turns:
+            logger.info(f"Analyzing {len(scored_turns)} of {len(turns)} speaker turns, agent is {agent}")
         
-        Assistant: """
-        
-        logger.info("Sending transcript to Bedrock for analysis")
-        
-        # Try to call Bedrock for analysis
-        try:
-            logger.info("Attempting to use Bedrock for analysis")
-            response = bedrock.invoke_model(
-                modelId='anthropic.claude-3-sonnet-20240229-v1:0',
-                body=json.dumps({
-                    "anthropic_version": "bedrock-2023-05-31",
-                    "max_tokens": 1000,
-                    "messages": [
-                        {"role": "user", "content": prompt}
-                    ]
-                }),
-                contentType='application/json'
-            )
-            
-            # Parse the response
-            response_body = json.loads(response.get('body').read())
-            response_content = response_body.get('content', [{}])[0].get('text', '{}')
-            
-            # Try to extract JSON from the response
-            if '```json' in response_content:
-                json_str = response_content.split('```json')[1].split('```')[0].strip()
-            elif '```' in response_content:
-                json_str = response_content.split('```')[1].split('```')[0].strip()
-            else:
-                json_str = response_content.strip()
-                
-            analysis = json.loads(json_str)
-            logger.info("Bedrock analysis successful")
-            
-        except Exception as e:
-            logger.warning(f"Bedrock analysis failed: {str(e)}. Using default analysis.")
-            # Create a default analysis if Bedrock fails
-            analysis = {
-                "complianceScore": 70,
-                "tone": "neutral",
-                "violations": [],
-                "summary": "Transcript analyzed using fallback method"
-            }
-            
         # Call Kiro for enhanced compliance analysis
+        kiro_results = None
         try:
             logger.info("Sending transcript to Kiro for enhanced compliance analysis")
             metadata = {
                 "job_name": job_name,
                 "source": "amazon_transcribe"
             }
-            kiro_results = kiro_integration.analyze_compliance(transcript, metadata)
+            if turns:
+                # Scan the scored turns and attribute each finding to its speaker
+                kiro_results = kiro_integration.analyze_compliance_items(
+                    speaker_segments.turn_items(scored_turns), metadata,
+                    on_finding=lambda finding: log_finding(speaker_segments.label_finding(finding, scored_turns, agent))
+                )
+            elif items:
+                # Scan the word stream so findings are available as soon as they are found
+                kiro_results = kiro_integration.analyze_compliance_items(items, metadata, on_finding=log_finding)
+            else:
+                kiro_results = kiro_integration.analyze_compliance(transcript, metadata)
             
             if kiro_results:
-                # Enhance the analysis with Kiro results
-                analysis["kiroScore"] = kiro_results.get("compliance_score")
-                analysis["kiroFindings"] = kiro_results.get("findings")
-                analysis["kiroRecommendations"] = kiro_results.get("recommendations")
                 logger.info(f"Kiro analysis complete: {json.dumps(kiro_results)}")
             else:
                 logger.warning("Kiro analysis failed or returned no results")
@@ -112,6 +98,23 @@ def lambda_handler(event, context):
             logger.error(f"Error during Kiro analysis: {str(e)}")
             # Continue with just the Bedrock analysis
         
+        # Analyze the scored turns with Bedrock, segments in parallel
+        if scored_turns:
+            segments = speaker_segments.group_turns(scored_turns, agent)
+            analyses = speaker_segments.fan_out(segments, lambda segment: analyze_with_bedrock(segment.text))
+            analysis = merge_segment_analyses(segments, analyses)
+        elif turns:
+            # Nothing to score; stored as not analyzable rather than given a made-up score
+            analysis = not_analyzable("No agent speech to analyze")
+        else:
+            analysis = analyze_with_bedrock(transcript)
+            
+        # Enhance the analysis with Kiro results
+        if kiro_results:
+            analysis["kiroScore"] = kiro_results.get("compliance_score")
+            analysis["kiroFindings"] = kiro_results.get("findings")
+            analysis["kiroRecommendations"] = kiro_results.get("recommendations")
+        
         logger.info(f"Analysis results: {json.dumps(analysis)}")
         
         # Generate a unique ID for this analysis
@@ -123,7 +126,7 @@ def lambda_handler(event, context):
             'callId': call_id,
             'jobName': job_name,
             'timestamp': datetime.utcnow().isoformat(),
-            'score': analysis.get('complianceScore', 0),
+            'status': analysis.get('status', 'ANALYZED'),
             'tone': analysis.get('tone', 'neutral'),
             'flags': analysis.get('violations', []),
             'summary': analysis.get('summary', ''),
@@ -132,14 +135,18 @@ def lambda_handler(event, context):
             # Add Kiro-specific fields if available
             'kiroScore': analysis.get('kiroScore'),
             'kiroFindings': analysis.get('kiroFindings'),
-            'kiroRecommendations': analysis.get('kiroRecommendations')
+            'kiroRecommendations': analysis.get('kiroRecommendations'),
+            'speakerFindings': speaker_findings(kiro_results)
         }
         
+        if 'complianceScore' in analysis:
+            item['score'] = analysis['complianceScore']
+        
         table.put_item(Item=item)
         logger.info(f"Stored analysis in DynamoDB with ID: {call_id}")
         
         # Send alert if compliance score is low
-        if analysis.get('complianceScore', 0) < 70:
+        if 'complianceScore' in analysis and analysis['complianceScore'] < 70:
             alert_message = {
                 'callId': call_id,
                 'score': analysis.get('complianceScore', 0),
@@ -148,27 +155,147 @@ def lambda_handler(event, context):
                 'timestamp': item['timestamp']
             }
             
-            sns.publish(
-                TopicArn=os.environ['SNS_TOPIC'],
-                Subject=f"Compliance Alert: Score {analysis.get('complianceScore', 0)}",
-                Message=json.dumps(alert_message)
+            # Critical scores are published at once, others in a digest
+            sent = compliance_alerts().add(
+                ALERT_GROUP, alert_message, analysis.get('complianceScore', 0),
+                subject=f"Compliance Alert: Score {analysis.get('complianceScore', 0)}"
             )
-            logger.info(f"Sent compliance alert to SNS topic")
+            logger.info(f"{'Sent' if sent else 'Queued'} compliance alert for SNS topic")
         
         return {
-            "statusCode": 200,
-            "body": json.dumps({
-                "callId": call_id,
-                "status": "analyzed",
-                "score": analysis.get('complianceScore', 0)
-            })
+            "callId": call_id,
+            "status": analysis.get('status', 'ANALYZED').lower(),
+            "score": analysis.get('complianceScore')
         }
         
     except Exception as e:
         logger.error(f"Error analyzing transcript: {str(e)}")
-        return {
-            "statusCode": 500,
-            "body": json.dumps({
-                "error": str(e)
-            })
-        }
\ No newline at end of file
+        raise
+
+def compliance_alerts():
+    """
+    Returns the digest that batches low-score alerts
+    """
+    return alert_digest.get_digest(os.environ['SNS_TOPIC'], 'Compliance Alerts', sns)
+
+def analyze_with_bedrock(text):
+    """
+    Analyzes transcript text with Bedrock. Errors, persistent throttling
+    included, propagate so the transcript fails and Lambda retries it
+    rather than storing a made-up score.
+    """
+    # Drop filler and fit the text to the prompt budget, keeping every
+    # sentence that mentions a compliance term
+    compaction = prompt_compaction.compact_transcript(
+        text, prompt_compaction.PROMPT_TOKEN_BUDGET,
+        rule_packs.get_rule_pack(kiro_integration.INDUSTRY_TYPE).matcher
+    )
+    logger.info(f"Prompt compaction saved {compaction.tokens_saved} of {compaction.original_tokens} estimated tokens")
+    
+    # Prepare the prompt for Bedrock
+    prompt = f"""Human: Analyze this customer call transcript for compliance issues. 
+    Provide your analysis in JSON format with the following fields:
+    - complianceScore: a number from 0-100 indicating overall compliance
+    - tone: a single word describing the overall tone (e.g., 'professional', 'aggressive', 'confused')
+    - violations: an array of potential compliance violations found
+    - summary: a brief summary of the call
+    
+    Here is the transcript:
+    {compaction.text}
+    
+    Assistant: """
+    
+    logger.info("Sending transcript to Bedrock for analysis")
+    
+    # Try to call Bedrock for analysis
+    try:
+        logger.info("Attempting to use Bedrock for analysis")
+        limiter = rate_limiter.get_limiter(f"bedrock:{BEDROCK_MODEL_ID}")
+        result = limiter.call(bedrock_stream.invoke_json, bedrock, BEDROCK_MODEL_ID, {
+            "anthropic_version": "bedrock-2023-05-31",
+            "max_tokens": 1000,
+            "messages": [
+                {"role": "user", "content": prompt}
+            ]
+        })
+        
+        # The JSON object is parsed from the stream, with or without code fences
+        logger.info(
+            f"Bedrock analysis successful: first token after {result.time_to_first_token:.2f}s, "
+            f"result complete after {result.latency:.2f}s"
+        )
+        return result.value
+        
+    except Exception as e:
+        logger.error(f"Bedrock analysis failed: {str(e)}")
+        raise
+
+def not_analyzable(summary):
+    """
+    Analysis of a call with no agent speech to score. It has no
+    complianceScore, so no score is stored and no alert is sent.
+    """
+    return {
+        "status": "NOT_ANALYZABLE",
+        "tone": "neutral",
+        "violations": [],
+        "summary": summary
+    }
+
+def merge_segment_analyses(segments, analyses):
+    """
+    Combines the analyses of several segments: the score is the lowest
+    segment score, so one severe violation is not averaged away,
+    violations are de-duplicated and the tone is taken from the largest
+    segment. A segment whose analysis failed fails the whole merge.
+    """
+    if len(analyses) == 1:
+        return analyses[0]
+    
+    scores = []
+    for index, analysis in enumerate(analyses):
+        score = analysis.get('complianceScore')
+        if not isinstance(score, (int, float)) or isinstance(score, bool):
+            raise ValueError(f"Segment {index} analysis has no compliance score")
+        scores.append(score)
+    
+    violations = []
+    for analysis in analyses:
+        for violation in analysis.get('violations', []):
+            if violation not in violations:
+                violations.append(violation)
+    
+    largest = max(range(len(segments)), key=lambda index: segments[index].tokens)
+    return {
+        "complianceScore": min(scores),
+        "tone": analyses[largest].get('tone', 'neutral'),
+        "violations": violations,
+        "summary": ' '.join(analysis.get('summary', '') for analysis in analyses).strip()
+    }
+
+def speaker_findings(kiro_results):
+    """
+    Returns the keyword findings with their speaker and timestamps, in a
+    form DynamoDB can store
+    """
+    return [
+        {
+            'keyword': match['keyword'],
+            'issue': match.get('issue', ''),
+            'speaker': match.get('speaker'),
+            'role': match.get('role'),
+            'startTime': None if match.get('start_time') is None else Decimal(str(match['start_time'])),
+            'endTime': None if match.get('end_time') is None else Decimal(str(match['end_time']))
+        }
+        for match in (kiro_results or {}).get('matches', [])
+        if 'speaker' in match
+    ]
+
+def log_finding(finding):
+    """
+    Logs a keyword finding as soon as the streaming scan confirms it
+    """
+    logger.info(
+        f"Kiro finding '{finding['keyword']}'{' by ' + finding['role'] if finding.get('role') else ''} at "
+        f"{finding['start_time']}s-{finding['end_time']}s: {finding['issue']}"
+    )
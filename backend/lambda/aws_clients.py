@@ -0,0 +1,136 @@
+"""
+AWS Clients Module for EchoGuard
+Creates boto3 clients, resources and DynamoDB Table objects on first use and
+caches them for the life of the container, so cold starts only pay for the
+clients a code path actually uses and warm invocations never rebuild them.
+"""
+import os
+import threading
+
+import boto3
+from botocore.config import Config
+
+# Shared client configuration
+AWS_MAX_POOL_CONNECTIONS = int(os.environ.get('AWS_MAX_POOL_CONNECTIONS', '25'))
+AWS_RETRY_MODE = os.environ.get('AWS_RETRY_MODE', 'standard')
+AWS_MAX_ATTEMPTS = int(os.environ.get('AWS_MAX_ATTEMPTS', '3'))
+AWS_CONNECT_TIMEOUT_SECONDS = float(os.environ.get('AWS_CONNECT_TIMEOUT_SECONDS', '5'))
+
+# Keep-alive connections, enough pooled connections for the handler thread
+# pools, and the standard retry mode's backoff for throttling and transient errors
+CLIENT_CONFIG = Config(
+    tcp_keepalive=True,
+    max_pool_connections=AWS_MAX_POOL_CONNECTIONS,
+    connect_timeout=AWS_CONNECT_TIMEOUT_SECONDS,
+    retries={'mode': AWS_RETRY_MODE, 'max_attempts': AWS_MAX_ATTEMPTS}
+)
+
+# Container-scoped caches; boto3 sessions are not safe to share across
+# threads while creating clients, so creation happens under the lock
+_session = None
+_clients = {}
+_resources = {}
+_tables = {}
+_lock = threading.RLock()
+
+def _get_session():
+    global _session
+    if _session is None:
+        _session = boto3.session.Session()
+    return _session
+
+def client(service_name, **config):
+    """
+    Returns the cached client for a service, creating it on first use.
+
+    Args:
+        service_name (str): e.g. 's3' or 'bedrock-runtime'
+        **config: botocore Config options merged over CLIENT_CONFIG,
+            such as read_timeout
+
+    Returns:
+        The boto3 client
+    """
+    key = (service_name, repr(sorted(config.items())))
+    cached = _clients.get(key)
+    if cached is None:
+        with _lock:
+            cached = _clients.get(key)
+            if cached is None:
+                cached = _clients[key] = _get_session().client(
+                    service_name, config=CLIENT_CONFIG.merge(Config(**config))
+                )
+    return cached
+
+def resource(service_name):
+    """
+    Returns the cached resource for a service, creating it on first use
+    """
+    cached = _resources.get(service_name)
+    if cached is None:
+        with _lock:
+            cached = _resources.get(service_name)
+            if cached is None:
+                cached = _resources[service_name] = _get_session().resource(service_name, config=CLIENT_CONFIG)
+    return cached
+
+def table(table_name):
+    """
+    Returns the cached DynamoDB Table object for a table name
+    """
+    cached = _tables.get(table_name)
+    if cached is None:
+        with _lock:
+            cached = _tables.get(table_name)
+            if cached is None:
+                cached = _tables[table_name] = resource('dynamodb').Table(table_name)
+    return cached
+
+def reset():
+    """
+    Drops every cached client, resource and table, e.g. after changing
+    credentials or region in tests
+    """
+    global _session
+    with _lock:
+        _session = None
+        _clients.clear()
+        _resources.clear()
+        _tables.clear()
+
+class LazyClient:
+    """
+    Module-level stand-in for a client that is only created when one of its
+    methods is first used. Handlers keep their `s3 = ...` globals, which
+    tests can still patch.
+    """
+
+    def __init__(self, service_name, **config):
+        self._service_name = service_name
+        self._config = config
+
+    def __getattr__(self, name):
+        return getattr(client(self._service_name, **self._config), name)
+
+    def __repr__(self):
+        return f"LazyClient({self._service_name!r})"
+
+class LazyResource:
+    """
+    Module-level stand-in for a resource that is only created on first use.
+    Table() returns cached Table objects for the DynamoDB resource.
+    """
+
+    def __init__(self, service_name):
+        self._service_name = service_name
+
+    def __getattr__(self, name):
+        return getattr(resource(self._service_name), name)
+
+    def Table(self, table_name):
+        if self._service_name == 'dynamodb':
+            return table(table_name)
+        return resource(self._service_name).Table(table_name)
+
+    def __repr__(self):
+        return f"LazyResource({self._service_name!r})"
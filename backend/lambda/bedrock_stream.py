@@ -0,0 +1,158 @@
+"""
+Bedrock Stream Module for EchoGuard
+Invokes Bedrock models with response streaming and parses the JSON object
+in the completion as it arrives, stopping once the object is complete
+"""
+import collections
+import json
+import re
+import time
+
+# Characters that can change the extractor's state
+_STRUCTURAL_RE = re.compile(r'["\\{}]')
+
+StreamResult = collections.namedtuple('StreamResult', ['value', 'text', 'time_to_first_token', 'latency'])
+
+class DeadlineExceeded(Exception):
+    """
+    Raised when the deadline passes before the JSON object is complete
+    """
+
+class JsonObjectExtractor:
+    """
+    Incremental parser that finds the first complete top-level JSON object in
+    text arriving in pieces, skipping any prose or code fences around it.
+    Only the candidate object is buffered, and only characters that can
+    change nesting or string state are inspected.
+    """
+
+    def __init__(self):
+        self.value = None
+        self._reset()
+
+    def _reset(self):
+        self._candidate = ''
+        self._depth = 0
+        self._in_string = False
+        self._skip = 0
+
+    def feed(self, text):
+        """
+        Adds the next piece of text.
+
+        Returns:
+            dict: The parsed object once it is complete, otherwise None
+        """
+        if self.value is not None:
+            return self.value
+
+        if not self._candidate:
+            start = text.find('{')
+            if start < 0:
+                return None
+            text = text[start:]
+
+        position = len(self._candidate)
+        self._candidate += text
+        return self._scan(position)
+
+    def _scan(self, position):
+        candidate = self._candidate
+        for match in _STRUCTURAL_RE.finditer(candidate, position):
+            index = match.start()
+            if index < self._skip:
+                continue
+
+            char = match.group()
+            if self._in_string:
+                if char == '\\':
+                    self._skip = index + 2
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char == '{':
+                self._depth += 1
+            elif char == '}':
+                self._depth -= 1
+                if self._depth == 0:
+                    try:
+                        self.value = json.loads(candidate[:index + 1])
+                        return self.value
+                    except ValueError:
+                        # Braces in prose, not JSON; look for the next object
+                        rest = candidate[1:]
+                        self._reset()
+                        return self.feed(rest)
+        return None
+
+def chunk_text(payload):
+    """
+    Returns the generated text in one decoded stream chunk, for both the
+    Claude text completions and messages formats
+    """
+    if 'completion' in payload:
+        return payload['completion']
+    if payload.get('type') == 'content_block_delta':
+        return payload.get('delta', {}).get('text', '')
+    return ''
+
+def invoke_json(client, model_id, body, clock=time.monotonic, deadline=None):
+    """
+    Invokes a model with response streaming and returns the JSON object in
+    its completion. The stream is closed as soon as the object is complete,
+    so trailing prose is never waited for, or as soon as the deadline passes.
+
+    Args:
+        client: bedrock-runtime client
+        model_id (str): Bedrock model ID
+        body (dict): Model request body
+        clock (callable): Time source, in seconds
+        deadline (float): Optional clock() value after which the model is
+            not invoked and the stream is no longer read
+
+    Returns:
+        StreamResult: The parsed object, the text read, and the seconds
+            until the first token and until the object was complete
+
+    Raises:
+        ValueError: If the stream ends without a complete JSON object
+        DeadlineExceeded: If the deadline passes first
+    """
+    started = clock()
+    if deadline is not None and started >= deadline:
+        raise DeadlineExceeded(f"Deadline passed before invoking {model_id}")
+    response = client.invoke_model_with_response_stream(
+        modelId=model_id,
+        body=json.dumps(body),
+        contentType='application/json',
+        accept='application/json'
+    )
+
+    stream = response['body']
+    extractor = JsonObjectExtractor()
+    pieces = []
+    time_to_first_token = None
+    try:
+        for event in stream:
+            if deadline is not None and clock() >= deadline:
+                raise DeadlineExceeded(f"Deadline passed while reading the {model_id} response")
+            if 'chunk' not in event:
+                continue
+            text = chunk_text(json.loads(event['chunk']['bytes']))
+            if not text:
+                continue
+            if time_to_first_token is None:
+                time_to_first_token = clock() - started
+            pieces.append(text)
+            if extractor.feed(text) is not None:
+                break
+    finally:
+        close = getattr(stream, 'close', None)
+        if close:
+            close()
+
+    if extractor.value is None:
+        raise ValueError("Model response ended without a complete JSON object")
+
+    return StreamResult(extractor.value, ''.join(pieces), time_to_first_token, clock() - started)
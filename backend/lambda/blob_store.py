@@ -0,0 +1,79 @@
+"""
+Blob Store Module for EchoGuard
+Stores large item fields as gzip-compressed JSON, inline as a DynamoDB
+binary attribute when small and as an S3 object behind a pointer otherwise
+"""
+import gzip
+import json
+import os
+
+from boto3.dynamodb.types import Binary
+
+# Blob configuration
+BLOB_INLINE_THRESHOLD_BYTES = int(os.environ.get('BLOB_INLINE_THRESHOLD_BYTES', '8192'))
+BLOB_PREFIX = os.environ.get('BLOB_PREFIX', 'blobs/')
+
+# Marks an attribute written by this module
+ENCODING = 'gzip+json'
+
+def compress(value):
+    """
+    Serializes a value to gzip-compressed JSON
+    """
+    return gzip.compress(json.dumps(value, default=str).encode('utf-8'), mtime=0)
+
+def decompress(data):
+    """
+    Restores a value compressed with compress()
+    """
+    return json.loads(gzip.decompress(data).decode('utf-8'))
+
+def is_blob(value):
+    """
+    Returns whether an attribute value was written by store_field()
+    """
+    return isinstance(value, dict) and value.get('encoding') == ENCODING
+
+def store_field(s3, bucket, key_prefix, name, value, threshold=BLOB_INLINE_THRESHOLD_BYTES):
+    """
+    Compresses a field value for storage in a DynamoDB item.
+
+    Args:
+        s3: S3 client used for values over the threshold
+        bucket (str): Bucket for offloaded values
+        key_prefix (str): Key prefix for the owning item, e.g. the recording ID
+        name (str): Field name, used in the S3 key
+        value: JSON-serializable value
+        threshold (int): Largest compressed size kept inline, in bytes
+
+    Returns:
+        dict: Attribute value holding either the compressed bytes or an S3 pointer
+    """
+    data = compress(value)
+    if len(data) <= threshold:
+        return {'encoding': ENCODING, 'data': Binary(data)}
+
+    key = f"{BLOB_PREFIX}{key_prefix}/{name}.json.gz"
+    s3.put_object(
+        Bucket=bucket,
+        Key=key,
+        Body=data,
+        ContentType='application/json',
+        ContentEncoding='gzip'
+    )
+    return {'encoding': ENCODING, 's3Bucket': bucket, 's3Key': key, 'size': len(data)}
+
+def load_field(s3, value):
+    """
+    Returns the original value of a field written by store_field().
+    Values stored before fields were compressed are returned unchanged.
+    """
+    if not is_blob(value):
+        return value
+
+    if 'data' in value:
+        data = value['data']
+        return decompress(data.value if isinstance(data, Binary) else data)
+
+    response = s3.get_object(Bucket=value['s3Bucket'], Key=value['s3Key'])
+    return decompress(response['Body'].read())
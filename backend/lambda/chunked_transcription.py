@@ -0,0 +1,574 @@
+"""
+Chunked Transcription Module for EchoGuard
+Cuts long WAV and FLAC recordings at pauses into overlapping segments that
+are transcribed as parallel Amazon Transcribe jobs, and stitches the segment
+transcripts back into one transcript in Transcribe's output format, with
+times and speaker labels relative to the whole recording
+"""
+import array
+import collections
+import json
+import os
+import sys
+import tempfile
+import time
+import warnings
+import wave
+from decimal import Decimal
+
+from botocore.exceptions import ClientError
+
+from speaker_segments import speaker_label_map
+from transcript_stream import item_content
+
+try:
+    # Deprecated since Python 3.11 but still the fastest way to measure PCM
+    # energy here; removed in 3.13, where energies are summed in Python
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', DeprecationWarning)
+        import audioop
+except ImportError:
+    audioop = None
+
+try:
+    import soundfile
+except ImportError:
+    # Decoding FLAC needs soundfile; without it FLAC recordings are transcribed whole
+    soundfile = None
+
+# Splitting configuration
+CHUNKED_TRANSCRIPTION_ENABLED = os.environ.get('CHUNKED_TRANSCRIPTION_ENABLED', 'false').lower() == 'true'
+CHUNKED_MIN_DURATION_SECONDS = float(os.environ.get('CHUNKED_MIN_DURATION_SECONDS', '1800'))
+CHUNK_TARGET_SECONDS = float(os.environ.get('CHUNK_TARGET_SECONDS', '600'))
+CHUNK_OVERLAP_SECONDS = float(os.environ.get('CHUNK_OVERLAP_SECONDS', '5'))
+CHUNK_SEARCH_SECONDS = float(os.environ.get('CHUNK_SEARCH_SECONDS', '30'))
+CHUNK_PREFIX = os.environ.get('CHUNK_PREFIX', 'chunks/')
+
+# Pauses: energy is summed per 20 ms frame and a cut goes in the middle of
+# the quietest 300 ms stretch
+ENERGY_FRAME_SECONDS = 0.02
+PAUSE_SECONDS = 0.3
+
+# Frames copied per read when writing a segment
+COPY_BLOCK_FRAMES = 64 * 1024
+
+# A word transcribed by two neighbouring segments has midpoints this close
+OVERLAP_MATCH_SECONDS = 0.5
+
+SPLIT_FORMATS = {'wav', 'flac'}
+
+# Recording statuses while segment jobs are queued or running
+WAITING_STATUSES = ('QUEUED', 'TRANSCRIBING')
+
+# Times in seconds. Transcribe is sent the audio from start to end, and the
+# words kept from its transcript are those between owned_start and
+# owned_end; the rest overlaps the neighbouring segments.
+Segment = collections.namedtuple('Segment', ['index', 'start', 'end', 'owned_start', 'owned_end'])
+
+class WavSource:
+    """
+    Reads frames from a PCM WAV file
+    """
+
+    def __init__(self, path):
+        self._reader = wave.open(path, 'rb')
+        self.frame_rate = self._reader.getframerate()
+        self.channels = self._reader.getnchannels()
+        self.sample_width = self._reader.getsampwidth()
+        self.frames = self._reader.getnframes()
+
+    def read(self, start, count):
+        self._reader.setpos(start)
+        return self._reader.readframes(count)
+
+    def close(self):
+        self._reader.close()
+
+class FlacSource:
+    """
+    Decodes frames of a FLAC file to 16-bit PCM
+    """
+
+    sample_width = 2
+
+    def __init__(self, path):
+        self._file = soundfile.SoundFile(path)
+        self.frame_rate = self._file.samplerate
+        self.channels = self._file.channels
+        self.frames = self._file.frames
+
+    def read(self, start, count):
+        self._file.seek(start)
+        return bytes(self._file.buffer_read(count, dtype='int16'))
+
+    def close(self):
+        self._file.close()
+
+def should_split(media):
+    """
+    Returns whether a probed recording is long enough to transcribe in
+    segments and in a format that can be cut here
+    """
+    return (CHUNKED_TRANSCRIPTION_ENABLED
+            and media.format in SPLIT_FORMATS
+            and (media.format != 'flac' or soundfile is not None)
+            and media.duration_seconds is not None
+            and media.duration_seconds >= CHUNKED_MIN_DURATION_SECONDS)
+
+def open_audio(path, media_format):
+    """
+    Opens a recording for splitting, or returns None when it cannot be
+    decoded here, such as compressed WAV or FLAC without soundfile
+    """
+    try:
+        if media_format == 'wav':
+            return WavSource(path)
+        if media_format == 'flac' and soundfile is not None:
+            return FlacSource(path)
+    except (wave.Error, EOFError, RuntimeError) as e:
+        print(f"Cannot decode {path} for splitting: {str(e)}")
+    return None
+
+def _samples(pcm, sample_width):
+    """
+    Unpacks little-endian PCM into signed integers
+    """
+    if sample_width == 1:
+        return [sample - 128 for sample in pcm]
+    if sample_width == 3:
+        return [int.from_bytes(pcm[i:i + 3], 'little', signed=True) for i in range(0, len(pcm) - 2, 3)]
+    samples = array.array('h' if sample_width == 2 else 'i')
+    samples.frombytes(pcm[:len(pcm) - len(pcm) % sample_width])
+    if sys.byteorder == 'big':
+        samples.byteswap()
+    return samples
+
+def frame_energies(pcm, sample_width, channels, frame_length):
+    """
+    Returns the sum of squared samples of each whole frame_length-frame
+    window of interleaved PCM, computed per window in C by audioop.rms when
+    audioop is available
+    """
+    if audioop is None:
+        return _python_frame_energies(pcm, sample_width, channels, frame_length)
+    if sample_width == 1:
+        # 8-bit WAV is unsigned; audioop expects signed samples
+        pcm = audioop.bias(pcm, 1, -128)
+    count = frame_length * channels
+    size = count * sample_width
+    view = memoryview(pcm)
+    return [audioop.rms(view[i:i + size], sample_width) ** 2 * count
+            for i in range(0, len(pcm) - size + 1, size)]
+
+def _python_frame_energies(pcm, sample_width, channels, frame_length):
+    """
+    frame_energies without audioop
+    """
+    samples = _samples(pcm, sample_width)
+    step = frame_length * channels
+    return [sum(sample * sample for sample in samples[i:i + step])
+            for i in range(0, len(samples) - step + 1, step)]
+
+def find_pause(source, around, search_seconds=CHUNK_SEARCH_SECONDS):
+    """
+    Returns the time of the middle of the quietest PAUSE_SECONDS stretch
+    within search_seconds of around, the one closest to around on a tie
+    """
+    frame_length = max(1, int(source.frame_rate * ENERGY_FRAME_SECONDS))
+    first = max(0, int((around - search_seconds) * source.frame_rate))
+    last = min(source.frames, int((around + search_seconds) * source.frame_rate))
+    energies = frame_energies(source.read(first, last - first), source.sample_width, source.channels, frame_length)
+
+    width = max(1, int(round(PAUSE_SECONDS / ENERGY_FRAME_SECONDS)))
+    if len(energies) < width:
+        return round(around, 3)
+
+    best = None
+    energy = sum(energies[:width])
+    for n in range(len(energies) - width + 1):
+        if n:
+            energy += energies[n + width - 1] - energies[n - 1]
+        middle = (first + (n + width / 2) * frame_length) / source.frame_rate
+        key = (energy, abs(middle - around))
+        if best is None or key < best[0]:
+            best = (key, middle)
+    return round(best[1], 3)
+
+def plan_segments(source, target_seconds=CHUNK_TARGET_SECONDS, overlap_seconds=CHUNK_OVERLAP_SECONDS,
+                  search_seconds=CHUNK_SEARCH_SECONDS):
+    """
+    Chooses where to cut a recording: about every target_seconds, moved to
+    the quietest pause within search_seconds, with overlap_seconds of audio
+    shared with each neighbour.
+
+    Returns:
+        list: Segment tuples in order; a single segment for recordings
+            shorter than one and a half target_seconds
+    """
+    duration = round(source.frames / source.frame_rate, 3)
+    count = max(1, int(round(duration / target_seconds)))
+
+    # Search windows a quarter of a segment wide at most keep the cuts in order
+    search_seconds = min(search_seconds, duration / count / 4)
+    bounds = [0.0] + [find_pause(source, duration * n / count, search_seconds) for n in range(1, count)] + [duration]
+    return [
+        Segment(
+            n,
+            round(max(0.0, bounds[n] - overlap_seconds), 3),
+            round(min(duration, bounds[n + 1] + overlap_seconds), 3),
+            bounds[n],
+            bounds[n + 1]
+        )
+        for n in range(count)
+    ]
+
+def write_segment(source, segment, path):
+    """
+    Writes a segment's audio to a PCM WAV file
+    """
+    start = int(round(segment.start * source.frame_rate))
+    end = min(source.frames, int(round(segment.end * source.frame_rate)))
+    with wave.open(path, 'wb') as writer:
+        writer.setnchannels(source.channels)
+        writer.setsampwidth(source.sample_width)
+        writer.setframerate(source.frame_rate)
+        for block in range(start, end, COPY_BLOCK_FRAMES):
+            writer.writeframes(source.read(block, min(COPY_BLOCK_FRAMES, end - block)))
+
+def split_and_transcribe(path, transcriber, media_format='wav', max_speakers=None, **plan_options):
+    """
+    Splits a local recording and stitches the transcripts of its segments,
+    for trying split settings on sample audio without Transcribe.
+
+    Args:
+        path (str): WAV or FLAC file
+        transcriber (callable): transcriber(segment_path, segment) returning
+            Transcribe output for the segment's audio
+        media_format (str): 'wav' or 'flac'
+        max_speakers (int): MaxSpeakerLabels the transcriber ran with
+        **plan_options: target_seconds, overlap_seconds or search_seconds
+
+    Returns:
+        tuple: (stitched Transcribe output, Segment tuples)
+    """
+    source = open_audio(path, media_format)
+    if source is None:
+        raise ValueError(f"Cannot split {media_format} audio")
+    try:
+        segments = plan_segments(source, **plan_options)
+        transcripts = []
+        with tempfile.TemporaryDirectory() as directory:
+            for segment in segments:
+                segment_path = os.path.join(directory, f"{segment.index:03d}.wav")
+                write_segment(source, segment, segment_path)
+                transcripts.append(transcriber(segment_path, segment))
+    finally:
+        source.close()
+    return stitch(transcripts, segments, max_speakers), segments
+
+def segment_key(recording_id, index):
+    """
+    Returns the S3 key of a segment's audio
+    """
+    return f"{CHUNK_PREFIX}{recording_id}/{index:03d}.wav"
+
+def segment_transcript_key(recording_id, index):
+    """
+    Returns the S3 key of a segment's Transcribe output
+    """
+    return f"{recording_id}/segments/{index:03d}/transcript.json"
+
+def split_object(s3, bucket, key, recording_id, media_format):
+    """
+    Downloads a recording to temporary storage, cuts it into segments and
+    uploads each one as WAV under CHUNK_PREFIX in the same bucket.
+
+    Returns:
+        list: Segment tuples; fewer than two when the recording cannot be
+            decoded here or is too short to split, and nothing is uploaded
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'recording')
+        s3.download_file(bucket, key, path)
+        source = open_audio(path, media_format)
+        if source is None:
+            return []
+        try:
+            segments = plan_segments(source)
+            if len(segments) < 2:
+                return segments
+            segment_path = os.path.join(directory, 'segment.wav')
+            for segment in segments:
+                write_segment(source, segment, segment_path)
+                s3.upload_file(segment_path, bucket, segment_key(recording_id, segment.index))
+        finally:
+            source.close()
+    return segments
+
+def segments_to_item(segments):
+    """
+    Converts Segment tuples to a DynamoDB list
+    """
+    return [
+        {
+            'start': Decimal(str(segment.start)),
+            'end': Decimal(str(segment.end)),
+            'ownedStart': Decimal(str(segment.owned_start)),
+            'ownedEnd': Decimal(str(segment.owned_end))
+        }
+        for segment in segments
+    ]
+
+def segments_from_item(values):
+    """
+    Converts a DynamoDB list written by segments_to_item to Segment tuples
+    """
+    return [
+        Segment(n, float(value['start']), float(value['end']), float(value['ownedStart']), float(value['ownedEnd']))
+        for n, value in enumerate(values)
+    ]
+
+def complete_segment(table, s3, bucket, recording_id, index):
+    """
+    Records that a segment's job completed. The completion of the last
+    segment stitches the segment transcripts into the recording's
+    transcript.json and moves the recording to TRANSCRIBED.
+
+    Args:
+        table: Recordings DynamoDB Table
+        s3: S3 client
+        bucket (str): Bucket holding the segments' Transcribe output
+        recording_id (str): Recording the segment belongs to
+        index (int): Segment number
+
+    Returns:
+        bool: Whether this completion transcribed the recording, so its
+            analysis should be triggered. False while other segments are
+            running, after a segment failed, or when a repeated completion
+            event got there first.
+    """
+    try:
+        recording = table.update_item(
+            Key={'recordingId': recording_id},
+            UpdateExpression="ADD segmentsCompleted :index",
+            ConditionExpression="#status IN (:queued, :transcribing)",
+            ExpressionAttributeNames={
+                '#status': 'status'
+            },
+            ExpressionAttributeValues={
+                ':index': {index},
+                ':queued': WAITING_STATUSES[0],
+                ':transcribing': WAITING_STATUSES[1]
+            },
+            ReturnValues='ALL_NEW'
+        )['Attributes']
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') == 'ConditionalCheckFailedException':
+            return False
+        raise
+
+    segments = segments_from_item(recording.get('transcriptionSegments', []))
+    if not segments or len(recording.get('segmentsCompleted', ())) < len(segments):
+        return False
+
+    max_speakers = recording.get('maxSpeakerLabels')
+    max_speakers = None if max_speakers is None else int(max_speakers)
+    transcripts = [
+        json.loads(s3.get_object(Bucket=bucket, Key=segment_transcript_key(recording_id, segment.index))['Body'].read())
+        for segment in segments
+    ]
+    s3.put_object(
+        Bucket=bucket,
+        Key=f"{recording_id}/transcript.json",
+        Body=json.dumps(stitch(transcripts, segments, max_speakers)),
+        ContentType='application/json'
+    )
+
+    try:
+        table.update_item(
+            Key={'recordingId': recording_id},
+            UpdateExpression="set #status = :status, updatedAt = :timestamp",
+            ConditionExpression="#status IN (:queued, :transcribing)",
+            ExpressionAttributeNames={
+                '#status': 'status'
+            },
+            ExpressionAttributeValues={
+                ':status': 'TRANSCRIBED',
+                ':queued': WAITING_STATUSES[0],
+                ':transcribing': WAITING_STATUSES[1],
+                ':timestamp': int(time.time())
+            }
+        )
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') == 'ConditionalCheckFailedException':
+            return False
+        raise
+    return True
+
+def stitch(transcripts, segments, max_speakers=None):
+    """
+    Joins segment transcripts into one transcript in Amazon Transcribe's
+    output format.
+
+    Each word is kept from the segment that owns its midpoint, so words in
+    the overlaps appear once, and its times are moved by the segment's
+    start. Transcribe numbers speakers per job, so each segment's speakers
+    take the labels of the words they share with the previous segment. A
+    speaker with no shared words gets a new label when every earlier
+    speaker is accounted for, or the only unmatched earlier label once
+    max_speakers labels exist; when it could be more than one speaker its
+    words are left without a speaker label rather than guessed.
+
+    Args:
+        transcripts (list): Transcribe output of each segment
+        segments (list): The Segment each transcript is of
+        max_speakers (int): MaxSpeakerLabels the segment jobs ran with
+
+    Returns:
+        dict: Transcribe output for the whole recording
+    """
+    speakers = []
+    items = []
+    previous = []
+    for position, (transcript, segment) in enumerate(zip(transcripts, segments)):
+        words = _shifted_items(transcript.get('results', {}), segment.start)
+        mapping = _map_speakers(words, previous, speakers, max_speakers)
+        last = position == len(segments) - 1
+
+        # Punctuation goes with the word before it
+        keep = position == 0
+        for item, start, end, speaker in words:
+            if start is not None:
+                middle = (start + end) / 2
+                keep = segment.owned_start <= middle and (middle < segment.owned_end or last)
+            if not keep:
+                continue
+            if speaker is not None and mapping[speaker] is not None:
+                item['speaker_label'] = mapping[speaker]
+            else:
+                item.pop('speaker_label', None)
+            if 'id' in item:
+                item['id'] = len(items)
+            items.append(item)
+
+        previous = [(item_content(item).lower(), (start + end) / 2, mapping[speaker])
+                    for item, start, end, speaker in words
+                    if start is not None and speaker is not None and mapping[speaker] is not None]
+
+    results = {
+        'transcripts': [{'transcript': _text(items)}],
+        'items': items
+    }
+    if speakers:
+        results['speaker_labels'] = {'speakers': len(speakers), 'segments': _speaker_segments(items)}
+
+    first = transcripts[0] if transcripts else {}
+    return {
+        'jobName': first.get('jobName'),
+        'accountId': first.get('accountId'),
+        'results': results,
+        'status': 'COMPLETED'
+    }
+
+def _seconds(value):
+    return f"{value:.3f}"
+
+def _shifted_items(results, offset):
+    """
+    Copies a segment's items with times moved by offset.
+
+    Returns:
+        list: [item, start, end, segment speaker label] entries; start and
+            end are None for punctuation
+    """
+    labels = speaker_label_map(results)
+    shifted = []
+    for item in results.get('items', []):
+        item = dict(item)
+        speaker = item.get('speaker_label') or labels.get(item.get('start_time'))
+        start = end = None
+        if 'start_time' in item:
+            start = float(item['start_time']) + offset
+            end = float(item.get('end_time', item['start_time'])) + offset
+            item['start_time'] = _seconds(start)
+            item['end_time'] = _seconds(end)
+        else:
+            speaker = None
+        shifted.append([item, start, end, speaker])
+    return shifted
+
+def _map_speakers(words, previous, speakers, max_speakers):
+    """
+    Maps a segment's speaker labels to labels for the whole recording by
+    voting with the words it shares with the previous segment, adding new
+    labels to speakers.
+
+    A speaker without shared words is only given a label that cannot be
+    wrong: a new one when every earlier speaker is already matched, or the
+    one earlier speaker left unmatched once max_speakers labels exist.
+    Otherwise it maps to None and its words are left unlabelled.
+    """
+    votes = collections.Counter()
+    if previous:
+        overlap_end = max(middle for _, middle, _ in previous) + OVERLAP_MATCH_SECONDS
+        for item, start, end, speaker in words:
+            if start is None or speaker is None or (start + end) / 2 > overlap_end:
+                continue
+            middle = (start + end) / 2
+            content = item_content(item).lower()
+            matches = [(abs(other - middle), label) for word, other, label in previous
+                       if word == content and abs(other - middle) <= OVERLAP_MATCH_SECONDS]
+            if matches:
+                votes[(speaker, min(matches)[1])] += 1
+
+    mapping = {}
+    for (speaker, label), _ in votes.most_common():
+        if speaker not in mapping and label not in mapping.values():
+            mapping[speaker] = label
+
+    unmatched = list(dict.fromkeys(
+        speaker for _, _, _, speaker in words if speaker is not None and speaker not in mapping
+    ))
+    candidates = [label for label in speakers if label not in mapping.values()]
+    for speaker in unmatched:
+        full = bool(max_speakers) and len(speakers) >= max_speakers
+        if not candidates and not full:
+            mapping[speaker] = f"spk_{len(speakers)}"
+            speakers.append(mapping[speaker])
+        elif full and len(unmatched) == 1 and len(candidates) == 1:
+            mapping[speaker] = candidates[0]
+        else:
+            print(f"Segment speaker {speaker} has no words in the overlap and could be any of "
+                  f"{candidates or 'no label'}; leaving its words unlabelled")
+            mapping[speaker] = None
+    return mapping
+
+def _text(items):
+    """
+    Rebuilds the transcript text, with punctuation attached to the word
+    before it
+    """
+    parts = []
+    for item in items:
+        content = item_content(item)
+        if parts and item.get('type') != 'punctuation':
+            parts.append(' ')
+        parts.append(content)
+    return ''.join(parts)
+
+def _speaker_segments(items):
+    """
+    Groups consecutive words by one speaker into speaker_labels segments
+    """
+    segments = []
+    for item in items:
+        label = item.get('speaker_label')
+        if label is None or 'start_time' not in item:
+            continue
+        entry = {'start_time': item['start_time'], 'speaker_label': label, 'end_time': item['end_time']}
+        if segments and segments[-1]['speaker_label'] == label:
+            segments[-1]['end_time'] = item['end_time']
+            segments[-1]['items'].append(entry)
+        else:
+            segments.append(dict(entry, items=[entry]))
+    return segments
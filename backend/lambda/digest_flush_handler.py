@@ -0,0 +1,23 @@
+import json
+import os
+
+import alert_digest
+import aws_clients
+
+# AWS clients, created on first use
+sns = aws_clients.LazyClient('sns')
+
+# Environment variables
+NOTIFICATION_TOPIC_ARN = os.environ.get('NOTIFICATION_TOPIC_ARN', 'arn:aws:sns:us-east-1:656570226565:echoguard-notifications')
+
+def lambda_handler(event, context):
+    """
+    Runs on the AlertDigestFlushSchedule and sends the completion
+    notification digests whose window elapsed without a later alert to
+    flush them. Only the digest module is loaded, so the frequent schedule
+    does not start the analysis function.
+    """
+    notifications = alert_digest.get_digest(NOTIFICATION_TOPIC_ARN, alert_digest.COMPLETION_SUBJECT, sns)
+    notifications.close()
+    print(f"SNS requests: {notifications.requests} for {notifications.published} notifications")
+    return {'statusCode': 200, 'body': json.dumps('Flushed alert digests')}
@@ -1,10 +1,13 @@
 import json
-import boto3
 import os
 from boto3.dynamodb.conditions import Key
 
-# Initialize AWS clients
-dynamodb = boto3.resource('dynamodb')
+import aws_clients
+import blob_store
+
+# AWS clients, created on first use
+dynamodb = aws_clients.LazyResource('dynamodb')
+s3 = aws_clients.LazyClient('s3')
 
 # Environment variables
 RECORDINGS_TABLE = os.environ.get('RECORDINGS_TABLE', 'echoguard-recordings')
@@ -93,12 +96,19 @@ def get_recording_details(event, context):
     {
         "pathParameters": {
             "recordingId": "abc-123"
+        },
+        "queryStringParameters": {
+            "includeTranscript": "true"
         }
     }
+    
+    The transcript is only loaded when includeTranscript is true.
     """
     try:
         # Extract recording ID from path parameters
         recording_id = event['pathParameters']['recordingId']
+        query_params = event.get('queryStringParameters', {}) or {}
+        include_transcript = query_params.get('includeTranscript', 'false').lower() == 'true'
         
         # Get recording metadata
         recordings_table = dynamodb.Table(RECORDINGS_TABLE)
@@ -117,9 +127,17 @@ def get_recording_details(event, context):
                 })
             }
         
-        # Get analysis results if available
+        # Get analysis results if available; a duplicate upload shares the original's
         results_table = dynamodb.Table(RESULTS_TABLE)
-        results = results_table.get_item(Key={'recordingId': recording_id})
+        results_id = recording['Item'].get('duplicateOf', recording_id)
+        projection = ['complianceScore', 'issues', 'bedrockSummary', 'kiroSummary']
+        if include_transcript:
+            projection.append('transcript')
+        results = results_table.get_item(
+            Key={'recordingId': results_id},
+            ProjectionExpression=', '.join(f'#{name}' for name in projection),
+            ExpressionAttributeNames={f'#{name}': name for name in projection}
+        )
         
         response_data = {
             'recording': recording['Item']
@@ -135,7 +153,7 @@ def get_recording_details(event, context):
             
             # Include transcript if available
             if 'transcript' in results['Item']:
-                response_data['transcript'] = results['Item']['transcript']
+                response_data['transcript'] = blob_store.load_field(s3, results['Item']['transcript'])
         
         return {
             'statusCode': 200,
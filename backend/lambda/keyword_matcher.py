@@ -0,0 +1,90 @@
+"""
+Keyword Matcher Module for EchoGuard
+Aho-Corasick automaton shared by the compliance phrase matchers, so a
+transcript is scanned once no matter how many phrases are configured
+"""
+import collections
+
+# Symbols fit in 21 bits, so (state, symbol) packs into a single int key
+_SYMBOL_BITS = 21
+
+class Automaton:
+    """
+    Aho-Corasick automaton over sequences of integer symbols.
+
+    Symbols must be below 2**21; patterns are identified by the index they
+    were added with.
+    """
+
+    def __init__(self):
+        self._goto = {}
+        self._fail = [0]
+        self._out = [()]
+        self._children = [[]]
+
+    def add(self, symbols, index):
+        """
+        Adds a pattern. Call build() once every pattern has been added.
+        """
+        state = 0
+        for symbol in symbols:
+            key = state << _SYMBOL_BITS | symbol
+            next_state = self._goto.get(key)
+            if next_state is None:
+                next_state = len(self._fail)
+                self._goto[key] = next_state
+                self._fail.append(0)
+                self._out.append(())
+                self._children.append([])
+                self._children[state].append((symbol, next_state))
+            state = next_state
+        self._out[state] += (index,)
+
+    def build(self):
+        """
+        Computes failure links and drops the construction-only child lists
+        """
+        children = self._children
+        queue = collections.deque(state for _, state in children[0])
+        while queue:
+            state = queue.popleft()
+            for symbol, child in children[state]:
+                queue.append(child)
+                fallback = self._fail[state]
+                while True:
+                    target = self._goto.get(fallback << _SYMBOL_BITS | symbol)
+                    if target is not None and target != child:
+                        self._fail[child] = target
+                        break
+                    if fallback == 0:
+                        break
+                    fallback = self._fail[fallback]
+                self._out[child] += self._out[self._fail[child]]
+        self._children = None
+
+    def advance(self, state, symbols):
+        """
+        Runs the automaton over symbols from the given state.
+
+        Returns:
+            tuple: (final state, list of (position, pattern indexes) for each
+                position where at least one pattern ends)
+        """
+        goto = self._goto
+        fail = self._fail
+        out = self._out
+        hits = []
+
+        for position, symbol in enumerate(symbols):
+            while True:
+                next_state = goto.get(state << _SYMBOL_BITS | symbol)
+                if next_state is not None:
+                    state = next_state
+                    break
+                if state == 0:
+                    break
+                state = fail[state]
+            if out[state]:
+                hits.append((position, out[state]))
+
+        return state, hits
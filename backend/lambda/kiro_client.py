@@ -0,0 +1,192 @@
+"""
+Kiro Client Module for EchoGuard
+Pooled, resilient HTTP client for the Kiro AI compliance API
+"""
+import os
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Client configuration
+KIRO_CONNECT_TIMEOUT_SECONDS = float(os.environ.get('KIRO_CONNECT_TIMEOUT_SECONDS', '3.05'))
+KIRO_READ_TIMEOUT_SECONDS = float(os.environ.get('KIRO_READ_TIMEOUT_SECONDS', '30'))
+KIRO_MAX_RETRIES = int(os.environ.get('KIRO_MAX_RETRIES', '2'))
+KIRO_BACKOFF_BASE_SECONDS = float(os.environ.get('KIRO_BACKOFF_BASE_SECONDS', '0.2'))
+KIRO_BACKOFF_MAX_SECONDS = float(os.environ.get('KIRO_BACKOFF_MAX_SECONDS', '2'))
+KIRO_POOL_SIZE = int(os.environ.get('KIRO_POOL_SIZE', '10'))
+KIRO_BREAKER_FAILURE_THRESHOLD = int(os.environ.get('KIRO_BREAKER_FAILURE_THRESHOLD', '5'))
+KIRO_BREAKER_RESET_SECONDS = float(os.environ.get('KIRO_BREAKER_RESET_SECONDS', '30'))
+
+# Responses worth retrying; other errors are returned to the caller at once
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# Container-scoped clients keyed by (endpoint, api key)
+_clients = {}
+_clients_lock = threading.Lock()
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of calling Kiro while the circuit breaker is open
+    """
+
+class CircuitBreaker:
+    """
+    Opens after a run of consecutive failures so callers fail fast, then
+    lets a single trial call through once reset_seconds have passed.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, failure_threshold=KIRO_BREAKER_FAILURE_THRESHOLD,
+                 reset_seconds=KIRO_BREAKER_RESET_SECONDS, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = self.CLOSED
+        self._clock = clock
+        self._failures = 0
+        self._opened_at = 0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """
+        Returns whether a call may go ahead
+        """
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and self._clock() - self._opened_at >= self.reset_seconds:
+                self.state = self.HALF_OPEN
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self._failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self._opened_at = self._clock()
+
+class KiroClient:
+    """
+    Kiro API client with keep-alive connection pooling, explicit connect and
+    read timeouts, bounded retries with jittered backoff and a circuit breaker.
+    """
+
+    def __init__(self, endpoint, api_key,
+                 connect_timeout=KIRO_CONNECT_TIMEOUT_SECONDS,
+                 read_timeout=KIRO_READ_TIMEOUT_SECONDS,
+                 max_retries=KIRO_MAX_RETRIES,
+                 backoff_base=KIRO_BACKOFF_BASE_SECONDS,
+                 backoff_max=KIRO_BACKOFF_MAX_SECONDS,
+                 pool_size=KIRO_POOL_SIZE,
+                 breaker=None):
+        self.endpoint = endpoint
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = breaker or CircuitBreaker()
+
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session = requests.Session()
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update({
+            'Authorization': f'Bearer {api_key}',
+            'Content-Type': 'application/json'
+        })
+
+    def analyze(self, payload, deadline=None):
+        """
+        Posts a compliance analysis request to Kiro.
+
+        Args:
+            payload (dict): Request body
+            deadline (float): Optional time.monotonic() value after which no
+                further retries are attempted
+
+        Returns:
+            dict: The Kiro response
+
+        Raises:
+            CircuitOpenError: If Kiro is currently considered unhealthy
+            requests.RequestException: If the request fails after retries
+        """
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"Kiro circuit breaker is open for {self.endpoint}")
+
+        attempt = 0
+        while True:
+            # Every step of an attempt records its outcome, so a half-open
+            # breaker's trial call always closes or reopens it
+            try:
+                response = self.session.post(self.endpoint, json=payload, timeout=self._timeout(deadline))
+                if response.status_code not in RETRYABLE_STATUS_CODES:
+                    response.raise_for_status()
+                    result = response.json()
+                    self.breaker.record_success()
+                    return result
+                error = requests.HTTPError(f"{response.status_code} response from Kiro", response=response)
+            except requests.HTTPError as e:
+                # A 4xx means Kiro answered and rejected the request, so it is
+                # still healthy; an unexpected 5xx (501, 505) is not
+                if e.response is not None and 400 <= e.response.status_code < 500:
+                    self.breaker.record_success()
+                else:
+                    self.breaker.record_failure()
+                raise
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = e
+            except Exception:
+                self.breaker.record_failure()
+                raise
+
+            delay = self._backoff(attempt)
+            if attempt >= self.max_retries or (deadline is not None and time.monotonic() + delay >= deadline):
+                self.breaker.record_failure()
+                raise error
+
+            attempt += 1
+            print(f"Kiro request failed ({error}), retry {attempt} of {self.max_retries} in {delay:.2f}s")
+            time.sleep(delay)
+
+    def _timeout(self, deadline):
+        """
+        Returns the (connect, read) timeout for the next attempt, cut down to
+        the time left before the deadline
+        """
+        if deadline is None:
+            return self.timeout
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise requests.Timeout(f"Deadline passed before calling Kiro at {self.endpoint}")
+        return tuple(min(timeout, remaining) for timeout in self.timeout)
+
+    def _backoff(self, attempt):
+        """
+        Full-jitter exponential backoff
+        """
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+def get_client(endpoint, api_key):
+    """
+    Returns the container-scoped KiroClient for an endpoint, creating it on first use
+    """
+    key = (endpoint, api_key)
+    client = _clients.get(key)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(key)
+            if client is None:
+                client = _clients[key] = KiroClient(endpoint, api_key)
+    return client
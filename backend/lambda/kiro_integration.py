@@ -4,14 +4,23 @@ Provides enhanced compliance analysis capabilities using a local mock
 """
 import json
 import os
-import boto3
 import time
-import re
+import collections
+import itertools
+from concurrent.futures import ProcessPoolExecutor
 from botocore.exceptions import ClientError
 
+import aws_clients
+import rule_packs
+import transcript_stream
+
 # Mock Kiro configuration
 INDUSTRY_TYPE = os.environ.get('INDUSTRY_TYPE', 'financial')
 
+# Batch analysis configuration
+BATCH_MAX_WORKERS = int(os.environ.get('KIRO_BATCH_MAX_WORKERS', '0')) or None
+BATCH_CHUNK_SIZE = int(os.environ.get('KIRO_BATCH_CHUNK_SIZE', '64'))
+
 def analyze_compliance(transcript_text, metadata=None):
     """
     Analyze transcript for compliance issues using mock Kiro AI
@@ -24,30 +33,73 @@ def analyze_compliance(transcript_text, metadata=None):
         dict: Compliance analysis results from mock Kiro
     """
     print("Using mock Kiro service for compliance analysis")
+    return _score_transcript(transcript_text, metadata)
+
+def analyze_compliance_items(items, metadata=None, on_finding=None):
+    """
+    Analyze Amazon Transcribe word items incrementally using mock Kiro AI
+    
+    Items are scanned segment by segment instead of waiting for the
+    flattened transcript, and each finding carries word-level times.
     
+    Args:
+        items (iterable): Transcribe results.items
+        metadata (dict): Additional metadata about the audio recording
+        on_finding (callable): Called with each finding as soon as it is found
+        
+    Returns:
+        dict: Compliance analysis results from mock Kiro
+    """
+    print("Using mock Kiro service for streaming compliance analysis")
+    pack = rule_packs.get_rule_pack(INDUSTRY_TYPE)
+    matches = []
+    for finding in stream_compliance_findings(items, pack=pack):
+        matches.append(finding)
+        if on_finding:
+            on_finding(finding)
+    return _build_result(pack, matches, metadata)
+
+def stream_compliance_findings(items, segment_items=transcript_stream.SEGMENT_ITEMS, pack=None):
+    """
+    Yields keyword findings from Transcribe word items as soon as they are found
+    
+    Args:
+        items (iterable): Transcribe results.items
+        segment_items (int): Number of items scanned per segment
+        pack (RulePack): Rule pack to use, defaults to the one for INDUSTRY_TYPE
+        
+    Yields:
+        dict: keyword, issue, character offsets, match confidence and word start/end times
+    """
+    pack = pack or rule_packs.get_rule_pack(INDUSTRY_TYPE)
+    for finding in transcript_stream.stream_matches(items, pack.matcher, segment_items):
+        finding['issue'] = pack.rules[finding['keyword']]
+        yield finding
+
+def _score_transcript(transcript_text, metadata):
+    """
+    Scores a single transcript against the rule pack for INDUSTRY_TYPE
+    """
+    pack = rule_packs.get_rule_pack(INDUSTRY_TYPE)
+    matches = [match._asdict() for match in pack.matcher.scan(transcript_text)]
+    return _build_result(pack, matches, metadata)
+
+def _build_result(pack, matches, metadata):
+    """
+    Builds the mock Kiro response from keyword matches
+    """
     # Simple analysis based on keywords
     compliance_issues = []
     recommendations = []
-    
-    # Financial compliance keywords
-    financial_keywords = {
-        "guarantee": "Potential guarantee of returns or performance",
-        "promise": "Promises of specific returns may violate regulations",
-        "risk-free": "Misrepresentation of investment risks",
-        "guaranteed": "Claims of guaranteed returns may be misleading",
-        "free money": "Misrepresentation of financial products",
-        "secret": "Non-transparent financial advice",
-        "insider": "Potential reference to insider trading",
-        "loophole": "Suggesting regulatory avoidance",
-        "tax-free": "Potentially misleading tax claims",
-        "off the books": "Suggestion of improper accounting"
-    }
+    finding_keywords = []
+    keyword_counts = collections.Counter(match['keyword'] for match in matches)
     
     # Check for compliance issues
     compliance_score = 100
-    for keyword, issue in financial_keywords.items():
-        if re.search(r'\b' + keyword + r'\b', transcript_text.lower()):
+    for keyword, issue in pack.rules.items():
+        if keyword_counts[keyword]:
             compliance_issues.append(issue)
+            finding_keywords.append(keyword)
             recommendations.append(f"Avoid using term '{keyword}' in customer communications")
             compliance_score -= 10
     
@@ -58,12 +110,76 @@ def analyze_compliance(transcript_text, metadata=None):
     return {
         "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
         "compliance_score": compliance_score,
-        "industry": INDUSTRY_TYPE,
+        "industry": pack.industry,
+        "rule_pack_version": pack.version,
         "findings": compliance_issues if compliance_issues else ["No compliance issues detected"],
         "recommendations": recommendations if recommendations else ["Continue maintaining compliance standards"],
+        "finding_keywords": finding_keywords,
+        "matches": matches,
+        "keyword_counts": dict(keyword_counts),
         "metadata": metadata or {}
     }
 
+def analyze_compliance_many(items, max_workers=BATCH_MAX_WORKERS, chunk_size=BATCH_CHUNK_SIZE, executor=None):
+    """
+    Analyze many transcripts, yielding results in input order
+    
+    Transcripts are sent to worker processes in chunks so pickling cost
+    stays small next to the matching work, and only a bounded number of
+    chunks are in flight so large archives can be streamed through.
+    
+    Args:
+        items (iterable): (transcript_text, metadata) pairs
+        max_workers (int): Worker processes to use, defaults to the CPU count;
+            1 analyzes in the calling process
+        chunk_size (int): Number of transcripts sent to a worker per task
+        executor (Executor): Optional executor to reuse instead of creating one
+        
+    Yields:
+        dict: Compliance analysis results, one per input pair
+    """
+    chunks = _chunked(items, max(1, chunk_size))
+    max_workers = max_workers or os.cpu_count() or 1
+    
+    if executor is None and max_workers == 1:
+        for chunk in chunks:
+            yield from _analyze_chunk(chunk)
+        return
+    
+    owns_executor = executor is None
+    if owns_executor:
+        executor = ProcessPoolExecutor(max_workers=max_workers)
+    
+    try:
+        # Keep every worker busy with one chunk queued behind it
+        in_flight = collections.deque()
+        for chunk in chunks:
+            in_flight.append(executor.submit(_analyze_chunk, chunk))
+            if len(in_flight) >= max_workers * 2:
+                yield from in_flight.popleft().result()
+        while in_flight:
+            yield from in_flight.popleft().result()
+    finally:
+        if owns_executor:
+            executor.shutdown(cancel_futures=True)
+
+def _chunked(items, size):
+    """
+    Splits an iterable into lists of at most size elements
+    """
+    iterator = iter(items)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+def _analyze_chunk(chunk):
+    """
+    Worker entry point for analyze_compliance_many
+    """
+    return [_score_transcript(transcript_text, metadata) for transcript_text, metadata in chunk]
+
 def store_kiro_results(analysis_id, kiro_results):
     """
     Store Kiro analysis results in DynamoDB
@@ -75,8 +191,7 @@ def store_kiro_results(analysis_id, kiro_results):
     Returns:
         bool: Success status
     """
-    dynamodb = boto3.resource('dynamodb')
-    table = dynamodb.Table(os.environ.get('AUDIT_TABLE_NAME'))
+    table = aws_clients.table(os.environ.get('AUDIT_TABLE_NAME'))
     
     try:
         # Add Kiro-specific fields
@@ -0,0 +1,173 @@
+"""
+Media Dedup Module for EchoGuard
+Indexes uploads by content hash so a recording uploaded again is linked to
+the transcript and analysis of the first upload instead of being
+transcribed and analyzed a second time. The index entry lists the linked
+recordings, which take on the original's final status.
+"""
+import base64
+import hashlib
+import os
+import re
+import time
+
+from botocore.exceptions import ClientError
+
+import aws_clients
+
+# Dedup configuration
+MEDIA_DEDUP_ENABLED = os.environ.get('MEDIA_DEDUP_ENABLED', 'true').lower() == 'true'
+MEDIA_INDEX_TABLE = os.environ.get('MEDIA_INDEX_TABLE', 'echoguard-media-index')
+
+# Statuses a recording does not leave on its own; duplicates take them on
+FINAL_STATUSES = {'COMPLETED', 'ANALYSIS_ERROR', 'TRANSCRIPTION_FAILED', 'TRANSCRIPTION_ERROR'}
+
+# Analysis attributes a duplicate shares with the original
+SHARED_ATTRIBUTES = ('complianceScore', 'verdictTier')
+
+# Bytes read at a time when the object has to be hashed
+HASH_CHUNK_BYTES = 1024 * 1024
+
+# A single-part upload's ETag is the MD5 of its content unless it is
+# encrypted with KMS or a customer key
+_MD5_ETAG_RE = re.compile(r'^[0-9a-f]{32}$')
+_OPAQUE_ETAG_ENCRYPTION = {'aws:kms', 'aws:kms:dsse'}
+
+def content_hash(s3, bucket, key):
+    """
+    Returns a key identifying the object's content.
+
+    Uses what S3 already knows before reading the object: the MD5 ETag of
+    a single-part upload, then a full-object SHA-256 checksum. Otherwise
+    the object is streamed through SHA-256.
+
+    Returns:
+        str: 'md5:<etag>:<size>' or 'sha256:<hex digest>'
+    """
+    head = s3.head_object(Bucket=bucket, Key=key, ChecksumMode='ENABLED')
+    etag = head.get('ETag', '').strip('"')
+    encrypted = head.get('ServerSideEncryption') in _OPAQUE_ETAG_ENCRYPTION or 'SSECustomerAlgorithm' in head
+    if _MD5_ETAG_RE.match(etag) and not encrypted:
+        return f"md5:{etag}:{head.get('ContentLength', 0)}"
+
+    checksum = head.get('ChecksumSHA256')
+    if checksum and '-' not in checksum:
+        return f"sha256:{base64.b64decode(checksum).hex()}"
+
+    return f"sha256:{stream_sha256(s3.get_object(Bucket=bucket, Key=key)['Body'])}"
+
+def stream_sha256(body):
+    """
+    Hashes an S3 StreamingBody without holding it in memory
+    """
+    digest = hashlib.sha256()
+    chunks = body.iter_chunks(HASH_CHUNK_BYTES) if hasattr(body, 'iter_chunks') else iter(
+        lambda: body.read(HASH_CHUNK_BYTES), b''
+    )
+    for chunk in chunks:
+        digest.update(chunk)
+    return digest.hexdigest()
+
+def _table(table=None):
+    return table or aws_clients.table(MEDIA_INDEX_TABLE)
+
+def claim(media_hash, recording_id, table=None):
+    """
+    Records recording_id as the owner of media_hash unless another
+    recording already owns it. The conditional put makes concurrent uploads
+    of the same media agree on a single owner.
+
+    Returns:
+        str: The owning recordingId; recording_id itself when it was
+            claimed now or by an earlier attempt for the same recording
+    """
+    table = _table(table)
+    try:
+        table.put_item(
+            Item={'contentHash': media_hash, 'recordingId': recording_id, 'createdAt': int(time.time())},
+            ConditionExpression='attribute_not_exists(contentHash) OR recordingId = :recording',
+            ExpressionAttributeValues={':recording': recording_id}
+        )
+        return recording_id
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') != 'ConditionalCheckFailedException':
+            raise
+
+    item = table.get_item(Key={'contentHash': media_hash}, ConsistentRead=True).get('Item')
+    if item is None:
+        # Released between the put and the read; try again
+        return claim(media_hash, recording_id, table)
+    return item['recordingId']
+
+def add_duplicate(media_hash, original_id, recording_id, table=None):
+    """
+    Lists recording_id on the index entry original_id owns, so the final
+    status of the original reaches it. Nothing is recorded once the
+    original has released the media; its status is final by then.
+    """
+    try:
+        _table(table).update_item(
+            Key={'contentHash': media_hash},
+            UpdateExpression='ADD duplicates :recording',
+            ConditionExpression='recordingId = :original',
+            ExpressionAttributeValues={':recording': {recording_id}, ':original': original_id}
+        )
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') != 'ConditionalCheckFailedException':
+            raise
+
+def duplicates(media_hash, recording_id, table=None):
+    """
+    Returns the recordings linked to the media recording_id owns
+    """
+    item = _table(table).get_item(Key={'contentHash': media_hash}, ConsistentRead=True).get('Item')
+    if not item or item['recordingId'] != recording_id:
+        return set()
+    return set(item.get('duplicates', ()))
+
+def release(media_hash, recording_id, table=None):
+    """
+    Drops the index entry when recording_id owns it, so a later upload of
+    the same media is transcribed after this one failed.
+
+    Returns:
+        set: The recordings that were linked to recording_id
+    """
+    try:
+        response = _table(table).delete_item(
+            Key={'contentHash': media_hash},
+            ConditionExpression='recordingId = :recording',
+            ExpressionAttributeValues={':recording': recording_id},
+            ReturnValues='ALL_OLD'
+        )
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') != 'ConditionalCheckFailedException':
+            raise
+        return set()
+    return set(response.get('Attributes', {}).get('duplicates', ()))
+
+def update_duplicates(recordings_table, original, recording_ids):
+    """
+    Gives duplicates the status of the original recording, with its score
+    once it is analyzed. Each write is conditional on the duplicate still
+    pointing at the original.
+    """
+    update = "set #status = :status, updatedAt = :timestamp"
+    values = {':status': original['status'], ':original': original['recordingId'], ':timestamp': int(time.time())}
+    for name in SHARED_ATTRIBUTES:
+        if name in original:
+            values[f':{name}'] = original[name]
+            update += f", {name} = :{name}"
+
+    for recording_id in recording_ids:
+        try:
+            recordings_table.update_item(
+                Key={'recordingId': recording_id},
+                UpdateExpression=update,
+                ConditionExpression='duplicateOf = :original',
+                ExpressionAttributeNames={'#status': 'status'},
+                ExpressionAttributeValues=values
+            )
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') != 'ConditionalCheckFailedException':
+                raise
@@ -0,0 +1,410 @@
+"""
+Media Probe Module for EchoGuard
+Identifies the container and codec of an upload from the first bytes of the
+object, read with a ranged GET, and estimates its duration from header
+metadata, so uploads Transcribe would reject are caught before a job is
+submitted
+"""
+import collections
+import os
+import struct
+
+from botocore.exceptions import ClientError
+
+# Bytes read from the start of the object
+MEDIA_PROBE_BYTES = int(os.environ.get('MEDIA_PROBE_BYTES', str(16 * 1024)))
+
+# Bytes read from the end of an Ogg file for its last granule position
+MEDIA_PROBE_TAIL_BYTES = int(os.environ.get('MEDIA_PROBE_TAIL_BYTES', str(16 * 1024)))
+
+# Amazon Transcribe batch limits
+MAX_MEDIA_BYTES = int(os.environ.get('MAX_MEDIA_BYTES', str(2 * 1024 ** 3)))
+MAX_MEDIA_DURATION_SECONDS = float(os.environ.get('MAX_MEDIA_DURATION_SECONDS', str(4 * 60 * 60)))
+MIN_MEDIA_DURATION_SECONDS = float(os.environ.get('MIN_MEDIA_DURATION_SECONDS', '0'))
+
+# Ranged GETs one probe may make, e.g. to reach an MP4 moov box after mdat
+MAX_PROBE_REQUESTS = 4
+
+# Bytes scanned for the first MP3 frame when there is no ID3 tag
+MP3_SYNC_SCAN_BYTES = 4096
+
+# format is the Transcribe MediaFormat, or None when Transcribe cannot read
+# the container; fields the header does not give are None
+MediaInfo = collections.namedtuple('MediaInfo', [
+    'format', 'container', 'codec', 'sample_rate', 'channels', 'duration_seconds', 'size'
+])
+
+UNKNOWN = MediaInfo(None, None, None, None, None, None, None)
+
+_MP3_BITRATES = {
+    'mpeg1': [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    'mpeg2': [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160]
+}
+_MP3_SAMPLE_RATES = [44100, 48000, 32000]
+
+_WAV_CODECS = {1: 'pcm', 3: 'float', 6: 'alaw', 7: 'mulaw', 0x11: 'adpcm'}
+
+_MP4_CODECS = {'mp4a': 'aac', 'alac': 'alac', 'samr': 'amr-nb', 'sawb': 'amr-wb', 'Opus': 'opus', '.mp3': 'mp3'}
+_MP4_CONTAINERS = {b'trak', b'mdia', b'minf', b'stbl'}
+
+_AMR_NB_FRAME_BYTES = [13, 14, 16, 18, 20, 21, 27, 32, 6]
+_AMR_WB_FRAME_BYTES = [18, 24, 33, 37, 41, 47, 51, 59, 61, 6]
+
+class UnsupportedMedia(ValueError):
+    """
+    Raised for uploads Transcribe would reject
+    """
+
+def s3_range_reader(s3, bucket, key):
+    """
+    Returns read_range(start, length) -> (bytes, object size) over an S3
+    object, one ranged GET per call
+    """
+    def read_range(start, length):
+        try:
+            response = s3.get_object(Bucket=bucket, Key=key, Range=f"bytes={start}-{start + length - 1}")
+        except ClientError as e:
+            # Ranges past the end of the object, including any range of an empty one
+            if e.response.get('Error', {}).get('Code') == 'InvalidRange':
+                return b'', start
+            raise
+        total = response.get('ContentRange', '').rpartition('/')[2]
+        data = response['Body'].read()
+        return data, int(total) if total.isdigit() else start + len(data)
+    return read_range
+
+def probe_object(s3, bucket, key, probe_bytes=MEDIA_PROBE_BYTES):
+    """
+    Probes an S3 object with ranged GETs.
+
+    Returns:
+        MediaInfo: What the header says about the media
+    """
+    return probe(s3_range_reader(s3, bucket, key), probe_bytes)
+
+def probe_bytes(data):
+    """
+    Probes media held in memory
+    """
+    return probe(lambda start, length: (data[start:start + length], len(data)), len(data) or 1)
+
+def probe(read_range, probe_bytes=MEDIA_PROBE_BYTES):
+    """
+    Identifies media from its header.
+
+    Args:
+        read_range (callable): read_range(start, length) -> (bytes, object size)
+        probe_bytes (int): Bytes read from the start of the media
+
+    Returns:
+        MediaInfo: What the header says about the media
+    """
+    requests = [0]
+
+    def read(start, length):
+        requests[0] += 1
+        if requests[0] > MAX_PROBE_REQUESTS:
+            return b'', None
+        return read_range(start, length)
+
+    head, size = read(0, probe_bytes)
+    base = 0
+    if head[:3] == b'ID3' and len(head) >= 10:
+        # Skip the ID3v2 tag; large cover art can push the audio past the head
+        base = 10 + ((head[6] & 0x7F) << 21 | (head[7] & 0x7F) << 14 | (head[8] & 0x7F) << 7 | head[9] & 0x7F)
+        if head[5] & 0x10:
+            base += 10
+        if base + 64 > len(head) and base < size:
+            head = read(base, probe_bytes)[0]
+        else:
+            head = head[base:]
+
+    for detect in (_probe_wav, _probe_flac, _probe_ogg, _probe_mp4, _probe_webm, _probe_amr, _probe_mp3):
+        info = detect(head, base, size, read)
+        if info is not None:
+            return info._replace(size=size)
+    return UNKNOWN._replace(size=size)
+
+def validate(info):
+    """
+    Raises UnsupportedMedia when Transcribe would reject the media,
+    otherwise returns it
+    """
+    if info.format is None:
+        raise UnsupportedMedia(f"Unsupported media container: {info.container or 'unrecognized'}")
+    if info.channels == 0:
+        raise UnsupportedMedia('Media has no audio track')
+    if info.size is not None and info.size > MAX_MEDIA_BYTES:
+        raise UnsupportedMedia(f"Media is {info.size} bytes, over the {MAX_MEDIA_BYTES} byte limit")
+    if info.duration_seconds is not None:
+        if info.duration_seconds <= MIN_MEDIA_DURATION_SECONDS:
+            raise UnsupportedMedia(f"Media is {info.duration_seconds:.1f} seconds long")
+        if info.duration_seconds > MAX_MEDIA_DURATION_SECONDS:
+            raise UnsupportedMedia(
+                f"Media is {info.duration_seconds:.0f} seconds long, over the {MAX_MEDIA_DURATION_SECONDS:.0f} second limit"
+            )
+    return info
+
+def _media(media_format, container, codec=None, sample_rate=None, channels=None, duration=None):
+    return MediaInfo(media_format, container, codec, sample_rate, channels, duration, None)
+
+def _probe_wav(data, base, size, read):
+    if data[:4] != b'RIFF' or data[8:12] != b'WAVE':
+        return None
+    info = _media('wav', 'wav')
+    pos = 12
+    byte_rate = None
+    while pos + 8 <= len(data):
+        chunk, chunk_size = struct.unpack_from('<4sI', data, pos)
+        if chunk == b'fmt ' and pos + 24 <= len(data):
+            audio_format, channels, sample_rate, byte_rate = struct.unpack_from('<HHII', data, pos + 8)
+            if audio_format == 0xFFFE and pos + 34 <= len(data):
+                audio_format = struct.unpack_from('<H', data, pos + 32)[0]
+            info = info._replace(codec=_WAV_CODECS.get(audio_format, f"0x{audio_format:04x}"),
+                                 sample_rate=sample_rate, channels=channels)
+        elif chunk == b'data':
+            # Streaming writers leave the size at 0 or 0xFFFFFFFF
+            available = size - base - pos - 8
+            if chunk_size == 0 or chunk_size > available:
+                chunk_size = available
+            if byte_rate:
+                info = info._replace(duration_seconds=chunk_size / byte_rate)
+            return info
+        pos += 8 + chunk_size + (chunk_size & 1)
+    return info
+
+def _probe_flac(data, base, size, read):
+    if data[:4] != b'fLaC':
+        return None
+    if len(data) < 26:
+        return _media('flac', 'flac', 'flac')
+    # STREAMINFO is always the first metadata block
+    info = data[8:26]
+    sample_rate = info[10] << 12 | info[11] << 4 | info[12] >> 4
+    channels = ((info[12] >> 1) & 0x07) + 1
+    total_samples = (info[13] & 0x0F) << 32 | struct.unpack_from('>I', info, 14)[0]
+    duration = total_samples / sample_rate if total_samples and sample_rate else None
+    return _media('flac', 'flac', 'flac', sample_rate, channels, duration)
+
+def _probe_ogg(data, base, size, read):
+    if data[:4] != b'OggS' or len(data) < 28:
+        return None
+    packet = data[27 + data[26]:]
+    if packet[:8] == b'OpusHead' and len(packet) >= 16:
+        channels, pre_skip, input_rate = struct.unpack_from('<BHI', packet, 9)
+        info = _media('ogg', 'ogg', 'opus', input_rate or 48000, channels)
+        # Opus granule positions always count 48kHz samples
+        granule_rate, skip = 48000, pre_skip
+    elif packet[:7] == b'\x01vorbis' and len(packet) >= 16:
+        channels, sample_rate = struct.unpack_from('<BI', packet, 11)
+        info = _media('ogg', 'ogg', 'vorbis', sample_rate, channels)
+        granule_rate, skip = sample_rate, 0
+    else:
+        return _media('ogg', 'ogg')
+
+    # The duration is the granule position of the last page
+    start = max(0, size - base - MEDIA_PROBE_TAIL_BYTES)
+    tail = data[start:] if size - base <= len(data) else read(base + start, MEDIA_PROBE_TAIL_BYTES)[0]
+    page = tail.rfind(b'OggS')
+    if page >= 0 and page + 14 <= len(tail) and granule_rate:
+        granule = struct.unpack_from('<q', tail, page + 6)[0]
+        if granule >= 0:
+            info = info._replace(duration_seconds=max(granule - skip, 0) / granule_rate)
+    return info
+
+def _boxes(data, start, end):
+    """
+    Yields (type, offset, header length, size) for the MP4 boxes in
+    data[start:end] whose headers are present
+    """
+    pos = start
+    while pos + 8 <= min(end, len(data)):
+        box_size, box_type = struct.unpack_from('>I4s', data, pos)
+        header = 8
+        if box_size == 1:
+            if pos + 16 > len(data):
+                return
+            box_size = struct.unpack_from('>Q', data, pos + 8)[0]
+            header = 16
+        elif box_size == 0:
+            box_size = end - pos
+        if box_size < header:
+            return
+        yield box_type, pos, header, box_size
+        pos += box_size
+
+def _probe_mp4(data, base, size, read):
+    if data[4:8] != b'ftyp':
+        return None
+    brand = data[8:12]
+    info = _media('m4a' if brand in (b'M4A ', b'M4B ') else 'mp4', brand.decode('latin-1').strip() or 'mp4')
+
+    # Find moov among the top-level boxes, reading past mdat when it comes first
+    offset, chunk = 0, data
+    while True:
+        moov = None
+        last_end = offset
+        for box_type, pos, header, box_size in _boxes(chunk, 0, size - offset):
+            last_end = offset + pos + box_size
+            if box_type == b'moov':
+                moov = (pos, header, box_size)
+                break
+        if moov is not None:
+            break
+        if last_end <= offset or last_end + 8 > size:
+            return info
+        offset = last_end
+        chunk = read(offset, MEDIA_PROBE_BYTES)[0]
+        if len(chunk) < 8:
+            return info
+
+    pos, header, box_size = moov
+    if pos + box_size > len(chunk) and pos > 0:
+        # Read moov from its start so as much of it as possible is in hand
+        chunk = read(offset + pos, min(box_size, MEDIA_PROBE_BYTES))[0]
+        pos = 0
+    return _parse_moov(chunk, pos + header, pos + box_size, info)
+
+def _parse_moov(data, start, end, info):
+    sound_track = None
+    tracks = 0
+    for box_type, pos, header, box_size in _boxes(data, start, end):
+        body = pos + header
+        if box_type == b'mvhd' and body + 32 <= len(data):
+            if data[body] == 1:
+                timescale, duration = struct.unpack_from('>IQ', data, body + 20)
+            else:
+                timescale, duration = struct.unpack_from('>II', data, body + 12)
+            if timescale and duration not in (0, 0xFFFFFFFF, 0xFFFFFFFFFFFFFFFF):
+                info = info._replace(duration_seconds=duration / timescale)
+        elif box_type == b'trak':
+            tracks += 1
+            if sound_track is None:
+                sound_track = _sound_entry(data, body, pos + box_size)
+    if sound_track is not None:
+        codec, channels, sample_rate = sound_track
+        info = info._replace(codec=codec, channels=channels, sample_rate=sample_rate)
+    elif tracks and end <= len(data):
+        # A complete moov without a sound track
+        info = info._replace(channels=0)
+    return info
+
+def _sound_entry(data, start, end, handler=None):
+    """
+    Returns (codec, channels, sample rate) of a sound track, or None
+    """
+    for box_type, pos, header, box_size in _boxes(data, start, end):
+        body = pos + header
+        if box_type == b'hdlr' and body + 12 <= len(data):
+            handler = data[body + 8:body + 12]
+        elif box_type == b'stsd' and handler in (None, b'soun') and body + 8 + 36 <= len(data):
+            entry = body + 8
+            codec = data[entry + 4:entry + 8].decode('latin-1')
+            channels, = struct.unpack_from('>H', data, entry + 24)
+            sample_rate = struct.unpack_from('>I', data, entry + 32)[0] >> 16
+            return _MP4_CODECS.get(codec, codec), channels, sample_rate
+        elif box_type in _MP4_CONTAINERS:
+            found = _sound_entry(data, body, pos + box_size, handler)
+            if found is not None:
+                return found
+        if handler is not None and handler != b'soun':
+            return None
+    return None
+
+def _probe_webm(data, base, size, read):
+    if data[:4] != b'\x1a\x45\xdf\xa3':
+        return None
+    header = data[:64]
+    if b'\x42\x82\x84webm' not in header:
+        # Matroska other than WebM is not a Transcribe format
+        return _media(None, 'matroska')
+    codec = 'opus' if b'A_OPUS' in data else 'vorbis' if b'A_VORBIS' in data else None
+    info = _media('webm', 'webm', codec)
+
+    scale = 1000000
+    found = data.find(b'\x2a\xd7\xb1')
+    if found >= 0 and found + 4 <= len(data) and data[found + 3] & 0x80:
+        length = data[found + 3] & 0x7F
+        if length <= 8 and found + 4 + length <= len(data):
+            scale = int.from_bytes(data[found + 4:found + 4 + length], 'big')
+    found = data.find(b'\x44\x89')
+    if found >= 0 and found + 3 <= len(data):
+        if data[found + 2] == 0x84 and found + 7 <= len(data):
+            duration = struct.unpack_from('>f', data, found + 3)[0]
+        elif data[found + 2] == 0x88 and found + 11 <= len(data):
+            duration = struct.unpack_from('>d', data, found + 3)[0]
+        else:
+            duration = None
+        if duration and duration > 0:
+            info = info._replace(duration_seconds=duration * scale / 1e9)
+    return info
+
+def _probe_amr(data, base, size, read):
+    if data.startswith(b'#!AMR-WB\n'):
+        magic, frames, sample_rate, codec = 9, _AMR_WB_FRAME_BYTES, 16000, 'amr-wb'
+    elif data.startswith(b'#!AMR\n'):
+        magic, frames, sample_rate, codec = 6, _AMR_NB_FRAME_BYTES, 8000, 'amr-nb'
+    else:
+        return None
+    info = _media('amr', 'amr', codec, sample_rate, 1)
+    if len(data) > magic:
+        mode = (data[magic] >> 3) & 0x0F
+        if mode < len(frames):
+            # Each frame is 20ms; estimated from the first frame's mode
+            info = info._replace(duration_seconds=(size - base - magic) / frames[mode] * 0.02)
+    return info
+
+def _mp3_frame(data, pos):
+    """
+    Returns (version, sample rate, bitrate, samples per frame, frame length,
+    channels) for an MPEG audio Layer III frame header at pos, or None
+    """
+    if pos + 4 > len(data) or data[pos] != 0xFF or data[pos + 1] & 0xE0 != 0xE0:
+        return None
+    version = (data[pos + 1] >> 3) & 0x03
+    layer = (data[pos + 1] >> 1) & 0x03
+    bitrate_index = data[pos + 2] >> 4
+    rate_index = (data[pos + 2] >> 2) & 0x03
+    if version == 1 or layer != 1 or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+    mpeg1 = version == 3
+    sample_rate = _MP3_SAMPLE_RATES[rate_index] // (1 if mpeg1 else 2 if version == 2 else 4)
+    bitrate = _MP3_BITRATES['mpeg1' if mpeg1 else 'mpeg2'][bitrate_index] * 1000
+    samples = 1152 if mpeg1 else 576
+    length = samples // 8 * bitrate // sample_rate + ((data[pos + 2] >> 1) & 0x01)
+    channels = 1 if data[pos + 3] >> 6 == 3 else 2
+    return mpeg1, sample_rate, bitrate, samples, length, channels
+
+def _probe_mp3(data, base, size, read):
+    scan = len(data) if base else min(len(data), MP3_SYNC_SCAN_BYTES)
+    pos = data.find(b'\xff', 0, scan)
+    while pos >= 0:
+        frame = _mp3_frame(data, pos)
+        if frame is not None:
+            following = pos + frame[4]
+            # A second frame right after the first rules out a chance sync word
+            if _mp3_frame(data, following) is not None or (following + 4 > len(data) and (pos == 0 or base)):
+                return _mp3_info(data, pos, base, size, frame)
+        pos = data.find(b'\xff', pos + 1, scan)
+    return None
+
+def _mp3_info(data, pos, base, size, frame):
+    mpeg1, sample_rate, bitrate, samples, _, channels = frame
+    info = _media('mp3', 'mp3', 'mp3', sample_rate, channels)
+
+    # VBR files carry their frame count in a Xing/Info or VBRI header
+    side_info = (32 if channels == 2 else 17) if mpeg1 else (17 if channels == 2 else 9)
+    xing = pos + 4 + side_info
+    vbri = pos + 36
+    frames = None
+    if data[xing:xing + 4] in (b'Xing', b'Info') and xing + 12 <= len(data):
+        flags, count = struct.unpack_from('>II', data, xing + 4)
+        if flags & 0x01:
+            frames = count
+    elif data[vbri:vbri + 4] == b'VBRI' and vbri + 18 <= len(data):
+        frames = struct.unpack_from('>I', data, vbri + 14)[0]
+
+    if frames:
+        return info._replace(duration_seconds=frames * samples / sample_rate)
+    # Constant bitrate: the audio bytes over the bitrate
+    return info._replace(duration_seconds=(size - base - pos) * 8 / bitrate)
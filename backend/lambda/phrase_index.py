@@ -0,0 +1,286 @@
+"""
+Phrase Index Module for EchoGuard
+Normalization-aware phrase matching that catches spoken-text variants of
+compliance terms (hyphenation, apostrophes, split or joined words) in a
+single linear scan over the transcript's word tokens
+"""
+import collections
+import re
+
+from keyword_matcher import Automaton
+
+# Word tokens, keeping apostrophes inside words ("guarantee'd")
+_TOKEN = r"\w+(?:['’]\w+)*"
+_TOKEN_RE = re.compile(_TOKEN)
+
+# Text allowed between the words of one phrase ("risk free", "risk-free", "guarantee 'd")
+_SEPARATOR = r"[\s\-‐‑–—'’]+"
+_SEPARATOR_RE = re.compile(_SEPARATOR)
+
+# Phrase sets up to this size also get a regex prefilter, so text without a
+# phrase is skipped in C instead of tokenized in Python. An alternation slows
+# down with every phrase added while the token scan does not, and past about
+# this many phrases the prefilter costs more than it saves.
+PREFILTER_MAX_PHRASES = 50
+
+# Confidence reported for each kind of match
+EXACT_CONFIDENCE = 1.0
+NORMALIZED_CONFIDENCE = 0.9
+COMPOUND_CONFIDENCE = 0.8
+
+PhraseMatch = collections.namedtuple('PhraseMatch', ['keyword', 'start', 'end', 'confidence'])
+
+# A word token with the separator text that preceded it
+Token = collections.namedtuple('Token', ['norm', 'surface', 'separator', 'start', 'end'])
+
+def normalize_token(token):
+    """
+    Lowercases a word token, drops a possessive 's and removes apostrophes
+    """
+    token = token.lower()
+    if token.endswith(("'s", "’s")):
+        token = token[:-2]
+    return token.replace("'", '').replace('’', '')
+
+def phrase_tokens(phrase):
+    """
+    Splits a phrase into normalized word tokens
+    """
+    return [normalize_token(token) for token in _TOKEN_RE.findall(phrase)]
+
+def _spelling(token):
+    """
+    Regex source for the word tokens that normalize to token, read
+    case-insensitively: its characters with optional apostrophes between
+    them and an optional possessive 's. It may also accept a few that do
+    not, which the token scan then rejects.
+    """
+    return "['’]?".join(re.escape(char) for char in token) + "(?:['’]s)?"
+
+def _variants(tokens, spoken_forms=()):
+    """
+    Yields the token sequences a phrase may appear as, with their confidence:
+    the phrase's own words, the words joined where the phrase has a word
+    boundary, and the declared spoken forms such as "loop hole"
+    """
+    yield tokens, NORMALIZED_CONFIDENCE
+    if len(tokens) > 1:
+        yield [''.join(tokens)], COMPOUND_CONFIDENCE
+    for form in spoken_forms:
+        form_tokens = phrase_tokens(form)
+        if form_tokens:
+            yield form_tokens, COMPOUND_CONFIDENCE
+
+class PhraseIndex:
+    """
+    Token-level phrase matcher built once per container.
+
+    Each phrase is indexed under its normalized tokens, the tokens joined,
+    and any spoken forms declared for it, so one pass over the transcript
+    tokens finds every variant. Words are only split where a declared form
+    splits them; splitting at arbitrary letters would index forms Transcribe
+    does not produce.
+    Matches carry a confidence: EXACT_CONFIDENCE when the spoken text equals
+    the phrase, NORMALIZED_CONFIDENCE when only case, hyphenation, spacing or
+    apostrophes differ, and COMPOUND_CONFIDENCE for joined or split words.
+
+    Sets of up to PREFILTER_MAX_PHRASES phrases also compile a regex that
+    finds where any variant may start, so only the words there are
+    tokenized. Larger sets tokenize every word.
+    """
+
+    def __init__(self, phrases, variants=None):
+        """
+        Args:
+            phrases (iterable): Keywords or phrases to match
+            variants (dict): Phrase to other spoken forms of it, e.g.
+                {'loophole': ['loop hole']}
+        """
+        variants = {phrase.lower(): forms for phrase, forms in (variants or {}).items()}
+        self.keywords = []
+        self.max_tokens = 0
+        self._vocabulary = {}
+        self._variants = []
+        self._automaton = Automaton()
+        self._prefilter = self._run = self._tail = None
+
+        patterns = []
+        seen = set()
+        for phrase in phrases:
+            phrase = phrase.lower()
+            tokens = phrase_tokens(phrase)
+            if not tokens or phrase in seen:
+                continue
+            seen.add(phrase)
+            self._add_phrase(len(self.keywords), tokens, variants.get(phrase, ()), patterns)
+            self.keywords.append(phrase)
+
+        self._automaton.build()
+        if patterns and len(self.keywords) <= PREFILTER_MAX_PHRASES:
+            # Zero-width, so phrases overlapping an earlier hit are found too
+            self._prefilter = re.compile(r"(?<!\w)(?<!\w['’])(?=" + '|'.join(patterns) + ')', re.IGNORECASE)
+            # Up to max_tokens words from a hit, and in reversed text, the last words a match may start with
+            self._run = re.compile(f"{_TOKEN}(?:{_SEPARATOR}{_TOKEN}){{0,{self.max_tokens - 1}}}")
+            self._tail = re.compile(f"(?:\\W*{_TOKEN}){{0,{self.max_tokens - 1}}}")
+
+    def _add_phrase(self, keyword_index, tokens, spoken_forms, patterns):
+        added = set()
+        for variant, confidence in _variants(tokens, spoken_forms):
+            if tuple(variant) in added:
+                continue
+            added.add(tuple(variant))
+            symbols = [self._vocabulary.setdefault(token, len(self._vocabulary) + 1) for token in variant]
+            self._automaton.add(symbols, len(self._variants))
+            self._variants.append((keyword_index, len(variant), confidence))
+            patterns.append(_SEPARATOR.join(_spelling(token) for token in variant))
+            self.max_tokens = max(self.max_tokens, len(variant))
+
+    def scanner(self):
+        """
+        Returns a PhraseScanner for matching text that arrives in pieces
+        """
+        return PhraseScanner(self)
+
+    def scan(self, text):
+        """
+        Finds every phrase occurrence in text.
+
+        Args:
+            text (str): The text to scan
+
+        Returns:
+            list: PhraseMatch tuples (keyword, start, end, confidence),
+                ordered by end
+        """
+        if self._prefilter is None:
+            scanner = self.scanner()
+            return scanner.feed(text) + scanner.close()
+
+        matches = []
+        for hit in self._prefilter.finditer(text):
+            start = hit.start()
+            run = self._run.match(text, start)
+            if run:
+                tokens = PhraseScanner(self)._match_tokens(run.group(), start)
+                matches.extend(match for match in tokens if match.start == start)
+        matches.sort(key=lambda match: match.end)
+        return matches
+
+    def count(self, text):
+        """
+        Counts phrase occurrences in text.
+
+        Returns:
+            collections.Counter: Occurrences per keyword
+        """
+        return collections.Counter(match.keyword for match in self.scan(text))
+
+class PhraseScanner:
+    """
+    Incremental scanner over a PhraseIndex. Automaton state and the last few
+    tokens are kept between calls to feed(), so phrases split across pieces
+    of text are still matched. Offsets are relative to the first piece.
+    """
+
+    def __init__(self, index):
+        self._index = index
+        self._state = 0
+        self._offset = 0
+        self._carry = ''
+        self._gap = ''
+        self._window = collections.deque(maxlen=index.max_tokens)
+
+    @property
+    def horizon(self):
+        """
+        Earliest character offset a match reported later can start at
+        """
+        if self._window:
+            return self._window[0].start
+        return self._offset - len(self._carry)
+
+    def feed(self, text):
+        """
+        Scans the next piece of text.
+
+        A word touching the end of the piece is held back until the next
+        piece (or close()) shows whether it continues.
+
+        Returns:
+            list: PhraseMatch tuples confirmed by this piece
+        """
+        if not text:
+            return []
+
+        buffer = self._carry + text
+        base = self._offset - len(self._carry)
+        self._offset += len(text)
+
+        limit = len(buffer)
+        while limit and (buffer[limit - 1].isalnum() or buffer[limit - 1] in "_'’"):
+            limit -= 1
+
+        self._carry = buffer[limit:]
+        return self._consume(buffer[:limit], base)
+
+    def close(self):
+        """
+        Scans any held-back text and returns the remaining matches
+        """
+        carry, self._carry = self._carry, ''
+        return self._consume(carry, self._offset - len(carry))
+
+    def _consume(self, text, base):
+        index = self._index
+        if self._state == 0 and index._prefilter is not None and not index._prefilter.search(text):
+            # No match is under way or lies within the text, so only the last
+            # words, which may start a match ending in a later piece, are scanned
+            cut = len(text) - index._tail.match(text[::-1]).end()
+            text, base = text[cut:], base + cut
+            self._window.clear()
+            self._gap = ''
+        return self._match_tokens(text, base)
+
+    def _match_tokens(self, text, base):
+        index = self._index
+        tokens = []
+        position = 0
+        for match in _TOKEN_RE.finditer(text):
+            separator = self._gap + text[position:match.start()]
+            self._gap = ''
+            surface = match.group()
+            tokens.append(Token(normalize_token(surface), surface, separator, base + match.start(), base + match.end()))
+            position = match.end()
+        self._gap += text[position:]
+
+        if not tokens:
+            return []
+
+        vocabulary = index._vocabulary
+        self._state, hits = index._automaton.advance(
+            self._state, [vocabulary.get(token.norm, 0) for token in tokens]
+        )
+
+        recent = list(self._window) + tokens
+        shift = len(self._window)
+        matches = []
+        for position, variant_indexes in hits:
+            end = position + shift + 1
+            best = {}
+            for variant_index in variant_indexes:
+                keyword_index, length, confidence = index._variants[variant_index]
+                run = recent[end - length:end]
+                if not all(_SEPARATOR_RE.fullmatch(token.separator) for token in run[1:]):
+                    continue
+                keyword = index.keywords[keyword_index]
+                surface = run[0].surface + ''.join(token.separator + token.surface for token in run[1:])
+                if surface.lower() == keyword:
+                    confidence = EXACT_CONFIDENCE
+                key = (keyword, run[0].start)
+                if confidence > best.get(key, 0):
+                    best[key] = confidence
+            for (keyword, start), confidence in best.items():
+                matches.append(PhraseMatch(keyword, start, recent[end - 1].end, confidence))
+
+        self._window.extend(tokens)
+        return matches
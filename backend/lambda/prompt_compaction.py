@@ -0,0 +1,213 @@
+"""
+Prompt Compaction Module for EchoGuard
+Removes filler and repeated words from transcripts before they are sent to
+Bedrock, and fits them into a token budget while keeping every sentence
+that mentions a compliance term
+"""
+import collections
+import os
+import re
+
+from transcript_chunker import CHARS_PER_TOKEN, estimate_tokens, split_sentences
+
+# Largest transcript, in estimated tokens, embedded in a single prompt
+PROMPT_TOKEN_BUDGET = int(os.environ.get('PROMPT_TOKEN_BUDGET', '24000'))
+
+# Longest repeated phrase collapsed, in words ("you know you know")
+MAX_REPEAT_WORDS = 3
+
+# Single words collapsed when repeated; other doubled words can be meant
+# ("no no", "that that", "had had") and are kept
+STUTTER_WORDS = frozenset(['i', 'the', 'a', 'an', 'and', 'to', 'we', 'my', 'so', 'but', 'of'])
+
+# Repeated phrases with these words are kept, since repetition can be the point
+NEGATION_WORDS = frozenset(['no', 'not', 'never', 'nothing', 'none', 'nope', "don't", "can't", "won't"])
+
+# Hesitation words Transcribe writes out; none of them carry meaning
+FILLER_WORDS = frozenset(['um', 'umm', 'uh', 'uhh', 'uhm', 'erm', 'er', 'ah', 'hmm', 'hm', 'mm', 'mhm'])
+
+# Marks sentences dropped to fit the budget
+GAP_MARKER = '...'
+
+_SENTENCE_END = ('.', '?', '!')
+_EDGE_PUNCTUATION = '.,!?;:"\'()'
+_SPACE_BEFORE_PUNCTUATION_RE = re.compile(r'\s+([.,!?;:])')
+_WORD_RE = re.compile(r'\S+')
+
+CompactionResult = collections.namedtuple(
+    'CompactionResult', ['text', 'original_tokens', 'compacted_tokens', 'tokens_saved']
+)
+
+def _norm(word):
+    return word.lower().strip(_EDGE_PUNCTUATION)
+
+def remove_fillers(words):
+    """
+    Drops filler words, moving sentence-ending punctuation they carried to
+    the previous word
+    """
+    kept = []
+    for word in words:
+        if _norm(word) not in FILLER_WORDS:
+            kept.append(word)
+        elif word.endswith(_SENTENCE_END) and kept and not kept[-1].endswith(_SENTENCE_END):
+            kept[-1] = kept[-1].rstrip(',;:') + word[-1]
+    return kept
+
+def collapse_repeats(words, max_words=MAX_REPEAT_WORDS):
+    """
+    Collapses immediately repeated words and short phrases within a sentence
+    ("I I think", "you know you know") into a single occurrence. A single
+    word is only collapsed if it is in STUTTER_WORDS, and phrases with a
+    negation are never collapsed.
+    """
+    kept = []
+    index = 0
+    while index < len(words):
+        for length in range(min(max_words, len(kept)), 0, -1):
+            tail = kept[-length:]
+            candidate = words[index:index + length]
+            normalized = [_norm(word) for word in tail]
+            if (len(candidate) == length
+                    and not any(word.endswith(_SENTENCE_END) for word in tail)
+                    and normalized == [_norm(word) for word in candidate]
+                    and (length > 1 or normalized[0] in STUTTER_WORDS)
+                    and not NEGATION_WORDS.intersection(normalized)):
+                # Keep punctuation that ended the dropped repeat
+                trailing = candidate[-1][len(candidate[-1].rstrip(_EDGE_PUNCTUATION)):]
+                if trailing and kept[-1] == kept[-1].rstrip(_EDGE_PUNCTUATION):
+                    kept[-1] += trailing
+                index += length
+                break
+        else:
+            kept.append(words[index])
+            index += 1
+    return kept
+
+def normalize_transcript(text):
+    """
+    Removes filler and repeats and tidies spacing around punctuation
+    """
+    words = collapse_repeats(remove_fillers(text.split()))
+    return _SPACE_BEFORE_PUNCTUATION_RE.sub(r'\1', ' '.join(words))
+
+def fit_budget(text, token_budget, matcher=None):
+    """
+    Shortens text to the token budget by dropping whole sentences.
+
+    Sentences the matcher finds a compliance term in are kept first,
+    starting with the first sentence for each distinct term so every term
+    survives where the budget allows, then the others in transcript order.
+    Kept sentences stay in their original order, with GAP_MARKER where
+    sentences were dropped; the markers count against the budget. A
+    flagged sentence too long for the budget left is cut down to the words
+    around its first compliance term.
+
+    Args:
+        text (str): Normalized transcript
+        token_budget (int): Maximum estimated tokens
+        matcher: Optional PhraseIndex for compliance terms
+
+    Returns:
+        str: Text within the budget
+    """
+    if estimate_tokens(text) <= token_budget:
+        return text
+
+    sentences = split_sentences(text)
+    matches = [matcher.scan(sentence) if matcher else [] for sentence in sentences]
+    first_mentions = {}
+    for index, sentence_matches in enumerate(matches):
+        for match in sentence_matches:
+            first_mentions.setdefault(match.keyword, (index, match))
+    focus = {index: match for index, match in reversed(list(first_mentions.values()))}
+    order = (sorted(focus)
+             + [i for i in range(len(sentences)) if matches[i] and i not in focus]
+             + [i for i in range(len(sentences)) if not matches[i]])
+
+    # Built text is the pieces (kept sentences and one marker per dropped
+    # run) joined by single spaces; track its length as sentences are kept
+    max_chars = token_budget * CHARS_PER_TOKEN
+    kept = {}
+    kept_chars = 0
+    gaps = 1 if sentences else 0
+
+    def length(kept_count, kept_length, gap_count):
+        pieces = kept_count + gap_count
+        return kept_length + gap_count * len(GAP_MARKER) + max(pieces - 1, 0)
+
+    for index in order:
+        before = index > 0 and index - 1 not in kept
+        after = index < len(sentences) - 1 and index + 1 not in kept
+        new_gaps = gaps + (1 if before and after else 0 if before or after else -1)
+        available = max_chars - length(len(kept) + 1, kept_chars, new_gaps)
+
+        sentence = sentences[index]
+        if len(sentence) > available:
+            if not matches[index]:
+                continue
+            sentence = _excerpt(sentence, focus.get(index, matches[index][0]), available)
+            if sentence is None:
+                continue
+
+        kept[index] = sentence
+        kept_chars += len(sentence)
+        gaps = new_gaps
+
+    pieces = []
+    for index in range(len(sentences)):
+        if index in kept:
+            pieces.append(kept[index])
+        elif not pieces or pieces[-1] != GAP_MARKER:
+            pieces.append(GAP_MARKER)
+    return ' '.join(pieces)
+
+def _excerpt(sentence, match, max_chars):
+    """
+    Returns the words of a sentence around a match, within max_chars and
+    with GAP_MARKER where words were cut, or None if the match cannot fit
+    """
+    words = [(word.start(), word.end()) for word in _WORD_RE.finditer(sentence)]
+    first = next(i for i, (start, end) in enumerate(words) if end > match.start)
+    last = max(i for i, (start, end) in enumerate(words) if start < match.end)
+
+    def text(first, last):
+        excerpt = sentence[words[first][0]:words[last][1]]
+        if first > 0:
+            excerpt = f"{GAP_MARKER} {excerpt}"
+        if last < len(words) - 1:
+            excerpt = f"{excerpt} {GAP_MARKER}"
+        return excerpt
+
+    if len(text(first, last)) > max_chars:
+        return None
+    grown = True
+    while grown:
+        grown = False
+        if last < len(words) - 1 and len(text(first, last + 1)) <= max_chars:
+            last += 1
+            grown = True
+        if first > 0 and len(text(first - 1, last)) <= max_chars:
+            first -= 1
+            grown = True
+    return text(first, last)
+
+def compact_transcript(text, token_budget=None, matcher=None):
+    """
+    Compacts a transcript for a Bedrock prompt.
+
+    Args:
+        text (str): The transcript
+        token_budget (int): Optional maximum estimated tokens
+        matcher: Optional compliance term matcher used when fitting the budget
+
+    Returns:
+        CompactionResult: Compacted text and estimated token counts
+    """
+    compacted = normalize_transcript(text)
+    if token_budget:
+        compacted = fit_budget(compacted, token_budget, matcher)
+
+    original_tokens = estimate_tokens(text)
+    compacted_tokens = estimate_tokens(compacted)
+    return CompactionResult(compacted, original_tokens, compacted_tokens, original_tokens - compacted_tokens)
@@ -0,0 +1,348 @@
+"""
+Rate Limiter Module for EchoGuard
+Adaptive concurrency limit (AIMD) plus token bucket for throttled AWS APIs.
+Throttled calls are queued and retried instead of falling back, and the
+concurrency limit can be shared across invocations through DynamoDB.
+"""
+import collections
+import os
+import random
+import threading
+import time
+import uuid
+from decimal import Decimal
+
+from botocore.exceptions import ClientError
+
+import aws_clients
+
+# Limiter configuration
+LIMITER_BACKEND = os.environ.get('LIMITER_BACKEND', 'local')
+LIMITER_TABLE = os.environ.get('LIMITER_TABLE', 'echoguard-rate-limits')
+LIMITER_MAX_CONCURRENCY = float(os.environ.get('LIMITER_MAX_CONCURRENCY', '16'))
+LIMITER_MIN_CONCURRENCY = float(os.environ.get('LIMITER_MIN_CONCURRENCY', '1'))
+LIMITER_INITIAL_CONCURRENCY = float(os.environ.get('LIMITER_INITIAL_CONCURRENCY', '4'))
+LIMITER_INCREASE_STEP = float(os.environ.get('LIMITER_INCREASE_STEP', '0.25'))
+LIMITER_DECREASE_FACTOR = float(os.environ.get('LIMITER_DECREASE_FACTOR', '0.5'))
+LIMITER_REQUESTS_PER_SECOND = float(os.environ.get('LIMITER_REQUESTS_PER_SECOND', '5'))
+LIMITER_BURST = float(os.environ.get('LIMITER_BURST', '10'))
+LIMITER_MAX_WAIT_SECONDS = float(os.environ.get('LIMITER_MAX_WAIT_SECONDS', '60'))
+LIMITER_POLL_SECONDS = float(os.environ.get('LIMITER_POLL_SECONDS', '0.1'))
+LIMITER_LEASE_SECONDS = int(os.environ.get('LIMITER_LEASE_SECONDS', '300'))
+
+# Error codes that mean the caller is being throttled
+THROTTLING_ERROR_CODES = {
+    'ThrottlingException',
+    'throttlingException',
+    'TooManyRequestsException',
+    'ProvisionedThroughputExceededException',
+    'ServiceQuotaExceededException',
+    'RequestLimitExceeded'
+}
+
+# How the concurrency limit reacts to successes and throttles
+AimdPolicy = collections.namedtuple('AimdPolicy', ['min_limit', 'max_limit', 'increase_step', 'decrease_factor'])
+
+DEFAULT_POLICY = AimdPolicy(
+    LIMITER_MIN_CONCURRENCY, LIMITER_MAX_CONCURRENCY, LIMITER_INCREASE_STEP, LIMITER_DECREASE_FACTOR
+)
+
+# Container-scoped limiters keyed by name
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+class RateLimitExceeded(Exception):
+    """
+    Raised when a call is still throttled or queued after the maximum wait
+    """
+
+def is_throttle(error):
+    """
+    Returns whether an exception is a throttling response
+    """
+    if not isinstance(error, ClientError):
+        return False
+    code = error.response.get('Error', {}).get('Code')
+    status = error.response.get('ResponseMetadata', {}).get('HTTPStatusCode')
+    return code in THROTTLING_ERROR_CODES or status == 429
+
+def next_limit(limit, throttled, policy):
+    """
+    Additive increase on success, multiplicative decrease on throttling
+    """
+    if throttled:
+        return max(policy.min_limit, limit * policy.decrease_factor)
+    return min(policy.max_limit, limit + policy.increase_step)
+
+class LocalStore:
+    """
+    In-process limiter state, shared by every thread and warm invocation in
+    one container. A limit of 2.5 allows three calls in flight.
+    """
+
+    def __init__(self):
+        self._state = {}
+        self._lock = threading.Lock()
+
+    def try_acquire(self, name, initial_limit):
+        """
+        Takes a concurrency slot if one is free, returning the lease to
+        release it with, or None
+        """
+        with self._lock:
+            state = self._state.setdefault(name, {'limit': initial_limit, 'in_flight': 0})
+            if state['in_flight'] < state['limit']:
+                state['in_flight'] += 1
+                return True
+            return None
+
+    def release(self, name, lease, throttled, policy):
+        """
+        Returns a slot and returns the limit after adjusting it for the
+        outcome: True for throttled, False for success, None for no signal
+        """
+        with self._lock:
+            state = self._state[name]
+            state['in_flight'] -= 1
+            if throttled is not None:
+                state['limit'] = next_limit(state['limit'], throttled, policy)
+            return state['limit']
+
+class DynamoDBStore:
+    """
+    Limiter state in one DynamoDB item per limiter, shared by every
+    container. Each slot in use is a lease in the item's leases map, keyed
+    by a random ID and holding its expiry time. Leases past their expiry
+    are reclaimed when a call finds the limiter full, so a slot leaked by a
+    crashed invocation comes back after lease_seconds even while other
+    calls keep the limiter busy.
+    """
+
+    def __init__(self, table_name=LIMITER_TABLE, dynamodb=None, lease_seconds=LIMITER_LEASE_SECONDS,
+                 clock=time.time):
+        self._table = (dynamodb or aws_clients.resource('dynamodb')).Table(table_name)
+        self.lease_seconds = lease_seconds
+        self._clock = clock
+
+    def try_acquire(self, name, initial_limit):
+        lease = uuid.uuid4().hex
+        for _ in range(2):
+            now = int(self._clock())
+            try:
+                if self._conditional_update(
+                    name, "SET leases.#lease = :expires, updatedAt = :now",
+                    "attribute_exists(leases) AND size(leases) < concurrencyLimit",
+                    {':expires': now + self.lease_seconds, ':now': now}, {'#lease': lease}
+                ):
+                    return lease
+            except ClientError as e:
+                # The item has no leases map to add to yet
+                if e.response['Error']['Code'] != 'ValidationException':
+                    raise
+
+            # Full, new, or holding leases of invocations that never released them
+            item = self._table.get_item(Key={'limiterName': name}, ConsistentRead=True).get('Item')
+            if item is None or 'leases' not in item:
+                self._conditional_update(
+                    name, "SET leases = :none, concurrencyLimit = if_not_exists(concurrencyLimit, :limit)",
+                    "attribute_not_exists(leases)", {':none': {}, ':limit': _decimal(initial_limit)}
+                )
+                continue
+            expired = [held for held, expires in item['leases'].items() if expires <= now]
+            if not expired:
+                return None
+            print(f"Reclaiming {len(expired)} expired {name} limiter leases")
+            names = {f"#expired{n}": held for n, held in enumerate(expired)}
+            self._conditional_update(
+                name, "REMOVE " + ", ".join(f"leases.{key}" for key in names),
+                " AND ".join(f"leases.{key} <= :now" for key in names), {':now': now}, names
+            )
+        return None
+
+    def release(self, name, lease, throttled, policy):
+        now = int(self._clock())
+        held = "attribute_exists(leases.#lease)"
+        names = {'#lease': lease}
+        if throttled:
+            # Multiplicative decrease needs the current value; if another
+            # container changes it first, that container's decrease stands
+            item = self._table.get_item(Key={'limiterName': name}, ConsistentRead=True).get('Item', {})
+            limit = float(item.get('concurrencyLimit', policy.max_limit))
+            new_limit = next_limit(limit, True, policy)
+            if self._conditional_update(
+                name, "REMOVE leases.#lease SET concurrencyLimit = :limit, updatedAt = :now",
+                f"{held} AND concurrencyLimit = :old",
+                {':limit': _decimal(new_limit), ':old': item.get('concurrencyLimit', _decimal(limit)), ':now': now},
+                names
+            ):
+                return new_limit
+        elif throttled is False and self._conditional_update(
+            name, "REMOVE leases.#lease SET concurrencyLimit = concurrencyLimit + :step, updatedAt = :now",
+            f"{held} AND concurrencyLimit <= :ceiling",
+            {':step': _decimal(policy.increase_step),
+             ':ceiling': _decimal(policy.max_limit - policy.increase_step), ':now': now},
+            names
+        ):
+            return None
+
+        # A lease reclaimed after expiring has nothing left to release
+        self._conditional_update(name, "REMOVE leases.#lease SET updatedAt = :now", held, {':now': now}, names)
+        return None
+
+    def _conditional_update(self, name, update_expression, condition, values, names=None):
+        """
+        Applies an update if its condition holds, returning whether it did
+        """
+        kwargs = {'ExpressionAttributeNames': names} if names else {}
+        try:
+            self._table.update_item(
+                Key={'limiterName': name},
+                UpdateExpression=update_expression,
+                ConditionExpression=condition,
+                ExpressionAttributeValues=values,
+                **kwargs
+            )
+            return True
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+            return False
+
+def _decimal(value):
+    return Decimal(str(round(value, 3)))
+
+class TokenBucket:
+    """
+    Local token bucket capping the request rate of one container
+    """
+
+    def __init__(self, rate, burst, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._clock = clock
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def take(self):
+        """
+        Takes a token and returns 0, or returns the seconds until one is available
+        """
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0
+            return (1 - self._tokens) / self.rate
+
+class AdaptiveLimiter:
+    """
+    Limits calls to a throttled API. Calls wait for a concurrency slot and a
+    rate token; throttled calls shrink the concurrency limit and are retried
+    with jittered backoff, and successful calls grow the limit again.
+    """
+
+    def __init__(self, name, store=None, policy=DEFAULT_POLICY,
+                 initial_concurrency=LIMITER_INITIAL_CONCURRENCY,
+                 requests_per_second=LIMITER_REQUESTS_PER_SECOND,
+                 burst=LIMITER_BURST,
+                 max_wait=LIMITER_MAX_WAIT_SECONDS,
+                 poll_seconds=LIMITER_POLL_SECONDS,
+                 clock=time.monotonic, sleep=time.sleep):
+        self.name = name
+        self.store = store or LocalStore()
+        self.policy = policy
+        self.initial_concurrency = initial_concurrency
+        self.max_wait = max_wait
+        self.poll_seconds = poll_seconds
+        self.bucket = TokenBucket(requests_per_second, burst, clock)
+        self.throttles = 0
+        self._clock = clock
+        self._sleep = sleep
+
+    def call(self, fn, *args, **kwargs):
+        """
+        Calls fn(*args, **kwargs) within the limits, retrying throttled calls.
+
+        Raises:
+            RateLimitExceeded: If no call succeeded within max_wait seconds
+        """
+        return self.call_before(None, fn, *args, **kwargs)
+
+    def call_before(self, deadline, fn, *args, **kwargs):
+        """
+        Like call, but also gives up waiting or retrying at deadline, a
+        clock() value, when that comes before max_wait
+        """
+        max_wait_deadline = self._clock() + self.max_wait
+        deadline = max_wait_deadline if deadline is None else min(deadline, max_wait_deadline)
+        attempt = 0
+        while True:
+            lease = self._acquire(deadline)
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                if not is_throttle(e):
+                    self.store.release(self.name, lease, None, self.policy)
+                    raise
+                limit = self.store.release(self.name, lease, True, self.policy)
+
+                self.throttles += 1
+                delay = random.uniform(0, self.poll_seconds * (2 ** attempt))
+                print(f"{self.name} throttled (concurrency limit {limit}), retrying in {delay:.2f}s")
+                if self._clock() + delay >= deadline:
+                    raise RateLimitExceeded(f"{self.name} still throttled after {self.max_wait}s") from e
+                attempt += 1
+                self._sleep(delay)
+                continue
+
+            self.store.release(self.name, lease, False, self.policy)
+            return result
+
+    def _acquire(self, deadline):
+        """
+        Waits for a concurrency slot and a rate token, returning the slot's lease
+        """
+        lease = self.store.try_acquire(self.name, self.initial_concurrency)
+        while not lease:
+            self._wait(self.poll_seconds, deadline)
+            lease = self.store.try_acquire(self.name, self.initial_concurrency)
+
+        delay = self.bucket.take()
+        while delay:
+            try:
+                self._wait(delay, deadline)
+            except RateLimitExceeded:
+                self.store.release(self.name, lease, None, self.policy)
+                raise
+            delay = self.bucket.take()
+        return lease
+
+    def _wait(self, delay, deadline):
+        if self._clock() + delay >= deadline:
+            raise RateLimitExceeded(f"{self.name} queue wait exceeded {self.max_wait}s")
+        self._sleep(delay)
+
+def create_store(name=LIMITER_BACKEND):
+    """
+    Creates the store selected by LIMITER_BACKEND
+    """
+    if name == 'dynamodb':
+        return DynamoDBStore()
+    if name == 'local':
+        return LocalStore()
+    raise ValueError(f"Unknown rate limiter backend: {name}")
+
+def get_limiter(name):
+    """
+    Returns the container-scoped AdaptiveLimiter for a name, creating it on first use
+    """
+    limiter = _limiters.get(name)
+    if limiter is None:
+        with _limiters_lock:
+            limiter = _limiters.get(name)
+            if limiter is None:
+                limiter = _limiters[name] = AdaptiveLimiter(name, create_store())
+    return limiter
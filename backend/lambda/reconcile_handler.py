@@ -0,0 +1,275 @@
+import json
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+from botocore.exceptions import ClientError
+
+import aws_clients
+import chunked_transcription
+import media_dedup
+import transcription_jobs
+import transcription_scheduler
+
+# AWS clients, created on first use
+dynamodb = aws_clients.LazyResource('dynamodb')
+s3 = aws_clients.LazyClient('s3')
+sns = aws_clients.LazyClient('sns')
+transcribe = aws_clients.LazyClient('transcribe')
+
+# Environment variables
+TRANSCRIPT_BUCKET = os.environ.get('TRANSCRIPT_BUCKET', 'echoguard-transcripts-656570226565')
+RECORDINGS_TABLE = os.environ.get('RECORDINGS_TABLE', 'echoguard-recordings')
+ANALYSIS_TOPIC_ARN = os.environ.get('ANALYSIS_TOPIC_ARN', 'arn:aws:sns:us-east-1:656570226565:echoguard-analysis')
+RECONCILE_LOOKBACK_HOURS = float(os.environ.get('RECONCILE_LOOKBACK_HOURS', '24'))
+RECONCILE_MAX_PAGES = int(os.environ.get('RECONCILE_MAX_PAGES', '20'))
+
+# Request size limits
+LIST_JOBS_PAGE_SIZE = 100
+BATCH_GET_SIZE = 100
+TRANSACT_WRITE_SIZE = 100
+PUBLISH_BATCH_SIZE = 10
+
+# Recordings waiting on a Transcribe job, and what a finished job moves them to
+WAITING_STATUSES = {'QUEUED', 'TRANSCRIBING'}
+FINISHED_STATUSES = {'COMPLETED': 'TRANSCRIBED', 'FAILED': 'TRANSCRIPTION_FAILED'}
+
+# Jobs that hold one of the account's concurrent job slots
+RUNNING_JOB_STATUSES = ['QUEUED', 'IN_PROGRESS']
+
+def lambda_handler(event, context):
+    """
+    Periodically reconciles recordings with their Transcribe jobs, for
+    completion events that never arrived.
+
+    Finished jobs from the last RECONCILE_LOOKBACK_HOURS are listed in
+    pages of 100 and matched to recordings through their job names; the
+    recordings still waiting on them are updated in batches and sent for
+    analysis. Completed segment jobs of long recordings are recorded one by
+    one, stitching the transcript after the last. Job slots held by jobs that are no longer running are freed
+    and queued jobs started.
+
+    Every run makes at most RECONCILE_MAX_PAGES list calls per job status,
+    and one read, one write and a tenth of a publish per 100 recordings.
+    """
+    try:
+        calls = {'list': 0, 'read': 0, 'write': 0, 'publish': 0}
+        since = datetime.now(timezone.utc) - timedelta(hours=RECONCILE_LOOKBACK_HOURS)
+
+        # Finished EchoGuard jobs, keyed by recording
+        finished = {}
+        segment_jobs = {}
+        for job_status in FINISHED_STATUSES:
+            for job in list_jobs(job_status, calls, since=since, name_contains=transcription_jobs.JOB_NAME_PREFIX):
+                job_name = job['TranscriptionJobName']
+                recording_id = transcription_jobs.recording_id(job_name)
+                segment = transcription_jobs.segment_index(job_name)
+                if recording_id is None:
+                    continue
+                if segment is None:
+                    finished.setdefault(recording_id, {})[job_name] = job_status
+                else:
+                    segment_jobs.setdefault(recording_id, {})[segment] = job_status
+
+        # Recordings still waiting on the job that finished
+        recordings = get_recordings(set(finished) | set(segment_jobs), calls)
+        updates = []
+        for recording_id, jobs in finished.items():
+            recording = recordings.get(recording_id)
+            if not recording or recording.get('status') not in WAITING_STATUSES:
+                continue
+            job_name = recording.get('transcriptionJobName')
+            if job_name not in jobs:
+                continue
+            updates.append((recording, FINISHED_STATUSES[jobs[job_name]]))
+
+        # Long recordings transcribed in segments; one that this run stitches is
+        # already TRANSCRIBED, so a failed notification for it is only logged
+        stitched = []
+        for recording_id, jobs in segment_jobs.items():
+            recording = recordings.get(recording_id)
+            if not recording or recording.get('status') not in WAITING_STATUSES:
+                continue
+            if 'FAILED' in jobs.values():
+                updates.append((recording, FINISHED_STATUSES['FAILED']))
+                continue
+            completed = {int(segment) for segment in recording.get('segmentsCompleted', ())}
+            for segment in sorted(set(jobs) - completed):
+                if chunked_transcription.complete_segment(
+                    dynamodb.Table(RECORDINGS_TABLE), s3, TRANSCRIPT_BUCKET, recording_id, segment
+                ):
+                    stitched.append(recording_id)
+
+        # Notify first: a recording whose notification failed stays waiting for
+        # the next run, and the conditional writes leave alone a recording
+        # that analysis has already moved on
+        failed_notifications = notify_analysis_service(
+            [recording['recordingId'] for recording, status in updates if status == 'TRANSCRIBED'] + stitched, calls
+        )
+        updates = [(recording, status) for recording, status in updates
+                   if recording['recordingId'] not in failed_notifications]
+        updated = update_statuses(updates, calls)
+        transcribed = [recording['recordingId'] for recording, status in updated if status == 'TRANSCRIBED']
+        for recording, status in updated:
+            if status == 'TRANSCRIPTION_FAILED' and recording.get('contentHash'):
+                media_dedup.update_duplicates(
+                    dynamodb.Table(RECORDINGS_TABLE), dict(recording, status=status),
+                    media_dedup.release(recording['contentHash'], recording['recordingId'])
+                )
+
+        # Slots whose completion event was lost
+        scheduler = transcription_scheduler.TranscriptionScheduler(transcribe)
+        held = scheduler.in_flight()
+        running = [job['TranscriptionJobName']
+                   for job_status in RUNNING_JOB_STATUSES
+                   for job in list_jobs(job_status, calls)]
+        freed = scheduler.sync_in_flight(running, held)
+        started = scheduler.drain()
+
+        summary = {
+            'finishedJobs': sum(len(jobs) for jobs in finished.values()),
+            'transcribed': len(transcribed),
+            'failed': len(updated) - len(transcribed),
+            'stitched': len(stitched),
+            'slotsFreed': len(freed),
+            'queuedJobsStarted': len(started),
+            'apiCalls': calls
+        }
+        print(f"Reconciled transcription jobs: {json.dumps(summary)}")
+
+        return {
+            'statusCode': 200,
+            'body': json.dumps(summary)
+        }
+
+    except Exception as e:
+        print(f"Error: {str(e)}")
+        return {
+            'statusCode': 500,
+            'body': json.dumps({
+                'message': 'Error reconciling transcription jobs',
+                'error': str(e)
+            })
+        }
+
+def list_jobs(job_status, calls, since=None, name_contains=None):
+    """
+    Yields job summaries with the given status, newest first, stopping at
+    jobs created before since or after RECONCILE_MAX_PAGES pages
+    """
+    kwargs = {'Status': job_status, 'MaxResults': LIST_JOBS_PAGE_SIZE}
+    if name_contains:
+        kwargs['JobNameContains'] = name_contains
+    for _ in range(RECONCILE_MAX_PAGES):
+        response = transcribe.list_transcription_jobs(**kwargs)
+        calls['list'] += 1
+        for job in response.get('TranscriptionJobSummaries', []):
+            if since and job.get('CreationTime') and job['CreationTime'] < since:
+                return
+            yield job
+        if 'NextToken' not in response:
+            return
+        kwargs['NextToken'] = response['NextToken']
+
+def get_recordings(recording_ids, calls):
+    """
+    Reads recordings with batch_get_item, 100 keys per request
+    """
+    recordings = {}
+    ids = list(recording_ids)
+    for start in range(0, len(ids), BATCH_GET_SIZE):
+        request = {RECORDINGS_TABLE: {
+            'Keys': [{'recordingId': recording_id} for recording_id in ids[start:start + BATCH_GET_SIZE]],
+            'ProjectionExpression': 'recordingId, #status, transcriptionJobName, contentHash, segmentsCompleted',
+            'ExpressionAttributeNames': {'#status': 'status'}
+        }}
+        while request:
+            response = dynamodb.batch_get_item(RequestItems=request)
+            calls['read'] += 1
+            for item in response.get('Responses', {}).get(RECORDINGS_TABLE, []):
+                recordings[item['recordingId']] = item
+            request = response.get('UnprocessedKeys')
+    return recordings
+
+def update_statuses(updates, calls):
+    """
+    Sets recording statuses in transactions of up to 100, each write
+    conditional on the status read earlier. A transaction that is cancelled
+    because a recording moved on is retried one recording at a time.
+
+    Returns:
+        list: (recording, status) pairs that were updated
+    """
+    updated = []
+    timestamp = int(time.time())
+    for start in range(0, len(updates), TRANSACT_WRITE_SIZE):
+        chunk = updates[start:start + TRANSACT_WRITE_SIZE]
+        try:
+            dynamodb.meta.client.transact_write_items(
+                TransactItems=[{'Update': status_update(recording, status, timestamp)} for recording, status in chunk]
+            )
+            calls['write'] += 1
+            updated.extend(chunk)
+            continue
+        except ClientError as e:
+            calls['write'] += 1
+            if e.response.get('Error', {}).get('Code') != 'TransactionCanceledException':
+                raise
+
+        for recording, status in chunk:
+            try:
+                dynamodb.meta.client.update_item(**status_update(recording, status, timestamp))
+                calls['write'] += 1
+                updated.append((recording, status))
+            except ClientError as e:
+                calls['write'] += 1
+                if e.response.get('Error', {}).get('Code') != 'ConditionalCheckFailedException':
+                    raise
+    return updated
+
+def status_update(recording, status, timestamp):
+    """
+    Builds an update of a recording's status, conditional on it still
+    being the status that was read
+    """
+    return {
+        'TableName': RECORDINGS_TABLE,
+        'Key': {'recordingId': recording['recordingId']},
+        'UpdateExpression': "set #status = :status, updatedAt = :timestamp",
+        'ConditionExpression': "#status = :expected",
+        'ExpressionAttributeNames': {
+            '#status': 'status'
+        },
+        'ExpressionAttributeValues': {
+            ':status': status,
+            ':expected': recording['status'],
+            ':timestamp': timestamp
+        }
+    }
+
+def notify_analysis_service(recording_ids, calls):
+    """
+    Sends the analysis notifications for transcribed recordings, ten per
+    PublishBatch request, and returns the IDs whose notification failed
+    """
+    failed = set()
+    for start in range(0, len(recording_ids), PUBLISH_BATCH_SIZE):
+        entries = [
+            {
+                'Id': str(index),
+                'Message': json.dumps({
+                    'recordingId': recording_id,
+                    'transcriptKey': f"{recording_id}/transcript.json",
+                    'bucket': TRANSCRIPT_BUCKET
+                }),
+                'Subject': 'Transcript Ready for Analysis'
+            }
+            for index, recording_id in enumerate(recording_ids[start:start + PUBLISH_BATCH_SIZE])
+        ]
+        batch = recording_ids[start:start + PUBLISH_BATCH_SIZE]
+        response = sns.publish_batch(TopicArn=ANALYSIS_TOPIC_ARN, PublishBatchRequestEntries=entries)
+        calls['publish'] += 1
+        for failure in response.get('Failed', []):
+            print(f"Analysis notification for {batch[int(failure['Id'])]} failed: {failure.get('Message')}")
+            failed.add(batch[int(failure['Id'])])
+    return failed
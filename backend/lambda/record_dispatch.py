@@ -0,0 +1,155 @@
+"""
+Record Dispatch Module for EchoGuard
+Processes every record in a batched S3, SNS or SQS event, optionally
+concurrently, and reports failed SQS messages as batchItemFailures so only
+those are retried. Failed S3 and SNS records raise RecordsFailedError so
+Lambda's asynchronous invocation retries them.
+"""
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import unquote_plus
+
+# Records processed at once within one invocation
+RECORD_CONCURRENCY = int(os.environ.get('RECORD_CONCURRENCY', '1'))
+
+class RecordsFailedError(Exception):
+    """
+    Raised when S3 or SNS records failed, so the asynchronous invocation is
+    retried; these triggers ignore the response and batchItemFailures
+    """
+
+    def __init__(self, response):
+        super().__init__(response['body'])
+        self.response = response
+
+def event_source(record):
+    """
+    Returns the source of a record: 'aws:sqs', 'aws:sns' or 'aws:s3'
+    """
+    return record.get('eventSource') or record.get('EventSource', '')
+
+def record_identifier(record):
+    """
+    Returns an identifier for a record, the SQS messageId where there is one
+    """
+    if 'messageId' in record:
+        return record['messageId']
+    if 'Sns' in record:
+        return record['Sns'].get('MessageId')
+    if 's3' in record:
+        return record['s3']['object']['key']
+    return None
+
+def message(record):
+    """
+    Decodes the JSON message carried by an SNS record, or by an SQS record
+    whose body is either the raw message or an SNS notification envelope
+    """
+    if 'Sns' in record:
+        return json.loads(record['Sns']['Message'])
+
+    body = json.loads(record['body'])
+    if isinstance(body, dict) and body.get('Type') == 'Notification' and 'Message' in body:
+        return json.loads(body['Message'])
+    return body
+
+def s3_objects(record):
+    """
+    Returns the (bucket, key) pairs an S3 record refers to, including S3
+    notifications delivered through SQS or SNS. Keys are URL-decoded.
+    """
+    if 's3' in record:
+        records = [record]
+    else:
+        records = message(record).get('Records', [])
+
+    return [
+        (item['s3']['bucket']['name'], unquote_plus(item['s3']['object']['key']))
+        for item in records if 's3' in item
+    ]
+
+def process_s3_objects(record, process_object):
+    """
+    Runs process_object(bucket, key) for each object an S3 record refers to.
+
+    Returns:
+        The result for a single object, or a list of results for several
+    """
+    results = [process_object(bucket, key) for bucket, key in s3_objects(record)]
+    return results[0] if len(results) == 1 else results
+
+def dispatch(event, process_record, error_message=None, concurrency=RECORD_CONCURRENCY):
+    """
+    Runs process_record for every record in an event.
+
+    A record fails when process_record raises; the other records are still
+    processed. Failed SQS records are listed in batchItemFailures, which
+    Lambda uses to retry only those messages when the event source mapping
+    reports batch item failures. If an S3 or SNS record failed,
+    RecordsFailedError is raised instead of returning, because only a failed
+    invocation makes those triggers retry. S3 and SNS deliver one record per
+    invocation, so the retry does not repeat other records' work.
+
+    Args:
+        event (dict): Lambda event with a Records list
+        process_record (callable): Called with each record, returns a
+            JSON-serializable result
+        error_message (str): Optional message included with a single
+            record's error
+        concurrency (int): Maximum records processed at once
+
+    Returns:
+        dict: Response with statusCode, body and batchItemFailures. For a
+            single record the body is that record's result or error.
+
+    Raises:
+        RecordsFailedError: If an S3 or SNS record failed
+    """
+    records = event.get('Records', [])
+    outcomes = [None] * len(records)
+
+    def run(index):
+        try:
+            outcomes[index] = (True, process_record(records[index]))
+        except Exception as e:
+            print(f"Error processing record {record_identifier(records[index])}: {str(e)}")
+            outcomes[index] = (False, str(e))
+
+    if concurrency > 1 and len(records) > 1:
+        with ThreadPoolExecutor(max_workers=min(concurrency, len(records))) as executor:
+            list(executor.map(run, range(len(records))))
+    else:
+        for index in range(len(records)):
+            run(index)
+
+    failed_records = [(record, outcome) for record, (succeeded, outcome) in zip(records, outcomes) if not succeeded]
+    failures = [{'itemIdentifier': record_identifier(record), 'error': error} for record, error in failed_records]
+
+    if len(records) == 1:
+        succeeded, outcome = outcomes[0]
+        if succeeded:
+            body = outcome
+        elif error_message:
+            body = {'message': error_message, 'error': outcome}
+        else:
+            body = {'error': outcome}
+    else:
+        body = {
+            'processed': len(records) - len(failures),
+            'failed': len(failures),
+            'results': [outcome for succeeded, outcome in outcomes if succeeded],
+            'failures': failures
+        }
+
+    response = {
+        'statusCode': 500 if failures else 200,
+        'body': json.dumps(body),
+        'batchItemFailures': [
+            {'itemIdentifier': record_identifier(record)}
+            for record, _ in failed_records if event_source(record) == 'aws:sqs'
+        ]
+    }
+    if len(response['batchItemFailures']) < len(failed_records):
+        raise RecordsFailedError(response)
+    return response
@@ -0,0 +1,193 @@
+"""
+Rule Pack Module for EchoGuard
+Loads per-industry compliance rule packs compiled ahead of time into
+versioned binary artifacts, caching them per container
+"""
+import json
+import os
+import pickle
+import struct
+import hashlib
+import threading
+import time
+
+from phrase_index import PhraseIndex
+
+# Rule pack configuration
+RULE_PACK_DIR = os.environ.get('RULE_PACK_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'rules'))
+RULE_PACK_CHECK_SECONDS = float(os.environ.get('RULE_PACK_CHECK_SECONDS', '60'))
+DEFAULT_INDUSTRY = 'financial'
+
+# Artifact layout: magic, format version, version string length, version string, pickled RulePack
+ARTIFACT_MAGIC = b'EGRP'
+ARTIFACT_FORMAT = 4
+_HEADER = struct.Struct('>4sHH')
+
+# Loaded packs keyed by industry: (RulePack, artifact signature, last checked)
+_cache = {}
+_lock = threading.RLock()
+
+class RulePack:
+    """
+    Compiled compliance rules for one industry
+    """
+
+    def __init__(self, industry, version, rules, matcher=None, variants=None):
+        """
+        Args:
+            industry (str): Industry the rules apply to
+            version (str): Rule pack version
+            rules (dict): Phrase to issue description, in reporting order
+            matcher (PhraseIndex): Prebuilt matcher, compiled from rules if omitted
+            variants (dict): Phrase to other spoken forms of it
+        """
+        self.industry = industry
+        self.version = version
+        self.rules = rules
+        self.variants = variants or {}
+        self.matcher = matcher or PhraseIndex(rules, self.variants)
+
+def source_path(industry, rule_dir=None):
+    """
+    Returns the path of an industry's JSON rule source
+    """
+    return os.path.join(rule_dir or RULE_PACK_DIR, f"{industry}.json")
+
+def artifact_path(industry, rule_dir=None):
+    """
+    Returns the path of an industry's compiled rule pack artifact
+    """
+    return os.path.join(rule_dir or RULE_PACK_DIR, f"{industry}.pack")
+
+def compile_rule_pack(path):
+    """
+    Compiles a JSON rule source into a RulePack.
+
+    The version combines the source's declared version with a hash of its
+    contents, so any edit to the rules produces a new version.
+
+    Args:
+        path (str): Path to the JSON rule source
+
+    Returns:
+        RulePack: The compiled rule pack
+    """
+    with open(path, 'rb') as f:
+        raw = f.read()
+    source = json.loads(raw)
+    rules = {phrase.lower(): issue for phrase, issue in source['rules'].items()}
+    variants = {phrase.lower(): forms for phrase, forms in source.get('variants', {}).items()}
+    digest = hashlib.sha256(raw).hexdigest()[:12]
+    version = f"{source.get('version', '0')}+{digest}"
+    return RulePack(source['industry'], version, rules, variants=variants)
+
+def write_artifact(pack, path):
+    """
+    Writes a compiled rule pack artifact, replacing any existing one atomically
+    """
+    version = pack.version.encode('utf-8')
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'wb') as f:
+        f.write(_HEADER.pack(ARTIFACT_MAGIC, ARTIFACT_FORMAT, len(version)))
+        f.write(version)
+        pickle.dump(pack, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temp_path, path)
+
+def read_artifact_version(path):
+    """
+    Reads only the version string from an artifact header
+    """
+    with open(path, 'rb') as f:
+        return _read_header(f)
+
+def load_artifact(path):
+    """
+    Loads a compiled rule pack artifact.
+
+    Returns:
+        RulePack: The rule pack with its prebuilt matcher tables
+    """
+    with open(path, 'rb') as f:
+        version = _read_header(f)
+        pack = pickle.load(f)
+    if pack.version != version:
+        raise ValueError(f"Rule pack artifact {path} is corrupt: header version {version} does not match payload")
+    return pack
+
+def _read_header(f):
+    magic, artifact_format, version_length = _HEADER.unpack(f.read(_HEADER.size))
+    if magic != ARTIFACT_MAGIC or artifact_format != ARTIFACT_FORMAT:
+        raise ValueError(f"Unsupported rule pack artifact format in {f.name}")
+    return f.read(version_length).decode('utf-8')
+
+def build_rule_packs(rule_dir=None):
+    """
+    Compiles every JSON rule source in rule_dir into an artifact next to it.
+
+    Returns:
+        list: (industry, version, artifact path) for each pack built
+    """
+    rule_dir = rule_dir or RULE_PACK_DIR
+    built = []
+    for file_name in sorted(os.listdir(rule_dir)):
+        if not file_name.endswith('.json'):
+            continue
+        pack = compile_rule_pack(os.path.join(rule_dir, file_name))
+        path = artifact_path(pack.industry, rule_dir)
+        write_artifact(pack, path)
+        built.append((pack.industry, pack.version, path))
+    return built
+
+def get_rule_pack(industry=None):
+    """
+    Returns the rule pack for an industry, loading it once per container.
+
+    The artifact is re-checked at most every RULE_PACK_CHECK_SECONDS and
+    swapped in when its version changes. Without an artifact the JSON
+    source is compiled directly, and unknown industries fall back to
+    DEFAULT_INDUSTRY.
+
+    Args:
+        industry (str): Industry name, defaults to DEFAULT_INDUSTRY
+
+    Returns:
+        RulePack: The current rule pack
+    """
+    industry = industry or DEFAULT_INDUSTRY
+    now = time.monotonic()
+    cached = _cache.get(industry)
+    if cached and now - cached[2] < RULE_PACK_CHECK_SECONDS:
+        return cached[0]
+
+    with _lock:
+        cached = _cache.get(industry)
+        if cached and now - cached[2] < RULE_PACK_CHECK_SECONDS:
+            return cached[0]
+
+        signature = _artifact_signature(industry)
+        if cached and cached[1] == signature:
+            pack = cached[0]
+        elif signature is not None:
+            version = read_artifact_version(artifact_path(industry))
+            if cached and cached[0].version == version:
+                pack = cached[0]
+            else:
+                pack = load_artifact(artifact_path(industry))
+                print(f"Loaded rule pack {industry} version {pack.version}")
+        elif os.path.exists(source_path(industry)):
+            pack = cached[0] if cached else compile_rule_pack(source_path(industry))
+        elif industry != DEFAULT_INDUSTRY:
+            print(f"No rule pack for industry {industry}, using {DEFAULT_INDUSTRY}")
+            pack = get_rule_pack(DEFAULT_INDUSTRY)
+        else:
+            raise FileNotFoundError(f"No rule pack found for industry {industry} in {RULE_PACK_DIR}")
+
+        _cache[industry] = (pack, signature, now)
+        return pack
+
+def _artifact_signature(industry):
+    try:
+        stat = os.stat(artifact_path(industry))
+    except FileNotFoundError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
@@ -0,0 +1,191 @@
+"""
+Speaker Segments Module for EchoGuard
+Builds per-speaker turns from Amazon Transcribe speaker labels, picks the
+agent's turns for analysis and fans segments of turns out to the analyzers
+in parallel
+"""
+import bisect
+import collections
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from transcript_chunker import CHUNK_TOKEN_BUDGET, estimate_tokens
+from transcript_stream import iter_segments
+
+# 'agent' analyzes only the agent's turns, 'all' analyzes every turn labeled with its role
+SPEAKER_ANALYSIS_MODE = os.environ.get('SPEAKER_ANALYSIS_MODE', 'agent')
+
+# Which speaker is the agent: 'first' (first to speak), 'most' (most words) or a label such as 'spk_0'
+AGENT_SPEAKER = os.environ.get('AGENT_SPEAKER', 'first')
+
+# Segments analyzed at once
+SPEAKER_SEGMENT_WORKERS = int(os.environ.get('SPEAKER_SEGMENT_WORKERS', '4'))
+
+AGENT_ROLE = 'Agent'
+CUSTOMER_ROLE = 'Customer'
+
+# Punctuation placed between turns; phrases never match across punctuation
+TURN_BOUNDARY = {'type': 'punctuation', 'alternatives': [{'content': '.'}]}
+
+# Consecutive items spoken by one speaker
+Turn = collections.namedtuple('Turn', ['speaker', 'start_time', 'end_time', 'items'])
+
+# Turns packed into one analysis request
+Segment = collections.namedtuple('Segment', ['index', 'turns', 'text', 'tokens'])
+
+def speaker_label_map(results):
+    """
+    Maps item start times to speakers from results.speaker_labels, for
+    output where the items themselves carry no speaker_label
+    """
+    labels = {}
+    for segment in (results.get('speaker_labels') or {}).get('segments', []):
+        for item in segment.get('items', []):
+            labels[item.get('start_time')] = item.get('speaker_label', segment.get('speaker_label'))
+    return labels
+
+def build_turns(results):
+    """
+    Groups Transcribe items into speaker turns.
+
+    Args:
+        results (dict): The results section of Transcribe output
+
+    Returns:
+        list: Turn tuples in spoken order, or an empty list when the
+            transcript has no speaker labels
+    """
+    return turns_from_items(results.get('items', []), speaker_label_map(results))
+
+def turns_from_items(items, labels=None):
+    """
+    Groups streamed Transcribe items into speaker turns.
+
+    Args:
+        items (iterable): Transcribe results.items
+        labels (dict): Item start times to speaker labels, for items
+            without a speaker_label of their own
+
+    Returns:
+        list: Turn tuples, or an empty list when an item has no speaker
+    """
+    labels = labels or {}
+    turns = []
+    speaker = None
+    current = []
+
+    for item in items:
+        if item.get('type') == 'pronunciation':
+            item_speaker = item.get('speaker_label') or labels.get(item.get('start_time'))
+            if item_speaker is None:
+                return []
+            if item_speaker != speaker and current:
+                turns.append(_turn(speaker, current))
+                current = []
+            speaker = item_speaker
+        current.append(item)
+
+    if current and speaker is not None:
+        turns.append(_turn(speaker, current))
+    return turns
+
+def _turn(speaker, items):
+    timed = [item for item in items if item.get('type') == 'pronunciation']
+    return Turn(speaker, float(timed[0]['start_time']), float(timed[-1]['end_time']), items)
+
+def turn_text(turn):
+    """
+    Rebuilds the text of a turn the way Transcribe joins items
+    """
+    return ''.join(text for text, _ in iter_segments(turn.items, len(turn.items) or 1))
+
+def identify_agent(turns, strategy=AGENT_SPEAKER):
+    """
+    Returns the speaker label of the agent
+    """
+    if not turns:
+        return None
+    if strategy == 'first':
+        return turns[0].speaker
+    if strategy == 'most':
+        words = collections.Counter()
+        for turn in turns:
+            words[turn.speaker] += sum(1 for item in turn.items if item.get('type') == 'pronunciation')
+        return words.most_common(1)[0][0]
+    return strategy
+
+def role(speaker, agent):
+    """
+    Returns AGENT_ROLE or CUSTOMER_ROLE for a speaker label
+    """
+    return AGENT_ROLE if speaker == agent else CUSTOMER_ROLE
+
+def select_turns(turns, agent, mode=SPEAKER_ANALYSIS_MODE):
+    """
+    Returns the turns to analyze: the agent's only, or every turn
+    """
+    if mode == 'all':
+        return list(turns)
+    return [turn for turn in turns if turn.speaker == agent]
+
+def group_turns(turns, agent, token_budget=CHUNK_TOKEN_BUDGET):
+    """
+    Packs consecutive turns into segments of at most token_budget estimated
+    tokens, each turn on its own line prefixed with its role. A turn over
+    the budget forms a segment by itself.
+
+    Returns:
+        list: Segment tuples
+    """
+    segments = []
+    lines = []
+    members = []
+    tokens = 0
+
+    for turn in turns:
+        line = f"{role(turn.speaker, agent)}: {turn_text(turn)}"
+        line_tokens = estimate_tokens(line)
+        if members and tokens + line_tokens > token_budget:
+            segments.append(Segment(len(segments), members, '\n'.join(lines), tokens))
+            lines, members, tokens = [], [], 0
+        lines.append(line)
+        members.append(turn)
+        tokens += line_tokens
+
+    if members:
+        segments.append(Segment(len(segments), members, '\n'.join(lines), tokens))
+    return segments
+
+def turn_items(turns):
+    """
+    Returns the items of the given turns as one list, for keyword scanning.
+    A TURN_BOUNDARY item goes between turns, so a phrase cannot be matched
+    across two turns that were not adjacent in the call.
+    """
+    items = []
+    for turn in turns:
+        if items:
+            items.append(TURN_BOUNDARY)
+        items.extend(turn.items)
+    return items
+
+def label_finding(finding, turns, agent):
+    """
+    Adds the speaker and role of the turn a timed finding falls in
+    """
+    starts = [turn.start_time for turn in turns]
+    position = bisect.bisect_right(starts, finding.get('start_time') or 0) - 1
+    speaker = turns[max(position, 0)].speaker if turns else None
+    finding['speaker'] = speaker
+    finding['role'] = role(speaker, agent)
+    return finding
+
+def fan_out(segments, analyze, max_workers=SPEAKER_SEGMENT_WORKERS):
+    """
+    Runs analyze(segment) for every segment in parallel, returning the
+    results in segment order
+    """
+    if len(segments) <= 1 or max_workers <= 1:
+        return [analyze(segment) for segment in segments]
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(segments))) as executor:
+        return list(executor.map(analyze, segments))
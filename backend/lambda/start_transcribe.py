@@ -1,61 +1,82 @@
-import boto3
 import os
 import json
+import hashlib
 import logging
-from urllib.parse import unquote_plus
+
+import aws_clients
+import media_probe
+import record_dispatch
+import transcription_jobs
 
 # Configure logging
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
+# AWS clients, created on first use and reused by warm invocations
+transcribe_client = aws_clients.LazyClient('transcribe')
+s3_client = aws_clients.LazyClient('s3')
+
 def lambda_handler(event, context):
     logger.info(f"Received event: {json.dumps(event)}")
     
+    # Start a job for every uploaded object in the batch
+    return record_dispatch.dispatch(
+        event,
+        lambda record: record_dispatch.process_s3_objects(
+            record, lambda bucket, s3_obj: start_transcription(bucket, s3_obj, context)
+        )
+    )
+
+def start_transcription(bucket, s3_obj, context):
+    """
+    Starts a transcription job for one uploaded audio object
+    """
     try:
-        # Get the object details from the event
-        s3_obj = unquote_plus(event['Records'][0]['s3']['object']['key'])
-        bucket = event['Records'][0]['s3']['bucket']['name']
+        # Create a unique job name; the object hash keeps names unique within a batch
+        suffix = f"_{context.aws_request_id}_{hashlib.sha1(f'{bucket}/{s3_obj}'.encode('utf-8')).hexdigest()[:8]}"
+        job_name = f"transcribe_{s3_obj.replace('/', '_').replace('.', '_')}"
+        job_name = job_name[:128 - len(suffix)] + suffix  # Ensure job name doesn't exceed AWS limits
         
-        # Create a unique job name
-        job_name = f"transcribe_{s3_obj.replace('/', '_').replace('.', '_')}_{context.aws_request_id}"
-        job_name = job_name[:128]  # Ensure job name doesn't exceed AWS limits
-        
-        # Determine media format from file extension
+        # Determine media format from the file header, falling back to the extension
         file_ext = s3_obj.split('.')[-1].lower()
-        media_format = file_ext if file_ext in ['mp3', 'mp4', 'wav', 'flac'] else 'mp3'
+        extension_format = file_ext if file_ext in ['mp3', 'mp4', 'wav', 'flac'] else 'mp3'
+        try:
+            media = media_probe.validate(media_probe.probe_object(s3_client, bucket, s3_obj))
+        except media_probe.UnsupportedMedia as e:
+            logger.warning(f"Rejected s3://{bucket}/{s3_obj}: {str(e)}")
+            return {
+                "file": s3_obj,
+                "status": "REJECTED",
+                "reason": str(e)
+            }
+        except Exception as e:
+            logger.warning(f"Could not probe s3://{bucket}/{s3_obj}, using its extension: {str(e)}")
+            media = media_probe.UNKNOWN._replace(format=extension_format)
+        media_format = media.format
+        if media_format != extension_format:
+            logger.info(f"{s3_obj} is {media_format}, not {extension_format} as its extension suggests")
         
         logger.info(f"Starting transcription job: {job_name} for s3://{bucket}/{s3_obj}")
         
-        # Start transcription job
-        transcribe = boto3.client('transcribe')
-        response = transcribe.start_transcription_job(
+        # Start transcription job; the legacy stack has no scheduler table or
+        # completion hook to release a slot, so it is not queued
+        response = transcribe_client.start_transcription_job(
             TranscriptionJobName=job_name,
             Media={'MediaFileUri': f's3://{bucket}/{s3_obj}'},
             MediaFormat=media_format,
             LanguageCode='en-US',
             OutputBucketName=os.environ['TRANSCRIBE_OUTPUT_BUCKET'],
-            Settings={
-                'ShowSpeakerLabels': True,
-                'MaxSpeakerLabels': 10
-            }
+            Settings=transcription_jobs.settings()
         )
         
         logger.info(f"Transcription job started: {response['TranscriptionJob']['TranscriptionJobStatus']}")
         
         return {
-            "statusCode": 200,
-            "body": json.dumps({
-                "jobName": job_name,
-                "status": response['TranscriptionJob']['TranscriptionJobStatus'],
-                "file": s3_obj
-            })
+            "jobName": job_name,
+            "status": response['TranscriptionJob']['TranscriptionJobStatus'],
+            "file": s3_obj
         }
         
     except Exception as e:
         logger.error(f"Error starting transcription job: {str(e)}")
-        return {
-            "statusCode": 500,
-            "body": json.dumps({
-                "error": str(e)
-            })
-        }
\ No newline at end of file
+        raise
\ No newline at end of file
@@ -0,0 +1,166 @@
+"""
+Tiered Analysis Module for EchoGuard
+Decides from the local keyword tier's result whether a transcript needs the
+Bedrock tier. Calls the keyword tier scores as clearly clean or clearly
+violating are not sent to Bedrock.
+"""
+import collections
+import os
+
+import transcript_stream
+
+# Confidence bands for the keyword tier's compliance score (0-100)
+TIER_CLEAN_MIN_SCORE = int(os.environ.get('TIER_CLEAN_MIN_SCORE', '100'))
+TIER_VIOLATION_MAX_SCORE = int(os.environ.get('TIER_VIOLATION_MAX_SCORE', '60'))
+
+# Lowest match and recognition confidence a finding needs to count toward a violation verdict
+TIER_MIN_FINDING_CONFIDENCE = float(os.environ.get('TIER_MIN_FINDING_CONFIDENCE', '0.8'))
+
+# Evidence a call without findings needs to be called clean: enough scanned
+# words, recognized with enough mean confidence that no finding was missed
+TIER_CLEAN_MIN_WORDS = int(os.environ.get('TIER_CLEAN_MIN_WORDS', '50'))
+TIER_CLEAN_MIN_ASR_CONFIDENCE = float(os.environ.get('TIER_CLEAN_MIN_ASR_CONFIDENCE', '0.9'))
+
+# Set to 'false' to send every transcript to Bedrock
+TIERED_ANALYSIS_ENABLED = os.environ.get('TIERED_ANALYSIS_ENABLED', 'true').lower() == 'true'
+
+# Tiers a verdict can come from
+KEYWORD_TIER = 'keyword'
+BEDROCK_TIER = 'bedrock'
+
+# Bands a keyword verdict can fall in
+CLEAN_BAND = 'clean'
+VIOLATION_BAND = 'violation'
+
+ConfidenceBands = collections.namedtuple('ConfidenceBands', [
+    'clean_min_score', 'violation_max_score', 'min_finding_confidence', 'clean_min_words', 'clean_min_asr_confidence'
+])
+
+DEFAULT_BANDS = ConfidenceBands(
+    TIER_CLEAN_MIN_SCORE, TIER_VIOLATION_MAX_SCORE, TIER_MIN_FINDING_CONFIDENCE,
+    TIER_CLEAN_MIN_WORDS, TIER_CLEAN_MIN_ASR_CONFIDENCE
+)
+
+# The tier chosen for a transcript; results is the keyword verdict, or None
+# when the transcript has to be escalated to Bedrock
+TierDecision = collections.namedtuple('TierDecision', ['tier', 'band', 'results'])
+
+class ScanEvidence:
+    """
+    Counts the words a keyword scan saw and their recognition confidence,
+    passing the Transcribe items through unchanged. Words without a
+    confidence count as fully confident, as they do for findings.
+    """
+
+    def __init__(self):
+        self.words = 0
+        self.confidence_total = 0.0
+
+    def track(self, items):
+        for item in items:
+            if item.get('type') == 'pronunciation':
+                self.words += 1
+                self.confidence_total += transcript_stream.item_confidence(item)
+            yield item
+
+    @property
+    def mean_confidence(self):
+        return self.confidence_total / self.words if self.words else 0.0
+
+def finding_confidence(finding):
+    """
+    Returns how sure the keyword tier is of a finding: the lower of its match
+    confidence and the recognition confidence of the words it covers
+    """
+    asr_confidence = finding.get('asr_confidence')
+    if asr_confidence is None:
+        return finding.get('confidence', 1.0)
+    return min(finding.get('confidence', 1.0), asr_confidence)
+
+def confident_keywords(keyword_results, bands=DEFAULT_BANDS):
+    """
+    Returns the keywords found with at least min_finding_confidence
+    """
+    return {
+        match['keyword'] for match in keyword_results.get('matches', [])
+        if finding_confidence(match) >= bands.min_finding_confidence
+    }
+
+def confident_score(keyword_results, bands=DEFAULT_BANDS):
+    """
+    Rescores a keyword tier result with only the keywords found with
+    confidence, deducting 10 points per keyword as the keyword tier does
+    """
+    return max(0, 100 - 10 * len(confident_keywords(keyword_results, bands)))
+
+def classify(keyword_results, bands=DEFAULT_BANDS, evidence=None):
+    """
+    Places a keyword tier result in a confidence band.
+
+    Finding nothing only makes a call clean when the scan has positive
+    evidence: at least clean_min_words words recognized with a mean
+    confidence of at least clean_min_asr_confidence. Without evidence, a
+    short, empty or poorly recognized call is never clean.
+
+    Args:
+        keyword_results (dict): Result of kiro_integration.analyze_compliance_items
+        bands (ConfidenceBands): Score and confidence thresholds
+        evidence (ScanEvidence): Words the scan saw
+
+    Returns:
+        str: CLEAN_BAND, VIOLATION_BAND, or None when the result is uncertain
+    """
+    score = keyword_results.get('compliance_score')
+    if score is None:
+        return None
+    if score >= bands.clean_min_score:
+        if (evidence is not None and evidence.words >= max(1, bands.clean_min_words)
+                and evidence.mean_confidence >= bands.clean_min_asr_confidence):
+            return CLEAN_BAND
+        return None
+
+    if score <= bands.violation_max_score and confident_score(keyword_results, bands) <= bands.violation_max_score:
+        return VIOLATION_BAND
+    return None
+
+def keyword_verdict(keyword_results, band, bands=DEFAULT_BANDS):
+    """
+    Converts a keyword tier result into the Bedrock result format, so it can
+    stand in for the Bedrock analysis. A violation verdict is built from the
+    confident findings only, the same ones classify counted.
+    """
+    issues = []
+    score = keyword_results['compliance_score']
+    if band == VIOLATION_BAND:
+        confident = confident_keywords(keyword_results, bands)
+        issues = [
+            {
+                'description': finding,
+                'risk_level': 'High',
+                'recommendation': recommendation
+            }
+            for keyword, finding, recommendation in zip(
+                keyword_results['finding_keywords'], keyword_results['findings'], keyword_results['recommendations']
+            )
+            if keyword in confident
+        ]
+        score = confident_score(keyword_results, bands)
+    return {
+        'issues': issues,
+        'overall_score': score,
+        'summary': f"Keyword analysis found the call clearly {'compliant' if band == CLEAN_BAND else 'non-compliant'}; Bedrock analysis was not needed"
+    }
+
+def choose_tier(keyword_results, bands=DEFAULT_BANDS, enabled=None, evidence=None):
+    """
+    Decides which tier produces the verdict for a transcript.
+
+    Returns:
+        TierDecision: The keyword tier with its verdict when the result falls
+            in a confidence band, otherwise the Bedrock tier
+    """
+    enabled = TIERED_ANALYSIS_ENABLED if enabled is None else enabled
+    band = classify(keyword_results, bands, evidence) if enabled and keyword_results else None
+    if band is None:
+        return TierDecision(BEDROCK_TIER, None, None)
+    return TierDecision(KEYWORD_TIER, band, keyword_verdict(keyword_results, band, bands))
@@ -1,12 +1,18 @@
 import json
-import boto3
 import os
 import time
 
-# Initialize AWS clients
-s3 = boto3.client('s3')
-dynamodb = boto3.resource('dynamodb')
-sns = boto3.client('sns')
+import aws_clients
+import chunked_transcription
+import media_dedup
+import transcription_jobs
+import transcription_scheduler
+
+# AWS clients, created on first use
+s3 = aws_clients.LazyClient('s3')
+dynamodb = aws_clients.LazyResource('dynamodb')
+sns = aws_clients.LazyClient('sns')
+transcribe = aws_clients.LazyClient('transcribe')
 
 # Environment variables
 TRANSCRIPT_BUCKET = os.environ.get('TRANSCRIPT_BUCKET', 'echoguard-transcripts-656570226565')
@@ -20,22 +26,51 @@ def lambda_handler(event, context):
     Expected CloudWatch Event format:
     {
         "detail": {
-            "TranscriptionJobName": "echoguard-abc-123-1626123456",
+            "TranscriptionJobName": "echoguard-3f2b8c1e-7a4d-4c2e-9b1f-0d6e5a4c3b2a-1626123456",
             "TranscriptionJobStatus": "COMPLETED"
         }
     }
+    
+    Jobs for segments of a long recording, named with a -part<n> suffix,
+    trigger analysis once the last of them completes.
     """
     try:
         # Extract job details from event
         job_name = event['detail']['TranscriptionJobName']
         job_status = event['detail']['TranscriptionJobStatus']
         
+        # The job's slot is free; start queued jobs in its place
+        if job_status in transcription_scheduler.FINISHED_JOB_STATUSES:
+            release_job_slot(job_name)
+        
         # Get recording ID from job name
-        recording_id = job_name.split('-')[1]
+        recording_id = transcription_jobs.recording_id(job_name)
+        if recording_id is None:
+            return {
+                'statusCode': 200,
+                'body': json.dumps({
+                    'message': 'Not an EchoGuard transcription job',
+                    'jobName': job_name
+                })
+            }
         
         if job_status == 'COMPLETED':
-            # Update recording status in DynamoDB
-            update_recording_status(recording_id, 'TRANSCRIBED')
+            segment = transcription_jobs.segment_index(job_name)
+            if segment is None:
+                # Update recording status in DynamoDB
+                update_recording_status(recording_id, 'TRANSCRIBED')
+            elif not chunked_transcription.complete_segment(
+                dynamodb.Table(RECORDINGS_TABLE), s3, TRANSCRIPT_BUCKET, recording_id, segment
+            ):
+                # Other segments are still being transcribed; the last one stitches the transcript
+                return {
+                    'statusCode': 200,
+                    'body': json.dumps({
+                        'message': 'Segment transcription completed',
+                        'recordingId': recording_id,
+                        'segment': segment
+                    })
+                }
             
             # Get transcript file path
             transcript_key = f"{recording_id}/transcript.json"
@@ -51,8 +86,13 @@ def lambda_handler(event, context):
                 })
             }
         else:
-            # Handle failed transcription
-            update_recording_status(recording_id, 'TRANSCRIPTION_FAILED')
+            # Handle failed transcription; later uploads of the same media get their own job
+            recording = update_recording_status(recording_id, 'TRANSCRIPTION_FAILED')
+            if recording.get('contentHash'):
+                media_dedup.update_duplicates(
+                    dynamodb.Table(RECORDINGS_TABLE), recording,
+                    media_dedup.release(recording['contentHash'], recording_id)
+                )
             
             return {
                 'statusCode': 200,
@@ -73,12 +113,27 @@ def lambda_handler(event, context):
             })
         }
 
+def release_job_slot(job_name):
+    """
+    Releases a finished job's slot and starts queued jobs. Errors are logged
+    rather than raised; the queue is drained again by later completions.
+    """
+    try:
+        scheduler = transcription_scheduler.TranscriptionScheduler(transcribe)
+        scheduler.release(job_name)
+        started = scheduler.drain()
+        if started:
+            print(f"Started {len(started)} queued transcription jobs")
+    except Exception as e:
+        print(f"Error releasing transcription job slot: {str(e)}")
+
 def update_recording_status(recording_id, status):
     """
-    Updates the status of a recording in DynamoDB
+    Updates the status of a recording in DynamoDB and returns the
+    updated recording
     """
     recordings_table = dynamodb.Table(RECORDINGS_TABLE)
-    recordings_table.update_item(
+    response = recordings_table.update_item(
         Key={'recordingId': recording_id},
         UpdateExpression="set #status = :status, updatedAt = :timestamp",
         ExpressionAttributeNames={
@@ -87,8 +142,10 @@ def update_recording_status(recording_id, status):
         ExpressionAttributeValues={
             ':status': status,
             ':timestamp': int(time.time())
-        }
+        },
+        ReturnValues='ALL_NEW'
     )
+    return response.get('Attributes', {})
 
 def notify_analysis_service(recording_id, transcript_key):
     """
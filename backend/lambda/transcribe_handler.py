@@ -1,15 +1,23 @@
 import json
-import boto3
 import os
 import uuid
 import time
 from datetime import datetime
+from decimal import Decimal
 
-# Initialize AWS clients
-s3 = boto3.client('s3')
-transcribe = boto3.client('transcribe')
-dynamodb = boto3.resource('dynamodb')
-sns = boto3.client('sns')
+import aws_clients
+import chunked_transcription
+import media_dedup
+import media_probe
+import record_dispatch
+import transcription_jobs
+import transcription_scheduler
+
+# AWS clients, created on first use
+s3 = aws_clients.LazyClient('s3')
+transcribe = aws_clients.LazyClient('transcribe')
+dynamodb = aws_clients.LazyResource('dynamodb')
+sns = aws_clients.LazyClient('sns')
 
 # Environment variables
 AUDIO_BUCKET = os.environ.get('AUDIO_BUCKET', 'echoguard-audio-656570226565')
@@ -21,56 +29,109 @@ def lambda_handler(event, context):
     """
     Handles transcription of audio files using Amazon Transcribe.
     
-    Expected SNS event format:
+    Expected SNS or SQS message format:
     {
         "recordingId": "abc-123",
         "s3Key": "user123/abc-123/recording.mp3",
-        "bucket": "echoguard-audio-656570226565"
+        "bucket": "echoguard-audio-656570226565",
+        "priority": 5
     }
+    
+    A transcription job is submitted for every record in the event; jobs
+    over TRANSCRIBE_MAX_CONCURRENT_JOBS are queued by priority, lower
+    numbers first. With CHUNKED_TRANSCRIPTION_ENABLED, long WAV and FLAC
+    recordings are cut into segments transcribed by parallel jobs. Failed
+    SQS messages are returned in batchItemFailures.
+    """
+    return record_dispatch.dispatch(event, transcribe_record, 'Error starting transcription job')
+
+def transcribe_record(record):
+    """
+    Starts the transcription job for one SNS or SQS record, or links the
+    recording to an earlier upload of the same media
     """
+    media_hash = None
     try:
-        # Extract message from SNS event
-        message = json.loads(event['Records'][0]['Sns']['Message'])
+        # Extract message from the record
+        message = record_dispatch.message(record)
         
         recording_id = message.get('recordingId')
         s3_key = message.get('s3Key')
         bucket = message.get('bucket', AUDIO_BUCKET)
         
-        # Update recording status in DynamoDB
-        update_recording_status(recording_id, 'TRANSCRIBING')
+        # Check the upload's header before paying for a job that would fail
+        media = probe_media(bucket, s3_key)
+        try:
+            media_probe.validate(media)
+        except media_probe.UnsupportedMedia as e:
+            print(f"Rejected {s3_key}: {str(e)}")
+            reject_recording(recording_id, str(e))
+            return {
+                'message': 'Media rejected',
+                'recordingId': recording_id,
+                'reason': str(e)
+            }
         
-        # Start transcription job
-        job_name = f"echoguard-{recording_id}-{int(time.time())}"
-        media_uri = f"s3://{bucket}/{s3_key}"
+        # Reuse the transcript and analysis of an earlier upload of the same media
+        media_hash, original_id = find_original(bucket, s3_key, recording_id)
+        if original_id:
+            print(f"Recording {recording_id} duplicates {original_id}")
+            link_duplicate(recording_id, original_id, media_hash)
+            return {
+                'message': 'Duplicate recording linked',
+                'recordingId': recording_id,
+                'duplicateOf': original_id
+            }
         
-        response = transcribe.start_transcription_job(
-            TranscriptionJobName=job_name,
-            Media={'MediaFileUri': media_uri},
-            MediaFormat=get_media_format(s3_key),
-            LanguageCode='en-US',
-            OutputBucketName=TRANSCRIPT_BUCKET,
-            OutputKey=f"{recording_id}/transcript.json"
-        )
+        # Long recordings are transcribed as parallel segment jobs
+        if chunked_transcription.should_split(media):
+            segments = split_recording(bucket, s3_key, recording_id, media.format)
+            if len(segments) > 1:
+                return transcribe_segments(recording_id, bucket, segments, media, media_hash, message.get('priority'))
+        
+        job_name = transcription_jobs.job_name(recording_id)
+        media_uri = f"s3://{bucket}/{s3_key}"
         
-        # Store transcription job details in DynamoDB
+        # Store the media details; the recording waits as QUEUED until a job slot is free
         recordings_table = dynamodb.Table(RECORDINGS_TABLE)
         recordings_table.update_item(
             Key={'recordingId': recording_id},
-            UpdateExpression="set transcriptionJobId = :jobId, transcriptionJobName = :jobName, updatedAt = :timestamp",
+            UpdateExpression=(
+                "set #status = :status, transcriptionJobName = :jobName, "
+                "mediaFormat = :format, mediaDurationSeconds = :duration, contentHash = :hash, updatedAt = :timestamp"
+            ),
+            ExpressionAttributeNames={
+                '#status': 'status'
+            },
             ExpressionAttributeValues={
-                ':jobId': response['TranscriptionJob']['TranscriptionJobName'],
+                ':status': 'QUEUED',
                 ':jobName': job_name,
+                ':format': media.format,
+                ':duration': media_duration(media),
+                ':hash': media_hash,
                 ':timestamp': int(time.time())
             }
         )
         
+        # Start the transcription job now, or once running jobs finish
+        started = scheduler().submit(
+            job_name,
+            {
+                'Media': {'MediaFileUri': media_uri},
+                'MediaFormat': media.format,
+                'LanguageCode': 'en-US',
+                'OutputBucketName': TRANSCRIPT_BUCKET,
+                'OutputKey': f"{recording_id}/transcript.json",
+                'Settings': transcription_jobs.settings()
+            },
+            recording_id=recording_id,
+            priority=message.get('priority')
+        )
+        
         return {
-            'statusCode': 200,
-            'body': json.dumps({
-                'message': 'Transcription job started successfully',
-                'recordingId': recording_id,
-                'transcriptionJobName': job_name
-            })
+            'message': 'Transcription job started successfully' if started else 'Transcription job queued',
+            'recordingId': recording_id,
+            'transcriptionJobName': job_name
         }
         
     except Exception as e:
@@ -79,14 +140,171 @@ def lambda_handler(event, context):
         # Update recording status to error if we have a recording ID
         if 'recording_id' in locals():
             update_recording_status(recording_id, 'TRANSCRIPTION_ERROR')
+            if media_hash:
+                media_dedup.update_duplicates(
+                    dynamodb.Table(RECORDINGS_TABLE),
+                    {'recordingId': recording_id, 'status': 'TRANSCRIPTION_ERROR'},
+                    media_dedup.release(media_hash, recording_id)
+                )
         
-        return {
-            'statusCode': 500,
-            'body': json.dumps({
-                'message': 'Error starting transcription job',
-                'error': str(e)
-            })
+        raise
+
+def probe_media(bucket, s3_key):
+    """
+    Identifies the upload from its first bytes, correcting a mislabeled
+    extension. Falls back to the extension when the object cannot be read.
+    """
+    try:
+        media = media_probe.probe_object(s3, bucket, s3_key)
+    except Exception as e:
+        print(f"Could not probe {s3_key}, using its extension: {str(e)}")
+        return media_probe.UNKNOWN._replace(format=get_media_format(s3_key))
+    
+    if media.format and media.format != get_media_format(s3_key):
+        print(f"{s3_key} is {media.format}, not {get_media_format(s3_key)} as its extension suggests")
+    return media
+
+def split_recording(bucket, s3_key, recording_id, media_format):
+    """
+    Cuts a long recording into segments uploaded next to it. Returns no
+    segments when it cannot be split, so it is transcribed whole.
+    """
+    try:
+        return chunked_transcription.split_object(s3, bucket, s3_key, recording_id, media_format)
+    except Exception as e:
+        print(f"Could not split {s3_key}, transcribing it whole: {str(e)}")
+        return []
+
+def transcribe_segments(recording_id, bucket, segments, media, media_hash, priority):
+    """
+    Submits one transcription job per segment of a long recording. The
+    completion handler stitches the segment transcripts into the
+    recording's transcript.json once every job has completed, matching
+    speakers across segments within the maxSpeakerLabels stored here.
+    """
+    max_speakers = transcription_jobs.TRANSCRIBE_MAX_SPEAKER_LABELS
+    recordings_table = dynamodb.Table(RECORDINGS_TABLE)
+    recordings_table.update_item(
+        Key={'recordingId': recording_id},
+        UpdateExpression=(
+            "set #status = :status, transcriptionSegments = :segments, "
+            "mediaFormat = :format, mediaDurationSeconds = :duration, contentHash = :hash, "
+            "maxSpeakerLabels = :speakers, updatedAt = :timestamp "
+            "remove segmentsCompleted"
+        ),
+        ExpressionAttributeNames={
+            '#status': 'status'
+        },
+        ExpressionAttributeValues={
+            ':status': 'QUEUED',
+            ':segments': chunked_transcription.segments_to_item(segments),
+            ':format': media.format,
+            ':duration': media_duration(media),
+            ':hash': media_hash,
+            ':speakers': max_speakers,
+            ':timestamp': int(time.time())
+        }
+    )
+    
+    segment_scheduler = scheduler()
+    started = 0
+    for segment in segments:
+        started += segment_scheduler.submit(
+            transcription_jobs.job_name(recording_id, segment=segment.index),
+            {
+                'Media': {'MediaFileUri': f"s3://{bucket}/{chunked_transcription.segment_key(recording_id, segment.index)}"},
+                'MediaFormat': 'wav',
+                'LanguageCode': 'en-US',
+                'OutputBucketName': TRANSCRIPT_BUCKET,
+                'OutputKey': chunked_transcription.segment_transcript_key(recording_id, segment.index),
+                'Settings': transcription_jobs.settings(max_speakers)
+            },
+            recording_id=recording_id,
+            priority=priority
+        )
+    
+    return {
+        'message': 'Segment transcription jobs submitted',
+        'recordingId': recording_id,
+        'segments': len(segments),
+        'started': started
+    }
+
+def media_duration(media):
+    """
+    Returns the probed duration for DynamoDB, or None when it is unknown
+    """
+    return None if media.duration_seconds is None else Decimal(str(round(media.duration_seconds, 1)))
+
+def scheduler():
+    """
+    Returns the scheduler that admits jobs under the concurrent job quota
+    """
+    return transcription_scheduler.TranscriptionScheduler(transcribe, recordings_table=dynamodb.Table(RECORDINGS_TABLE))
+
+def find_original(bucket, s3_key, recording_id):
+    """
+    Claims the upload's content hash for this recording.
+    
+    Returns:
+        tuple: (content hash, recordingId of an earlier upload of the same
+            media or None); the hash is None when it could not be checked
+    """
+    if not media_dedup.MEDIA_DEDUP_ENABLED:
+        return None, None
+    try:
+        media_hash = media_dedup.content_hash(s3, bucket, s3_key)
+        owner = media_dedup.claim(media_hash, recording_id)
+    except Exception as e:
+        print(f"Could not check {s3_key} for duplicates: {str(e)}")
+        return None, None
+    return media_hash, (owner if owner != recording_id else None)
+
+def link_duplicate(recording_id, original_id, media_hash):
+    """
+    Points a recording at the earlier upload it duplicates. It stays
+    DUPLICATE until the original reaches a final status, which it then
+    shares, with the score once the original is analyzed.
+    """
+    recordings_table = dynamodb.Table(RECORDINGS_TABLE)
+    recordings_table.update_item(
+        Key={'recordingId': recording_id},
+        UpdateExpression="set #status = :status, duplicateOf = :original, contentHash = :hash, updatedAt = :timestamp",
+        ExpressionAttributeNames={
+            '#status': 'status'
+        },
+        ExpressionAttributeValues={
+            ':status': 'DUPLICATE',
+            ':original': original_id,
+            ':hash': media_hash,
+            ':timestamp': int(time.time())
+        }
+    )
+    
+    # Listed before the original is read: either the original sees this
+    # recording when it finishes, or it has finished already
+    media_dedup.add_duplicate(media_hash, original_id, recording_id)
+    original = recordings_table.get_item(Key={'recordingId': original_id}, ConsistentRead=True).get('Item', {})
+    if original.get('status') in media_dedup.FINAL_STATUSES:
+        media_dedup.update_duplicates(recordings_table, original, [recording_id])
+
+def reject_recording(recording_id, reason):
+    """
+    Marks a recording whose media Transcribe cannot process
+    """
+    recordings_table = dynamodb.Table(RECORDINGS_TABLE)
+    recordings_table.update_item(
+        Key={'recordingId': recording_id},
+        UpdateExpression="set #status = :status, errorMessage = :reason, updatedAt = :timestamp",
+        ExpressionAttributeNames={
+            '#status': 'status'
+        },
+        ExpressionAttributeValues={
+            ':status': 'INVALID_MEDIA',
+            ':reason': reason,
+            ':timestamp': int(time.time())
         }
+    )
 
 def get_media_format(s3_key):
     """
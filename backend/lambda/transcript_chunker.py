@@ -0,0 +1,163 @@
+"""
+Transcript Chunker Module for EchoGuard
+Splits long transcripts into overlapping chunks that fit a token budget and
+merges the per-chunk analyses back into one result
+"""
+import collections
+import math
+import os
+import re
+
+# Chunking configuration
+CHUNK_TOKEN_BUDGET = int(os.environ.get('CHUNK_TOKEN_BUDGET', '6000'))
+CHUNK_OVERLAP_TOKENS = int(os.environ.get('CHUNK_OVERLAP_TOKENS', '200'))
+
+# Rough characters-per-token ratio for English text
+CHARS_PER_TOKEN = 4
+
+# Ordering used to keep the most severe copy of a duplicated issue
+RISK_LEVELS = {'low': 0, 'medium': 1, 'high': 2}
+
+_SENTENCE_END_RE = re.compile(r'(?<=[.!?])\s+')
+_ISSUE_KEY_RE = re.compile(r'[^\w]+')
+
+Chunk = collections.namedtuple('Chunk', ['index', 'text', 'tokens'])
+
+def estimate_tokens(text):
+    """
+    Estimates the number of model tokens in text
+    """
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+def split_sentences(text):
+    """
+    Splits text into sentences on terminal punctuation
+    """
+    return [sentence for sentence in _SENTENCE_END_RE.split(text.strip()) if sentence]
+
+def _fit(unit, token_budget):
+    """
+    Splits a unit larger than the budget on word boundaries
+    """
+    if estimate_tokens(unit) <= token_budget:
+        return [unit]
+
+    pieces = []
+    words = []
+    length = 0
+    for word in unit.split():
+        if words and math.ceil((length + len(word)) / CHARS_PER_TOKEN) > token_budget:
+            pieces.append(' '.join(words))
+            words, length = [], 0
+        words.append(word)
+        length += len(word) + 1
+    if words:
+        pieces.append(' '.join(words))
+    return pieces
+
+def chunk_units(units, token_budget=CHUNK_TOKEN_BUDGET, overlap_tokens=CHUNK_OVERLAP_TOKENS):
+    """
+    Packs text units (sentences or speaker turns) into chunks.
+
+    Each chunk after the first starts with the trailing units of the previous
+    chunk, up to overlap_tokens, so an issue spanning a boundary is seen
+    whole by at least one chunk.
+
+    Args:
+        units (iterable): Text units in order
+        token_budget (int): Maximum estimated tokens per chunk
+        overlap_tokens (int): Maximum estimated tokens repeated between chunks
+
+    Returns:
+        list: Chunk tuples (index, text, tokens)
+    """
+    chunks = []
+    current = []
+    current_tokens = 0
+
+    for unit in units:
+        for piece in _fit(unit, token_budget):
+            tokens = estimate_tokens(piece) + 1
+            if current and current_tokens + tokens > token_budget:
+                chunks.append(_chunk(len(chunks), current))
+
+                overlap = []
+                overlap_total = 0
+                for previous in reversed(current):
+                    if overlap_total + previous[1] > overlap_tokens:
+                        break
+                    overlap.insert(0, previous)
+                    overlap_total += previous[1]
+                while overlap and overlap_total + tokens > token_budget:
+                    overlap_total -= overlap.pop(0)[1]
+                current, current_tokens = overlap, overlap_total
+
+            current.append((piece, tokens))
+            current_tokens += tokens
+
+    if current:
+        chunks.append(_chunk(len(chunks), current))
+    return chunks
+
+def _chunk(index, units):
+    text = ' '.join(unit for unit, _ in units)
+    return Chunk(index, text, estimate_tokens(text))
+
+def chunk_transcript(text, token_budget=CHUNK_TOKEN_BUDGET, overlap_tokens=CHUNK_OVERLAP_TOKENS):
+    """
+    Splits a transcript into overlapping chunks on sentence boundaries
+    """
+    return chunk_units(split_sentences(text), token_budget, overlap_tokens)
+
+def _issue_key(issue):
+    return _ISSUE_KEY_RE.sub(' ', issue.get('description', '').lower()).strip()
+
+def _risk(issue):
+    return RISK_LEVELS.get(str(issue.get('risk_level', '')).lower(), 1)
+
+def merge_results(chunks, results):
+    """
+    Merges per-chunk analyses into one result.
+
+    Issues with the same description are reported once at their highest
+    risk level. The overall score is the lowest chunk score, so a severe
+    violation in one chunk is not averaged away by clean chunks.
+
+    Args:
+        chunks (list): Chunk tuples that were analyzed
+        results (list): Analysis result for each chunk, in the same order
+
+    Returns:
+        dict: Result with issues, overall_score, summary and chunk count
+
+    Raises:
+        ValueError: If a chunk result has no overall score
+    """
+    issues = {}
+    summaries = []
+    scores = []
+
+    for chunk, result in zip(chunks, results):
+        score = result.get('overall_score')
+        if not isinstance(score, (int, float)) or isinstance(score, bool):
+            raise ValueError(f"Chunk {chunk.index} analysis has no overall score")
+        scores.append(score)
+
+        for issue in result.get('issues', []):
+            key = _issue_key(issue)
+            if key not in issues or _risk(issue) > _risk(issues[key]):
+                issues[key] = issue
+
+        summary = result.get('summary')
+        if summary and summary not in summaries:
+            summaries.append(summary)
+
+    if not scores:
+        raise ValueError("No chunk analyses to merge")
+
+    return {
+        'issues': list(issues.values()),
+        'overall_score': min(scores),
+        'summary': ' '.join(summaries),
+        'chunks': len(chunks)
+    }
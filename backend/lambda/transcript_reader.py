@@ -0,0 +1,270 @@
+"""
+Transcript Reader Module for EchoGuard
+Streams Amazon Transcribe output JSON from an S3 body and decodes only the
+requested paths, so memory stays bounded by the largest value read rather
+than by the length of the call
+"""
+import codecs
+import collections
+import json
+import os
+import re
+
+# Bytes read from the S3 body at a time
+READ_CHUNK_BYTES = int(os.environ.get('TRANSCRIPT_READ_CHUNK_BYTES', str(64 * 1024)))
+
+# Paths in Transcribe output; '*' matches any array element or object key
+TRANSCRIPT_PATH = 'results.transcripts.0.transcript'
+ITEMS_PATH = 'results.items.*'
+SPEAKER_LABEL_ITEMS_PATH = 'results.speaker_labels.segments.*.items.*'
+
+_WHITESPACE_RE = re.compile(r'[ \t\n\r]*')
+_STRING_RE = re.compile(r'"(?:[^"\\]|\\.)*"', re.DOTALL)
+_STRUCTURAL_RE = re.compile(r'["\[\]{}]')
+_SCALAR_RE = re.compile(r'[^,\]}\s]+')
+
+# The transcript text plus lazily read word items; speaker_labels maps item
+# start times to speaker labels for output that keeps them outside the items
+TranscriptStream = collections.namedtuple('TranscriptStream', ['transcript', 'speaker_labels', 'items'])
+
+def body_chunks(body, chunk_size=READ_CHUNK_BYTES):
+    """
+    Yields the bytes of an S3 StreamingBody, or any file-like object, in chunks
+    """
+    if hasattr(body, 'iter_chunks'):
+        yield from body.iter_chunks(chunk_size)
+        return
+    while True:
+        chunk = body.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+def parse_path(path):
+    """
+    Splits 'results.items.*' into ('results', 'items', '*'); numeric parts
+    become array indexes
+    """
+    return tuple(int(part) if part.isdigit() else part for part in path.split('.'))
+
+class _Reader:
+    """
+    Pulls characters from chunked UTF-8 input, keeping only the unread part
+    of the current chunk plus any value being decoded
+    """
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._decoder = codecs.getincrementaldecoder('utf-8')()
+        self._json = json.JSONDecoder()
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self, minimum=1):
+        """
+        Reads chunks until at least minimum unread characters are buffered,
+        returning False at end of input
+        """
+        pieces = [self.buffer[self.pos:]]
+        available = len(pieces[0])
+        while available < minimum and not self.eof:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                self.eof = True
+                text = self._decoder.decode(b'', final=True)
+            else:
+                text = self._decoder.decode(chunk)
+            pieces.append(text)
+            available += len(text)
+        self.buffer = ''.join(pieces)
+        self.pos = 0
+        return available >= minimum
+
+    def peek(self):
+        """
+        Skips whitespace and returns the next character
+        """
+        while True:
+            self.pos = _WHITESPACE_RE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                raise ValueError('Unexpected end of JSON input')
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError(f"Expected '{char}' at offset {self.pos}")
+        self.pos += 1
+
+    def _match(self, pattern):
+        """
+        Matches a token at the current position, reading more input until
+        the token is complete
+        """
+        while True:
+            match = pattern.match(self.buffer, self.pos)
+            if match and (match.end() < len(self.buffer) or self.eof):
+                return match
+            if self.eof:
+                raise ValueError('Unexpected end of JSON input')
+            self._fill(2 * (len(self.buffer) - self.pos) + 1)
+
+    def read_string(self):
+        self.peek()
+        match = self._match(_STRING_RE)
+        self.pos = match.end()
+        return json.loads(match.group())
+
+    def decode_value(self):
+        """
+        Decodes the value at the current position with the C decoder,
+        doubling the buffered input until the value is complete
+        """
+        if self.peek() not in '{["':
+            # A number could continue in the next chunk, so read the whole token
+            match = self._match(_SCALAR_RE)
+            self.pos = match.end()
+            return json.loads(match.group())
+        while True:
+            try:
+                value, self.pos = self._json.raw_decode(self.buffer, self.pos)
+                return value
+            except ValueError:
+                if self.eof:
+                    raise
+            self._fill(2 * (len(self.buffer) - self.pos) + 1)
+
+    def skip_value(self):
+        """
+        Skips the value at the current position without decoding it
+        """
+        char = self.peek()
+        if char == '"':
+            self.pos = self._match(_STRING_RE).end()
+        elif char in '{[':
+            self._skip_container()
+        else:
+            self.pos = self._match(_SCALAR_RE).end()
+
+    def _skip_container(self):
+        depth = 0
+        while True:
+            match = _STRUCTURAL_RE.search(self.buffer, self.pos)
+            if match is None:
+                self.pos = len(self.buffer)
+                if not self._fill():
+                    raise ValueError('Unexpected end of JSON input')
+                continue
+            self.pos = match.start()
+            char = match.group()
+            if char == '"':
+                self.pos = self._match(_STRING_RE).end()
+                continue
+            self.pos += 1
+            depth += 1 if char in '[{' else -1
+            if depth == 0:
+                return
+
+def iter_paths(chunks, paths):
+    """
+    Yields the values at the given paths as they are read, in document order.
+
+    Containers that cannot hold a requested path are skipped without being
+    decoded; each requested value is decoded on its own.
+
+    Args:
+        chunks (iterable): Bytes of a JSON document
+        paths (iterable): Dotted paths such as 'results.items.*'
+
+    Yields:
+        tuple: (requested path, decoded value)
+    """
+    targets = [(path, parse_path(path)) for path in paths]
+    reader = _Reader(chunks)
+    yield from _walk(reader, (), targets)
+
+def _matches(pattern, path):
+    return len(pattern) == len(path) and all(want == '*' or want == got for want, got in zip(pattern, path))
+
+def _under(pattern, path):
+    return len(pattern) > len(path) and all(want == '*' or want == got for want, got in zip(pattern, path))
+
+def _walk(reader, path, targets):
+    for name, pattern in targets:
+        if _matches(pattern, path):
+            yield name, reader.decode_value()
+            return
+
+    char = reader.peek()
+    if char not in '{[' or not any(_under(pattern, path) for _, pattern in targets):
+        reader.skip_value()
+        return
+
+    reader.pos += 1
+    closing = '}' if char == '{' else ']'
+    index = 0
+    if reader.peek() == closing:
+        reader.pos += 1
+        return
+    while True:
+        if char == '{':
+            key = reader.read_string()
+            reader.expect(':')
+        else:
+            key = index
+        yield from _walk(reader, path + (key,), targets)
+        index += 1
+        if reader.peek() == ',':
+            reader.pos += 1
+            continue
+        reader.expect(closing)
+        return
+
+def open_transcript(body, chunk_size=READ_CHUNK_BYTES, speaker_labels=False):
+    """
+    Reads the transcript text from Transcribe output and returns it with an
+    iterator that streams the word items from the rest of the body.
+
+    Transcribe writes the transcripts and speaker_labels before the items,
+    so normally no items are held; any met before the transcript text are.
+
+    Args:
+        body: S3 StreamingBody or file-like object
+        chunk_size (int): Bytes read at a time
+        speaker_labels (bool): Also collect item start times to speaker
+            labels from results.speaker_labels
+
+    Returns:
+        TranscriptStream: transcript text, speaker label map and items iterator
+    """
+    paths = [TRANSCRIPT_PATH, ITEMS_PATH] + ([SPEAKER_LABEL_ITEMS_PATH] if speaker_labels else [])
+    events = iter_paths(body_chunks(body, chunk_size), paths)
+    transcript = None
+    labels = {}
+    early_items = []
+
+    for path, value in events:
+        if path == TRANSCRIPT_PATH:
+            transcript = value
+            if not speaker_labels:
+                break
+        elif path == SPEAKER_LABEL_ITEMS_PATH:
+            labels[value.get('start_time')] = value.get('speaker_label')
+        else:
+            early_items.append(value)
+            if transcript is not None:
+                break
+
+    if transcript is None:
+        raise ValueError('Transcribe output has no transcript text')
+
+    def items():
+        yield from early_items
+        for path, value in events:
+            if path == ITEMS_PATH:
+                yield value
+            elif path == SPEAKER_LABEL_ITEMS_PATH:
+                labels[value.get('start_time')] = value.get('speaker_label')
+
+    return TranscriptStream(transcript, labels, items())
@@ -0,0 +1,115 @@
+"""
+Transcript Stream Module for EchoGuard
+Incremental keyword scanning over the word items in Amazon Transcribe output
+"""
+import os
+import collections
+
+# Number of Transcribe items scanned per segment
+SEGMENT_ITEMS = int(os.environ.get('STREAM_SEGMENT_ITEMS', '200'))
+
+# Character span of a spoken word in the flattened transcript
+WordSpan = collections.namedtuple('WordSpan', ['start', 'end', 'start_time', 'end_time', 'confidence'])
+
+def item_content(item):
+    """
+    Returns the best alternative's text for a Transcribe item
+    """
+    alternatives = item.get('alternatives') or [{}]
+    return alternatives[0].get('content', '')
+
+def item_confidence(item):
+    """
+    Returns the best alternative's recognition confidence for a Transcribe item
+    """
+    alternatives = item.get('alternatives') or [{}]
+    return float(alternatives[0].get('confidence', 1.0))
+
+def iter_segments(items, segment_items=SEGMENT_ITEMS):
+    """
+    Rebuilds the transcript text from Transcribe items one segment at a time.
+
+    Words are joined with spaces and punctuation is attached to the previous
+    word, which is how Transcribe builds results.transcripts[0].transcript.
+
+    Args:
+        items (iterable): Transcribe results.items
+        segment_items (int): Number of items per segment
+
+    Yields:
+        tuple: (segment text, list of WordSpan for the words in the segment)
+    """
+    offset = 0
+    pieces = []
+    spans = []
+    count = 0
+
+    for item in items:
+        content = item_content(item)
+        if item.get('type') != 'punctuation' and offset:
+            content = ' ' + content
+
+        if item.get('type') == 'pronunciation':
+            start = offset + len(content) - len(content.lstrip())
+            spans.append(WordSpan(
+                start,
+                offset + len(content),
+                float(item.get('start_time', 0)),
+                float(item.get('end_time', 0)),
+                item_confidence(item)
+            ))
+
+        pieces.append(content)
+        offset += len(content)
+        count += 1
+
+        if count >= segment_items:
+            yield ''.join(pieces), spans
+            pieces, spans, count = [], [], 0
+
+    if pieces:
+        yield ''.join(pieces), spans
+
+def stream_matches(items, matcher, segment_items=SEGMENT_ITEMS):
+    """
+    Scans Transcribe items segment by segment and yields each keyword hit
+    as soon as it is confirmed.
+
+    Matcher state is carried across segments, so phrases split between two
+    segments are still found. Only the word spans a pending match could
+    still touch are kept in memory.
+
+    Args:
+        items (iterable): Transcribe results.items
+        matcher (PhraseIndex): Compiled matcher, or any matcher whose
+            scanner() exposes feed(), close() and horizon
+        segment_items (int): Number of items per segment
+
+    Yields:
+        dict: The match fields plus word-level start/end times and the
+            lowest recognition confidence of the words it covers
+    """
+    scanner = matcher.scanner()
+    window = collections.deque()
+
+    for text, spans in iter_segments(items, segment_items):
+        window.extend(spans)
+        for match in scanner.feed(text):
+            yield _timed_match(match, window)
+
+        while window and window[0].end <= scanner.horizon:
+            window.popleft()
+
+    for match in scanner.close():
+        yield _timed_match(match, window)
+
+def _timed_match(match, spans):
+    """
+    Attaches the start and end times of the words a match covers
+    """
+    covered = [span for span in spans if span.end > match.start and span.start < match.end]
+    finding = match._asdict()
+    finding['start_time'] = covered[0].start_time if covered else None
+    finding['end_time'] = covered[-1].end_time if covered else None
+    finding['asr_confidence'] = min(span.confidence for span in covered) if covered else None
+    return finding
@@ -0,0 +1,53 @@
+"""
+Transcription Jobs Module for EchoGuard
+Names Amazon Transcribe jobs after the recordings they transcribe, maps
+job names back to recording IDs and holds the settings every job shares
+"""
+import os
+import re
+import time
+
+JOB_NAME_PREFIX = 'echoguard-'
+
+# Speakers Transcribe tells apart within one job
+TRANSCRIBE_MAX_SPEAKER_LABELS = int(os.environ.get('TRANSCRIBE_MAX_SPEAKER_LABELS', '10'))
+
+# echoguard-<recordingId>[-part<segment>]-<submitted epoch seconds>;
+# recording IDs are UUIDs, so the ID is everything between the prefix and
+# the optional segment number
+_JOB_NAME_RE = re.compile(
+    r'^echoguard-(?P<recording_id>.+?)(?:-part(?P<segment>\d+))?-(?P<submitted_at>\d+)$'
+)
+
+def job_name(recording_id, submitted_at=None, segment=None):
+    """
+    Returns the Transcribe job name for a recording, or for one segment of
+    a recording transcribed in parts
+    """
+    part = '' if segment is None else f"-part{int(segment):03d}"
+    return f"{JOB_NAME_PREFIX}{recording_id}{part}-{int(time.time() if submitted_at is None else submitted_at)}"
+
+def settings(max_speakers=None):
+    """
+    Returns the Settings of a job, labelling up to max_speakers speakers,
+    TRANSCRIBE_MAX_SPEAKER_LABELS by default
+    """
+    if max_speakers is None:
+        max_speakers = TRANSCRIBE_MAX_SPEAKER_LABELS
+    return {'ShowSpeakerLabels': True, 'MaxSpeakerLabels': int(max_speakers)}
+
+def recording_id(name):
+    """
+    Returns the recording ID a job name was built from, or None for jobs
+    EchoGuard did not name
+    """
+    match = _JOB_NAME_RE.match(name or '')
+    return match.group('recording_id') if match else None
+
+def segment_index(name):
+    """
+    Returns the segment number of a segment job, or None for a job that
+    transcribes a whole recording
+    """
+    match = _JOB_NAME_RE.match(name or '')
+    return int(match.group('segment')) if match and match.group('segment') else None
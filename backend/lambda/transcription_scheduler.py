@@ -0,0 +1,315 @@
+"""
+Transcription Scheduler Module for EchoGuard
+Keeps the number of running Amazon Transcribe jobs under the account's
+concurrent job quota. Jobs over the limit wait in a DynamoDB-backed
+priority queue and are started as running jobs finish.
+"""
+import json
+import os
+import time
+
+from botocore.exceptions import ClientError
+from boto3.dynamodb.conditions import Key
+
+import aws_clients
+import media_dedup
+
+# Scheduler configuration
+TRANSCRIPTION_SCHEDULER_TABLE = os.environ.get('TRANSCRIPTION_SCHEDULER_TABLE', 'echoguard-transcription-scheduler')
+TRANSCRIBE_MAX_CONCURRENT_JOBS = int(os.environ.get('TRANSCRIBE_MAX_CONCURRENT_JOBS', '100'))
+TRANSCRIBE_DEFAULT_PRIORITY = int(os.environ.get('TRANSCRIBE_DEFAULT_PRIORITY', '5'))
+RECORDINGS_TABLE = os.environ.get('RECORDINGS_TABLE', 'echoguard-recordings')
+TRANSCRIBE_MAX_START_ATTEMPTS = int(os.environ.get('TRANSCRIBE_MAX_START_ATTEMPTS', '5'))
+TRANSCRIBE_START_RETRY_SECONDS = float(os.environ.get('TRANSCRIBE_START_RETRY_SECONDS', '60'))
+
+# Partition keys of the queued jobs and of the running job names
+QUEUE_NAME = 'transcribe'
+SLOTS_NAME = 'transcribe#slots'
+SLOTS_POSITION = 'slots'
+
+# Queued jobs read per query while draining
+DRAIN_PAGE_SIZE = 25
+
+# Outcomes of starting a queued job
+STARTED = 'STARTED'
+FAILED = 'FAILED'
+AT_LIMIT = 'AT_LIMIT'
+DEFERRED = 'DEFERRED'
+
+# Statuses of jobs that no longer hold a slot
+FINISHED_JOB_STATUSES = {'COMPLETED', 'FAILED'}
+
+def queue_position(priority, enqueued_at, job_name):
+    """
+    Sort key of a queued job: lower priority numbers first, then oldest
+    first
+    """
+    return f"{max(0, min(int(priority), 999)):03d}#{int(enqueued_at * 1000):013d}#{job_name}"
+
+def _error_code(error):
+    return error.response.get('Error', {}).get('Code')
+
+class TranscriptionScheduler:
+    """
+    Admission control for start_transcription_job.
+
+    The running jobs are a string set of job names on one item, so adding a
+    job is a conditional write against the limit and removing one is
+    idempotent when a completion event is delivered twice. A queued job is
+    deleted only after its job has started; a start repeated after a crash
+    fails with ConflictException because job names are unique, so no job is
+    lost or started twice.
+    """
+
+    def __init__(self, transcribe=None, table=None, max_in_flight=TRANSCRIBE_MAX_CONCURRENT_JOBS,
+                 recordings_table=None, clock=time.time):
+        self.transcribe = transcribe or aws_clients.client('transcribe')
+        self.max_in_flight = max_in_flight
+        self._table = table
+        self._recordings_table = recordings_table
+        self._clock = clock
+
+    @property
+    def table(self):
+        if self._table is None:
+            self._table = aws_clients.table(TRANSCRIPTION_SCHEDULER_TABLE)
+        return self._table
+
+    @property
+    def recordings_table(self):
+        if self._recordings_table is None:
+            self._recordings_table = aws_clients.table(RECORDINGS_TABLE)
+        return self._recordings_table
+
+    def submit(self, job_name, params, recording_id=None, priority=None):
+        """
+        Queues a job and starts queued jobs while there are free slots.
+
+        Args:
+            job_name (str): TranscriptionJobName
+            params (dict): Other start_transcription_job parameters
+            recording_id (str): Recording updated when the job starts
+            priority (int): Lower numbers start first; bulk imports can
+                use a higher number to let interactive uploads go ahead
+
+        Returns:
+            bool: Whether this job has started
+        """
+        priority = TRANSCRIBE_DEFAULT_PRIORITY if priority is None else priority
+        item = {
+            'queueName': QUEUE_NAME,
+            'position': queue_position(priority, self._clock(), job_name),
+            'jobName': job_name,
+            'params': json.dumps(params)
+        }
+        if recording_id:
+            item['recordingId'] = recording_id
+        self.table.put_item(Item=item)
+        try:
+            return job_name in self.drain()
+        except Exception as e:
+            # The job is queued, so a later drain starts it
+            print(f"Error draining transcription queue: {str(e)}")
+            return False
+
+    def drain(self):
+        """
+        Starts queued jobs in priority order until the end of the queue or
+        until every slot is taken. Jobs waiting out a retry delay are
+        skipped, so a job that keeps failing does not hold up the rest.
+
+        Returns:
+            list: Names of the jobs started
+        """
+        started = []
+        kwargs = {
+            'KeyConditionExpression': Key('queueName').eq(QUEUE_NAME),
+            'ConsistentRead': True,
+            'Limit': DRAIN_PAGE_SIZE
+        }
+        while True:
+            response = self.table.query(**kwargs)
+            for item in response.get('Items', []):
+                if float(item.get('retryAt', 0)) > self._clock():
+                    continue
+                if not self._acquire(item['jobName']):
+                    return started
+                outcome = self._start(item)
+                if outcome == AT_LIMIT:
+                    return started
+                if outcome == STARTED:
+                    started.append(item['jobName'])
+            if 'LastEvaluatedKey' not in response:
+                return started
+            kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    def release(self, job_name):
+        """
+        Frees the slot of a job that finished; repeated calls are harmless
+        """
+        self.table.update_item(
+            Key={'queueName': SLOTS_NAME, 'position': SLOTS_POSITION},
+            UpdateExpression='DELETE jobs :job',
+            ExpressionAttributeValues={':job': {job_name}}
+        )
+
+    def in_flight(self):
+        """
+        Returns the names of the jobs holding slots
+        """
+        item = self.table.get_item(
+            Key={'queueName': SLOTS_NAME, 'position': SLOTS_POSITION}, ConsistentRead=True
+        ).get('Item', {})
+        return set(item.get('jobs', set()))
+
+    def sync_in_flight(self, job_names, held=None):
+        """
+        Frees the slots of jobs Transcribe no longer reports as running,
+        whose completion event was lost.
+
+        Args:
+            job_names (iterable): Jobs Transcribe reports as queued or in progress
+            held (set): in_flight() read before Transcribe was asked, so jobs
+                admitted since are left alone; read now when omitted
+
+        Returns:
+            set: Names of the jobs whose slots were freed
+        """
+        stale = (self.in_flight() if held is None else set(held)) - set(job_names)
+        if stale:
+            self.table.update_item(
+                Key={'queueName': SLOTS_NAME, 'position': SLOTS_POSITION},
+                UpdateExpression='DELETE jobs :jobs',
+                ExpressionAttributeValues={':jobs': stale}
+            )
+        return stale
+
+    def queued(self):
+        """
+        Returns the number of queued jobs
+        """
+        count = 0
+        kwargs = {'KeyConditionExpression': Key('queueName').eq(QUEUE_NAME), 'Select': 'COUNT'}
+        while True:
+            response = self.table.query(**kwargs)
+            count += response.get('Count', 0)
+            if 'LastEvaluatedKey' not in response:
+                return count
+            kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    def _acquire(self, job_name):
+        if self.max_in_flight <= 0:
+            # Paused
+            return False
+        try:
+            self.table.update_item(
+                Key={'queueName': SLOTS_NAME, 'position': SLOTS_POSITION},
+                UpdateExpression='ADD jobs :job',
+                ConditionExpression='attribute_not_exists(jobs) OR size(jobs) < :limit OR contains(jobs, :name)',
+                ExpressionAttributeValues={':job': {job_name}, ':limit': self.max_in_flight, ':name': job_name}
+            )
+            return True
+        except ClientError as e:
+            if _error_code(e) == 'ConditionalCheckFailedException':
+                return False
+            raise
+
+    def _start(self, item):
+        """
+        Starts a queued job, returning STARTED, FAILED, AT_LIMIT or DEFERRED.
+        A request Transcribe rejects as bad drops the job. After other
+        errors it stays queued and is retried after a growing delay, until
+        it has failed TRANSCRIBE_MAX_START_ATTEMPTS times.
+        """
+        job_name = item['jobName']
+        try:
+            response = self.transcribe.start_transcription_job(
+                TranscriptionJobName=job_name, **json.loads(item['params'])
+            )
+        except ClientError as e:
+            code = _error_code(e)
+            if code == 'ConflictException':
+                # Started by an earlier attempt, which may have finished since
+                self._dequeue(item)
+                status = self.transcribe.get_transcription_job(TranscriptionJobName=job_name)
+                if status['TranscriptionJob']['TranscriptionJobStatus'] in FINISHED_JOB_STATUSES:
+                    self.release(job_name)
+                return STARTED
+            self.release(job_name)
+            if code == 'LimitExceededException':
+                # Another producer holds part of the quota; wait for a completion
+                return AT_LIMIT
+            if code != 'BadRequestException':
+                return self._defer(item, e)
+            # The request itself is bad, so retrying cannot help
+            print(f"Could not start transcription job {job_name}: {str(e)}")
+            return self._fail(item)
+        except Exception as e:
+            # The request may not have reached Transcribe; a repeat that did gets ConflictException
+            self.release(job_name)
+            return self._defer(item, e)
+
+        self._dequeue(item)
+        self._update_recording(item, 'TRANSCRIBING', response['TranscriptionJob']['TranscriptionJobName'])
+        return STARTED
+
+    def _defer(self, item, error):
+        """
+        Leaves a job queued until its retry delay has passed, or fails it
+        once it has used up its attempts
+        """
+        attempts = int(item.get('attempts', 0)) + 1
+        if attempts >= TRANSCRIBE_MAX_START_ATTEMPTS:
+            print(f"Could not start transcription job {item['jobName']} after {attempts} attempts: {str(error)}")
+            return self._fail(item)
+        retry_at = self._clock() + TRANSCRIBE_START_RETRY_SECONDS * 2 ** (attempts - 1)
+        print(f"Transcription job {item['jobName']} left queued after attempt {attempts}: {str(error)}")
+        try:
+            self.table.update_item(
+                Key={'queueName': item['queueName'], 'position': item['position']},
+                UpdateExpression='SET attempts = :attempts, retryAt = :retryAt',
+                ConditionExpression='attribute_exists(jobName)',
+                ExpressionAttributeValues={':attempts': attempts, ':retryAt': int(retry_at)}
+            )
+        except ClientError as e:
+            # Another drain started or dropped the job meanwhile
+            if _error_code(e) != 'ConditionalCheckFailedException':
+                raise
+        return DEFERRED
+
+    def _fail(self, item):
+        """
+        Drops a job that cannot be started and marks its recording
+        """
+        self._dequeue(item)
+        recording = self._update_recording(item, 'TRANSCRIPTION_ERROR')
+        if recording.get('contentHash'):
+            # Later uploads of the same media get their own job; linked ones share the error
+            media_dedup.update_duplicates(
+                self.recordings_table, recording,
+                media_dedup.release(recording['contentHash'], recording['recordingId'])
+            )
+        return FAILED
+
+    def _dequeue(self, item):
+        self.table.delete_item(Key={'queueName': item['queueName'], 'position': item['position']})
+
+    def _update_recording(self, item, status, job_id=None):
+        if not item.get('recordingId'):
+            return {}
+        update = "set #status = :status, updatedAt = :timestamp"
+        values = {':status': status, ':timestamp': int(self._clock())}
+        if job_id:
+            update += ", transcriptionJobId = :jobId, transcriptionJobName = :jobName"
+            values[':jobId'] = job_id
+            values[':jobName'] = item['jobName']
+        response = self.recordings_table.update_item(
+            Key={'recordingId': item['recordingId']},
+            UpdateExpression=update,
+            ExpressionAttributeNames={
+                '#status': 'status'
+            },
+            ExpressionAttributeValues=values,
+            ReturnValues='ALL_NEW'
+        )
+        return response['Attributes']
@@ -1,14 +1,15 @@
 import json
-import boto3
 import os
 import uuid
 import time
 from datetime import datetime
 
-# Initialize AWS clients
-s3 = boto3.client('s3')
-dynamodb = boto3.resource('dynamodb')
-sns = boto3.client('sns')
+import aws_clients
+
+# AWS clients, created on first use
+s3 = aws_clients.LazyClient('s3')
+dynamodb = aws_clients.LazyResource('dynamodb')
+sns = aws_clients.LazyClient('sns')
 
 # Environment variables
 AUDIO_BUCKET = os.environ.get('AUDIO_BUCKET', 'echoguard-audio-656570226565')
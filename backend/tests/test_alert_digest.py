@@ -0,0 +1,205 @@
+import unittest
+import json
+import os
+import sys
+from unittest.mock import MagicMock, patch
+
+import boto3
+from moto import mock_dynamodb
+
+# Add the lambda directory to the path so we can import the digest
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'lambda'))
+import alert_digest
+import digest_flush_handler
+
+TOPIC_ARN = 'arn:aws:sns:us-east-1:123456789012:test-topic'
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+def create_table(dynamodb):
+    """Creates the digest table with its due index, as in the CloudFormation template"""
+    dynamodb.create_table(
+        TableName='digests',
+        KeySchema=[{'AttributeName': 'groupKey', 'KeyType': 'HASH'}],
+        AttributeDefinitions=[
+            {'AttributeName': 'groupKey', 'AttributeType': 'S'},
+            {'AttributeName': 'due', 'AttributeType': 'S'},
+            {'AttributeName': 'firstAt', 'AttributeType': 'N'}
+        ],
+        GlobalSecondaryIndexes=[{
+            'IndexName': 'DueIndex',
+            'KeySchema': [{'AttributeName': 'due', 'KeyType': 'HASH'},
+                          {'AttributeName': 'firstAt', 'KeyType': 'RANGE'}],
+            'Projection': {'ProjectionType': 'KEYS_ONLY'}
+        }],
+        BillingMode='PAY_PER_REQUEST'
+    )
+    return dynamodb
+
+class TestAlertDigest(unittest.TestCase):
+    """Test cases for batched alert digests"""
+
+    def setUp(self):
+        self.sns = MagicMock()
+        self.sns.publish_batch.return_value = {'Successful': [], 'Failed': []}
+        self.clock = FakeClock()
+
+    def digest(self, store=None, **kwargs):
+        return alert_digest.AlertDigest(
+            TOPIC_ARN, 'Compliance Alert', sns=self.sns, store=store or alert_digest.LocalStore(),
+            window_seconds=300, max_alerts=3, critical_score=40, clock=self.clock, **kwargs
+        )
+
+    def test_critical_alert_published_immediately(self):
+        """Test that a score at or below the critical score skips the buffer"""
+        digest = self.digest()
+
+        self.assertTrue(digest.add('user-1', {'callId': 'c1'}, 35, subject='Compliance Alert: Score 35'))
+
+        self.sns.publish.assert_called_once_with(
+            TopicArn=TOPIC_ARN, Message=json.dumps({'callId': 'c1'}), Subject='Compliance Alert: Score 35'
+        )
+        self.assertEqual(digest.store.groups(), [])
+
+    def test_groups_sent_in_one_batch_on_close(self):
+        """Test that buffered groups become digests sent with publish_batch"""
+        digest = self.digest()
+        self.assertFalse(digest.add('user-1', {'callId': 'c1'}, 65))
+        digest.add('user-1', {'callId': 'c2'}, 60)
+        digest.add('user-2', {'callId': 'c3'}, 55)
+        self.sns.publish_batch.assert_not_called()
+
+        digest.close()
+
+        self.sns.publish.assert_not_called()
+        entries = self.sns.publish_batch.call_args.kwargs['PublishBatchRequestEntries']
+        self.assertEqual(len(entries), 2)
+        self.assertEqual(entries[0]['Subject'], 'Compliance Alert (2 calls)')
+        message = json.loads(entries[0]['Message'])
+        self.assertEqual(message['count'], 2)
+        self.assertEqual([alert['callId'] for alert in message['alerts']], ['c1', 'c2'])
+        self.assertEqual(json.loads(entries[1]['Message']), {'callId': 'c3'})
+        self.assertEqual(len({entry['Id'] for entry in entries}), 2)
+        self.assertEqual((digest.requests, digest.published), (1, 2))
+
+    def test_flush_on_count_and_window(self):
+        """Test that a group is flushed once full or once its window elapses"""
+        digest = self.digest()
+        for call in range(3):
+            digest.add('user-1', {'callId': f"c{call}"}, 70)
+        self.assertEqual(json.loads(self.sns.publish.call_args.kwargs['Message'])['count'], 3)
+
+        digest.add('user-2', {'callId': 'c4'}, 70)
+        self.clock.now += 300
+        digest.add('user-2', {'callId': 'c5'}, 70)
+        self.assertEqual(self.sns.publish.call_count, 2)
+        self.assertEqual(digest.store.groups(), [])
+
+    def test_failed_publish_keeps_alerts(self):
+        """Test that alerts are buffered again when publishing fails"""
+        self.sns.publish.side_effect = Exception('SNS unavailable')
+        digest = self.digest()
+        digest.add('user-1', {'callId': 'c1'}, 70)
+
+        with self.assertRaises(Exception):
+            digest.close()
+        self.assertEqual(digest.store.claim('user-1'), [{'subject': 'Compliance Alert', 'message': {'callId': 'c1'}}])
+
+    def test_rejected_entries_buffered_again(self):
+        """Test that entries PublishBatch reports as failed are kept for a later flush"""
+        self.sns.publish_batch.return_value = {
+            'Successful': [{'Id': '0'}], 'Failed': [{'Id': '1', 'Message': 'Throttled'}]
+        }
+        digest = self.digest()
+        digest.add('user-1', {'callId': 'c1'}, 70)
+        digest.add('user-2', {'callId': 'c2'}, 70)
+
+        digest.close()
+
+        self.assertEqual(digest.store.groups(), ['user-2'])
+        self.assertEqual(digest.store.claim('user-2'), [{'subject': 'Compliance Alert', 'message': {'callId': 'c2'}}])
+        self.assertEqual(digest.published, 1)
+
+    def test_sent_batches_not_buffered_again(self):
+        """Test that an error partway through only keeps the batches that were not sent"""
+        self.sns.publish.side_effect = Exception('SNS unavailable')
+        digest = self.digest()
+        for user in range(alert_digest.PUBLISH_BATCH_ENTRIES + 1):
+            digest.add(f"user-{user}", {'callId': user}, 70)
+
+        with self.assertRaises(Exception):
+            digest.close()
+
+        self.sns.publish_batch.assert_called_once()
+        last = f"user-{alert_digest.PUBLISH_BATCH_ENTRIES}"
+        self.assertEqual(digest.store.groups(), [last])
+        self.assertEqual(digest.store.claim(last)[0]['message'], {'callId': alert_digest.PUBLISH_BATCH_ENTRIES})
+
+    def test_batches_split_at_entry_limit(self):
+        """Test that more groups than one PublishBatch holds use several requests"""
+        digest = self.digest()
+        for user in range(alert_digest.PUBLISH_BATCH_ENTRIES + 2):
+            digest.add(f"user-{user}", {'callId': user}, 70)
+
+        digest.close()
+
+        self.assertEqual(self.sns.publish_batch.call_count, 2)
+        first = self.sns.publish_batch.call_args_list[0].kwargs['PublishBatchRequestEntries']
+        self.assertEqual(len(first), alert_digest.PUBLISH_BATCH_ENTRIES)
+        self.assertEqual(digest.requests, 2)
+        self.assertEqual(digest.published, alert_digest.PUBLISH_BATCH_ENTRIES + 2)
+
+    @mock_dynamodb
+    def test_dynamodb_store_debounces_across_invocations(self):
+        """Test that the shared store only flushes groups whose window elapsed"""
+        dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
+        store = alert_digest.DynamoDBStore('digests', create_table(dynamodb))
+
+        self.digest(store).add('team', {'callId': 'c1'}, 70)
+        self.digest(store).close()
+        self.sns.publish.assert_not_called()
+
+        self.clock.now += 60
+        self.digest(store).add('team', {'callId': 'c2'}, 70)
+        self.clock.now += 240
+        self.digest(store).close()
+
+        message = json.loads(self.sns.publish.call_args.kwargs['Message'])
+        self.assertEqual([alert['callId'] for alert in message['alerts']], ['c1', 'c2'])
+        self.assertEqual(store.groups(), [])
+
+    @mock_dynamodb
+    def test_due_groups_queried_by_first_alert(self):
+        """Test that only groups old enough are found, through the due index"""
+        dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
+        store = alert_digest.DynamoDBStore('digests', create_table(dynamodb))
+        store.append('early', {'message': 1}, 1000)
+        store.append('late', {'message': 2}, 1200)
+        store.append('early', {'message': 3}, 1250)
+
+        self.assertEqual(store.due_groups(1100), ['early'])
+        self.assertEqual(sorted(store.groups()), ['early', 'late'])
+
+class TestDigestFlushHandler(unittest.TestCase):
+    """Test cases for the scheduled alert digest flush"""
+
+    def test_scheduled_event_flushes_due_digests(self):
+        """Test that the schedule closes the completion notification digest"""
+        notifications = MagicMock(requests=1, published=2)
+
+        with patch.object(alert_digest, 'get_digest', return_value=notifications) as get_digest:
+            response = digest_flush_handler.lambda_handler(
+                {'source': 'aws.events', 'detail-type': 'Scheduled Event', 'detail': {}}, None
+            )
+
+        self.assertEqual(get_digest.call_args.args[1], alert_digest.COMPLETION_SUBJECT)
+        notifications.close.assert_called_once_with()
+        self.assertEqual(response['statusCode'], 200)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+import unittest
+import os
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+from moto import mock_dynamodb
+
+# Add the lambda directory to the path so we can import the cache
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'lambda'))
+import analysis_cache
+
+RESULT = {'issues': [], 'overall_score': 85, 'summary': 'Compliant'}
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+class TestCacheKey(unittest.TestCase):
+    """Test cases for content-addressed cache keys"""
+
+    def test_whitespace_does_not_change_key(self):
+        """Test that re-delivered transcripts with different spacing share a key"""
+        first = analysis_cache.cache_key('We  guarantee\nreturns. ', 'Call', 'model', '1')
+        second = analysis_cache.cache_key('We guarantee returns.', 'Call', 'model', '1')
+        self.assertEqual(first, second)
+
+    def test_model_and_prompt_version_change_key(self):
+        """Test that a new model or prompt version misses the cache"""
+        key = analysis_cache.cache_key('text', 'Call', 'model', '1')
+        self.assertNotEqual(key, analysis_cache.cache_key('text', 'Call', 'other-model', '1'))
+        self.assertNotEqual(key, analysis_cache.cache_key('text', 'Call', 'model', '2'))
+        self.assertNotEqual(key, analysis_cache.cache_key('text', 'Other call', 'model', '1'))
+
+class TestCacheBackends(unittest.TestCase):
+    """Test cases for TTL and size-bounded eviction in each backend"""
+
+    def setUp(self):
+        self.clock = FakeClock()
+
+    def check_backend(self, backend):
+        cache = analysis_cache.AnalysisCache(backend, ttl_seconds=60)
+        self.assertIsNone(cache.get('a'))
+        cache.put('a', RESULT)
+        self.assertEqual(cache.get('a'), RESULT)
+
+        self.clock.now += 61
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.stats(), {'hits': 1, 'misses': 2, 'errors': 0})
+
+    def check_eviction(self, backend):
+        backend.put('a', RESULT, 60)
+        self.clock.now += 1
+        backend.put('b', RESULT, 60)
+        self.clock.now += 1
+        backend.get('a')
+        self.clock.now += 1
+        backend.put('c', RESULT, 60)
+
+        self.assertEqual(backend.get('a'), RESULT)
+        self.assertIsNone(backend.get('b'))
+        self.assertEqual(backend.get('c'), RESULT)
+
+    def test_memory_backend(self):
+        """Test the in-memory LRU backend"""
+        self.check_backend(analysis_cache.MemoryBackend(clock=self.clock))
+        self.check_eviction(analysis_cache.MemoryBackend(max_entries=2, clock=self.clock))
+
+    def test_sqlite_backend(self):
+        """Test the SQLite backend"""
+        with tempfile.TemporaryDirectory() as directory:
+            self.check_backend(analysis_cache.SQLiteBackend(os.path.join(directory, 'ttl.db'), clock=self.clock))
+            self.check_eviction(analysis_cache.SQLiteBackend(
+                os.path.join(directory, 'lru.db'), max_entries=2, clock=self.clock
+            ))
+
+    @mock_dynamodb
+    def test_dynamodb_backend(self):
+        """Test the DynamoDB backend"""
+        dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
+        dynamodb.create_table(
+            TableName='analysis-cache',
+            KeySchema=[{'AttributeName': 'cacheKey', 'KeyType': 'HASH'}],
+            AttributeDefinitions=[{'AttributeName': 'cacheKey', 'AttributeType': 'S'}],
+            BillingMode='PAY_PER_REQUEST'
+        )
+        self.check_backend(analysis_cache.DynamoDBBackend('analysis-cache', dynamodb=dynamodb, clock=self.clock))
+
+    def test_backend_errors_count_as_misses(self):
+        """Test that a failing backend never fails the analysis"""
+        class BrokenBackend:
+            def get(self, key):
+                raise IOError('unavailable')
+
+            def put(self, key, value, ttl_seconds):
+                raise IOError('unavailable')
+
+        cache = analysis_cache.AnalysisCache(BrokenBackend())
+        cache.put('a', RESULT)
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.stats(), {'hits': 0, 'misses': 1, 'errors': 2})
+
+    def test_counters_from_many_threads(self):
+        """Test that lookups from the analysis threads are all counted"""
+        cache = analysis_cache.AnalysisCache(analysis_cache.MemoryBackend(max_entries=10))
+        cache.put('a', RESULT)
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(lambda n: cache.get('a' if n % 2 else 'b'), range(4000)))
+
+        self.assertEqual(cache.stats(), {'hits': 2000, 'misses': 2000, 'errors': 0})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,246 @@
+import unittest
+import json
+import os
+import random
+import sys
+import time
+from decimal import Decimal
+from unittest.mock import MagicMock, patch
+
+import boto3
+from botocore.exceptions import ClientError
+from moto import mock_dynamodb, mock_s3
+
+# Add the lambda directory to the path so we can import the handler
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'lambda'))
+import analysis_cache
+import analysis_handler
+import blob_store
+import kiro_client
+import record_dispatch
+import tiered_analysis
+
+def create_table(dynamodb, name):
+    return dynamodb.create_table(
+        TableName=name,
+        KeySchema=[{'AttributeName': 'recordingId', 'KeyType': 'HASH'}],
+        AttributeDefinitions=[{'AttributeName': 'recordingId', 'AttributeType': 'S'}],
+        BillingMode='PAY_PER_REQUEST'
+    )
+
+@mock_s3
+@mock_dynamodb
+class TestAnalysisStorage(unittest.TestCase):
+    """Test cases for the recording and results writes against moto"""
+
+    def setUp(self):
+        self.dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
+        self.recordings = create_table(self.dynamodb, 'recordings')
+        self.results = create_table(self.dynamodb, 'results')
+        self.s3 = boto3.client('s3', region_name='us-east-1')
+        self.s3.create_bucket(Bucket='transcripts')
+        self.recordings.put_item(Item={'recordingId': 'rec-1', 'status': 'TRANSCRIBED', 'userId': 'user-1'})
+
+        for name, value in [('dynamodb', self.dynamodb), ('s3', self.s3), ('sns', MagicMock()),
+                            ('RECORDINGS_TABLE', 'recordings'), ('RESULTS_TABLE', 'results'),
+                            ('TRANSCRIPT_BUCKET', 'transcripts')]:
+            patcher = patch.object(analysis_handler, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def recording(self, recording_id='rec-1'):
+        return self.recordings.get_item(Key={'recordingId': recording_id}).get('Item')
+
+    def test_start_recording_analysis(self):
+        """Test that an existing recording is marked ANALYZING and returned in one call"""
+        usage = analysis_handler.DynamoDBUsage()
+
+        recording = analysis_handler.start_recording_analysis('rec-1', usage)
+
+        self.assertEqual(recording['status'], 'ANALYZING')
+        self.assertEqual(recording['userId'], 'user-1')
+        self.assertEqual(usage.round_trips, 1)
+
+    def test_start_missing_recording_fails(self):
+        """Test that a deleted recording is not recreated by the status update"""
+        with self.assertRaises(ClientError) as raised:
+            analysis_handler.start_recording_analysis('missing', analysis_handler.DynamoDBUsage())
+
+        self.assertEqual(raised.exception.response['Error']['Code'], 'ConditionalCheckFailedException')
+        self.assertIsNone(self.recording('missing'))
+
+    def test_store_results_in_one_transaction(self):
+        """Test that results, floats included, and the COMPLETED status are written together"""
+        usage = analysis_handler.DynamoDBUsage()
+        bedrock_results = {'issues': [{'description': 'Guaranteed returns', 'risk_level': 'High'}],
+                           'overall_score': 40.5, 'summary': 'Risky'}
+        kiro_results = {'financial_compliance_score': 60, 'issues': [], 'summary': 'Checked'}
+        findings = [{'keyword': 'guaranteed', 'issue': 'Promise', 'confidence': 0.9,
+                     'startTime': Decimal('1.5'), 'endTime': Decimal('2.0')}]
+
+        analysis_handler.store_analysis_results(
+            'rec-1', 'It is guaranteed.', bedrock_results, kiro_results, 52.2, findings, usage
+        )
+
+        item = self.results.get_item(Key={'recordingId': 'rec-1'})['Item']
+        self.assertEqual(item['complianceScore'], Decimal('52.2'))
+        self.assertEqual(item['keywordFindings'][0]['confidence'], Decimal('0.9'))
+        self.assertEqual(item['issues'][0]['source'], 'Bedrock')
+        self.assertEqual(item['verdictTier'], tiered_analysis.BEDROCK_TIER)
+        self.assertEqual(blob_store.load_field(self.s3, item['bedrockResults'])['overall_score'], 40.5)
+        recording = self.recording()
+        self.assertEqual((recording['status'], recording['complianceScore']), ('COMPLETED', Decimal('52.2')))
+        self.assertEqual(usage.round_trips, 1)
+
+    def test_large_transcript_offloaded_to_s3(self):
+        """Test that a transcript too big to keep inline is stored in S3 behind a pointer"""
+        rng = random.Random(3)
+        transcript = ' '.join(''.join(rng.choice('abcdefghijklmnop') for _ in range(8)) for _ in range(5000))
+
+        analysis_handler.store_analysis_results(
+            'rec-1', transcript, {'issues': [], 'overall_score': 90}, {'issues': []}, 90
+        )
+
+        item = self.results.get_item(Key={'recordingId': 'rec-1'})['Item']
+        self.assertEqual(item['transcript']['s3Key'], 'blobs/rec-1/transcript.json.gz')
+        self.assertEqual(blob_store.load_field(self.s3, item['transcript']), transcript)
+        self.assertIn('data', item['kiroResults'])
+
+    def test_failed_provider_fails_the_record(self):
+        """Test that a Bedrock error marks the recording and fails the invocation without storing a score"""
+        with open(os.path.join(os.path.dirname(__file__), 'data', 'test-transcript.json')) as f:
+            self.s3.put_object(Bucket='transcripts', Key='rec-1/transcript.json', Body=f.read())
+        event = {'Records': [{'EventSource': 'aws:sns', 'Sns': {'MessageId': 'sns-1', 'Message': json.dumps(
+            {'recordingId': 'rec-1', 'transcriptKey': 'rec-1/transcript.json', 'bucket': 'transcripts'}
+        )}}]}
+
+        with patch.object(tiered_analysis, 'choose_tier',
+                          return_value=tiered_analysis.TierDecision(tiered_analysis.BEDROCK_TIER, None, None)), \
+                patch.object(analysis_handler, 'invoke_bedrock_analysis', side_effect=RuntimeError('model error')), \
+                patch.object(analysis_handler, 'analyze_with_kiro', return_value={'financial_compliance_score': 90}):
+            with self.assertRaises(record_dispatch.RecordsFailedError):
+                analysis_handler.lambda_handler(event, None)
+
+        self.assertEqual(self.recording()['status'], 'ANALYSIS_ERROR')
+        self.assertNotIn('Item', self.results.get_item(Key={'recordingId': 'rec-1'}))
+
+    def test_kiro_outage_stores_bedrock_result(self):
+        """Test that a failing Kiro call leaves the Bedrock verdict in place, uncached"""
+        with open(os.path.join(os.path.dirname(__file__), 'data', 'test-transcript.json')) as f:
+            self.s3.put_object(Bucket='transcripts', Key='rec-1/transcript.json', Body=f.read())
+        event = {'Records': [{'EventSource': 'aws:sns', 'Sns': {'MessageId': 'sns-1', 'Message': json.dumps(
+            {'recordingId': 'rec-1', 'transcriptKey': 'rec-1/transcript.json', 'bucket': 'transcripts'}
+        )}}]}
+        client = MagicMock()
+        client.analyze.side_effect = kiro_client.CircuitOpenError('Kiro circuit is open')
+        cache = MagicMock()
+        cache.get.return_value = None
+
+        with patch.object(tiered_analysis, 'choose_tier',
+                          return_value=tiered_analysis.TierDecision(tiered_analysis.BEDROCK_TIER, None, None)), \
+                patch.object(analysis_handler, 'invoke_bedrock_analysis',
+                             return_value={'issues': [], 'overall_score': 80, 'summary': 'Fine'}), \
+                patch.object(kiro_client, 'get_client', return_value=client), \
+                patch.object(analysis_cache, 'get_cache', return_value=cache):
+            analysis_handler.lambda_handler(event, None)
+
+        item = self.results.get_item(Key={'recordingId': 'rec-1'})['Item']
+        self.assertEqual((item['complianceScore'], item['kiroAvailable']), (80, False))
+        self.assertEqual(self.recording()['status'], 'COMPLETED')
+        self.assertEqual([call.args[1]['overall_score'] for call in cache.put.call_args_list], [80])
+
+    def analyze(self, words, confidence):
+        """Runs the handler on a transcript of the given words, returning the Bedrock mock"""
+        items = [{'type': 'pronunciation', 'start_time': f"{i}.0", 'end_time': f"{i}.4",
+                  'alternatives': [{'content': word, 'confidence': confidence}]} for i, word in enumerate(words)]
+        self.s3.put_object(Bucket='transcripts', Key='rec-1/transcript.json', Body=json.dumps({
+            'results': {'transcripts': [{'transcript': ' '.join(words)}], 'items': items}
+        }))
+        event = {'Records': [{'EventSource': 'aws:sns', 'Sns': {'MessageId': 'sns-1', 'Message': json.dumps(
+            {'recordingId': 'rec-1', 'transcriptKey': 'rec-1/transcript.json', 'bucket': 'transcripts'}
+        )}}]}
+        bedrock = MagicMock(return_value={'issues': [], 'overall_score': 70, 'summary': 'Unclear'})
+
+        with patch.object(analysis_handler, 'invoke_bedrock_analysis', bedrock), \
+                patch.object(analysis_handler, 'analyze_with_kiro', return_value={'financial_compliance_score': 90}):
+            analysis_handler.lambda_handler(event, None)
+        return bedrock
+
+    def test_short_or_unclear_call_escalates(self):
+        """Test that a call with no findings but little or poorly recognized speech goes to Bedrock"""
+        for words, confidence in [(['Hello'], '0.99'), ([f"hello{i}" for i in range(100)], '0.3'), ([], '0.99')]:
+            bedrock = self.analyze(words, confidence)
+
+            bedrock.assert_called_once()
+            self.assertEqual(self.recording()['verdictTier'], tiered_analysis.BEDROCK_TIER)
+
+    def test_clear_clean_call_skips_bedrock(self):
+        """Test that a long, well-recognized call without findings is scored by the keyword tier"""
+        bedrock = self.analyze([f"thanks{i}" for i in range(100)], '0.98')
+
+        bedrock.assert_not_called()
+        recording = self.recording()
+        self.assertEqual(recording['verdictTier'], tiered_analysis.KEYWORD_TIER)
+        self.assertEqual(recording['complianceScore'], 94)
+
+class TestRunAnalyses(unittest.TestCase):
+    """Test cases for the concurrent provider calls"""
+
+    def test_slow_bedrock_misses_its_deadline(self):
+        """Test that Bedrock past its deadline fails the analysis instead of holding it up"""
+        deadlines = []
+
+        def slow_bedrock(transcript_text, description, deadline):
+            deadlines.append(deadline)
+            time.sleep(0.5)
+            return {'overall_score': 80}
+
+        with patch.object(analysis_handler, 'BEDROCK_TIMEOUT_SECONDS', 0.1), \
+                patch.object(analysis_handler, 'analyze_with_bedrock', slow_bedrock), \
+                patch.object(analysis_handler, 'analyze_with_kiro', return_value={'financial_compliance_score': 95}):
+            started = time.monotonic()
+            with self.assertRaises(analysis_handler.AnalysisUnavailableError):
+                analysis_handler.run_analyses('text', 'call')
+
+        self.assertLess(time.monotonic() - started, 0.4)
+        self.assertAlmostEqual(deadlines[0], started + 0.1, delta=0.05)
+
+    def test_slow_kiro_reported_unavailable(self):
+        """Test that Kiro past its deadline leaves the Bedrock result to score the call"""
+        def slow_kiro(transcript_text, description, deadline):
+            time.sleep(0.5)
+            return {'financial_compliance_score': 95}
+
+        with patch.object(analysis_handler, 'KIRO_TIMEOUT_SECONDS', 0.1), \
+                patch.object(analysis_handler, 'analyze_with_kiro', slow_kiro), \
+                patch.object(analysis_handler, 'analyze_with_bedrock', return_value={'overall_score': 80}):
+            bedrock_results, kiro_results = analysis_handler.run_analyses('text', 'call')
+
+        self.assertFalse(kiro_results['available'])
+        self.assertEqual(analysis_handler.calculate_compliance_score(bedrock_results, kiro_results), 80)
+
+    def test_bedrock_tier_calls_both_providers(self):
+        """Test that an escalated call gets both provider results in order"""
+        tier = tiered_analysis.TierDecision(tiered_analysis.BEDROCK_TIER, None, None)
+
+        with patch.object(analysis_handler, 'analyze_with_kiro', return_value={'financial_compliance_score': 90}), \
+                patch.object(analysis_handler, 'analyze_with_bedrock', return_value={'overall_score': 70}):
+            results = analysis_handler.run_analyses('text', 'call', tier)
+
+        self.assertEqual(results, ({'overall_score': 70}, {'financial_compliance_score': 90}))
+
+    def test_keyword_tier_skips_bedrock(self):
+        """Test that a keyword verdict replaces the Bedrock call"""
+        tier = tiered_analysis.TierDecision(tiered_analysis.KEYWORD_TIER, tiered_analysis.CLEAN_BAND,
+                                            {'issues': [], 'overall_score': 100})
+        bedrock = MagicMock()
+
+        with patch.object(analysis_handler, 'analyze_with_kiro', return_value={'financial_compliance_score': 90}), \
+                patch.object(analysis_handler, 'analyze_with_bedrock', bedrock):
+            results = analysis_handler.run_analyses('text', 'call', tier)
+
+        self.assertEqual(results, (tier.results, {'financial_compliance_score': 90}))
+        bedrock.assert_not_called()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+import unittest
+import json
+import os
+import sys
+
+# Add the lambda directory to the path so we can import the stream module
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'lambda'))
+import bedrock_stream
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
+
+class FakeEventStream:
+    """Replays recorded stream events, advancing a fake clock per event"""
+
+    def __init__(self, events, clock, seconds_per_event):
+        self.events = events
+        self.clock = clock
+        self.seconds_per_event = seconds_per_event
+        self.consumed = 0
+        self.closed = False
+
+    def __iter__(self):
+        for event in self.events:
+            self.clock.now += self.seconds_per_event
+            self.consumed += 1
+            yield {'chunk': {'bytes': json.dumps(event['chunk']).encode('utf-8')}}
+
+    def close(self):
+        self.closed = True
+
+class FakeBedrock:
+    """Local stand-in for the bedrock-runtime client"""
+
+    def __init__(self, recording, clock, seconds_per_event=0.5):
+        with open(os.path.join(DATA_DIR, recording)) as f:
+            self.stream = FakeEventStream(json.load(f), clock, seconds_per_event)
+        self.requests = []
+
+    def invoke_model_with_response_stream(self, **kwargs):
+        self.requests.append(kwargs)
+        return {'body': self.stream}
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+class TestBedrockStream(unittest.TestCase):
+    """Test cases for streaming Bedrock invocation"""
+
+    def test_completion_stream_stops_when_object_closes(self):
+        """Test that trailing prose is not read once the JSON object is complete"""
+        clock = FakeClock()
+        bedrock = FakeBedrock('bedrock-stream-completion.json', clock)
+
+        result = bedrock_stream.invoke_json(bedrock, 'anthropic.claude-v2', {'prompt': 'p'}, clock=clock)
+
+        self.assertEqual(result.value['overall_score'], 35)
+        self.assertEqual(result.value['issues'][0]['recommendation'], 'Disclose "risk" clearly')
+        self.assertEqual(bedrock.stream.consumed, 5)
+        self.assertTrue(bedrock.stream.closed)
+        self.assertEqual(result.time_to_first_token, 0.5)
+        self.assertEqual(result.latency, 2.5)
+        self.assertEqual(json.loads(bedrock.requests[0]['body']), {'prompt': 'p'})
+
+    def test_messages_stream_with_code_fence(self):
+        """Test that the messages format is parsed through code fences and braces in strings"""
+        clock = FakeClock()
+        bedrock = FakeBedrock('bedrock-stream-messages.json', clock)
+
+        result = bedrock_stream.invoke_json(bedrock, 'anthropic.claude-3-sonnet', {}, clock=clock)
+
+        self.assertEqual(result.value['complianceScore'], 82)
+        self.assertEqual(result.value['summary'], 'Agent followed the script } closely.')
+        self.assertEqual(result.time_to_first_token, 1.5)
+        self.assertEqual(bedrock.stream.consumed, 5)
+
+    def test_extractor_skips_braces_in_prose(self):
+        """Test that a brace pair in prose before the object is not mistaken for it"""
+        extractor = bedrock_stream.JsonObjectExtractor()
+
+        self.assertIsNone(extractor.feed('Using the {template} you gave: {"a"'))
+        self.assertEqual(extractor.feed(': {"b": "\\\\"}}'), {'a': {'b': '\\'}})
+
+    def test_incomplete_stream_raises(self):
+        """Test that a stream ending mid-object is an error"""
+        clock = FakeClock()
+        bedrock = FakeBedrock('bedrock-stream-completion.json', clock)
+        bedrock.stream.events = bedrock.stream.events[:3]
+
+        with self.assertRaises(ValueError):
+            bedrock_stream.invoke_json(bedrock, 'anthropic.claude-v2', {}, clock=clock)
+
+    def test_stream_stops_at_deadline(self):
+        """Test that the stream is closed once the deadline passes mid-response"""
+        clock = FakeClock()
+        bedrock = FakeBedrock('bedrock-stream-completion.json', clock)
+
+        with self.assertRaises(bedrock_stream.DeadlineExceeded):
+            bedrock_stream.invoke_json(bedrock, 'anthropic.claude-v2', {}, clock=clock, deadline=1.0)
+
+        self.assertEqual(bedrock.stream.consumed, 2)
+        self.assertTrue(bedrock.stream.closed)
+
+    def test_passed_deadline_skips_invocation(self):
+        """Test that the model is not invoked once the deadline has passed"""
+        clock = FakeClock()
+        bedrock = FakeBedrock('bedrock-stream-completion.json', clock)
+
+        with self.assertRaises(bedrock_stream.DeadlineExceeded):
+            bedrock_stream.invoke_json(bedrock, 'anthropic.claude-v2', {}, clock=clock, deadline=0.0)
+
+        self.assertEqual(bedrock.requests, [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,43 @@
+import unittest
+import os
+import sys
+
+import boto3
+from moto import mock_s3
+
+# Add the lambda directory to the path so we can import the blob store
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'lambda'))
+import blob_store
+
+class TestBlobStore(unittest.TestCase):
+    """Test cases for compressed field storage"""
+
+    def test_small_value_is_stored_inline(self):
+        """Test that a value under the threshold is kept as a compressed binary attribute"""
+        value = {'issues': [], 'overall_score': 90}
+
+        stored = blob_store.store_field(None, 'unused', 'rec-1', 'bedrockResults', value)
+
+        self.assertIn('data', stored)
+        self.assertEqual(blob_store.load_field(None, stored), value)
+
+    @mock_s3
+    def test_large_value_is_offloaded_to_s3(self):
+        """Test that a value over the threshold is written to S3 behind a pointer"""
+        s3 = boto3.client('s3', region_name='us-east-1')
+        s3.create_bucket(Bucket='echoguard-blobs')
+        transcript = ' '.join(f"word{i}" for i in range(20000))
+
+        stored = blob_store.store_field(s3, 'echoguard-blobs', 'rec-1', 'transcript', transcript, threshold=1024)
+
+        self.assertNotIn('data', stored)
+        self.assertEqual(stored['s3Key'], 'blobs/rec-1/transcript.json.gz')
+        self.assertLess(stored['size'], len(transcript) / 2)
+        self.assertEqual(blob_store.load_field(s3, stored), transcript)
+
+    def test_legacy_values_are_returned_unchanged(self):
+        """Test that fields written before compression still load"""
+        self.assertEqual(blob_store.load_field(None, 'plain transcript'), 'plain transcript')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,296 @@
+import unittest
+import json
+import math
+import os
+import random
+import sys
+import tempfile
+import wave
+from unittest.mock import MagicMock, patch
+
+import boto3
+from moto import mock_dynamodb, mock_s3
+
+# Add the lambda directory to the path so we can import the module
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'lambda'))
+import chunked_transcription
+import media_probe
+import transcribe_handler
+import transcription_jobs
+
+RATE = 8000
+
+# A minute of alternating speakers: a word every half second, turns of six
+# words, and two long pauses away from the 20 and 40 second marks
+PAUSES = [(21.0, 21.8), (38.5, 39.3)]
+
+def script():
+    words = []
+    start = 0.2
+    while start < 59.5:
+        for pause_start, pause_end in PAUSES:
+            if start < pause_end and start + 0.35 > pause_start:
+                start = pause_end + 0.1
+        words.append({'content': f"word{len(words)}", 'start': round(start, 2), 'end': round(start + 0.35, 2),
+                      'speaker': 'A' if len(words) // 6 % 2 == 0 else 'B'})
+        start += 0.5
+    return words
+
+def write_sample(path, words, seconds=60):
+    noise = random.Random(7)
+    samples = [noise.randint(-40, 40) for _ in range(RATE * seconds)]
+    for word in words:
+        for n in range(int(word['start'] * RATE), int(word['end'] * RATE)):
+            samples[n] = int(8000 * math.sin(2 * math.pi * 440 * n / RATE))
+    with wave.open(path, 'wb') as writer:
+        writer.setnchannels(1)
+        writer.setsampwidth(2)
+        writer.setframerate(RATE)
+        writer.writeframes(b''.join(sample.to_bytes(2, 'little', signed=True) for sample in samples))
+
+class FakeTranscriber:
+    """Transcribes the script words heard in full in a segment, with
+    per-job speaker labels that swap on odd segments"""
+
+    def __init__(self, words):
+        self.words = words
+        self.calls = []
+
+    def __call__(self, segment_path, segment):
+        with wave.open(segment_path, 'rb') as reader:
+            self.calls.append(reader.getnframes() / reader.getframerate())
+        heard = [word for word in self.words if word['start'] >= segment.start and word['end'] <= segment.end]
+        labels = {'A': 'spk_1', 'B': 'spk_0'} if segment.index % 2 else {'A': 'spk_0', 'B': 'spk_1'}
+
+        items = []
+        for n, word in enumerate(heard):
+            items.append({
+                'type': 'pronunciation',
+                'start_time': f"{word['start'] - segment.start:.2f}",
+                'end_time': f"{word['end'] - segment.start:.2f}",
+                'alternatives': [{'confidence': '0.99', 'content': word['content']}],
+                'speaker_label': labels[word['speaker']]
+            })
+            if int(word['content'][4:]) % 5 == 4:
+                items.append({'type': 'punctuation', 'alternatives': [{'confidence': '0.0', 'content': '.'}]})
+
+        results = {'transcripts': [{'transcript': ''}], 'items': items}
+        if segment.index == 1:
+            # Older output format: speakers only in speaker_labels
+            results['speaker_labels'] = {'speakers': 2, 'segments': [{
+                'speaker_label': 'spk_0',
+                'items': [{'start_time': item['start_time'], 'speaker_label': item.pop('speaker_label')}
+                          for item in items if item['type'] == 'pronunciation']
+            }]}
+        return {'jobName': f"segment-{segment.index}", 'accountId': '656570226565', 'results': results,
+                'status': 'COMPLETED'}
+
+class TestChunkedTranscription(unittest.TestCase):
+    """Test cases for split-and-stitch transcription"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.TemporaryDirectory()
+        cls.words = script()
+        cls.path = os.path.join(cls.directory.name, 'call.wav')
+        write_sample(cls.path, cls.words)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.directory.cleanup()
+
+    def split(self, transcriber=None):
+        return chunked_transcription.split_and_transcribe(
+            self.path, transcriber or FakeTranscriber(self.words),
+            target_seconds=20, overlap_seconds=2, search_seconds=4
+        )
+
+    def test_cuts_at_pauses_with_overlap(self):
+        """Test that cuts move from the 20 and 40 second marks into the pauses"""
+        transcriber = FakeTranscriber(self.words)
+        _, segments = self.split(transcriber)
+
+        self.assertEqual(len(segments), 3)
+        pauses = [(before['end'], after['start']) for before, after in zip(self.words, self.words[1:])
+                  if after['start'] - before['end'] > 0.5]
+        self.assertEqual(len(pauses), len(PAUSES))
+        for segment, (pause_start, pause_end) in zip(segments, pauses):
+            self.assertTrue(pause_start < segment.owned_end < pause_end, segment)
+        self.assertEqual((segments[0].start, segments[-1].end), (0.0, 60.0))
+        self.assertAlmostEqual(segments[1].start, segments[0].owned_end - 2)
+        self.assertAlmostEqual(segments[0].end, segments[1].owned_start + 2)
+        for duration, segment in zip(transcriber.calls, segments):
+            self.assertAlmostEqual(duration, segment.end - segment.start, places=3)
+
+    def test_frame_energies_match_without_audioop(self):
+        """Test that the audioop and pure Python energies agree for every sample width"""
+        noise = random.Random(3)
+        samples = [noise.randint(-100, 100) * (1 + n // 800) for n in range(RATE)]
+        for width in (1, 2, 3, 4):
+            if width == 1:
+                pcm = bytes(max(0, min(255, sample // 40 + 128)) for sample in samples)
+            else:
+                pcm = b''.join(sample.to_bytes(width, 'little', signed=True) for sample in samples)
+            fast = chunked_transcription.frame_energies(pcm, width, 1, 160)
+            with patch.object(chunked_transcription, 'audioop', None):
+                exact = chunked_transcription.frame_energies(pcm, width, 1, 160)
+
+            # audioop rounds each frame's RMS to a whole number
+            self.assertEqual(len(fast), len(exact))
+            for estimate, energy in zip(fast, exact):
+                self.assertAlmostEqual(math.sqrt(estimate / 160), math.sqrt(energy / 160), delta=1)
+
+    def test_stitched_transcript(self):
+        """Test that every word appears once with whole-recording times and speakers"""
+        transcript, _ = self.split()
+        items = transcript['results']['items']
+        words = [item for item in items if item['type'] == 'pronunciation']
+
+        self.assertEqual([word['alternatives'][0]['content'] for word in words],
+                         [word['content'] for word in self.words])
+        for word, expected in zip(words, self.words):
+            self.assertAlmostEqual(float(word['start_time']), expected['start'], places=3)
+            self.assertEqual(word['speaker_label'], 'spk_0' if expected['speaker'] == 'A' else 'spk_1')
+
+        text = transcript['results']['transcripts'][0]['transcript']
+        self.assertTrue(text.startswith('word0 word1 word2 word3 word4. word5'))
+        self.assertEqual(text.count('.'), len(self.words) // 5)
+
+        labels = transcript['results']['speaker_labels']
+        self.assertEqual(labels['speakers'], 2)
+        self.assertEqual(len(labels['segments']), math.ceil(len(self.words) / 6))
+
+    def test_speaker_silent_in_overlap(self):
+        """Test that a speaker with no words in the overlap is only labelled when it cannot be anyone else"""
+        segments = [chunked_transcription.Segment(0, 0.0, 12.0, 0.0, 10.0),
+                    chunked_transcription.Segment(1, 8.0, 20.0, 10.0, 20.0)]
+
+        def output(words):
+            return {'results': {'items': [
+                {'type': 'pronunciation', 'start_time': str(start), 'end_time': str(start + 0.3),
+                 'alternatives': [{'content': content}], 'speaker_label': speaker}
+                for content, start, speaker in words
+            ]}}
+
+        def labels(transcript):
+            return [item.get('speaker_label') for item in transcript['results']['items']]
+
+        first = output([('hello', 1.0, 'spk_0'), ('hi', 3.0, 'spk_1'), ('so', 9.0, 'spk_0')])
+        second = output([('so', 1.0, 'spk_1'), ('yes', 6.0, 'spk_0')])
+        third_party = output([('hello', 1.0, 'spk_0'), ('hi', 3.0, 'spk_1'), ('hey', 5.0, 'spk_2'),
+                              ('so', 9.0, 'spk_0')])
+
+        # Two speakers at most: the silent one can only be the other caller
+        self.assertEqual(labels(chunked_transcription.stitch([first, second], segments, max_speakers=2)),
+                         ['spk_0', 'spk_1', 'spk_0', 'spk_1'])
+
+        # Unbounded, or one of two earlier speakers: left unlabelled rather than guessed
+        unbounded = chunked_transcription.stitch([first, second], segments)
+        self.assertEqual(labels(unbounded), ['spk_0', 'spk_1', 'spk_0', None])
+        self.assertEqual(unbounded['results']['speaker_labels']['speakers'], 2)
+        self.assertEqual(labels(chunked_transcription.stitch([third_party, second], segments, max_speakers=3)),
+                         ['spk_0', 'spk_1', 'spk_2', 'spk_0', None])
+
+        # Every earlier speaker matched: the silent one is new
+        alone = output([('hello', 1.0, 'spk_0'), ('so', 9.0, 'spk_0')])
+        self.assertEqual(labels(chunked_transcription.stitch([alone, second], segments, max_speakers=2)),
+                         ['spk_0', 'spk_0', 'spk_1'])
+
+    def test_should_split(self):
+        """Test that only long WAV, or FLAC with a decoder, is split"""
+        long_wav = media_probe.MediaInfo('wav', 'wav', 'pcm', 8000, 1, 7200.0, None)
+        with patch.object(chunked_transcription, 'CHUNKED_TRANSCRIPTION_ENABLED', True), \
+                patch.object(chunked_transcription, 'soundfile', None):
+            self.assertTrue(chunked_transcription.should_split(long_wav))
+            self.assertFalse(chunked_transcription.should_split(long_wav._replace(duration_seconds=60.0)))
+            self.assertFalse(chunked_transcription.should_split(long_wav._replace(format='flac')))
+            self.assertFalse(chunked_transcription.should_split(long_wav._replace(format='mp3')))
+        self.assertFalse(chunked_transcription.should_split(long_wav))
+
+    def test_segment_job_names(self):
+        """Test that segment jobs map back to their recording and segment"""
+        name = transcription_jobs.job_name('3f2b8c1e-7a4d-4c2e-9b1f-0d6e5a4c3b2a', 1626123456, segment=12)
+
+        self.assertEqual(transcription_jobs.recording_id(name), '3f2b8c1e-7a4d-4c2e-9b1f-0d6e5a4c3b2a')
+        self.assertEqual(transcription_jobs.segment_index(name), 12)
+        self.assertIsNone(transcription_jobs.segment_index(transcription_jobs.job_name('abc', 1626123456)))
+
+@mock_s3
+@mock_dynamodb
+class TestCompleteSegment(unittest.TestCase):
+    """Test cases for stitching once the last segment job completes"""
+
+    def setUp(self):
+        self.s3 = boto3.client('s3', region_name='us-east-1')
+        self.s3.create_bucket(Bucket='transcripts')
+        dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
+        self.recordings = dynamodb.create_table(
+            TableName='recordings',
+            KeySchema=[{'AttributeName': 'recordingId', 'KeyType': 'HASH'}],
+            AttributeDefinitions=[{'AttributeName': 'recordingId', 'AttributeType': 'S'}],
+            BillingMode='PAY_PER_REQUEST'
+        )
+        segments = [chunked_transcription.Segment(0, 0.0, 12.0, 0.0, 10.0),
+                    chunked_transcription.Segment(1, 8.0, 20.0, 10.0, 20.0)]
+        self.recordings.put_item(Item={
+            'recordingId': 'rec-1',
+            'status': 'TRANSCRIBING',
+            'transcriptionSegments': chunked_transcription.segments_to_item(segments)
+        })
+        for segment, word in zip(segments, ('hello', 'goodbye')):
+            self.s3.put_object(
+                Bucket='transcripts',
+                Key=chunked_transcription.segment_transcript_key('rec-1', segment.index),
+                Body=json.dumps({'results': {'items': [{'type': 'pronunciation', 'start_time': '3.0',
+                                                        'end_time': '3.5', 'alternatives': [{'content': word}]}]}})
+            )
+
+    def complete(self, index):
+        return chunked_transcription.complete_segment(self.recordings, self.s3, 'transcripts', 'rec-1', index)
+
+    def test_last_segment_stitches_once(self):
+        """Test that only the completion of the last outstanding segment stitches"""
+        self.assertFalse(self.complete(1))
+        self.assertFalse(self.complete(1))
+        self.assertTrue(self.complete(0))
+        self.assertFalse(self.complete(0))
+
+        transcript = json.loads(self.s3.get_object(Bucket='transcripts', Key='rec-1/transcript.json')['Body'].read())
+        self.assertEqual(transcript['results']['transcripts'][0]['transcript'], 'hello goodbye')
+        self.assertEqual(transcript['results']['items'][1]['start_time'], '11.000')
+        self.assertEqual(self.recordings.get_item(Key={'recordingId': 'rec-1'})['Item']['status'], 'TRANSCRIBED')
+
+    def test_segment_jobs_label_speakers(self):
+        """Test that segment jobs label speakers and stitching keeps to their speaker limit"""
+        segments = chunked_transcription.segments_from_item(
+            self.recordings.get_item(Key={'recordingId': 'rec-1'})['Item']['transcriptionSegments']
+        )
+        scheduler = MagicMock()
+        media = media_probe.MediaInfo('wav', 'wav', 'pcm', 8000, 1, 20.0, None)
+        with patch.object(transcribe_handler, 'RECORDINGS_TABLE', 'recordings'), \
+                patch.object(transcribe_handler, 'dynamodb', boto3.resource('dynamodb', region_name='us-east-1')), \
+                patch.object(transcribe_handler, 'scheduler', lambda: scheduler), \
+                patch.object(transcription_jobs, 'TRANSCRIBE_MAX_SPEAKER_LABELS', 2):
+            transcribe_handler.transcribe_segments('rec-1', 'audio', segments, media, 'md5:x', None)
+
+        self.assertEqual(scheduler.submit.call_count, 2)
+        for call in scheduler.submit.call_args_list:
+            self.assertEqual(call.args[1]['Settings'], {'ShowSpeakerLabels': True, 'MaxSpeakerLabels': 2})
+        self.assertEqual(self.recordings.get_item(Key={'recordingId': 'rec-1'})['Item']['maxSpeakerLabels'], 2)
+
+        with patch.object(chunked_transcription, 'stitch', wraps=chunked_transcription.stitch) as stitch:
+            self.complete(0)
+            self.complete(1)
+        self.assertEqual(stitch.call_args.args[2], 2)
+
+    def test_failed_recording_not_stitched(self):
+        """Test that segments completing after another failed do not stitch"""
+        self.recordings.update_item(Key={'recordingId': 'rec-1'}, UpdateExpression='set #status = :status',
+                                    ExpressionAttributeNames={'#status': 'status'},
+                                    ExpressionAttributeValues={':status': 'TRANSCRIPTION_FAILED'})
+
+        self.assertFalse(self.complete(0))
+        self.assertFalse(self.complete(1))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+import unittest
+import ast
+import os
+import sys
+import tempfile
+import zipfile
+
+# Add the backend and lambda directories to the path so we can import the deploy script
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'lambda'))
+import deploy
+
+def local_imports(module_name, modules, seen=None):
+    """Returns the lambda modules a module imports, directly or through other lambda modules"""
+    seen = set() if seen is None else seen
+    with open(os.path.join(deploy.LAMBDA_DIR, f"{module_name}.py")) as f:
+        tree = ast.parse(f.read())
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names = [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.module:
+            names = [node.module]
+        else:
+            continue
+        for name in names:
+            if name in modules and name not in seen:
+                seen.add(name)
+                local_imports(name, modules, seen)
+    return seen
+
+class TestDeploy(unittest.TestCase):
+    """Test cases for Lambda packaging"""
+
+    def test_dependencies_cover_imports(self):
+        """Test that every packaged function ships all the lambda modules it imports"""
+        modules = {name[:-3] for name in os.listdir(deploy.LAMBDA_DIR) if name.endswith('.py')}
+
+        for function_name in set(deploy.LAMBDA_FUNCTIONS) | set(deploy.LAMBDA_DEPENDENCIES):
+            missing = local_imports(function_name, modules) - set(deploy.LAMBDA_DEPENDENCIES.get(function_name, []))
+            self.assertEqual(missing, set(), function_name)
+
+    def test_package_includes_modules_and_rules(self):
+        """Test that a packaged function contains its handler, shared modules and rule sources"""
+        with tempfile.TemporaryDirectory() as output_dir:
+            zip_path = deploy.zip_lambda_function('analyze_transcript', output_dir)
+            with zipfile.ZipFile(zip_path) as package:
+                names = set(package.namelist())
+
+        self.assertIn('analyze_transcript.py', names)
+        self.assertIn('kiro_integration.py', names)
+        self.assertIn('rules/financial.json', names)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,164 @@
+import unittest
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+# Add the lambda directory to the path so we can import the client
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'lambda'))
+import kiro_client
+
+class StubKiroHandler(BaseHTTPRequestHandler):
+    """Local stand-in for the Kiro API that replays scripted responses"""
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        server.requests.append({
+            'body': json.loads(body),
+            'authorization': self.headers['Authorization'],
+            'client_port': self.client_address[1]
+        })
+        status, delay = server.script.pop(0) if server.script else (200, 0)
+        time.sleep(delay)
+
+        payload = json.dumps({'financial_compliance_score': 90, 'issues': []}).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+class TestKiroClient(unittest.TestCase):
+    """Test cases for the Kiro API client against a local stub server"""
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StubKiroHandler)
+        self.server.daemon_threads = True
+        self.server.script = []
+        self.server.requests = []
+        thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+        self.endpoint = f'http://127.0.0.1:{self.server.server_address[1]}/compliance/analyze'
+        self.breaker = kiro_client.CircuitBreaker(failure_threshold=2, reset_seconds=60)
+        self.client = kiro_client.KiroClient(
+            self.endpoint, 'test-key',
+            read_timeout=0.2, max_retries=2, backoff_base=0.01, breaker=self.breaker
+        )
+
+    def test_reuses_pooled_connection(self):
+        """Test that consecutive calls share one keep-alive connection"""
+        self.client.analyze({'transcript': 'one'})
+        result = self.client.analyze({'transcript': 'two'})
+
+        self.assertEqual(result['financial_compliance_score'], 90)
+        self.assertEqual(len({r['client_port'] for r in self.server.requests}), 1)
+        self.assertEqual(self.server.requests[0]['authorization'], 'Bearer test-key')
+
+    def test_retries_server_errors(self):
+        """Test that retryable responses are retried until one succeeds"""
+        self.server.script = [(503, 0), (502, 0)]
+
+        result = self.client.analyze({'transcript': 'retry'})
+
+        self.assertEqual(result['financial_compliance_score'], 90)
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertEqual(self.breaker.state, kiro_client.CircuitBreaker.CLOSED)
+
+    def test_client_errors_are_not_retried(self):
+        """Test that a rejected request fails at once without tripping the breaker"""
+        self.server.script = [(400, 0)]
+
+        with self.assertRaises(requests.HTTPError):
+            self.client.analyze({'transcript': 'bad'})
+
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertEqual(self.breaker.state, kiro_client.CircuitBreaker.CLOSED)
+
+    def test_unexpected_server_errors_count_as_failures(self):
+        """Test that a non-retryable 5xx fails at once and counts against the breaker"""
+        self.server.script = [(501, 0), (505, 0)]
+
+        for _ in range(2):
+            with self.assertRaises(requests.HTTPError):
+                self.client.analyze({'transcript': 'unsupported'})
+
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertEqual(self.breaker.state, kiro_client.CircuitBreaker.OPEN)
+
+    def test_request_timeout_capped_by_deadline(self):
+        """Test that a call gives up at the deadline rather than after the full read timeout"""
+        client = kiro_client.KiroClient(self.endpoint, 'test-key', read_timeout=5, max_retries=0,
+                                        breaker=self.breaker)
+        self.server.script = [(200, 1)]
+
+        started = time.monotonic()
+        with self.assertRaises(requests.Timeout):
+            client.analyze({'transcript': 'slow'}, deadline=started + 0.2)
+
+        self.assertLess(time.monotonic() - started, 0.6)
+        with self.assertRaises(requests.Timeout):
+            client.analyze({'transcript': 'late'}, deadline=time.monotonic() - 1)
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_read_timeout_and_circuit_breaker(self):
+        """Test that hung calls time out and the open breaker fails fast"""
+        self.server.script = [(200, 0.5)] * 6
+
+        for _ in range(2):
+            with self.assertRaises(requests.Timeout):
+                self.client.analyze({'transcript': 'slow'})
+        self.assertEqual(len(self.server.requests), 6)
+        self.assertEqual(self.breaker.state, kiro_client.CircuitBreaker.OPEN)
+
+        started = time.monotonic()
+        with self.assertRaises(kiro_client.CircuitOpenError):
+            self.client.analyze({'transcript': 'fast fail'})
+        self.assertLess(time.monotonic() - started, 0.1)
+        self.assertEqual(len(self.server.requests), 6)
+
+    def test_half_open_trial_closes_breaker(self):
+        """Test that a successful trial call after the reset period closes the breaker"""
+        now = [0]
+        breaker = kiro_client.CircuitBreaker(failure_threshold=1, reset_seconds=30, clock=lambda: now[0])
+        breaker.record_failure()
+        self.assertFalse(breaker.allow())
+
+        now[0] = 31
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+        breaker.record_success()
+
+        self.assertTrue(breaker.allow())
+        self.assertEqual(breaker.state, kiro_client.CircuitBreaker.CLOSED)
+
+    def test_trial_past_deadline_reopens_breaker(self):
+        """Test that a half-open trial whose deadline passed before sending still ends the trial"""
+        now = [0]
+        breaker = kiro_client.CircuitBreaker(failure_threshold=1, reset_seconds=30, clock=lambda: now[0])
+        client = kiro_client.KiroClient(self.endpoint, 'test-key', breaker=breaker)
+        breaker.record_failure()
+        now[0] = 31
+
+        with self.assertRaises(requests.Timeout):
+            client.analyze({'transcript': 'late'}, deadline=time.monotonic() - 1)
+
+        self.assertEqual(breaker.state, kiro_client.CircuitBreaker.OPEN)
+        now[0] = 62
+        self.assertTrue(breaker.allow())
+        self.assertEqual(self.server.requests, [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,261 @@
+import unittest
+import json
+import os
+import re
+import sys
+import random
+import shutil
+import tempfile
+from unittest.mock import patch
+
+# Add the lambda directory to the path so we can import the modules
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'lambda'))
+import kiro_integration
+import phrase_index
+import rule_packs
+from keyword_matcher import Automaton
+from phrase_index import PhraseIndex
+
+FINANCIAL_RULES = rule_packs.get_rule_pack('financial').rules
+
+class TestAutomaton(unittest.TestCase):
+    """Test cases for the automaton shared by the phrase matchers"""
+
+    def test_overlapping_patterns(self):
+        """Test that every pattern ending at a position is reported, including suffixes"""
+        automaton = Automaton()
+        for index, pattern in enumerate(['he', 'she', 'his', 'hers']):
+            automaton.add(map(ord, pattern), index)
+        automaton.build()
+
+        state, hits = automaton.advance(0, map(ord, 'ushers'))
+
+        self.assertEqual([(position, sorted(indexes)) for position, indexes in hits], [(3, [0, 1]), (5, [3])])
+
+    def test_state_carries_between_calls(self):
+        """Test that advancing in pieces finds patterns spanning them"""
+        automaton = Automaton()
+        automaton.add([1, 2, 3], 0)
+        automaton.build()
+
+        state, hits = automaton.advance(0, [1, 2])
+        self.assertEqual(hits, [])
+        self.assertEqual(automaton.advance(state, [3])[1], [(0, (0,))])
+
+class TestPhraseIndex(unittest.TestCase):
+    """Test cases for normalization-aware phrase matching"""
+
+    def setUp(self):
+        self.index = rule_packs.get_rule_pack('financial').matcher
+
+    def hits(self, text):
+        return [(m.keyword, text[m.start:m.end], m.confidence) for m in self.index.scan(text)]
+
+    def test_spoken_variants(self):
+        """Test that hyphenation, spacing and joined words match with lower confidence"""
+        self.assertEqual(self.hits('It is Risk-Free, risk free, riskfree'), [
+            ('risk-free', 'Risk-Free', 1.0),
+            ('risk-free', 'risk free', 0.9),
+            ('risk-free', 'riskfree', 0.8)
+        ])
+
+    def test_apostrophes_and_declared_splits(self):
+        """Test that contractions and declared spoken forms match, and other splits do not"""
+        self.assertIn(('guaranteed', "guarantee'd", 0.9), self.hits("It's guarantee'd"))
+        self.assertEqual(self.hits("the secret's out"), [('secret', "secret's", 0.9)])
+        self.assertEqual(self.hits('a loop hole'), [('loophole', 'loop hole', 0.8)])
+        self.assertEqual(self.hits("It's guarantee 'd"), [('guarantee', 'guarantee', 1.0)])
+        self.assertEqual(self.hits('a secre t loop hol e'), [])
+
+    def test_finds_every_regex_hit(self):
+        """Test that every hit of the original per-keyword regexes is found"""
+        keywords = list(FINANCIAL_RULES)
+        vocabulary = keywords + ['money', 'free', 'risk', 'tax', '-', 'the', 'books', 'off', 'a', 'guaranteed!']
+        rng = random.Random(7)
+
+        for _ in range(200):
+            text = ' '.join(rng.choice(vocabulary) for _ in range(30))
+            counts = self.index.count(text)
+            for keyword in keywords:
+                expected = len(re.findall(r'\b' + re.escape(keyword) + r'\b', text.lower()))
+                self.assertGreaterEqual(counts.get(keyword, 0), expected, text)
+
+    def test_phrases_do_not_cross_punctuation(self):
+        """Test that phrase words separated by sentence punctuation do not match"""
+        self.assertEqual(self.hits('There is no risk. Free coffee'), [])
+        self.assertEqual(self.hits('guarantees and promised'), [])
+
+    def test_scanner_matches_across_pieces(self):
+        """Test that feeding text in pieces gives the same hits as one scan"""
+        text = 'Totally risk free, off-the-books and guarantee \'d. Secret'
+
+        for size in (1, 2, 5, 64):
+            scanner = self.index.scanner()
+            matches = []
+            for start in range(0, len(text), size):
+                matches.extend(scanner.feed(text[start:start + size]))
+            matches.extend(scanner.close())
+            self.assertEqual(sorted(matches), sorted(self.index.scan(text)))
+
+    def test_prefilter_finds_what_the_token_scan_finds(self):
+        """Test that small phrase sets skipping text by regex match the same phrases as a full token scan"""
+        pack = rule_packs.get_rule_pack('financial')
+        with patch.object(phrase_index, 'PREFILTER_MAX_PHRASES', 0):
+            full = PhraseIndex(pack.rules, pack.variants)
+        vocabulary = list(pack.rules) + ['Risk', 'FREE', 'money', 'tax', 'Off-The-Books', 'loop', 'hole', "secret's",
+                                         "guarantee'd", 'riskfree', 'the', '-', '.', "'", 'a']
+        rng = random.Random(11)
+
+        self.assertIsNotNone(self.index._prefilter)
+        self.assertIsNone(full._prefilter)
+        for _ in range(300):
+            text = ''.join(rng.choice(vocabulary) + rng.choice([' ', '-', "'", ', ', '']) for _ in range(25))
+            expected = sorted(full.scan(text))
+            self.assertEqual(sorted(self.index.scan(text)), expected, text)
+
+            scanner = self.index.scanner()
+            matches = []
+            for start in range(0, len(text), 7):
+                matches.extend(scanner.feed(text[start:start + 7]))
+            matches.extend(scanner.close())
+            self.assertEqual(sorted(matches), expected, text)
+
+class TestRulePacks(unittest.TestCase):
+    """Test cases for compiled rule pack artifacts"""
+
+    def setUp(self):
+        self.rule_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.rule_dir)
+        self.write_source('1.0.0', {'guarantee': 'Guarantee issue'})
+
+    def write_source(self, version, rules):
+        with open(os.path.join(self.rule_dir, 'test.json'), 'w') as f:
+            json.dump({'industry': 'test', 'version': version, 'rules': rules}, f)
+
+    def test_artifact_round_trip(self):
+        """Test that a built artifact loads with a working matcher"""
+        [(industry, version, path)] = rule_packs.build_rule_packs(self.rule_dir)
+
+        pack = rule_packs.load_artifact(path)
+
+        self.assertEqual(industry, 'test')
+        self.assertEqual(pack.version, version)
+        self.assertEqual(rule_packs.read_artifact_version(path), version)
+        self.assertEqual(pack.matcher.count('We guarantee it'), {'guarantee': 1})
+
+    def test_hot_swap_on_version_change(self):
+        """Test that a rebuilt artifact replaces the cached pack"""
+        rule_packs.build_rule_packs(self.rule_dir)
+        with patch.object(rule_packs, 'RULE_PACK_DIR', self.rule_dir), \
+                patch.object(rule_packs, 'RULE_PACK_CHECK_SECONDS', 0), \
+                patch.dict(rule_packs._cache, clear=True):
+            first = rule_packs.get_rule_pack('test')
+            self.assertIs(rule_packs.get_rule_pack('test'), first)
+
+            self.write_source('1.1.0', {'secret': 'Secret issue'})
+            rule_packs.build_rule_packs(self.rule_dir)
+            second = rule_packs.get_rule_pack('test')
+
+        self.assertNotEqual(first.version, second.version)
+        self.assertEqual(list(second.rules), ['secret'])
+
+class TestAnalyzeCompliance(unittest.TestCase):
+    """Test cases for kiro_integration.analyze_compliance"""
+
+    def test_sample_transcript(self):
+        """Test scoring of the sample transcript in tests/data"""
+        path = os.path.join(os.path.dirname(__file__), 'data', 'test-transcript.json')
+        with open(path) as f:
+            transcript = json.load(f)['results']['transcripts'][0]['transcript']
+
+        result = kiro_integration.analyze_compliance(transcript, {'job_name': 'test'})
+
+        self.assertEqual(result['compliance_score'], 50)
+        self.assertEqual(
+            result['keyword_counts'],
+            {'guarantee': 1, 'risk-free': 1, 'secret': 1, 'tax-free': 1, 'loophole': 1}
+        )
+        self.assertEqual(result['findings'][0], FINANCIAL_RULES['guarantee'])
+        self.assertEqual(result['industry'], 'financial')
+        for match in result['matches']:
+            self.assertEqual(transcript[match['start']:match['end']].lower(), match['keyword'])
+
+    def test_clean_transcript(self):
+        """Test that a clean transcript keeps the full score"""
+        result = kiro_integration.analyze_compliance('Thanks for calling, how can I help?')
+
+        self.assertEqual(result['compliance_score'], 100)
+        self.assertEqual(result['findings'], ['No compliance issues detected'])
+        self.assertEqual(result['matches'], [])
+
+class TestStreamingAnalysis(unittest.TestCase):
+    """Test cases for streaming analysis over Transcribe word items"""
+
+    def make_items(self, tokens):
+        """Builds Transcribe items, one second per word"""
+        items = []
+        for i, token in enumerate(tokens):
+            if token in ',.':
+                items.append({'alternatives': [{'content': token}], 'type': 'punctuation'})
+            else:
+                items.append({
+                    'start_time': f'{i}.0',
+                    'end_time': f'{i}.5',
+                    'alternatives': [{'confidence': '0.99', 'content': token}],
+                    'type': 'pronunciation'
+                })
+        return items
+
+    def test_findings_have_word_times(self):
+        """Test that phrases split across segments match with word times"""
+        tokens = 'It is kept off the books , and it is Guaranteed .'.split()
+        items = self.make_items(tokens)
+
+        for segment_items in (1, 2, 3, 50):
+            findings = list(kiro_integration.stream_compliance_findings(items, segment_items))
+            self.assertEqual(
+                [(f['keyword'], f['start_time'], f['end_time']) for f in findings],
+                [('off the books', 3.0, 5.5), ('guaranteed', 10.0, 10.5)]
+            )
+
+    def test_matches_flat_transcript(self):
+        """Test that the item stream gives the same result as the flattened text"""
+        tokens = 'I promise this is risk-free , a secret loophole .'.split()
+        text = 'I promise this is risk-free, a secret loophole.'
+
+        streamed = kiro_integration.analyze_compliance_items(self.make_items(tokens))
+        flat = kiro_integration.analyze_compliance(text)
+
+        self.assertEqual(streamed['findings'], flat['findings'])
+        self.assertEqual(
+            [(m['keyword'], m['start'], m['end']) for m in streamed['matches']],
+            [(m['keyword'], m['start'], m['end']) for m in flat['matches']]
+        )
+
+class TestAnalyzeComplianceMany(unittest.TestCase):
+    """Test cases for kiro_integration.analyze_compliance_many"""
+
+    def setUp(self):
+        self.items = [
+            (f'Call {i}: this is a {"guaranteed" if i % 3 == 0 else "normal"} offer', {'index': i})
+            for i in range(25)
+        ]
+
+    def assert_in_order(self, results):
+        self.assertEqual(len(results), len(self.items))
+        for i, result in enumerate(results):
+            self.assertEqual(result['metadata'], {'index': i})
+            self.assertEqual(result['compliance_score'], 90 if i % 3 == 0 else 100)
+
+    def test_in_process(self):
+        """Test batch analysis in the calling process"""
+        self.assert_in_order(list(kiro_integration.analyze_compliance_many(self.items, max_workers=1, chunk_size=4)))
+
+    def test_process_pool(self):
+        """Test that results stream back in input order from a process pool"""
+        results = kiro_integration.analyze_compliance_many(iter(self.items), max_workers=2, chunk_size=3)
+
+        self.assert_in_order(list(results))
+
+if __name__ == '__main__':
+    unittest.main()
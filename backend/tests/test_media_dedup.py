@@ -0,0 +1,162 @@
+import unittest
+import hashlib
+import io
+import json
+import os
+import sys
+import wave
+from decimal import Decimal
+from unittest.mock import MagicMock, patch
+
+import boto3
+from moto import mock_dynamodb, mock_s3
+
+# Add the lambda directory to the path so we can import the modules
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'lambda'))
+import analysis_handler
+import media_dedup
+import transcribe_handler
+import transcription_scheduler
+
+def wav_bytes(seconds):
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as writer:
+        writer.setnchannels(1)
+        writer.setsampwidth(2)
+        writer.setframerate(8000)
+        writer.writeframes(b'\x01\x00' * int(8000 * seconds))
+    return buffer.getvalue()
+
+def create_table(dynamodb, name, key):
+    return dynamodb.create_table(
+        TableName=name,
+        KeySchema=[{'AttributeName': key, 'KeyType': 'HASH'}],
+        AttributeDefinitions=[{'AttributeName': key, 'AttributeType': 'S'}],
+        BillingMode='PAY_PER_REQUEST'
+    )
+
+@mock_s3
+@mock_dynamodb
+class TestMediaDedup(unittest.TestCase):
+    """Test cases for content-hash deduplication of uploads"""
+
+    def setUp(self):
+        self.s3 = boto3.client('s3', region_name='us-east-1')
+        self.s3.create_bucket(Bucket='audio')
+        self.dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
+        self.index = create_table(self.dynamodb, 'media-index', 'contentHash')
+
+    def test_content_hash_uses_etag(self):
+        """Test that identical uploads hash alike without reading them"""
+        self.s3.put_object(Bucket='audio', Key='a/call.wav', Body=wav_bytes(1))
+        self.s3.put_object(Bucket='audio', Key='b/copy.mp3', Body=wav_bytes(1))
+        self.s3.put_object(Bucket='audio', Key='c/other.wav', Body=wav_bytes(2))
+
+        first = media_dedup.content_hash(self.s3, 'audio', 'a/call.wav')
+
+        self.assertTrue(first.startswith('md5:'))
+        self.assertEqual(first, media_dedup.content_hash(self.s3, 'audio', 'b/copy.mp3'))
+        self.assertNotEqual(first, media_dedup.content_hash(self.s3, 'audio', 'c/other.wav'))
+
+    def test_content_hash_streams_multipart_uploads(self):
+        """Test that an object without a usable ETag or checksum is streamed"""
+        data = wav_bytes(1)
+        s3 = MagicMock()
+        s3.head_object.return_value = {'ETag': '"abc-2"', 'ContentLength': len(data)}
+        s3.get_object.return_value = {'Body': io.BytesIO(data)}
+
+        self.assertEqual(media_dedup.content_hash(s3, 'audio', 'call.wav'),
+                         f"sha256:{hashlib.sha256(data).hexdigest()}")
+
+    def test_claim_and_release(self):
+        """Test that the first claim wins until its owner releases it"""
+        self.assertEqual(media_dedup.claim('md5:x', 'rec-1', self.index), 'rec-1')
+        self.assertEqual(media_dedup.claim('md5:x', 'rec-2', self.index), 'rec-1')
+        self.assertEqual(media_dedup.claim('md5:x', 'rec-1', self.index), 'rec-1')
+
+        media_dedup.release('md5:x', 'rec-2', self.index)
+        self.assertEqual(media_dedup.claim('md5:x', 'rec-3', self.index), 'rec-1')
+
+        media_dedup.release('md5:x', 'rec-1', self.index)
+        self.assertEqual(media_dedup.claim('md5:x', 'rec-3', self.index), 'rec-3')
+
+    def test_duplicate_upload_is_linked(self):
+        """Test that transcribe_handler links a re-upload instead of transcribing it"""
+        recordings = create_table(self.dynamodb, 'recordings', 'recordingId')
+        queue = self.dynamodb.create_table(
+            TableName='scheduler',
+            KeySchema=[{'AttributeName': 'queueName', 'KeyType': 'HASH'},
+                       {'AttributeName': 'position', 'KeyType': 'RANGE'}],
+            AttributeDefinitions=[{'AttributeName': 'queueName', 'AttributeType': 'S'},
+                                  {'AttributeName': 'position', 'AttributeType': 'S'}],
+            BillingMode='PAY_PER_REQUEST'
+        )
+        recordings.put_item(Item={'recordingId': 'rec-1', 'status': 'PENDING_UPLOAD'})
+        recordings.put_item(Item={'recordingId': 'rec-2', 'status': 'PENDING_UPLOAD'})
+        self.s3.put_object(Bucket='audio', Key='user/rec-1/call.wav', Body=wav_bytes(1))
+        self.s3.put_object(Bucket='audio', Key='user/rec-2/call.wav', Body=wav_bytes(1))
+
+        transcribe = MagicMock()
+        transcribe.start_transcription_job.return_value = {'TranscriptionJob': {'TranscriptionJobName': 'job'}}
+        with patch.object(transcribe_handler, 'RECORDINGS_TABLE', 'recordings'), \
+                patch.object(transcribe_handler, 's3', self.s3), \
+                patch.object(transcribe_handler, 'dynamodb', self.dynamodb), \
+                patch.object(transcribe_handler, 'scheduler', lambda: transcription_scheduler.TranscriptionScheduler(
+                    transcribe, queue, recordings_table=recordings)), \
+                patch.object(media_dedup, '_table', lambda table=None: self.index):
+            for recording_id in ('rec-1', 'rec-2'):
+                message = {'recordingId': recording_id, 's3Key': f"user/{recording_id}/call.wav", 'bucket': 'audio'}
+                result = transcribe_handler.transcribe_record({'Sns': {'Message': json.dumps(message)}})
+
+        transcribe.start_transcription_job.assert_called_once()
+        self.assertEqual(result['duplicateOf'], 'rec-1')
+        duplicate = recordings.get_item(Key={'recordingId': 'rec-2'})['Item']
+        self.assertEqual((duplicate['status'], duplicate['duplicateOf']), ('DUPLICATE', 'rec-1'))
+        original = recordings.get_item(Key={'recordingId': 'rec-1'})['Item']
+        self.assertEqual(original['contentHash'], duplicate['contentHash'])
+
+    def link(self, recordings, recording_id, original_id, media_hash):
+        with patch.object(transcribe_handler, 'RECORDINGS_TABLE', 'recordings'), \
+                patch.object(transcribe_handler, 'dynamodb', self.dynamodb), \
+                patch.object(media_dedup, '_table', lambda table=None: self.index):
+            transcribe_handler.link_duplicate(recording_id, original_id, media_hash)
+        return recordings.get_item(Key={'recordingId': recording_id})['Item']
+
+    def test_duplicates_follow_the_original(self):
+        """Test that duplicates linked while the original is pending take on its final status"""
+        recordings = create_table(self.dynamodb, 'recordings', 'recordingId')
+        recordings.put_item(Item={'recordingId': 'rec-1', 'status': 'TRANSCRIBING', 'contentHash': 'md5:x'})
+        media_dedup.claim('md5:x', 'rec-1', self.index)
+
+        self.assertEqual(self.link(recordings, 'rec-2', 'rec-1', 'md5:x')['status'], 'DUPLICATE')
+        self.assertEqual(media_dedup.duplicates('md5:x', 'rec-1', self.index), {'rec-2'})
+
+        with patch.object(analysis_handler, 'RECORDINGS_TABLE', 'recordings'), \
+                patch.object(analysis_handler, 'dynamodb', self.dynamodb), \
+                patch.object(media_dedup, '_table', lambda table=None: self.index):
+            analysis_handler.share_with_duplicates(
+                {'recordingId': 'rec-1', 'contentHash': 'md5:x'},
+                {'status': 'COMPLETED', 'complianceScore': 72.5, 'verdictTier': 'bedrock'}
+            )
+
+        duplicate = recordings.get_item(Key={'recordingId': 'rec-2'})['Item']
+        self.assertEqual((duplicate['status'], duplicate['complianceScore']), ('COMPLETED', Decimal('72.5')))
+
+    def test_released_media_fails_its_duplicates(self):
+        """Test that an original whose transcription fails passes the failure to its duplicates"""
+        recordings = create_table(self.dynamodb, 'recordings', 'recordingId')
+        recordings.put_item(Item={'recordingId': 'rec-1', 'status': 'TRANSCRIBING'})
+        media_dedup.claim('md5:x', 'rec-1', self.index)
+        self.link(recordings, 'rec-2', 'rec-1', 'md5:x')
+
+        recordings.put_item(Item={'recordingId': 'rec-1', 'status': 'TRANSCRIPTION_FAILED'})
+        media_dedup.update_duplicates(
+            recordings, {'recordingId': 'rec-1', 'status': 'TRANSCRIPTION_FAILED'},
+            media_dedup.release('md5:x', 'rec-1', self.index)
+        )
+
+        self.assertEqual(recordings.get_item(Key={'recordingId': 'rec-2'})['Item']['status'], 'TRANSCRIPTION_FAILED')
+        self.assertEqual(self.link(recordings, 'rec-3', 'rec-1', 'md5:x')['status'], 'TRANSCRIPTION_FAILED')
+
+if __name__ == '__main__':
+    unittest.main()
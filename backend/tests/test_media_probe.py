@@ -0,0 +1,158 @@
+import unittest
+import io
+import os
+import struct
+import sys
+import wave
+
+import boto3
+from moto import mock_s3
+
+# Add the lambda directory to the path so we can import the probe
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'lambda'))
+import media_probe
+
+def wav_bytes(seconds, rate=8000, channels=1):
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as writer:
+        writer.setnchannels(channels)
+        writer.setsampwidth(2)
+        writer.setframerate(rate)
+        writer.writeframes(b'\x00\x00' * channels * int(rate * seconds))
+    return buffer.getvalue()
+
+def mp3_frame(padding=0):
+    # MPEG-1 Layer III, 128 kbps, 44.1kHz, stereo: 417 bytes plus padding
+    header = bytes([0xFF, 0xFB, 0x90 | padding << 1, 0x00])
+    return header + b'\x00' * (417 + padding - 4)
+
+def box(box_type, payload):
+    return struct.pack('>I4s', 8 + len(payload), box_type) + payload
+
+def mp4_bytes(seconds, handler=b'soun', mdat_bytes=0):
+    mvhd = box(b'mvhd', b'\x00' * 12 + struct.pack('>II', 1000, int(seconds * 1000)) + b'\x00' * 80)
+    hdlr = box(b'hdlr', b'\x00' * 8 + handler + b'\x00' * 12)
+    entry = box(b'mp4a', b'\x00' * 16 + struct.pack('>HHHHI', 2, 16, 0, 0, 44100 << 16))
+    stsd = box(b'stsd', b'\x00' * 4 + struct.pack('>I', 1) + entry)
+    trak = box(b'trak', box(b'mdia', hdlr + box(b'minf', box(b'stbl', stsd))))
+    moov = box(b'moov', mvhd + trak)
+    ftyp = box(b'ftyp', b'M4A \x00\x00\x00\x00isomM4A ')
+    return ftyp + box(b'mdat', b'\x00' * mdat_bytes) + moov
+
+class CountingReader:
+    def __init__(self, data):
+        self.data = data
+        self.requests = []
+
+    def __call__(self, start, length):
+        self.requests.append((start, length))
+        return self.data[start:start + length], len(self.data)
+
+class TestMediaProbe(unittest.TestCase):
+    """Test cases for header-based media detection"""
+
+    def test_wav(self):
+        """Test that WAV format, codec and duration come from the RIFF header"""
+        info = media_probe.probe_bytes(wav_bytes(2.5, rate=16000, channels=2))
+
+        self.assertEqual((info.format, info.codec, info.sample_rate, info.channels), ('wav', 'pcm', 16000, 2))
+        self.assertAlmostEqual(info.duration_seconds, 2.5)
+
+    def test_mislabeled_wav_reads_only_the_head(self):
+        """Test that a large file is identified from one ranged read"""
+        reader = CountingReader(wav_bytes(60))
+
+        info = media_probe.probe(reader, probe_bytes=4096)
+
+        self.assertEqual(info.format, 'wav')
+        self.assertAlmostEqual(info.duration_seconds, 60)
+        self.assertEqual(reader.requests, [(0, 4096)])
+
+    def test_flac(self):
+        """Test that duration comes from FLAC STREAMINFO"""
+        sample_rate, channels, bits, samples = 44100, 2, 16, 44100 * 90
+        packed = (sample_rate << 44) | ((channels - 1) << 41) | ((bits - 1) << 36) | samples
+        streaminfo = struct.pack('>HH', 4096, 4096) + b'\x00' * 6 + packed.to_bytes(8, 'big') + b'\x00' * 16
+        data = b'fLaC' + bytes([0x80, 0, 0, 34]) + streaminfo
+
+        info = media_probe.probe_bytes(data)
+
+        self.assertEqual((info.format, info.sample_rate, info.channels), ('flac', 44100, 2))
+        self.assertAlmostEqual(info.duration_seconds, 90)
+
+    def test_mp3_after_id3_tag(self):
+        """Test that an ID3 tag is skipped and a CBR duration estimated"""
+        frames = b''.join(mp3_frame() for _ in range(100))
+        tag = b'ID3\x03\x00\x00' + bytes([0, 0, 0, 20]) + b'\x00' * 20
+
+        info = media_probe.probe_bytes(tag + frames)
+
+        self.assertEqual((info.format, info.sample_rate, info.channels), ('mp3', 44100, 2))
+        self.assertAlmostEqual(info.duration_seconds, len(frames) * 8 / 128000)
+
+    def test_mp3_xing_frame_count(self):
+        """Test that a VBR header's frame count gives the duration"""
+        first = bytearray(mp3_frame())
+        first[36:48] = b'Xing' + struct.pack('>II', 1, 1000)
+        info = media_probe.probe_bytes(bytes(first) + mp3_frame() * 3)
+
+        self.assertAlmostEqual(info.duration_seconds, 1000 * 1152 / 44100)
+
+    def test_m4a_with_moov_after_mdat(self):
+        """Test that moov is read with a ranged GET past mdat"""
+        reader = CountingReader(mp4_bytes(125.5, mdat_bytes=100000))
+
+        info = media_probe.probe(reader, probe_bytes=1024)
+
+        self.assertEqual((info.format, info.codec, info.channels, info.sample_rate), ('m4a', 'aac', 2, 44100))
+        self.assertAlmostEqual(info.duration_seconds, 125.5)
+        self.assertEqual(len(reader.requests), 2)
+
+    def test_video_without_audio_rejected(self):
+        """Test that an MP4 with no sound track is rejected"""
+        info = media_probe.probe_bytes(mp4_bytes(10, handler=b'vide'))
+
+        with self.assertRaisesRegex(media_probe.UnsupportedMedia, 'no audio'):
+            media_probe.validate(info)
+
+    def test_ogg_opus_duration_from_last_page(self):
+        """Test that Ogg duration comes from the last page's granule position"""
+        def page(granule, packet):
+            return b'OggS\x00\x00' + struct.pack('<qIII', granule, 1, 0, 0) + bytes([1, len(packet)]) + packet
+        head = page(0, b'OpusHead\x01\x01' + struct.pack('<HI', 312, 16000) + b'\x00\x00\x00')
+        data = head + b'\x00' * 50000 + page(48000 * 30 + 312, b'\x00')
+
+        info = media_probe.probe_bytes(data)
+
+        self.assertEqual((info.format, info.codec, info.channels), ('ogg', 'opus', 1))
+        self.assertAlmostEqual(info.duration_seconds, 30)
+
+    def test_unrecognized_and_limits(self):
+        """Test that unknown, empty and over-long media are rejected"""
+        with self.assertRaisesRegex(media_probe.UnsupportedMedia, 'unrecognized'):
+            media_probe.validate(media_probe.probe_bytes(b'test audio content'))
+        with self.assertRaisesRegex(media_probe.UnsupportedMedia, 'matroska'):
+            media_probe.validate(media_probe.probe_bytes(b'\x1a\x45\xdf\xa3\x42\x82\x88matroska'))
+        with self.assertRaises(media_probe.UnsupportedMedia):
+            media_probe.validate(media_probe.probe_bytes(wav_bytes(0)))
+        with self.assertRaisesRegex(media_probe.UnsupportedMedia, 'limit'):
+            media_probe.validate(media_probe.MediaInfo('wav', 'wav', 'pcm', 8000, 1, 5 * 60 * 60, 1000))
+
+    @mock_s3
+    def test_probe_object_uses_ranged_get(self):
+        """Test probing S3 objects, including an empty one"""
+        s3 = boto3.client('s3', region_name='us-east-1')
+        s3.create_bucket(Bucket='audio')
+        s3.put_object(Bucket='audio', Key='call.mp3', Body=wav_bytes(3))
+        s3.put_object(Bucket='audio', Key='empty.wav', Body=b'')
+
+        info = media_probe.probe_object(s3, 'audio', 'call.mp3', probe_bytes=64)
+        self.assertEqual(info.format, 'wav')
+        self.assertEqual(info.size, len(wav_bytes(3)))
+        self.assertAlmostEqual(info.duration_seconds, 3)
+
+        empty = media_probe.probe_object(s3, 'audio', 'empty.wav')
+        self.assertIsNone(empty.format)
+
+if __name__ == '__main__':
+    unittest.main()
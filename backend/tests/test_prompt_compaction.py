@@ -0,0 +1,102 @@
+import unittest
+import json
+import os
+import random
+import sys
+
+# Add the lambda directory to the path so we can import the compaction module
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'lambda'))
+import prompt_compaction
+import rule_packs
+from phrase_index import PhraseIndex
+from transcript_chunker import estimate_tokens
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
+
+RULES = {'guaranteed': 'Claims of guaranteed returns may be misleading', 'insider': 'Potential reference to insider trading'}
+
+class TestPromptCompaction(unittest.TestCase):
+    """Test cases for transcript compaction before prompting"""
+
+    def test_fillers_and_repeats_removed(self):
+        """Test that filler words and stutters are dropped without losing meaning"""
+        result = prompt_compaction.compact_transcript(
+            "Um, so I I think, uh, the the fund is, you know you know, guaranteed uh. Yes. Yes."
+        )
+
+        self.assertEqual(result.text, "so I think, the fund is, you know, guaranteed. Yes. Yes.")
+        self.assertGreater(result.tokens_saved, 0)
+        self.assertEqual(result.tokens_saved, result.original_tokens - result.compacted_tokens)
+
+    def test_meaningful_repetition_kept(self):
+        """Test that emphatic and grammatical doubled words survive"""
+        for text in ("No no, that is not guaranteed.", "I know that that fund is risky.",
+                     "He had had enough.", "It is not, not at all, not at all."):
+            self.assertEqual(prompt_compaction.normalize_transcript(text), text)
+
+    def test_budget_keeps_compliance_sentences(self):
+        """Test that sentences with compliance terms survive budget fitting"""
+        filler = ' '.join(f"We talked about the weather on day {i}." for i in range(50))
+        transcript = f"{filler} These returns are guaranteed. {filler} I heard it from an insider."
+
+        result = prompt_compaction.compact_transcript(transcript, token_budget=60, matcher=PhraseIndex(RULES))
+
+        self.assertLessEqual(result.compacted_tokens, 60)
+        self.assertIn("These returns are guaranteed.", result.text)
+        self.assertIn("I heard it from an insider.", result.text)
+        self.assertIn(prompt_compaction.GAP_MARKER, result.text)
+
+    def test_gap_markers_count_against_budget(self):
+        """Test that the fitted text, markers included, is within the budget"""
+        sentences = [f"Sentence {i} is here." if i % 4 else f"Returns are guaranteed {i}." for i in range(200)]
+        text = ' '.join(sentences)
+
+        for budget in (5, 17, 40, 101, 333):
+            fitted = prompt_compaction.fit_budget(text, budget, PhraseIndex(RULES))
+            self.assertLessEqual(estimate_tokens(fitted), budget, fitted)
+
+    def test_oversized_compliance_sentence_excerpted(self):
+        """Test that a flagged sentence longer than the budget keeps the words around its term"""
+        padding = ' '.join(f"word{i}" for i in range(200))
+        text = f"Hello there. {padding} and these returns are guaranteed by us {padding}. Bye now."
+
+        fitted = prompt_compaction.fit_budget(text, 20, PhraseIndex(RULES))
+
+        self.assertLessEqual(estimate_tokens(fitted), 20)
+        self.assertIn("returns are guaranteed by", fitted)
+        self.assertTrue(fitted.startswith(prompt_compaction.GAP_MARKER))
+
+    def test_compliance_term_recall(self):
+        """Test that every compliance term in a transcript is still found after compaction"""
+        matcher = rule_packs.get_rule_pack('financial').matcher
+        vocabulary = ['um', 'uh', 'the', 'the', 'I', 'I', 'no', 'you', 'know', 'fund', 'is', 'that', 'returns',
+                      'we', 'can', 'offer', 'risk', 'free'] + list(rule_packs.get_rule_pack('financial').rules)
+        rng = random.Random(11)
+
+        for _ in range(100):
+            words = [rng.choice(vocabulary) + ('.' if rng.random() < 0.1 else '') for _ in range(300)]
+            text = ' '.join(words)
+            expected = set(matcher.count(text))
+
+            result = prompt_compaction.compact_transcript(text, token_budget=150, matcher=matcher)
+
+            self.assertLessEqual(result.compacted_tokens, 150)
+            self.assertEqual(expected - set(matcher.count(result.text)), set(), text)
+
+    def test_sample_transcript_savings(self):
+        """Test the savings on the sample transcript, which is fluent, so only budget fitting saves tokens"""
+        with open(os.path.join(DATA_DIR, 'test-transcript.json')) as f:
+            transcript = json.load(f)['results']['transcripts'][0]['transcript']
+        matcher = rule_packs.get_rule_pack('financial').matcher
+        terms = set(matcher.count(transcript))
+
+        self.assertEqual(prompt_compaction.compact_transcript(transcript).tokens_saved, 0)
+        for saving in (0.2, 0.3):
+            budget = int(estimate_tokens(transcript) * (1 - saving))
+            result = prompt_compaction.compact_transcript(transcript, token_budget=budget, matcher=matcher)
+
+            self.assertGreaterEqual(result.tokens_saved / result.original_tokens, saving)
+            self.assertEqual(set(matcher.count(result.text)), terms, result.text)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,144 @@
+import unittest
+import os
+import sys
+
+import boto3
+from botocore.exceptions import ClientError
+from moto import mock_dynamodb
+
+# Add the lambda directory to the path so we can import the limiter
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'lambda'))
+import rate_limiter
+
+POLICY = rate_limiter.AimdPolicy(min_limit=1, max_limit=8, increase_step=0.5, decrease_factor=0.5)
+
+def throttling_error():
+    return ClientError({'Error': {'Code': 'ThrottlingException', 'Message': 'Too many requests'}}, 'InvokeModel')
+
+class FakeTime:
+    def __init__(self):
+        self.now = 0.0
+
+    def clock(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+class TestAdaptiveLimiter(unittest.TestCase):
+    """Test cases for the AIMD limiter with a local store"""
+
+    def setUp(self):
+        self.time = FakeTime()
+        self.store = rate_limiter.LocalStore()
+        self.limiter = rate_limiter.AdaptiveLimiter(
+            'bedrock', self.store, policy=POLICY, initial_concurrency=4,
+            requests_per_second=100, burst=100, max_wait=30,
+            clock=self.time.clock, sleep=self.time.sleep
+        )
+
+    def test_throttles_are_retried_and_shrink_limit(self):
+        """Test that throttled calls are retried instead of failing"""
+        outcomes = [throttling_error(), throttling_error(), {'overall_score': 80}]
+
+        def invoke():
+            outcome = outcomes.pop(0)
+            if isinstance(outcome, Exception):
+                raise outcome
+            return outcome
+
+        self.assertEqual(self.limiter.call(invoke), {'overall_score': 80})
+        self.assertEqual(self.limiter.throttles, 2)
+        self.assertEqual(self.store._state['bedrock'], {'limit': 1.5, 'in_flight': 0})
+
+    def test_successes_grow_limit_to_maximum(self):
+        """Test additive increase up to the policy maximum"""
+        for _ in range(20):
+            self.limiter.call(lambda: None)
+        self.assertEqual(self.store._state['bedrock']['limit'], 8)
+
+    def test_persistent_throttling_raises(self):
+        """Test that a call throttled past the maximum wait raises instead of returning a default"""
+        def invoke():
+            raise throttling_error()
+
+        with self.assertRaises(rate_limiter.RateLimitExceeded):
+            self.limiter.call(invoke)
+        self.assertEqual(self.store._state['bedrock']['in_flight'], 0)
+        self.assertLessEqual(self.time.now, 30)
+
+    def test_caller_deadline_cuts_retries_short(self):
+        """Test that a caller's deadline before the maximum wait ends the retries"""
+        def invoke():
+            raise throttling_error()
+
+        with self.assertRaises(rate_limiter.RateLimitExceeded):
+            self.limiter.call_before(2, invoke)
+        self.assertEqual(self.store._state['bedrock']['in_flight'], 0)
+        self.assertLessEqual(self.time.now, 2)
+
+    def test_other_errors_are_not_retried(self):
+        """Test that non-throttling errors are raised at once and leave the limit alone"""
+        def invoke():
+            raise ValueError('bad response')
+
+        with self.assertRaises(ValueError):
+            self.limiter.call(invoke)
+        self.assertEqual(self.store._state['bedrock'], {'limit': 4, 'in_flight': 0})
+
+    def test_token_bucket_paces_requests(self):
+        """Test that calls beyond the burst wait for tokens"""
+        limiter = rate_limiter.AdaptiveLimiter(
+            'paced', self.store, policy=POLICY, requests_per_second=2, burst=1,
+            clock=self.time.clock, sleep=self.time.sleep
+        )
+        for _ in range(5):
+            limiter.call(lambda: None)
+        self.assertAlmostEqual(self.time.now, 2.0, places=1)
+
+class TestDynamoDBStore(unittest.TestCase):
+    """Test cases for limiter state shared through DynamoDB"""
+
+    @mock_dynamodb
+    def test_shared_slots_and_adjustments(self):
+        """Test slot leases, AIMD updates and recovery of expired leases"""
+        dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
+        dynamodb.create_table(
+            TableName='rate-limits',
+            KeySchema=[{'AttributeName': 'limiterName', 'KeyType': 'HASH'}],
+            AttributeDefinitions=[{'AttributeName': 'limiterName', 'AttributeType': 'S'}],
+            BillingMode='PAY_PER_REQUEST'
+        )
+        clock = FakeTime()
+        clock.now = 1000.0
+        store = rate_limiter.DynamoDBStore('rate-limits', dynamodb=dynamodb, lease_seconds=300, clock=clock.clock)
+        table = dynamodb.Table('rate-limits')
+
+        first = store.try_acquire('bedrock', 2)
+        second = store.try_acquire('bedrock', 2)
+        self.assertTrue(first and second and first != second)
+        self.assertIsNone(store.try_acquire('bedrock', 2))
+
+        self.assertEqual(store.release('bedrock', first, True, POLICY), 1)
+        store.release('bedrock', second, False, POLICY)
+        item = table.get_item(Key={'limiterName': 'bedrock'})['Item']
+        self.assertEqual((item['leases'], float(item['concurrencyLimit'])), ({}, 1.5))
+
+        # A slot leaked by a crashed invocation comes back once its own
+        # lease expires, although the other slot stays busy
+        leaked = store.try_acquire('bedrock', 2)
+        clock.now += 200
+        busy = store.try_acquire('bedrock', 2)
+        self.assertIsNone(store.try_acquire('bedrock', 2))
+        clock.now += 101
+        reclaimed = store.try_acquire('bedrock', 2)
+        self.assertTrue(reclaimed)
+        leases = table.get_item(Key={'limiterName': 'bedrock'})['Item']['leases']
+        self.assertEqual(set(leases), {busy, reclaimed})
+
+        # Releasing the reclaimed lease leaves the other slots alone
+        store.release('bedrock', leaked, None, POLICY)
+        self.assertEqual(len(table.get_item(Key={'limiterName': 'bedrock'})['Item']['leases']), 2)
+
+if __name__ == '__main__':
+    unittest.main()
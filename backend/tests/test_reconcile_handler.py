@@ -0,0 +1,146 @@
+import unittest
+import json
+import os
+import sys
+import uuid
+from datetime import datetime, timedelta, timezone
+from unittest.mock import MagicMock, patch
+
+import boto3
+from moto import mock_dynamodb
+
+# Add the lambda directory to the path so we can import the handler
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'lambda'))
+import aws_clients
+import reconcile_handler
+import transcription_jobs
+
+NOW = datetime.now(timezone.utc)
+
+class FakeTranscribe:
+    """Pages job summaries the way list_transcription_jobs does"""
+
+    def __init__(self, jobs):
+        self.jobs = jobs
+        self.list_calls = 0
+
+    def list_transcription_jobs(self, Status, MaxResults, NextToken=None, JobNameContains=None):
+        self.list_calls += 1
+        matching = [job for job in self.jobs if job['TranscriptionJobStatus'] == Status
+                    and (JobNameContains is None or JobNameContains in job['TranscriptionJobName'])]
+        start = int(NextToken or 0)
+        response = {'TranscriptionJobSummaries': matching[start:start + MaxResults]}
+        if start + MaxResults < len(matching):
+            response['NextToken'] = str(start + MaxResults)
+        return response
+
+def job(name, status, age_hours=1):
+    return {'TranscriptionJobName': name, 'TranscriptionJobStatus': status,
+            'CreationTime': NOW - timedelta(hours=age_hours)}
+
+class TestTranscriptionJobs(unittest.TestCase):
+    """Test cases for job names"""
+
+    def test_recording_id_round_trip(self):
+        """Test that the whole UUID is recovered from a job name"""
+        recording_id = str(uuid.uuid4())
+        self.assertEqual(transcription_jobs.recording_id(transcription_jobs.job_name(recording_id, 1626123456)),
+                         recording_id)
+        self.assertIsNone(transcription_jobs.recording_id('transcribe_uploads_call_mp3'))
+
+@mock_dynamodb
+class TestReconcileHandler(unittest.TestCase):
+    """Test cases for the reconciliation sweeper"""
+
+    def setUp(self):
+        self.dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
+        self.recordings = self.dynamodb.create_table(
+            TableName='recordings',
+            KeySchema=[{'AttributeName': 'recordingId', 'KeyType': 'HASH'}],
+            AttributeDefinitions=[{'AttributeName': 'recordingId', 'AttributeType': 'S'}],
+            BillingMode='PAY_PER_REQUEST'
+        )
+        self.scheduler = self.dynamodb.create_table(
+            TableName='echoguard-transcription-scheduler',
+            KeySchema=[{'AttributeName': 'queueName', 'KeyType': 'HASH'},
+                       {'AttributeName': 'position', 'KeyType': 'RANGE'}],
+            AttributeDefinitions=[{'AttributeName': 'queueName', 'AttributeType': 'S'},
+                                  {'AttributeName': 'position', 'AttributeType': 'S'}],
+            BillingMode='PAY_PER_REQUEST'
+        )
+        self.sns = MagicMock()
+        self.sns.publish_batch.return_value = {'Successful': [], 'Failed': []}
+
+    def add_recording(self, status, job_status=None, job_age_hours=1, newer_job=False):
+        recording_id = str(uuid.uuid4())
+        job_name = transcription_jobs.job_name(recording_id, 1700000000)
+        self.recordings.put_item(Item={
+            'recordingId': recording_id,
+            'status': status,
+            'transcriptionJobName': job_name + '0' if newer_job else job_name
+        })
+        if job_status:
+            self.jobs.append(job(job_name, job_status, job_age_hours))
+        return recording_id
+
+    def status(self, recording_id):
+        return self.recordings.get_item(Key={'recordingId': recording_id})['Item']['status']
+
+    def test_reconciles_stuck_recordings_in_bulk(self):
+        """Test that recordings whose completion event was lost are caught up"""
+        self.jobs = []
+        completed = [self.add_recording('TRANSCRIBING', 'COMPLETED') for _ in range(230)]
+        failed = self.add_recording('QUEUED', 'FAILED')
+        analyzed = self.add_recording('COMPLETED', 'COMPLETED')
+        superseded = self.add_recording('TRANSCRIBING', 'COMPLETED', newer_job=True)
+        too_old = self.add_recording('TRANSCRIBING', 'COMPLETED', job_age_hours=48)
+        self.jobs.append(job('transcribe_other_upload', 'COMPLETED'))
+        self.jobs.append(job('echoguard-running-1700000000', 'IN_PROGRESS'))
+        self.scheduler.put_item(Item={'queueName': 'transcribe#slots', 'position': 'slots',
+                                      'jobs': {'echoguard-running-1700000000', 'echoguard-lost-1700000000'}})
+        transcribe = FakeTranscribe(self.jobs)
+
+        with patch.object(reconcile_handler, 'RECORDINGS_TABLE', 'recordings'), \
+                patch.object(reconcile_handler, 'dynamodb', self.dynamodb), \
+                patch.object(reconcile_handler, 'sns', self.sns), \
+                patch.object(reconcile_handler, 'transcribe', transcribe), \
+                patch.object(aws_clients, 'table', self.dynamodb.Table):
+            response = reconcile_handler.lambda_handler({}, None)
+
+        summary = json.loads(response['body'])
+        self.assertEqual(response['statusCode'], 200)
+        self.assertEqual((summary['transcribed'], summary['failed'], summary['slotsFreed']), (230, 1, 1))
+        self.assertTrue(all(self.status(recording_id) == 'TRANSCRIBED' for recording_id in completed))
+        self.assertEqual(self.status(failed), 'TRANSCRIPTION_FAILED')
+        self.assertEqual(self.status(analyzed), 'COMPLETED')
+        self.assertEqual(self.status(superseded), 'TRANSCRIBING')
+        self.assertEqual(self.status(too_old), 'TRANSCRIBING')
+
+        # 230 notifications in batches of ten
+        self.assertEqual(self.sns.publish_batch.call_count, 23)
+        message = json.loads(self.sns.publish_batch.call_args_list[0].kwargs['PublishBatchRequestEntries'][0]['Message'])
+        self.assertIn(message['recordingId'], completed)
+
+        # Bounded API calls: pages of 100 jobs and 100 recordings
+        calls = summary['apiCalls']
+        self.assertEqual(calls['list'], 3 + 1 + 2)
+        self.assertEqual(calls['read'], 3)
+        self.assertEqual(calls['write'], 3)
+
+    def test_failed_notification_retried_next_run(self):
+        """Test that a recording whose notification failed is left waiting"""
+        self.jobs = []
+        recording_id = self.add_recording('TRANSCRIBING', 'COMPLETED')
+        self.sns.publish_batch.return_value = {'Failed': [{'Id': '0', 'Message': 'throttled'}]}
+
+        with patch.object(reconcile_handler, 'RECORDINGS_TABLE', 'recordings'), \
+                patch.object(reconcile_handler, 'dynamodb', self.dynamodb), \
+                patch.object(reconcile_handler, 'sns', self.sns), \
+                patch.object(reconcile_handler, 'transcribe', FakeTranscribe(self.jobs)), \
+                patch.object(aws_clients, 'table', self.dynamodb.Table):
+            reconcile_handler.lambda_handler({}, None)
+
+        self.assertEqual(self.status(recording_id), 'TRANSCRIBING')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+import unittest
+import json
+import os
+import sys
+import threading
+
+# Add the lambda directory to the path so we can import the dispatcher
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'lambda'))
+import record_dispatch
+
+def sqs_record(message_id, body):
+    return {'messageId': message_id, 'eventSource': 'aws:sqs', 'body': json.dumps(body)}
+
+def sns_record(message_id, message):
+    return {'EventSource': 'aws:sns', 'Sns': {'MessageId': message_id, 'Message': json.dumps(message)}}
+
+def s3_event(bucket, key):
+    return {'Records': [{'s3': {'bucket': {'name': bucket}, 'object': {'key': key}}}]}
+
+class TestRecordDispatch(unittest.TestCase):
+    """Test cases for batched record processing"""
+
+    def test_sqs_partial_failures(self):
+        """Test that only failed SQS messages are reported for retry"""
+        event = {'Records': [sqs_record(f"msg-{i}", {'recordingId': f"rec-{i}"}) for i in range(5)]}
+
+        def process(record):
+            message = record_dispatch.message(record)
+            if message['recordingId'] in ('rec-1', 'rec-3'):
+                raise ValueError('analysis failed')
+            return message['recordingId']
+
+        response = record_dispatch.dispatch(event, process)
+
+        self.assertEqual(response['statusCode'], 500)
+        self.assertEqual(response['batchItemFailures'], [{'itemIdentifier': 'msg-1'}, {'itemIdentifier': 'msg-3'}])
+        body = json.loads(response['body'])
+        self.assertEqual(body['results'], ['rec-0', 'rec-2', 'rec-4'])
+        self.assertEqual(body['failed'], 2)
+
+    def test_single_record_keeps_response_body(self):
+        """Test that a single SNS record returns its own result as the body"""
+        event = {'Records': [sns_record('sns-1', {'recordingId': 'rec-1'})]}
+
+        response = record_dispatch.dispatch(event, lambda record: {'recordingId': record_dispatch.message(record)['recordingId']})
+        self.assertEqual(response['statusCode'], 200)
+        self.assertEqual(json.loads(response['body']), {'recordingId': 'rec-1'})
+
+    def test_failed_sns_and_s3_records_raise(self):
+        """Test that failed records from asynchronous triggers fail the invocation so it is retried"""
+        for event in (
+            {'Records': [sns_record('sns-1', {'recordingId': 'rec-1'})]},
+            {'Records': [dict(s3_event('audio', 'call.mp3')['Records'][0], eventSource='aws:s3')]}
+        ):
+            with self.assertRaises(record_dispatch.RecordsFailedError) as raised:
+                record_dispatch.dispatch(event, lambda record: 1 / 0, 'Error analyzing transcript')
+
+            response = raised.exception.response
+            self.assertEqual(response['statusCode'], 500)
+            self.assertEqual(json.loads(response['body'])['message'], 'Error analyzing transcript')
+            self.assertEqual(response['batchItemFailures'], [])
+
+    def test_wrapped_messages(self):
+        """Test that SNS envelopes and S3 notifications delivered through SQS are unwrapped"""
+        envelope = {'Type': 'Notification', 'Message': json.dumps({'recordingId': 'rec-1'})}
+        self.assertEqual(record_dispatch.message(sqs_record('m', envelope)), {'recordingId': 'rec-1'})
+
+        record = sqs_record('m', s3_event('audio', 'user+1/call%231.mp3'))
+        self.assertEqual(record_dispatch.s3_objects(record), [('audio', 'user 1/call#1.mp3')])
+
+    def test_concurrent_processing(self):
+        """Test that records are processed concurrently up to the limit"""
+        event = {'Records': [sqs_record(f"msg-{i}", {}) for i in range(8)]}
+        barrier = threading.Barrier(4, timeout=5)
+
+        response = record_dispatch.dispatch(event, lambda record: barrier.wait() >= 0, concurrency=4)
+
+        self.assertEqual(response['statusCode'], 200)
+        self.assertEqual(json.loads(response['body'])['processed'], 8)
+
+if __name__ == '__main__':
+    unittest.main()
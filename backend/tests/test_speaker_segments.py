@@ -0,0 +1,139 @@
+import unittest
+import io
+import json
+import os
+import sys
+from unittest.mock import MagicMock, patch
+
+# Add the lambda directory to the path so we can import the segmenter
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'lambda'))
+import analyze_transcript
+import kiro_integration
+import speaker_segments
+
+def word(content, start, speaker=None):
+    item = {'type': 'pronunciation', 'start_time': str(start), 'end_time': str(start + 0.4),
+            'alternatives': [{'content': content, 'confidence': '0.99'}]}
+    if speaker:
+        item['speaker_label'] = speaker
+    return item
+
+def punctuation(content):
+    return {'type': 'punctuation', 'alternatives': [{'content': content}]}
+
+# Agent (spk_0) opens the call, the customer (spk_1) answers
+CALL = [
+    (word('These', 0.0), 'spk_0'), (word('returns', 0.5), 'spk_0'), (word('are', 1.0), 'spk_0'),
+    (word('guaranteed', 1.5), 'spk_0'), (punctuation('.'), None),
+    (word('Is', 3.0), 'spk_1'), (word('it', 3.5), 'spk_1'), (word('risk-free', 4.0), 'spk_1'), (punctuation('?'), None),
+    (word('Yes', 6.0), 'spk_0'), (punctuation('.'), None)
+]
+
+def speaker_labels_results():
+    """Older Transcribe output: speakers only in results.speaker_labels"""
+    return {
+        'items': [item for item, _ in CALL],
+        'speaker_labels': {'speakers': 2, 'segments': [{
+            'speaker_label': 'spk_0',
+            'items': [{'start_time': item['start_time'], 'speaker_label': speaker} for item, speaker in CALL if speaker]
+        }]}
+    }
+
+def item_label_results():
+    """Newer Transcribe output: speaker_label on each item"""
+    return {'items': [word(item['alternatives'][0]['content'], float(item['start_time']), speaker) if speaker else item
+                      for item, speaker in CALL]}
+
+class TestSpeakerSegments(unittest.TestCase):
+    """Test cases for speaker turn segmentation"""
+
+    def test_turns_from_either_output_format(self):
+        """Test that turns are built from speaker_labels or per-item labels alike"""
+        for results in (speaker_labels_results(), item_label_results()):
+            turns = speaker_segments.build_turns(results)
+
+            self.assertEqual([turn.speaker for turn in turns], ['spk_0', 'spk_1', 'spk_0'])
+            self.assertEqual(speaker_segments.turn_text(turns[1]), 'Is it risk-free?')
+            self.assertEqual((turns[0].start_time, turns[0].end_time), (0.0, 1.9))
+
+        self.assertEqual(speaker_segments.build_turns({'items': [word('Hello', 0.0)]}), [])
+
+    def test_agent_turns_and_attributed_findings(self):
+        """Test that only agent speech is scanned and findings carry the speaker"""
+        turns = speaker_segments.build_turns(item_label_results())
+        agent = speaker_segments.identify_agent(turns)
+        scored = speaker_segments.select_turns(turns, agent)
+
+        findings = []
+        kiro_integration.analyze_compliance_items(
+            speaker_segments.turn_items(scored),
+            on_finding=lambda finding: findings.append(speaker_segments.label_finding(finding, scored, agent))
+        )
+
+        self.assertEqual(agent, 'spk_0')
+        self.assertEqual([finding['keyword'] for finding in findings], ['guaranteed'])
+        self.assertEqual((findings[0]['speaker'], findings[0]['role'], findings[0]['start_time']),
+                         ('spk_0', speaker_segments.AGENT_ROLE, 1.5))
+
+    def test_phrases_do_not_span_turns(self):
+        """Test that words from two agent turns the customer spoke between are not matched as one phrase"""
+        turns = speaker_segments.build_turns({'items': [
+            word('It', 0.0, 'spk_0'), word('is', 0.5, 'spk_0'), word('free', 1.0, 'spk_0'),
+            word('Really', 2.0, 'spk_1'),
+            word('money', 3.0, 'spk_0'), word('back', 3.5, 'spk_0')
+        ]})
+        scored = speaker_segments.select_turns(turns, 'spk_0')
+
+        results = kiro_integration.analyze_compliance_items(speaker_segments.turn_items(scored))
+
+        self.assertEqual(results['matches'], [])
+
+    def test_no_agent_speech_stores_no_score(self):
+        """Test that a call without agent turns is stored as not analyzable, with no score or alert"""
+        items = [word('Is', 3.0, 'spk_1'), word('it', 3.5, 'spk_1'), word('risk-free', 4.0, 'spk_1')]
+        body = json.dumps({'results': {'transcripts': [{'transcript': 'Is it risk-free'}], 'items': items}})
+        s3 = MagicMock()
+        s3.get_object.return_value = {'Body': io.BytesIO(body.encode('utf-8'))}
+        dynamodb = MagicMock()
+        alerts = MagicMock()
+
+        with patch.object(analyze_transcript, 's3', s3), patch.object(analyze_transcript, 'dynamodb', dynamodb), \
+                patch.object(analyze_transcript, 'compliance_alerts', return_value=alerts), \
+                patch.object(speaker_segments, 'identify_agent', return_value='spk_0'), \
+                patch.dict(os.environ, {'AUDIT_TABLE': 'audit'}):
+            result = analyze_transcript.analyze_transcript('transcripts', 'call.json')
+
+        item = dynamodb.Table.return_value.put_item.call_args.kwargs['Item']
+        self.assertEqual(item['status'], 'NOT_ANALYZABLE')
+        self.assertNotIn('score', item)
+        self.assertIsNone(result['score'])
+        alerts.add.assert_not_called()
+
+    def test_segments_respect_budget_and_fan_out_in_order(self):
+        """Test segment packing and ordered parallel analysis"""
+        turns = speaker_segments.build_turns(item_label_results())
+        segments = speaker_segments.group_turns(turns, 'spk_0', token_budget=8)
+
+        self.assertEqual(len(segments), 3)
+        self.assertTrue(segments[1].text.startswith('Customer: '))
+        results = speaker_segments.fan_out(segments, lambda segment: segment.index, max_workers=3)
+        self.assertEqual(results, [0, 1, 2])
+
+    def test_merge_keeps_worst_segment(self):
+        """Test that one severe segment sets the merged score and a segment without a score fails the merge"""
+        turns = speaker_segments.build_turns(item_label_results())
+        segments = speaker_segments.group_turns(turns, 'spk_0', token_budget=8)
+        analyses = [{'complianceScore': 100, 'tone': 'calm', 'violations': []} for _ in segments]
+        analyses[1] = {'complianceScore': 20, 'tone': 'pushy', 'violations': ['Guaranteed returns']}
+
+        merged = analyze_transcript.merge_segment_analyses(segments, analyses)
+
+        self.assertEqual(merged['complianceScore'], 20)
+        self.assertEqual(merged['violations'], ['Guaranteed returns'])
+
+        analyses[2] = {'summary': 'Unparsed'}
+        with self.assertRaises(ValueError):
+            analyze_transcript.merge_segment_analyses(segments, analyses)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,8 @@
+import io
 import json
 import os
 import unittest
+import wave
 from unittest.mock import patch, MagicMock
 
 import boto3
@@ -10,8 +12,18 @@ from moto import mock_s3, mock_transcribe
 # Import the Lambda function
 import sys
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'lambda'))
+import record_dispatch
 import start_transcribe
 
+def wav_bytes(seconds=1):
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as writer:
+        writer.setnchannels(1)
+        writer.setsampwidth(2)
+        writer.setframerate(8000)
+        writer.writeframes(b'\x01\x00' * int(8000 * seconds))
+    return buffer.getvalue()
+
 @mock_s3
 @mock_transcribe
 class TestStartTranscribe(unittest.TestCase):
@@ -21,8 +33,8 @@ class TestStartTranscribe(unittest.TestCase):
         self.s3.create_bucket(Bucket='echoguard-audio')
         self.s3.put_object(
             Bucket='echoguard-audio',
-            Key='test-audio.mp3',
-            Body=b'test audio content'
+            Key='test-audio.wav',
+            Body=wav_bytes()
         )
         
         # Mock event
@@ -30,36 +42,49 @@ class TestStartTranscribe(unittest.TestCase):
             'Records': [{
                 's3': {
                     'bucket': {'name': 'echoguard-audio'},
-                    'object': {'key': 'test-audio.mp3'}
+                    'object': {'key': 'test-audio.wav'}
                 }
             }]
         }
         
         # Set environment variables
         os.environ['TRANSCRIPT_BUCKET'] = 'echoguard-transcripts'
+        os.environ['TRANSCRIBE_OUTPUT_BUCKET'] = 'echoguard-transcripts'
         os.environ['AWS_REGION'] = 'us-east-1'
     
     @patch('start_transcribe.transcribe_client')
     def test_lambda_handler(self, mock_transcribe_client):
         # Mock the start_transcription_job method
-        mock_start_job = MagicMock()
+        mock_start_job = MagicMock(return_value={'TranscriptionJob': {'TranscriptionJobStatus': 'IN_PROGRESS'}})
         mock_transcribe_client.start_transcription_job = mock_start_job
         
-        # Call the Lambda handler
-        response = start_transcribe.lambda_handler(self.event, {})
+        # Call the Lambda handler with a context carrying the request ID
+        with patch.object(start_transcribe, 's3_client', self.s3):
+            response = start_transcribe.lambda_handler(self.event, MagicMock(aws_request_id='request-1'))
         
         # Assert that start_transcription_job was called with correct parameters
         mock_start_job.assert_called_once()
         call_args = mock_start_job.call_args[1]
         
-        self.assertEqual(call_args['TranscriptionJobName'].startswith('echoguard-'), True)
+        self.assertTrue(call_args['TranscriptionJobName'].startswith('transcribe_test-audio_wav_request-1_'))
         self.assertEqual(call_args['LanguageCode'], 'en-US')
-        self.assertEqual(call_args['Media']['MediaFileUri'].startswith('s3://echoguard-audio/test-audio.mp3'), True)
+        self.assertEqual(call_args['Media']['MediaFileUri'], 's3://echoguard-audio/test-audio.wav')
+        self.assertEqual(call_args['MediaFormat'], 'wav')
         self.assertEqual(call_args['OutputBucketName'], 'echoguard-transcripts')
+        self.assertEqual(call_args['Settings']['ShowSpeakerLabels'], True)
         
         # Assert the response
         self.assertEqual(response['statusCode'], 200)
-        self.assertIn('Started transcription job', response['body'])
+        self.assertEqual(json.loads(response['body'])['status'], 'IN_PROGRESS')
+    
+    @patch('start_transcribe.transcribe_client')
+    def test_failed_start_fails_invocation(self, mock_transcribe_client):
+        # A failed S3 record raises so Lambda retries the invocation
+        mock_transcribe_client.start_transcription_job.side_effect = Exception('Transcribe unavailable')
+        
+        with patch.object(start_transcribe, 's3_client', self.s3):
+            with self.assertRaises(record_dispatch.RecordsFailedError):
+                start_transcribe.lambda_handler(self.event, MagicMock(aws_request_id='request-1'))
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,100 @@
+import unittest
+import os
+import sys
+
+# Add the lambda directory to the path so we can import the tier selection
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'lambda'))
+import kiro_integration
+import tiered_analysis
+
+def keyword_results(*keywords, confidence=1.0, unsure=()):
+    matches = [{'keyword': keyword, 'confidence': confidence, 'asr_confidence': 0.99} for keyword in keywords]
+    matches += [{'keyword': keyword, 'confidence': 1.0, 'asr_confidence': 0.4} for keyword in unsure]
+    keywords += tuple(unsure)
+    return {
+        'compliance_score': 100 - 10 * len(keywords),
+        'findings': [f"Issue with {keyword}" for keyword in keywords] or ["No compliance issues detected"],
+        'recommendations': [f"Avoid using term '{keyword}'" for keyword in keywords],
+        'finding_keywords': list(keywords),
+        'matches': matches
+    }
+
+def items(count, confidence='0.99'):
+    return [{'type': 'pronunciation', 'start_time': f"{i}.0", 'end_time': f"{i}.4",
+             'alternatives': [{'content': 'Hello', 'confidence': confidence}]} for i in range(count)]
+
+def evidence_of(words):
+    tracked = tiered_analysis.ScanEvidence()
+    list(tracked.track(words))
+    return tracked
+
+def evidence(count, confidence='0.99'):
+    return evidence_of(items(count, confidence))
+
+class TestTieredAnalysis(unittest.TestCase):
+    """Test cases for deciding when to escalate to Bedrock"""
+
+    def test_clean_call_stays_on_keyword_tier(self):
+        """Test that a well-recognized call without findings is scored by the keyword tier"""
+        decision = tiered_analysis.choose_tier(keyword_results(), enabled=True, evidence=evidence(200))
+
+        self.assertEqual((decision.tier, decision.band), (tiered_analysis.KEYWORD_TIER, tiered_analysis.CLEAN_BAND))
+        self.assertEqual(decision.results['overall_score'], 100)
+        self.assertEqual(decision.results['issues'], [])
+
+    def test_clear_violation_stays_on_keyword_tier(self):
+        """Test that many confident findings produce a keyword verdict with issues"""
+        results = keyword_results('guaranteed', 'risk-free', 'secret', 'insider')
+        decision = tiered_analysis.choose_tier(results, enabled=True)
+
+        self.assertEqual(decision.band, tiered_analysis.VIOLATION_BAND)
+        self.assertEqual(len(decision.results['issues']), 4)
+
+    def test_violation_verdict_uses_confident_findings(self):
+        """Test that misrecognized findings neither lower the score nor become issues"""
+        results = keyword_results('guaranteed', 'risk-free', 'secret', 'insider', unsure=('promise', 'sure thing'))
+        decision = tiered_analysis.choose_tier(results, enabled=True)
+
+        self.assertEqual(decision.band, tiered_analysis.VIOLATION_BAND)
+        self.assertEqual(decision.results['overall_score'], 60)
+        self.assertEqual([issue['description'] for issue in decision.results['issues']],
+                         ['Issue with guaranteed', 'Issue with risk-free', 'Issue with secret', 'Issue with insider'])
+
+    def test_uncertain_calls_escalate(self):
+        """Test that middling scores, low-confidence findings and a disabled scheduler escalate"""
+        for results, enabled in [
+            (keyword_results('guaranteed'), True),
+            (keyword_results('guaranteed', 'risk-free', 'secret', 'insider', confidence=0.5), True),
+            (keyword_results(), False)
+        ]:
+            decision = tiered_analysis.choose_tier(results, enabled=enabled, evidence=evidence(200))
+            self.assertEqual(decision, tiered_analysis.TierDecision(tiered_analysis.BEDROCK_TIER, None, None))
+
+    def test_clean_needs_positive_evidence(self):
+        """Test that short, empty, unrecognized or unscanned calls without findings escalate"""
+        for count, confidence, tracked in [(1, '0.99', True), (0, '0.99', True), (200, '0.3', True),
+                                           (200, '0.99', False)]:
+            scan = tiered_analysis.ScanEvidence()
+            results = kiro_integration.analyze_compliance_items(scan.track(items(count, confidence)))
+
+            self.assertEqual(results['compliance_score'], 100)
+            self.assertIsNone(tiered_analysis.classify(results, evidence=scan if tracked else None))
+
+    def test_keyword_tier_result_from_items(self):
+        """Test classification of a real keyword tier result"""
+        scan = tiered_analysis.ScanEvidence()
+        results = kiro_integration.analyze_compliance_items(scan.track(items(60)))
+
+        self.assertEqual((scan.words, round(scan.mean_confidence, 2)), (60, 0.99))
+        self.assertEqual(tiered_analysis.classify(results, evidence=scan), tiered_analysis.CLEAN_BAND)
+
+    def test_words_without_confidence_count_as_confident(self):
+        """Test that evidence treats a missing confidence as the word matcher does"""
+        words = items(60)
+        for word in words:
+            del word['alternatives'][0]['confidence']
+
+        self.assertEqual(evidence_of(words).mean_confidence, 1.0)
+
+if __name__ == '__main__':
+    unittest.main()
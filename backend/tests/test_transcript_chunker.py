@@ -0,0 +1,83 @@
+import unittest
+import os
+import sys
+
+# Add the lambda directory to the path so we can import the chunker
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'lambda'))
+import transcript_chunker
+
+class TestTranscriptChunker(unittest.TestCase):
+    """Test cases for token-budgeted transcript chunking"""
+
+    def setUp(self):
+        self.sentences = [f"Sentence number {i} talks about the account." for i in range(40)]
+        self.transcript = ' '.join(self.sentences)
+
+    def test_short_transcript_is_one_chunk(self):
+        """Test that a transcript within budget is not split"""
+        chunks = transcript_chunker.chunk_transcript(self.transcript, token_budget=10000)
+
+        self.assertEqual(len(chunks), 1)
+        self.assertEqual(chunks[0].text, self.transcript)
+
+    def test_chunks_fit_budget_and_overlap(self):
+        """Test that chunks respect the budget, cover every sentence and overlap"""
+        chunks = transcript_chunker.chunk_transcript(self.transcript, token_budget=60, overlap_tokens=15)
+
+        self.assertGreater(len(chunks), 1)
+        for chunk in chunks:
+            self.assertLessEqual(chunk.tokens, 60)
+        for sentence in self.sentences:
+            self.assertTrue(any(sentence in chunk.text for chunk in chunks))
+        for previous, chunk in zip(chunks, chunks[1:]):
+            last_sentence = transcript_chunker.split_sentences(previous.text)[-1]
+            self.assertTrue(chunk.text.startswith(last_sentence))
+
+    def test_oversized_sentence_is_split_on_words(self):
+        """Test that a sentence longer than the budget still yields bounded chunks"""
+        chunks = transcript_chunker.chunk_transcript('word ' * 200, token_budget=50, overlap_tokens=0)
+
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(sum(len(chunk.text.split()) for chunk in chunks), 200)
+        for chunk in chunks:
+            self.assertLessEqual(chunk.tokens, 50)
+
+    def test_merge_deduplicates_issues_and_keeps_worst_score(self):
+        """Test that repeated issues are merged at their highest risk level"""
+        chunks = [
+            transcript_chunker.Chunk(0, 'a', 300),
+            transcript_chunker.Chunk(1, 'b', 100)
+        ]
+        results = [
+            {'issues': [{'description': 'Guaranteed returns promised.', 'risk_level': 'Medium'}],
+             'overall_score': 40, 'summary': 'Risky.'},
+            {'issues': [{'description': 'guaranteed returns promised', 'risk_level': 'High'},
+                        {'description': 'No risk disclosure', 'risk_level': 'Low'}],
+             'overall_score': 80, 'summary': 'Risky.'}
+        ]
+
+        merged = transcript_chunker.merge_results(chunks, results)
+
+        self.assertEqual(len(merged['issues']), 2)
+        self.assertEqual(merged['issues'][0]['risk_level'], 'High')
+        self.assertEqual(merged['overall_score'], 40)
+        self.assertEqual(merged['summary'], 'Risky.')
+        self.assertEqual(merged['chunks'], 2)
+
+    def test_merge_keeps_severe_chunk_score(self):
+        """Test that one severe chunk is not diluted by many clean ones"""
+        chunks = [transcript_chunker.Chunk(i, 'a', 1000 if i else 50) for i in range(10)]
+        results = [{'issues': [], 'overall_score': 10 if i == 0 else 100} for i in range(10)]
+
+        self.assertEqual(transcript_chunker.merge_results(chunks, results)['overall_score'], 10)
+
+    def test_merge_fails_on_chunk_without_score(self):
+        """Test that a chunk analysis with no score fails the merge"""
+        chunks = [transcript_chunker.Chunk(0, 'a', 10), transcript_chunker.Chunk(1, 'b', 10)]
+        results = [{'issues': [], 'overall_score': 90}, {'issues': [], 'summary': 'Unparsed'}]
+
+        with self.assertRaises(ValueError):
+            transcript_chunker.merge_results(chunks, results)
+
+if __name__ == '__main__':
+    unittest.main()
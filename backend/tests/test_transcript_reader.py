@@ -0,0 +1,63 @@
+import unittest
+import io
+import json
+import os
+import sys
+
+# Add the lambda directory to the path so we can import the reader
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'lambda'))
+import transcript_reader
+
+ITEMS = [
+    {'start_time': '0.0', 'end_time': '0.4', 'type': 'pronunciation',
+     'alternatives': [{'confidence': '0.99', 'content': 'Guaranteed'}]},
+    {'type': 'punctuation', 'alternatives': [{'confidence': '0.0', 'content': '.'}]}
+]
+
+DOCUMENT = {
+    'jobName': 'job-1',
+    'results': {
+        'transcripts': [{'transcript': 'Guaranteed. "Quoted" \\ text – ünïcode'}],
+        'speaker_labels': {'speakers': 1, 'segments': [
+            {'speaker_label': 'spk_0', 'items': [{'start_time': '0.0', 'speaker_label': 'spk_0'}]}
+        ]},
+        'items': ITEMS
+    },
+    'status': 'COMPLETED'
+}
+
+class TestTranscriptReader(unittest.TestCase):
+    """Test cases for streaming Transcribe output"""
+
+    def test_matches_json_loads_for_any_chunk_size(self):
+        """Test that results do not depend on where chunks split the document"""
+        raw = json.dumps(DOCUMENT, ensure_ascii=False, indent=1).encode('utf-8')
+        for chunk_size in (1, 2, 7, 64, len(raw)):
+            stream = transcript_reader.open_transcript(io.BytesIO(raw), chunk_size=chunk_size, speaker_labels=True)
+
+            self.assertEqual(stream.transcript, DOCUMENT['results']['transcripts'][0]['transcript'])
+            self.assertEqual(stream.speaker_labels, {'0.0': 'spk_0'})
+            self.assertEqual(list(stream.items), ITEMS)
+
+    def test_requested_paths_in_document_order(self):
+        """Test that only the requested paths are returned, in document order"""
+        raw = json.dumps(DOCUMENT).encode('utf-8')
+        values = list(transcript_reader.iter_paths(
+            transcript_reader.body_chunks(io.BytesIO(raw), 5),
+            ['status', 'results.items.*.type', 'jobName']
+        ))
+
+        self.assertEqual(values, [
+            ('jobName', 'job-1'),
+            ('results.items.*.type', 'pronunciation'),
+            ('results.items.*.type', 'punctuation'),
+            ('status', 'COMPLETED')
+        ])
+
+    def test_missing_transcript(self):
+        """Test that output without transcript text is rejected"""
+        with self.assertRaises(ValueError):
+            transcript_reader.open_transcript(io.BytesIO(b'{"results": {"items": []}}'))
+
+if __name__ == '__main__':
+    unittest.main()
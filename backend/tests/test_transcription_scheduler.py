@@ -0,0 +1,206 @@
+import unittest
+import os
+import sys
+from unittest.mock import MagicMock
+
+import boto3
+from botocore.exceptions import ClientError
+from moto import mock_dynamodb
+
+# Add the lambda directory to the path so we can import the scheduler
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'lambda'))
+import transcription_scheduler
+
+def client_error(code):
+    return ClientError({'Error': {'Code': code, 'Message': code}}, 'StartTranscriptionJob')
+
+class FakeTranscribe:
+    """Starts jobs until it holds quota jobs, like the account quota"""
+
+    def __init__(self, quota=100):
+        self.quota = quota
+        self.running = []
+        self.started = []
+
+    def start_transcription_job(self, TranscriptionJobName, **params):
+        if TranscriptionJobName in self.started:
+            raise client_error('ConflictException')
+        if len(self.running) >= self.quota:
+            raise client_error('LimitExceededException')
+        self.running.append(TranscriptionJobName)
+        self.started.append(TranscriptionJobName)
+        return {'TranscriptionJob': {'TranscriptionJobName': TranscriptionJobName}}
+
+    def get_transcription_job(self, TranscriptionJobName):
+        status = 'IN_PROGRESS' if TranscriptionJobName in self.running else 'COMPLETED'
+        return {'TranscriptionJob': {'TranscriptionJobStatus': status}}
+
+    def finish(self, job_name):
+        self.running.remove(job_name)
+
+@mock_dynamodb
+class TestTranscriptionScheduler(unittest.TestCase):
+    """Test cases for admission-controlled transcription jobs"""
+
+    def setUp(self):
+        dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
+        self.table = dynamodb.create_table(
+            TableName='scheduler',
+            KeySchema=[{'AttributeName': 'queueName', 'KeyType': 'HASH'},
+                       {'AttributeName': 'position', 'KeyType': 'RANGE'}],
+            AttributeDefinitions=[{'AttributeName': 'queueName', 'AttributeType': 'S'},
+                                  {'AttributeName': 'position', 'AttributeType': 'S'}],
+            BillingMode='PAY_PER_REQUEST'
+        )
+        self.recordings = dynamodb.create_table(
+            TableName='recordings',
+            KeySchema=[{'AttributeName': 'recordingId', 'KeyType': 'HASH'}],
+            AttributeDefinitions=[{'AttributeName': 'recordingId', 'AttributeType': 'S'}],
+            BillingMode='PAY_PER_REQUEST'
+        )
+        self.transcribe = FakeTranscribe()
+        self.now = 1000.0
+
+    def scheduler(self, max_in_flight=2):
+        def clock():
+            self.now += 1
+            return self.now
+        return transcription_scheduler.TranscriptionScheduler(
+            self.transcribe, self.table, max_in_flight, recordings_table=self.recordings, clock=clock
+        )
+
+    def test_excess_jobs_queued_until_slots_free(self):
+        """Test that jobs over the limit wait and start as jobs finish"""
+        scheduler = self.scheduler()
+        results = [scheduler.submit(f"job-{n}", {'LanguageCode': 'en-US'}, recording_id=f"rec-{n}")
+                   for n in range(4)]
+
+        self.assertEqual(results, [True, True, False, False])
+        self.assertEqual(scheduler.in_flight(), {'job-0', 'job-1'})
+        self.assertEqual(scheduler.queued(), 2)
+
+        self.transcribe.finish('job-0')
+        scheduler.release('job-0')
+        scheduler.release('job-0')
+        self.assertEqual(scheduler.drain(), ['job-2'])
+        self.assertEqual(scheduler.in_flight(), {'job-1', 'job-2'})
+
+        recording = self.recordings.get_item(Key={'recordingId': 'rec-2'})['Item']
+        self.assertEqual((recording['status'], recording['transcriptionJobName']), ('TRANSCRIBING', 'job-2'))
+
+    def test_priority_order(self):
+        """Test that lower priority numbers start first, oldest first within one"""
+        scheduler = self.scheduler(max_in_flight=0)
+        scheduler.submit('bulk-1', {}, priority=9)
+        scheduler.submit('upload-1', {}, priority=1)
+        scheduler.submit('bulk-2', {}, priority=9)
+
+        scheduler.max_in_flight = 10
+        self.assertEqual(scheduler.drain(), ['upload-1', 'bulk-1', 'bulk-2'])
+
+    def test_limit_exceeded_keeps_job_queued(self):
+        """Test that a job refused by the account quota stays queued"""
+        self.transcribe.quota = 1
+        scheduler = self.scheduler(max_in_flight=5)
+
+        self.assertTrue(scheduler.submit('job-0', {}))
+        self.assertFalse(scheduler.submit('job-1', {}))
+        self.assertEqual(scheduler.in_flight(), {'job-0'})
+        self.assertEqual(scheduler.queued(), 1)
+
+        self.transcribe.finish('job-0')
+        scheduler.release('job-0')
+        self.assertEqual(scheduler.drain(), ['job-1'])
+
+    def test_restarted_job_not_started_twice(self):
+        """Test that a job started before its queue item was deleted is not repeated"""
+        scheduler = self.scheduler()
+        scheduler.submit('job-0', {})
+        self.transcribe.finish('job-0')
+        scheduler.release('job-0')
+
+        # Put the job back as if the queue item had survived a crash
+        self.table.put_item(Item={'queueName': 'transcribe', 'position': '005#x#job-0',
+                                  'jobName': 'job-0', 'params': '{}'})
+        self.assertEqual(scheduler.drain(), ['job-0'])
+        self.assertEqual(self.transcribe.started, ['job-0'])
+        self.assertEqual(scheduler.in_flight(), set())
+        self.assertEqual(scheduler.queued(), 0)
+
+    def test_bad_request_marks_recording(self):
+        """Test that a job Transcribe rejects is dropped from the queue"""
+        transcribe = MagicMock()
+        transcribe.start_transcription_job.side_effect = client_error('BadRequestException')
+        scheduler = transcription_scheduler.TranscriptionScheduler(
+            transcribe, self.table, 2, recordings_table=self.recordings
+        )
+
+        self.assertFalse(scheduler.submit('job-0', {}, recording_id='rec-0'))
+        self.assertEqual(scheduler.queued(), 0)
+        self.assertEqual(scheduler.in_flight(), set())
+        self.assertEqual(self.recordings.get_item(Key={'recordingId': 'rec-0'})['Item']['status'],
+                         'TRANSCRIPTION_ERROR')
+
+    def test_transient_errors_keep_job_queued(self):
+        """Test that throttling, service and network errors free the slot but keep the job"""
+        transcribe = MagicMock()
+        transcribe.start_transcription_job.side_effect = [
+            client_error('ThrottlingException'), client_error('InternalFailureException'), ConnectionError('reset'),
+            {'TranscriptionJob': {'TranscriptionJobName': 'job-0'}}
+        ]
+        scheduler = transcription_scheduler.TranscriptionScheduler(
+            transcribe, self.table, 2, recordings_table=self.recordings, clock=lambda: self.now
+        )
+
+        self.assertFalse(scheduler.submit('job-0', {}, recording_id='rec-0'))
+        for _ in range(2):
+            self.assertEqual(scheduler.drain(), [])
+            self.now += 3600
+            self.assertEqual(scheduler.drain(), [])
+            self.assertEqual(scheduler.queued(), 1)
+            self.assertEqual(scheduler.in_flight(), set())
+        self.assertNotIn('Item', self.recordings.get_item(Key={'recordingId': 'rec-0'}))
+
+        self.now += 3600
+        self.assertEqual(scheduler.drain(), ['job-0'])
+        self.assertEqual(self.recordings.get_item(Key={'recordingId': 'rec-0'})['Item']['status'], 'TRANSCRIBING')
+
+    def test_failing_job_does_not_block_queue(self):
+        """Test that jobs behind one that keeps failing still start, and the failing one is dropped"""
+        def start(TranscriptionJobName, **params):
+            if TranscriptionJobName == 'job-0':
+                raise client_error('AccessDeniedException')
+            return {'TranscriptionJob': {'TranscriptionJobName': TranscriptionJobName}}
+
+        transcribe = MagicMock()
+        transcribe.start_transcription_job.side_effect = start
+        scheduler = transcription_scheduler.TranscriptionScheduler(
+            transcribe, self.table, 5, recordings_table=self.recordings, clock=lambda: self.now
+        )
+
+        self.assertFalse(scheduler.submit('job-0', {}, recording_id='rec-0'))
+        self.assertTrue(scheduler.submit('job-1', {}, recording_id='rec-1'))
+        self.assertEqual(scheduler.queued(), 1)
+
+        for _ in range(transcription_scheduler.TRANSCRIBE_MAX_START_ATTEMPTS):
+            self.now += 3600
+            scheduler.drain()
+        self.assertEqual(transcribe.start_transcription_job.call_count,
+                         transcription_scheduler.TRANSCRIBE_MAX_START_ATTEMPTS + 1)
+        self.assertEqual(scheduler.queued(), 0)
+        self.assertEqual(self.recordings.get_item(Key={'recordingId': 'rec-0'})['Item']['status'],
+                         'TRANSCRIPTION_ERROR')
+
+    def test_sync_in_flight(self):
+        """Test that lost completions are dropped when syncing with Transcribe"""
+        scheduler = self.scheduler()
+        scheduler.submit('job-0', {})
+        scheduler.submit('job-1', {})
+        scheduler.submit('job-2', {})
+
+        scheduler.sync_in_flight(['job-1'])
+        self.assertEqual(scheduler.drain(), ['job-2'])
+        self.assertEqual(scheduler.in_flight(), {'job-1', 'job-2'})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -10,6 +10,14 @@ set /p AWS_REGION=
 echo Please enter your Kiro API key:
 set /p KIRO_API_KEY=
 
+echo.
+echo Packaging Lambda function...
+python backend\deploy.py --package analyze_transcript
+if %ERRORLEVEL% NEQ 0 (
+    echo Error packaging analyze_transcript
+    exit /b 1
+)
+
 echo.
 echo Uploading Lambda package to S3...
 aws s3 cp backend\lambda\analyze_transcript.zip s3://echoguard-lambda-%AWS_ACCOUNT_ID%/
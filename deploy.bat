@@ -51,9 +51,9 @@ aws s3api put-bucket-policy --bucket %FRONTEND_BUCKET% --policy file://bucket-po
 
 REM Package Lambda functions
 echo Packaging Lambda functions...
-cd backend\lambda
-powershell Compress-Archive -Path start_transcribe.py -DestinationPath start_transcribe.zip -Force
-powershell Compress-Archive -Path analyze_transcript.py -DestinationPath analyze_transcript.zip -Force
+cd backend
+python deploy.py --package start_transcribe analyze_transcript
+cd lambda
 aws s3 cp start_transcribe.zip s3://%LAMBDA_BUCKET%/
 aws s3 cp analyze_transcript.zip s3://%LAMBDA_BUCKET%/
 cd ..\..
@@ -7,6 +7,14 @@ set /p AWS_ACCOUNT_ID=
 echo Please enter your AWS region (e.g., us-east-1):
 set /p AWS_REGION=
 
+echo.
+echo Packaging Lambda function...
+python backend\deploy.py --package analyze_transcript
+if %ERRORLEVEL% NEQ 0 (
+    echo Error packaging analyze_transcript
+    exit /b 1
+)
+
 echo.
 echo Uploading Lambda package to S3...
 aws s3 cp backend\lambda\analyze_transcript.zip s3://echoguard-lambda-%AWS_ACCOUNT_ID%/